@@ -287,11 +287,25 @@ def create_app():
         app.config['REMOTE_LOGGING_PASSWORD'] = os.getenv('REMOTE_LOGGING_PASSWORD')
     app.config['REMOTE_LOGGING_TIMEOUT'] = int(os.getenv('REMOTE_LOGGING_TIMEOUT', '2'))
     app.config['REMOTE_LOGGING_RETRY_COUNT'] = int(os.getenv('REMOTE_LOGGING_RETRY_COUNT', '1'))
+    # Remote log entries are buffered in-process and shipped to Redis in batches
+    app.config['REMOTE_LOGGING_QUEUE_SIZE'] = int(os.getenv('REMOTE_LOGGING_QUEUE_SIZE', '10000'))
+    app.config['REMOTE_LOGGING_BATCH_SIZE'] = int(os.getenv('REMOTE_LOGGING_BATCH_SIZE', '500'))
+    app.config['REMOTE_LOGGING_FLUSH_INTERVAL'] = float(os.getenv('REMOTE_LOGGING_FLUSH_INTERVAL', '0.5'))
+    app.config['REMOTE_LOGGING_MAX_ENTRIES'] = int(os.getenv('REMOTE_LOGGING_MAX_ENTRIES', '100000'))
+    # Seconds a log index (one per level, source, URL rule, client IP and tenant) is kept without writes
+    app.config['REMOTE_LOGGING_INDEX_TTL'] = int(os.getenv('REMOTE_LOGGING_INDEX_TTL', '604800'))
+    app.config['REMOTE_LOGGING_OVERLOAD_POLICY'] = os.getenv('REMOTE_LOGGING_OVERLOAD_POLICY', 'sample')  # 'sample' or 'drop'
     app.config['REMOTE_LOGGING_FALLBACK_LOCAL'] = True  # Always fall back to local logging
 
     # IP Blocker configuration - using Key Vault for password
     app.config['IP_BLOCKER_USE_REDIS'] = os.getenv('IP_BLOCKER_USE_REDIS', 'False').lower() in ['true', '1', 't']
     app.config['IP_BLOCKER_USE_LMDB'] = os.getenv('IP_BLOCKER_USE_LMDB', 'True').lower() in ['true', '1', 't']
+    # fsync every LMDB commit; off by default, block/whitelist changes are synced explicitly
+    app.config['IP_BLOCKER_LMDB_SYNC'] = os.getenv('IP_BLOCKER_LMDB_SYNC', 'False').lower() in ['true', '1', 't']
+    # Firewall enforcement: 'ipset' (one set + one rule), 'iptables' (rule per IP) or 'dry-run'
+    app.config['IP_BLOCKER_FIREWALL_BACKEND'] = os.getenv('IP_BLOCKER_FIREWALL_BACKEND', 'ipset')
+    app.config['IP_BLOCKER_FIREWALL_BATCH_DELAY'] = float(os.getenv('IP_BLOCKER_FIREWALL_BATCH_DELAY', '0.5'))
+    app.config['IP_BLOCKER_BAN_TIMEOUT'] = int(os.getenv('IP_BLOCKER_BAN_TIMEOUT', '0'))  # Seconds, 0 = permanent
     app.config['IP_BLOCKER_REDIS_HOST'] = os.getenv('IP_BLOCKER_REDIS_HOST')
     app.config['IP_BLOCKER_REDIS_PORT'] = int(os.getenv('IP_BLOCKER_REDIS_PORT', '6379'))
     try:
@@ -306,6 +320,15 @@ def create_app():
     if not os.path.exists(app.config['IP_BLOCKER_DATA_DIR']):
         os.makedirs(app.config['IP_BLOCKER_DATA_DIR'])
 
+    # Per-tenant vector index of AI long-term memories, and its vector dimension
+    app.config['AI_MEMORY_INDEX_DIR'] = os.getenv('AI_MEMORY_INDEX_DIR') or os.path.join(app.root_path, 'data', 'memory_index')
+    app.config['AI_MEMORY_INDEX_DIM'] = int(os.getenv('AI_MEMORY_INDEX_DIM', '512'))
+    # Background memory pipeline: turns condensed per model call, jobs per run, claim timeout (s), attempts per job
+    app.config['AI_MEMORY_CONDENSE_BATCH_SIZE'] = int(os.getenv('AI_MEMORY_CONDENSE_BATCH_SIZE', '10'))
+    app.config['AI_MEMORY_PIPELINE_MAX_JOBS'] = int(os.getenv('AI_MEMORY_PIPELINE_MAX_JOBS', '200'))
+    app.config['AI_MEMORY_JOB_CLAIM_TIMEOUT'] = int(os.getenv('AI_MEMORY_JOB_CLAIM_TIMEOUT', '600'))
+    app.config['AI_MEMORY_JOB_MAX_ATTEMPTS'] = int(os.getenv('AI_MEMORY_JOB_MAX_ATTEMPTS', '3'))
+
 
 
     # Access secrets from Azure Key Vault
@@ -415,6 +438,80 @@ def create_app():
     # Application Flags
     app.config['LOG_DEVICE_HEALTH_SCORE'] = os.getenv('LOG_DEVICE_HEALTH_SCORE', 'False') == 'True'
 
+    # Payload ingest: number of audit files written per database transaction
+    app.config['PAYLOAD_INGEST_BATCH_SIZE'] = int(os.getenv('PAYLOAD_INGEST_BATCH_SIZE', '50'))
+    # Payload queue workers: parallel consumers, files claimed per round, time budget and stale-claim timeout
+    app.config['PAYLOAD_QUEUE_WORKERS'] = int(os.getenv('PAYLOAD_QUEUE_WORKERS', '4'))
+    app.config['PAYLOAD_QUEUE_CLAIM_SIZE'] = int(os.getenv('PAYLOAD_QUEUE_CLAIM_SIZE', '200'))
+    app.config['PAYLOAD_QUEUE_MAX_SECONDS'] = int(os.getenv('PAYLOAD_QUEUE_MAX_SECONDS', '50'))
+    app.config['PAYLOAD_QUEUE_CLAIM_TIMEOUT'] = int(os.getenv('PAYLOAD_QUEUE_CLAIM_TIMEOUT', '600'))
+    # Failed attempts after which a payload is moved to payloads/invalid
+    app.config['PAYLOAD_QUEUE_MAX_ATTEMPTS'] = int(os.getenv('PAYLOAD_QUEUE_MAX_ATTEMPTS', '5'))
+    # Push ingest: hand validated audits to an in-process ingest thread instead of waiting for the queue sweep
+    app.config['PAYLOAD_PUSH_INGEST'] = os.getenv('PAYLOAD_PUSH_INGEST', 'False').lower() in ['true', '1', 't']
+    app.config['PAYLOAD_PUSH_QUEUE_SIZE'] = int(os.getenv('PAYLOAD_PUSH_QUEUE_SIZE', '1000'))
+
+    # Health scores: hourly runs only recompute devices analysed since the last run (plus this many seconds of overlap)
+    app.config['HEALTH_SCORE_INCREMENTAL'] = os.getenv('HEALTH_SCORE_INCREMENTAL', 'True').lower() in ['true', '1', 't']
+    app.config['HEALTH_SCORE_DIRTY_OVERLAP'] = int(os.getenv('HEALTH_SCORE_DIRTY_OVERLAP', '900'))
+    # Health score history retention in days: raw samples, hourly rollups, daily rollups (0 keeps daily forever)
+    app.config['HEALTH_HISTORY_RAW_DAYS'] = int(os.getenv('HEALTH_HISTORY_RAW_DAYS', '7'))
+    app.config['HEALTH_HISTORY_HOURLY_DAYS'] = int(os.getenv('HEALTH_HISTORY_HOURLY_DAYS', '90'))
+    app.config['HEALTH_HISTORY_DAILY_DAYS'] = int(os.getenv('HEALTH_HISTORY_DAILY_DAYS', '0'))
+    # Most points returned by a health history chart query
+    app.config['HEALTH_HISTORY_MAX_POINTS'] = int(os.getenv('HEALTH_HISTORY_MAX_POINTS', '500'))
+
+    # Realtime device metric retention in days per bucket width (0 keeps that width forever)
+    app.config['DEVICE_METRICS_MINUTE_DAYS'] = int(os.getenv('DEVICE_METRICS_MINUTE_DAYS', '2'))
+    app.config['DEVICE_METRICS_FIVE_MINUTE_DAYS'] = int(os.getenv('DEVICE_METRICS_FIVE_MINUTE_DAYS', '14'))
+    app.config['DEVICE_METRICS_HOURLY_DAYS'] = int(os.getenv('DEVICE_METRICS_HOURLY_DAYS', '180'))
+    # Most points returned by a realtime metric chart query
+    app.config['DEVICE_METRICS_MAX_POINTS'] = int(os.getenv('DEVICE_METRICS_MAX_POINTS', '1440'))
+
+    # Device deletion: most devices deleted inside the request, devices per transaction in a background job
+    app.config['DEVICE_DELETE_SYNC_MAX'] = int(os.getenv('DEVICE_DELETE_SYNC_MAX', '5'))
+    app.config['DEVICE_DELETE_BATCH_SIZE'] = int(os.getenv('DEVICE_DELETE_BATCH_SIZE', '25'))
+
+    # Analysis workers: concurrent model calls per batch (1 = one item at a time) and per tenant
+    app.config['ANALYSIS_BATCH_CONCURRENCY'] = int(os.getenv('ANALYSIS_BATCH_CONCURRENCY', '4'))
+    app.config['ANALYSIS_TENANT_CONCURRENCY'] = int(os.getenv('ANALYSIS_TENANT_CONCURRENCY', '2'))
+    # Seconds before a claimed analysis whose worker never finished it returns to the queue
+    app.config['ANALYSIS_CLAIM_TIMEOUT'] = int(os.getenv('ANALYSIS_CLAIM_TIMEOUT', '1800'))
+    # Seconds a worker reuses a tenant's analysis settings before reloading them
+    app.config['ANALYSIS_TENANT_CACHE_TTL'] = int(os.getenv('ANALYSIS_TENANT_CACHE_TTL', '60'))
+    # Reuse results for identical analysis inputs; billing 'full' charges reused results, 'free' does not
+    app.config['ANALYSIS_DEDUP_ENABLED'] = os.getenv('ANALYSIS_DEDUP_ENABLED', 'True').lower() in ['true', '1', 't']
+    app.config['ANALYSIS_DEDUP_TTL'] = int(os.getenv('ANALYSIS_DEDUP_TTL', '86400'))
+    app.config['ANALYSIS_DEDUP_MAX_ENTRIES'] = int(os.getenv('ANALYSIS_DEDUP_MAX_ENTRIES', '50000'))
+    app.config['ANALYSIS_DEDUP_BILLING'] = os.getenv('ANALYSIS_DEDUP_BILLING', 'full')
+
+    # NATS heartbeats: seconds between bulk writes, and seconds without a heartbeat before a device goes offline
+    app.config['HEARTBEAT_FLUSH_INTERVAL'] = float(os.getenv('HEARTBEAT_FLUSH_INTERVAL', '2'))
+    app.config['HEARTBEAT_OFFLINE_AFTER'] = int(os.getenv('HEARTBEAT_OFFLINE_AFTER', '600'))
+    # NATS device membership index: seconds between full reloads, and seconds an unknown device is remembered
+    app.config['NATS_MEMBERSHIP_RELOAD_INTERVAL'] = int(os.getenv('NATS_MEMBERSHIP_RELOAD_INTERVAL', '300'))
+    app.config['NATS_MEMBERSHIP_NEGATIVE_TTL'] = int(os.getenv('NATS_MEMBERSHIP_NEGATIVE_TTL', '30'))
+    # Device commands from the web app: NATS server of the per-process bridge, and seconds to wait for an agent
+    app.config['NATS_SERVER_URL'] = os.getenv('NATS_SERVER_URL', 'tls://nats.wegweiser.tech:443')
+    app.config['NATS_COMMAND_TIMEOUT'] = float(os.getenv('NATS_COMMAND_TIMEOUT', '30'))
+    # Fleet queries: devices queried at once, seconds each device gets, rows kept per device, days jobs are kept
+    app.config['FLEET_QUERY_CONCURRENCY'] = int(os.getenv('FLEET_QUERY_CONCURRENCY', '50'))
+    app.config['FLEET_QUERY_DEVICE_TIMEOUT'] = float(os.getenv('FLEET_QUERY_DEVICE_TIMEOUT', '30'))
+    app.config['FLEET_QUERY_MAX_ROWS_PER_DEVICE'] = int(os.getenv('FLEET_QUERY_MAX_ROWS_PER_DEVICE', '10000'))
+    app.config['FLEET_QUERY_RETENTION_DAYS'] = int(os.getenv('FLEET_QUERY_RETENTION_DAYS', '7'))
+    # Seconds a running fleet query may go without a device result before it is marked failed
+    app.config['FLEET_QUERY_STALE_AFTER'] = int(os.getenv('FLEET_QUERY_STALE_AFTER', '600'))
+
+    # Device detail data: providers run concurrently (1 = one after another); audit-table components
+    # are cached per process for this many seconds (0 disables) until their last_update changes
+    app.config['DEVICE_DATA_CONCURRENCY'] = int(os.getenv('DEVICE_DATA_CONCURRENCY', '4'))
+    app.config['DEVICE_DATA_CACHE_TTL'] = int(os.getenv('DEVICE_DATA_CACHE_TTL', '300'))
+    app.config['DEVICE_DATA_CACHE_MAX_ENTRIES'] = int(os.getenv('DEVICE_DATA_CACHE_MAX_ENTRIES', '10000'))
+
+    # GeoLite2 City database for device geolocation, and addresses cached per process
+    app.config['GEOIP_DATABASE_PATH'] = os.getenv('GEOIP_DATABASE_PATH', '/opt/wegweiser/GeoLite2-City.mmdb')
+    app.config['GEOIP_CACHE_MAX_ENTRIES'] = int(os.getenv('GEOIP_CACHE_MAX_ENTRIES', '50000'))
+
     # Ensure the upload folders exists
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -19,6 +19,12 @@ from app.tasks.organizations.analyzer import OrganizationAnalyzer
 from app.tasks.tenant.analyzer import TenantRecommendationsAnalyzer, TenantSuggestionsAnalyzer
 
 from app.tasks.base.scheduler import run_analysis_worker
+from app.tasks.base.result_cache import evict_analysis_result_cache_task
+from app.utilities.device_metrics_timeseries import maintain_device_metrics_task
+from app.utilities.chat.memory_pipeline import process_ai_memory_jobs_task
+from app.utilities.device_backup import delete_devices_job_task
+from app.utilities.fleet_query import run_fleet_query_task
+from app.utilities.device_commands import run_device_command_task
 
 # Initialize Flask app first
 flask_app = create_app()
@@ -664,6 +670,32 @@ def setup_periodic_tasks(sender, **kwargs):
         name='Generate Healthscores every 1 hour'
     )
 
+    # Hourly runs are incremental; a daily full pass picks up deletions and device moves
+    sender.add_periodic_task(86400.0,
+        sys_function_generate_healthscores.update_cascading_health_scores_task.s(full=True),
+        name='Full Healthscore recompute every day'
+    )
+
+    sender.add_periodic_task(3600.0,
+        sys_function_generate_healthscores.maintain_health_score_history_task.s(),
+        name='Roll up Healthscore history every 1 hour'
+    )
+
+    sender.add_periodic_task(300.0,
+        maintain_device_metrics_task.s(),
+        name='Roll up realtime device metrics every 5 minutes'
+    )
+
+    sender.add_periodic_task(60.0,
+        process_ai_memory_jobs_task.s(),
+        name='Condense queued AI chat memories every 1 minute'
+    )
+
+    sender.add_periodic_task(3600.0,
+        evict_analysis_result_cache_task.s(),
+        name='Evict analysis result cache every 1 hour'
+    )
+
     # Lynis audit parser worker (non-AI, no wegcoin cost)
     sender.add_periodic_task(
         60.0,
@@ -162,6 +162,38 @@ def diagnose_lmdb(db_path):
 
     return True
 
+def read_set_members(env, txn, set_key):
+    """
+    Read the members of an IP blocker set.
+    
+    Sets are stored one entry per member in the dupsort 'set_members' database;
+    stores the application has not opened since that change still hold a JSON
+    list in 'sets'.
+    
+    Returns:
+        List of members, or None if the set does not exist
+    """
+    try:
+        members_db = env.open_db(b'set_members', txn=txn, dupsort=True)
+        cursor = txn.cursor(db=members_db)
+        if cursor.set_key(set_key):
+            return [value.decode('utf-8') for value in cursor.iternext_dup()]
+    except lmdb.Error:
+        pass  # Not created yet in this store
+    
+    try:
+        sets_db = env.open_db(b'sets', txn=txn)
+        value = txn.get(set_key, db=sets_db)
+    except lmdb.Error:
+        return None
+    if value is None:
+        return None
+    try:
+        return json.loads(value.decode('utf-8'))
+    except json.JSONDecodeError:
+        logger.error(f"Failed to decode {set_key.decode('utf-8')} JSON")
+        return None
+
 def get_blocked_ips(db_path, search_term=None, limit=None):
     """
     Get blocked IPs from the database
@@ -181,28 +213,17 @@ def get_blocked_ips(db_path, search_term=None, limit=None):
         
         with env.begin() as txn:
             # Try to get IPs from the blacklist set
-            sets_db = env.open_db(b'sets', txn=txn)
-            cursor = txn.cursor(db=sets_db)
-            
-            # Look for the blacklist key
-            if cursor.set_key(b'wegweiser:ip_blocker:blacklist'):
-                key, value = cursor.item()
-                value_str = value.decode('utf-8') if isinstance(value, bytes) else str(value)
+            ip_list = read_set_members(env, txn, b'wegweiser:ip_blocker:blacklist')
+            if ip_list is not None:
+                # Apply search filter if provided
+                if search_term:
+                    ip_list = [ip for ip in ip_list if search_term in ip]
                 
-                try:
-                    ip_list = json.loads(value_str)
-                    
-                    # Apply search filter if provided
-                    if search_term:
-                        ip_list = [ip for ip in ip_list if search_term in ip]
+                # Apply limit if provided
+                if limit and len(ip_list) > limit:
+                    ip_list = ip_list[:limit]
                     
-                    # Apply limit if provided
-                    if limit and len(ip_list) > limit:
-                        ip_list = ip_list[:limit]
-                        
-                    blocked_ips = ip_list
-                except json.JSONDecodeError:
-                    logger.error("Failed to decode blacklist JSON")
+                blocked_ips = ip_list
             
             # Try to get detailed information about blocked IPs
             blocked_ip_details = {}
@@ -275,29 +296,19 @@ def get_whitelisted_ips(db_path, search_term=None, limit=None):
         
         with env.begin() as txn:
             # Try to get IPs from the whitelist set
-            sets_db = env.open_db(b'sets', txn=txn)
-            cursor = txn.cursor(db=sets_db)
-            
-            # Look for the whitelist key
-            if cursor.set_key(b'wegweiser:ip_blocker:whitelist'):
-                key, value = cursor.item()
-                value_str = value.decode('utf-8') if isinstance(value, bytes) else str(value)
+            ip_list = read_set_members(env, txn, b'wegweiser:ip_blocker:whitelist')
+            if ip_list is not None:
+                logger.info(f"Found {len(ip_list)} whitelisted IPs in LMDB")
                 
-                try:
-                    ip_list = json.loads(value_str)
-                    logger.info(f"Found {len(ip_list)} whitelisted IPs in LMDB")
-                    
-                    # Apply search filter if provided
-                    if search_term:
-                        ip_list = [ip for ip in ip_list if search_term in ip]
+                # Apply search filter if provided
+                if search_term:
+                    ip_list = [ip for ip in ip_list if search_term in ip]
+                
+                # Apply limit if provided
+                if limit and len(ip_list) > limit:
+                    ip_list = ip_list[:limit]
                     
-                    # Apply limit if provided
-                    if limit and len(ip_list) > limit:
-                        ip_list = ip_list[:limit]
-                        
-                    whitelisted_ips = ip_list
-                except json.JSONDecodeError:
-                    logger.error("Failed to decode whitelist JSON from LMDB")
+                whitelisted_ips = ip_list
         
         env.close()
     except Exception as e:
@@ -441,43 +452,27 @@ def add_whitelist_from_json(db_path):
     
     # Now add the IPs to LMDB
     try:
-        env = lmdb.open(db_path, readonly=False, lock=True, max_dbs=5)
+        env = lmdb.open(db_path, readonly=False, lock=True, max_dbs=20)
         
         with env.begin(write=True) as txn:
-            sets_db = env.open_db(b'sets', txn=txn)
-            
-            # Check if whitelist key already exists
-            current_whitelist = []
-            if txn.get(b'wegweiser:ip_blocker:whitelist', db=sets_db):
-                try:
-                    value = txn.get(b'wegweiser:ip_blocker:whitelist', db=sets_db)
-                    value_str = value.decode('utf-8') if isinstance(value, bytes) else str(value)
-                    current_whitelist = json.loads(value_str)
-                    logger.info(f"Found existing whitelist with {len(current_whitelist)} IPs")
-                except Exception as e:
-                    logger.error(f"Error reading existing whitelist: {e}")
+            members_db = env.open_db(b'set_members', txn=txn, dupsort=True)
             
-            # Merge the lists without duplicates
-            updated_whitelist = list(set(current_whitelist + whitelist_ips))
-            added_count = len(updated_whitelist) - len(current_whitelist)
+            # One entry per member; existing members are left alone
+            added_count = 0
+            for ip in whitelist_ips:
+                if txn.put(b'wegweiser:ip_blocker:whitelist', ip.encode('utf-8'), db=members_db, dupdata=False):
+                    added_count += 1
             
-            # Only update if there are new IPs
             if added_count > 0:
-                # Store the updated whitelist
-                txn.put(
-                    b'wegweiser:ip_blocker:whitelist',
-                    json.dumps(updated_whitelist).encode('utf-8'),
-                    db=sets_db
-                )
                 logger.info(f"Added {added_count} new IPs to whitelist in LMDB")
                 
                 # Also add a timestamp entry for when the whitelist was last updated
                 now = int(time.time())
-                txn.put(
-                    b'wegweiser:ip_blocker:whitelist_updated',
-                    str(now).encode('utf-8'),
-                    db=sets_db
-                )
+                txn.put(b'wegweiser:ip_blocker:whitelist_updated', str(now).encode('utf-8'))
+                
+                # Bump the generation so running workers recompile their whitelist
+                generation_key = b'counter:wegweiser:ip_blocker:generation'
+                txn.put(generation_key, str(int(txn.get(generation_key) or b'0') + 1).encode('utf-8'))
             else:
                 logger.info("No new IPs to add to whitelist")
         
@@ -4,7 +4,6 @@
 import os
 import sys
 import lmdb
-import json
 import logging
 
 # Configure logging
@@ -23,41 +22,33 @@ def remove_ip_from_blacklist(db_path, ip_address):
         Tuple of (success, message)
     """
     try:
-        env = lmdb.open(db_path, readonly=False, lock=True, max_dbs=5)
+        env = lmdb.open(db_path, readonly=False, lock=True, max_dbs=20)
         
         with env.begin(write=True) as txn:
-            # Get the sets database
-            sets_db = env.open_db(b'sets', txn=txn)
+            # Set members are stored one entry per member (dupsort)
+            sets_db = env.open_db(b'set_members', txn=txn, dupsort=True)
             
-            # Get current blacklist
             blacklist_key = b'wegweiser:ip_blocker:blacklist'
-            current_blacklist_bytes = txn.get(blacklist_key, db=sets_db)
-            
-            if current_blacklist_bytes is None:
-                return False, "Blacklist not found in database"
-            
-            try:
-                current_blacklist = json.loads(current_blacklist_bytes.decode('utf-8'))
-            except json.JSONDecodeError:
-                return False, "Failed to decode blacklist JSON"
-            
-            # Check if IP is in blacklist
-            if ip_address not in current_blacklist:
+            if not txn.delete(blacklist_key, ip_address.encode('utf-8'), db=sets_db):
                 return False, f"IP {ip_address} is not in blacklist"
-            
-            # Remove IP from blacklist
-            current_blacklist.remove(ip_address)
             logger.info(f"Removed {ip_address} from blacklist")
             
-            # Update the blacklist in database
-            txn.put(blacklist_key, json.dumps(current_blacklist).encode('utf-8'), db=sets_db)
-            
-            # Also remove any blacklist data for this IP
-            hashes_db = env.open_db(b'hashes', txn=txn)
-            ip_data_key = f'wegweiser:ip_blocker:blacklist_data:{ip_address}'.encode('utf-8')
-            if txn.get(ip_data_key, db=hashes_db):
-                txn.delete(ip_data_key, db=hashes_db)
+            # Also remove any blacklist data for this IP (hash fields are keyed <key>\x00<field>)
+            hashes_db = env.open_db(b'hash_fields', txn=txn)
+            prefix = f'wegweiser:ip_blocker:blacklist_data:{ip_address}'.encode('utf-8') + b'\x00'
+            cursor = txn.cursor(db=hashes_db)
+            removed_fields = 0
+            if cursor.set_range(prefix):
+                while cursor.key().startswith(prefix):
+                    removed_fields += 1
+                    if not cursor.delete():
+                        break
+            if removed_fields:
                 logger.info(f"Removed blacklist data for {ip_address}")
+            
+            # Bump the generation so running workers recompile their blacklist
+            generation_key = b'counter:wegweiser:ip_blocker:generation'
+            txn.put(generation_key, str(int(txn.get(generation_key) or b'0') + 1).encode('utf-8'))
         
         env.close()
         return True, f"Successfully removed {ip_address} from blacklist"
@@ -18,7 +18,7 @@ logger = logging.getLogger('unblock_whitelisted')
 
 def unblock_whitelisted_ip(ip_address):
     """
-    Unblock an IP that should be whitelisted but is currently blocked in iptables
+    Unblock an IP that should be whitelisted but is currently blocked in the firewall
     """
     try:
         # Initialize the IP blocker
@@ -42,14 +42,14 @@ def unblock_whitelisted_ip(ip_address):
                     logger.error(f"Failed to unblock IP {ip_address}: {result.get('reason')}")
                     return False
             else:
-                logger.info(f"IP {ip_address} is not in blacklist, but may still have iptables rule")
+                logger.info(f"IP {ip_address} is not in blacklist, but may still have a firewall entry")
                 
-                # Try to remove iptables rule directly
-                if blocker._execute_iptables_command('-D', ip_address):
-                    logger.info(f"Successfully removed iptables rule for {ip_address}")
+                # Try to remove the firewall entry directly
+                if blocker.firewall.unblock([ip_address]):
+                    logger.info(f"Successfully removed firewall entry for {ip_address}")
                     return True
                 else:
-                    logger.warning(f"Could not remove iptables rule for {ip_address} (may not exist)")
+                    logger.warning(f"Could not remove firewall entry for {ip_address} (may not exist)")
                     return False
         else:
             logger.error(f"IP {ip_address} is NOT whitelisted, cannot unblock")
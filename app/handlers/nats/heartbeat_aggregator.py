@@ -0,0 +1,284 @@
+# Filepath: app/handlers/nats/heartbeat_aggregator.py
+"""
+Heartbeat Aggregator
+
+Coalesces device heartbeats in memory and writes them in bulk.
+
+HeartbeatHandler records each heartbeat here instead of writing it. Only the
+latest heartbeat per device is kept, and every HEARTBEAT_FLUSH_INTERVAL
+seconds the pending set is written with one upsert into deviceconnectivity
+and one update of devices. So database load follows the number of devices,
+not the heartbeat rate. System info is only rewritten when it changes.
+
+Online and offline transitions are emitted to listeners registered with
+add_listener(). A device goes offline once it has sent no heartbeat for
+HEARTBEAT_OFFLINE_AFTER seconds. The connectivity cleanup task still covers
+devices this process has not seen since it started.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from flask import current_app
+from sqlalchemy import text, bindparam
+
+from app.models import db, DeviceStatus, DeviceRealtimeData
+from app.utilities.app_logging_helper import log_with_route
+
+# One statement per flush. `previous` reads the state before the upsert, so the
+# devices returned are the ones that were offline (or unknown) until now.
+# Heartbeats for devices deleted since they were recorded are dropped by the join.
+flush_heartbeats_sql = text("""
+    WITH incoming AS (
+        SELECT t.deviceuuid, t.heartbeat, t.info
+        FROM unnest(CAST(:uuids AS uuid[]), CAST(:heartbeats AS bigint[]), CAST(:infos AS text[]))
+            AS t(deviceuuid, heartbeat, info)
+        JOIN devices d ON d.deviceuuid = t.deviceuuid
+    ),
+    previous AS (
+        SELECT c.deviceuuid, c.is_online
+        FROM deviceconnectivity c
+        JOIN incoming i ON i.deviceuuid = c.deviceuuid
+        FOR UPDATE OF c
+    ),
+    upserted AS (
+        INSERT INTO deviceconnectivity (deviceuuid, is_online, last_online_change, last_seen_online,
+                                        last_heartbeat, connection_type, connection_info)
+        SELECT deviceuuid, true, heartbeat, heartbeat, heartbeat, 'nats', CAST(info AS json)
+        FROM incoming
+        ON CONFLICT (deviceuuid) DO UPDATE
+        SET is_online = true,
+            last_online_change = CASE WHEN deviceconnectivity.is_online
+                                      THEN deviceconnectivity.last_online_change
+                                      ELSE EXCLUDED.last_online_change END,
+            last_seen_online = EXCLUDED.last_seen_online,
+            last_heartbeat = EXCLUDED.last_heartbeat,
+            connection_type = EXCLUDED.connection_type,
+            connection_info = EXCLUDED.connection_info
+        RETURNING deviceuuid
+    ),
+    devices_updated AS (
+        UPDATE devices d
+        SET last_heartbeat = i.heartbeat, is_online = true
+        FROM incoming i
+        WHERE d.deviceuuid = i.deviceuuid
+    )
+    SELECT u.deviceuuid
+    FROM upserted u
+    LEFT JOIN previous p ON p.deviceuuid = u.deviceuuid
+    WHERE p.is_online IS NOT TRUE
+""")
+
+mark_offline_sql = text("""
+    UPDATE deviceconnectivity
+    SET is_online = false, last_online_change = :now
+    WHERE deviceuuid IN :uuids
+    AND is_online = true
+    AND last_heartbeat < :cutoff
+    RETURNING deviceuuid
+""").bindparams(bindparam('uuids', expanding=True))
+
+
+class HeartbeatAggregator:
+    """Keeps the latest heartbeat per device and flushes them in bulk"""
+
+    def __init__(self, flush_interval: float = 2.0, offline_after: int = 600):
+        self.flush_interval = flush_interval
+        self.offline_after = offline_after
+        self.running = False
+        self._pending = {}             # device_uuid -> latest heartbeat not yet written
+        self._last_seen = {}           # device_uuid -> (tenant_uuid, last heartbeat time)
+        self._system_info_hashes = {}  # device_uuid -> hash of the system info last written
+        self._listeners = []
+        self._lock = threading.Lock()
+        self.stats = {
+            'heartbeats_received': 0,
+            'heartbeats_written': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+            'online_events': 0,
+            'offline_events': 0,
+            'last_flush': None,
+            'last_flush_duration_ms': None,
+        }
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """Register a callback for {'event': 'online'|'offline', 'device_uuid', 'tenant_uuid', 'timestamp'}"""
+        self._listeners.append(callback)
+
+    def record(self, message) -> None:
+        """Remember a heartbeat; it is written on the next flush"""
+        payload = message.payload or {}
+        current_time = int(time.time())
+        status = payload.get('status', {})
+        with self._lock:
+            self._pending[str(message.device_uuid)] = {
+                'tenant_uuid': str(message.tenant_uuid),
+                'heartbeat': current_time,
+                'connection_info': {
+                    "nats_server": status.get('nats_server'),
+                    "session_id": payload.get('session_id'),
+                    "last_heartbeat": current_time,
+                    "system_info": payload.get('system_info', {}),
+                    "uptime": status.get('uptime')
+                },
+                'system_info': payload.get('system_info'),
+            }
+            self.stats['heartbeats_received'] += 1
+
+    async def run(self) -> None:
+        """Flush on an interval until stop() is called, then flush what is left"""
+        self.flush_interval = current_app.config.get('HEARTBEAT_FLUSH_INTERVAL', self.flush_interval)
+        self.offline_after = current_app.config.get('HEARTBEAT_OFFLINE_AFTER', self.offline_after)
+        self.running = True
+        log_with_route(logging.INFO, f"Heartbeat aggregator flushing every {self.flush_interval}s")
+        try:
+            while self.running:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            self.running = False
+            await self.flush()
+
+    def stop(self) -> None:
+        self.running = False
+
+    async def flush(self) -> int:
+        """Write pending heartbeats and offline transitions; returns heartbeats written"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+
+        current_time = int(time.time())
+        start = time.perf_counter()
+        events = []
+        try:
+            if batch:
+                events.extend(self._write_heartbeats(batch))
+            events.extend(self._mark_stale_offline(current_time, exclude=batch))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.stats['flush_errors'] += 1
+            log_with_route(logging.ERROR, f"Heartbeat flush of {len(batch)} devices failed: {str(e)}")
+            with self._lock:
+                # Keep anything newer that arrived while this batch was being written
+                for device_uuid, state in batch.items():
+                    self._pending.setdefault(device_uuid, state)
+            return 0
+
+        for device_uuid, state in batch.items():
+            self._last_seen[device_uuid] = (state['tenant_uuid'], state['heartbeat'])
+            if state['system_info']:
+                self._system_info_hashes[device_uuid] = self._hash(state['system_info'])
+        for event in events:
+            self._emit(event)
+
+        self.stats['flushes'] += 1
+        self.stats['heartbeats_written'] += len(batch)
+        self.stats['last_flush'] = current_time
+        self.stats['last_flush_duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        if batch:
+            log_with_route(logging.DEBUG, f"Flushed heartbeats for {len(batch)} devices")
+        return len(batch)
+
+    def _write_heartbeats(self, batch: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Sorted so concurrent flushes lock rows in the same order
+        device_uuids = sorted(batch)
+        came_online = db.session.execute(flush_heartbeats_sql, {
+            'uuids': device_uuids,
+            'heartbeats': [batch[device_uuid]['heartbeat'] for device_uuid in device_uuids],
+            'infos': [json.dumps(batch[device_uuid]['connection_info']) for device_uuid in device_uuids],
+        }).scalars().all()
+
+        for device_uuid in device_uuids:
+            system_info = batch[device_uuid]['system_info']
+            if system_info and self._system_info_hashes.get(device_uuid) != self._hash(system_info):
+                self._update_system_info(device_uuid, system_info)
+
+        events = []
+        for device_uuid in map(str, came_online):
+            state = batch[device_uuid]
+            log_with_route(logging.INFO, f"Device {device_uuid} came online via NATS")
+            events.append({'event': 'online', 'device_uuid': device_uuid,
+                           'tenant_uuid': state['tenant_uuid'], 'timestamp': state['heartbeat']})
+        return events
+
+    def _mark_stale_offline(self, current_time: int, exclude) -> List[Dict[str, Any]]:
+        cutoff = current_time - self.offline_after
+        stale = [device_uuid for device_uuid, (_, heartbeat) in self._last_seen.items()
+                 if heartbeat < cutoff and device_uuid not in exclude]
+        if not stale:
+            return []
+
+        went_offline = db.session.execute(mark_offline_sql, {
+            'uuids': stale, 'now': current_time, 'cutoff': cutoff
+        }).scalars().all()
+
+        events = []
+        for device_uuid in map(str, went_offline):
+            log_with_route(logging.INFO, f"Device {device_uuid} went offline (no NATS heartbeat for {self.offline_after}s)")
+            events.append({'event': 'offline', 'device_uuid': device_uuid,
+                           'tenant_uuid': self._last_seen[device_uuid][0], 'timestamp': current_time})
+        for device_uuid in stale:
+            self._last_seen.pop(device_uuid, None)
+        return events
+
+    def _update_system_info(self, device_uuid: str, system_info: Dict[str, Any]):
+        """Update device system information"""
+        # Update DeviceStatus if it exists
+        device_status = DeviceStatus.query.filter_by(deviceuuid=device_uuid).first()
+
+        if device_status:
+            # Update relevant fields
+            if 'hostname' in system_info:
+                device_status.system_name = system_info['hostname']
+            if 'platform' in system_info:
+                device_status.agent_platform = system_info['platform']
+            if 'cpu_count' in system_info:
+                device_status.cpu_count = system_info['cpu_count']
+            if 'boot_time' in system_info:
+                device_status.boot_time = system_info['boot_time']
+
+            device_status.last_update = int(time.time())
+
+        # Store detailed system info in realtime data
+        realtime_data = DeviceRealtimeData.query.filter_by(
+            deviceuuid=device_uuid,
+            data_type='system_info'
+        ).first()
+
+        if realtime_data:
+            realtime_data.data_value = json.dumps(system_info)
+            realtime_data.last_updated = int(time.time())
+        else:
+            realtime_data = DeviceRealtimeData(
+                deviceuuid=device_uuid,
+                data_type='system_info',
+                data_value=json.dumps(system_info),
+                last_updated=int(time.time())
+            )
+            db.session.add(realtime_data)
+
+    def _emit(self, event: Dict[str, Any]):
+        self.stats[f"{event['event']}_events"] += 1
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                log_with_route(logging.ERROR, f"Heartbeat event listener failed: {str(e)}")
+
+    @staticmethod
+    def _hash(system_info: Dict[str, Any]) -> str:
+        return hashlib.sha1(json.dumps(system_info, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, running=self.running, pending=len(self._pending), tracked_devices=len(self._last_seen))
+
+
+# Global heartbeat aggregator instance
+heartbeat_aggregator = HeartbeatAggregator()
@@ -0,0 +1,229 @@
+# Filepath: app/handlers/nats/membership_index.py
+"""
+Device Membership Index
+
+In-process map of device UUID -> tenant UUID used for the tenant isolation
+check on every NATS message, so validating a message does not read the
+database.
+
+The index is loaded in full when NATSMessageService starts. It is kept current
+by a trigger on devices that sends a Postgres NOTIFY on every insert, delete
+and tenant change. The notifications are applied by a listener thread, which
+reloads everything after (re)connecting and every
+NATS_MEMBERSHIP_RELOAD_INTERVAL seconds as a safety net.
+
+The check stays strict. A device missing from the index is looked up once in
+the database, and a negative answer is cached for
+NATS_MEMBERSHIP_NEGATIVE_TTL seconds. When the listener is not running,
+every check goes to the database as before.
+"""
+
+import json
+import logging
+import select
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from app.models import db
+from app.utilities.app_logging_helper import log_with_route
+
+try:
+    import psycopg2
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+
+CHANNEL = 'device_membership'
+
+create_notify_function_sql = """
+    CREATE OR REPLACE FUNCTION notify_device_membership() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('device_membership',
+                json_build_object('op', 'delete', 'device', OLD.deviceuuid, 'tenant', OLD.tenantuuid)::text);
+            RETURN OLD;
+        END IF;
+        PERFORM pg_notify('device_membership',
+            json_build_object('op', 'upsert', 'device', NEW.deviceuuid, 'tenant', NEW.tenantuuid)::text);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+create_notify_trigger_sql = """
+    CREATE TRIGGER device_membership_notify
+    AFTER INSERT OR DELETE OR UPDATE OF tenantuuid ON devices
+    FOR EACH ROW EXECUTE FUNCTION notify_device_membership()
+"""
+
+
+class DeviceMembershipIndex:
+    """Device -> tenant map kept current through Postgres LISTEN/NOTIFY"""
+
+    def __init__(self, reload_interval: int = 300, negative_ttl: int = 30):
+        self.reload_interval = reload_interval
+        self.negative_ttl = negative_ttl
+        self.listening = False
+        self._members = {}   # device_uuid -> tenant_uuid
+        self._negative = {}  # device_uuid -> monotonic time of the failed lookup
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {
+            'devices': 0,
+            'reloads': 0,
+            'notifications': 0,
+            'database_lookups': 0,
+            'rejected': 0,
+            'last_reload': None,
+        }
+
+    def start(self, database_url, reload_interval: Optional[int] = None, negative_ttl: Optional[int] = None):
+        """Start the listener thread; the index is usable once the first load has finished"""
+        if not PSYCOPG2_AVAILABLE:
+            log_with_route(logging.WARNING, "psycopg2 not available; NATS membership checks will query the database")
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        if reload_interval is not None:
+            self.reload_interval = reload_interval
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+
+        dsn = database_url.set(drivername='postgresql').render_as_string(hide_password=False)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, args=(dsn,), name='nats-membership-index', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.listening = False
+
+    def is_member(self, device_uuid: str, tenant_uuid: str) -> bool:
+        """True if the device exists and belongs to the tenant"""
+        device_uuid = str(device_uuid).lower()
+        tenant_uuid = str(tenant_uuid).lower()
+
+        if not self.listening:
+            return self._lookup(device_uuid) == tenant_uuid
+
+        member_of = self._members.get(device_uuid)
+        if member_of is None:
+            failed_at = self._negative.get(device_uuid)
+            if failed_at is None or time.monotonic() - failed_at >= self.negative_ttl:
+                # Not in the index yet (or just created); ask the database once
+                member_of = self._lookup(device_uuid)
+                with self._lock:
+                    if member_of is None:
+                        self._negative[device_uuid] = time.monotonic()
+                    else:
+                        self._members.setdefault(device_uuid, member_of)
+
+        if member_of != tenant_uuid:
+            self.stats['rejected'] += 1
+            return False
+        return True
+
+    def tenant_for_device(self, device_uuid: str) -> Optional[str]:
+        return self._members.get(str(device_uuid).lower())
+
+    def _lookup(self, device_uuid: str) -> Optional[str]:
+        self.stats['database_lookups'] += 1
+        try:
+            tenant_uuid = db.session.execute(
+                text("SELECT tenantuuid FROM devices WHERE deviceuuid = CAST(:device_uuid AS uuid)"),
+                {'device_uuid': device_uuid}
+            ).scalar()
+        except Exception as e:
+            # Malformed UUIDs land here as well as database errors
+            db.session.rollback()
+            log_with_route(logging.DEBUG, f"Membership lookup for device {device_uuid} failed: {str(e)}")
+            return None
+        return str(tenant_uuid) if tenant_uuid else None
+
+    def apply(self, op: str, device_uuid: str, tenant_uuid: str):
+        """Apply one membership change"""
+        device_uuid = str(device_uuid).lower()
+        with self._lock:
+            if op == 'delete':
+                self._members.pop(device_uuid, None)
+            else:
+                self._members[device_uuid] = str(tenant_uuid).lower()
+                self._negative.pop(device_uuid, None)
+            self.stats['devices'] = len(self._members)
+
+    def _listen(self, dsn: str):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(dsn)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    self._ensure_trigger(cur)
+                    cur.execute(f"LISTEN {CHANNEL}")
+                    # Load after LISTEN so no change between the two is missed
+                    self._reload(cur)
+                self.listening = True
+                log_with_route(logging.INFO, f"NATS membership index loaded {len(self._members)} devices")
+
+                last_reload = time.monotonic()
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self._apply_notification(conn.notifies.pop(0).payload)
+                    if self.reload_interval and time.monotonic() - last_reload >= self.reload_interval:
+                        with conn.cursor() as cur:
+                            self._reload(cur)
+                        last_reload = time.monotonic()
+
+            except Exception as e:
+                # Changes may have been missed; fall back to the database until reconnected
+                self.listening = False
+                log_with_route(logging.ERROR, f"NATS membership listener error: {str(e)}")
+                self._stop.wait(5)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+        self.listening = False
+
+    def _ensure_trigger(self, cur):
+        cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'device_membership_notify' AND NOT tgisinternal")
+        if cur.fetchone() is None:
+            cur.execute(create_notify_function_sql)
+            cur.execute(create_notify_trigger_sql)
+            log_with_route(logging.INFO, "Created device_membership_notify trigger on devices")
+
+    def _reload(self, cur):
+        cur.execute("SELECT deviceuuid::text, tenantuuid::text FROM devices")
+        members = dict(cur.fetchall())
+        with self._lock:
+            self._members = members
+            self._negative.clear()
+            self.stats['devices'] = len(members)
+            self.stats['reloads'] += 1
+            self.stats['last_reload'] = int(time.time())
+
+    def _apply_notification(self, payload: str):
+        try:
+            change = json.loads(payload)
+            self.apply(change['op'], change['device'], change['tenant'])
+            self.stats['notifications'] += 1
+        except (ValueError, KeyError) as e:
+            log_with_route(logging.WARNING, f"Ignoring malformed membership notification {payload!r}: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, listening=self.listening)
+
+
+# Global membership index instance
+device_membership_index = DeviceMembershipIndex()
@@ -14,8 +14,10 @@ import time
 from typing import Dict, Any, Optional
 from datetime import datetime
 
-from app.models import db, Devices, DeviceConnectivity, DeviceStatus, DeviceRealtimeData, Tenants
+from app.models import db, DeviceRealtimeData, Tenants
 from app.utilities.app_logging_helper import log_with_route
+from app.handlers.nats.heartbeat_aggregator import HeartbeatAggregator, heartbeat_aggregator
+from app.handlers.nats.membership_index import device_membership_index
 try:
     from app.utilities.nats_manager import NATSMessage, NATSSubjectValidator, NATS_AVAILABLE
 except ImportError:
@@ -35,28 +37,24 @@ class NATSMessageHandler:
     def validate_tenant_context(self, message: NATSMessage) -> bool:
         """Validate that the message tenant context is valid"""
         try:
-            # Verify tenant exists
-            tenant = Tenants.query.filter_by(tenantuuid=message.tenant_uuid).first()
-            if not tenant:
-                log_with_route(logging.ERROR, f"Invalid tenant UUID in message: {message.tenant_uuid}")
-                return False
-            
-            # Verify device belongs to tenant
-            device = Devices.query.filter_by(
-                deviceuuid=message.device_uuid,
-                tenantuuid=message.tenant_uuid
-            ).first()
-            
-            if not device:
+            # The subject the message arrived on must name the same tenant and device
+            if message.subject:
+                subject = NATSSubjectValidator.parse_subject(message.subject)
+                if subject['tenant_uuid'] != message.tenant_uuid or subject['device_uuid'] != message.device_uuid:
+                    log_with_route(logging.ERROR, f"Message tenant/device does not match subject {message.subject}")
+                    return False
+
+            # Verify device exists and belongs to tenant
+            if not device_membership_index.is_member(message.device_uuid, message.tenant_uuid):
                 log_with_route(logging.ERROR, f"Device {message.device_uuid} not found in tenant {message.tenant_uuid}")
                 return False
-            
+
             return True
-            
+
         except Exception as e:
             log_with_route(logging.ERROR, f"Error validating tenant context: {str(e)}")
             return False
-    
+
     async def handle_message(self, message: NATSMessage) -> bool:
         """Handle a NATS message with validation"""
         try:
@@ -88,123 +86,29 @@ class NATSMessageHandler:
 
 class HeartbeatHandler(NATSMessageHandler):
     """Handles device heartbeat messages"""
-    
+
+    def __init__(self, aggregator: HeartbeatAggregator = None):
+        super().__init__()
+        self.aggregator = aggregator or heartbeat_aggregator
+
     async def process_message(self, message: NATSMessage) -> bool:
-        """Process heartbeat message"""
+        """Process heartbeat message
+
+        Heartbeats are coalesced and written in bulk by the aggregator. When its
+        flush loop is not running (outside NATSMessageService) they are written
+        straight away.
+        """
         try:
-            payload = message.payload
-            current_time = int(time.time())
-            
-            # Get device
-            device = Devices.query.filter_by(deviceuuid=message.device_uuid).first()
-            if not device:
-                return False
-            
-            # Update device connectivity
-            connectivity = DeviceConnectivity.query.filter_by(deviceuuid=message.device_uuid).first()
-            
-            if connectivity:
-                # Update existing record
-                was_offline = not connectivity.is_online
-                connectivity.is_online = True
-                connectivity.last_heartbeat = current_time
-                connectivity.last_seen_online = current_time
-                connectivity.connection_type = "nats"
-                
-                # Update connection info
-                connection_info = {
-                    "nats_server": payload.get('status', {}).get('nats_server'),
-                    "session_id": payload.get('session_id'),
-                    "last_heartbeat": current_time,
-                    "system_info": payload.get('system_info', {}),
-                    "uptime": payload.get('status', {}).get('uptime')
-                }
-                connectivity.connection_info = connection_info
-                
-                # Track status changes
-                if was_offline:
-                    connectivity.last_online_change = current_time
-                    log_with_route(logging.INFO, f"Device {message.device_uuid} came online via NATS")
-            else:
-                # Create new connectivity record
-                connection_info = {
-                    "nats_server": payload.get('status', {}).get('nats_server'),
-                    "session_id": payload.get('session_id'),
-                    "last_heartbeat": current_time,
-                    "system_info": payload.get('system_info', {}),
-                    "uptime": payload.get('status', {}).get('uptime')
-                }
-                
-                connectivity = DeviceConnectivity(
-                    deviceuuid=message.device_uuid,
-                    is_online=True,
-                    last_online_change=current_time,
-                    last_seen_online=current_time,
-                    last_heartbeat=current_time,
-                    connection_type="nats",
-                    connection_info=connection_info
-                )
-                db.session.add(connectivity)
-                log_with_route(logging.INFO, f"Created NATS connectivity record for device {message.device_uuid}")
-            
-            # Update device fields for backward compatibility
-            device.last_heartbeat = current_time
-            device.is_online = True
-            
-            # Update system information if provided
-            system_info = payload.get('system_info')
-            if system_info:
-                await self._update_system_info(message.device_uuid, system_info)
-            
-            db.session.commit()
-            
+            self.aggregator.record(message)
+            if not self.aggregator.running:
+                await self.aggregator.flush()
+
             log_with_route(logging.DEBUG, f"Processed heartbeat for device {message.device_uuid}")
             return True
-            
+
         except Exception as e:
             log_with_route(logging.ERROR, f"Error processing heartbeat: {str(e)}")
-            db.session.rollback()
             return False
-    
-    async def _update_system_info(self, device_uuid: str, system_info: Dict[str, Any]):
-        """Update device system information"""
-        try:
-            # Update DeviceStatus if it exists
-            device_status = DeviceStatus.query.filter_by(deviceuuid=device_uuid).first()
-            
-            if device_status:
-                # Update relevant fields
-                if 'hostname' in system_info:
-                    device_status.system_name = system_info['hostname']
-                if 'platform' in system_info:
-                    device_status.agent_platform = system_info['platform']
-                if 'cpu_count' in system_info:
-                    device_status.cpu_count = system_info['cpu_count']
-                if 'boot_time' in system_info:
-                    device_status.boot_time = system_info['boot_time']
-                
-                device_status.last_update = int(time.time())
-            
-            # Store detailed system info in realtime data
-            realtime_data = DeviceRealtimeData.query.filter_by(
-                deviceuuid=device_uuid,
-                data_type='system_info'
-            ).first()
-            
-            if realtime_data:
-                realtime_data.data_value = json.dumps(system_info)
-                realtime_data.last_updated = int(time.time())
-            else:
-                realtime_data = DeviceRealtimeData(
-                    deviceuuid=device_uuid,
-                    data_type='system_info',
-                    data_value=json.dumps(system_info),
-                    last_updated=int(time.time())
-                )
-                db.session.add(realtime_data)
-            
-        except Exception as e:
-            log_with_route(logging.ERROR, f"Error updating system info: {str(e)}")
 
 
 class CommandResponseHandler(NATSMessageHandler):
@@ -417,6 +321,14 @@ class NATSMessageService:
 
             # Get all tenants and set up subscriptions
             from app.utilities.nats_manager import nats_manager, NATSSubscriber
+            from flask import current_app
+
+            # Tenant isolation checks are answered from memory once the index has loaded
+            device_membership_index.start(
+                db.engine.url,
+                reload_interval=current_app.config.get('NATS_MEMBERSHIP_RELOAD_INTERVAL'),
+                negative_ttl=current_app.config.get('NATS_MEMBERSHIP_NEGATIVE_TTL')
+            )
 
             tenants = Tenants.query.all()
             log_with_route(logging.INFO, f"Found {len(tenants)} tenants to subscribe to")
@@ -446,9 +358,17 @@ class NATSMessageService:
 
             log_with_route(logging.INFO, f"NATS message processing started for {len(self.subscribers)} tenants")
 
+            # Write coalesced heartbeats in the background
+            heartbeat_task = asyncio.create_task(heartbeat_aggregator.run())
+
             # Keep the service running
-            while self.running:
-                await asyncio.sleep(1)
+            try:
+                while self.running:
+                    await asyncio.sleep(1)
+            finally:
+                heartbeat_aggregator.stop()
+                await heartbeat_task
+                device_membership_index.stop()
 
         except Exception as e:
             self.running = False
@@ -470,7 +390,9 @@ class NATSMessageService:
             'running': self.running,
             'active_subscriptions': len(self.subscribers),
             'subscribed_tenants': list(self.subscribers.keys()),
-            'router_stats': self.router.get_stats()
+            'router_stats': self.router.get_stats(),
+            'heartbeat_stats': heartbeat_aggregator.get_stats(),
+            'membership_stats': device_membership_index.get_stats()
         }
 
 
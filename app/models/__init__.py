@@ -23,7 +23,7 @@ from .user_log import UserLog
 from .servercore import ServerCore
 from .mfa import MFA
 from .devicemetadata import DeviceMetadata
-from .ai_memory import AIMemory
+from .ai_memory import AIMemory, AIMemoryJob
 from .context import Context
 from .conversations import Conversations
 from .snippets import Snippets, SnippetsSchedule, SnippetsHistory
@@ -32,6 +32,8 @@ from .health_score_update_log import HealthScoreUpdateLog
 from .faq import FAQ
 from .wegcoin_transaction import WegcoinTransaction
 from .health_score_history import HealthScoreHistory
+from .health_score_rollup import HealthScoreRollup
+from .device_metric_rollup import DeviceMetricRollup
 from .rss_feeds import RSSFeed
 from .messagestream import MessageStream
 from .tenantmetadata import TenantMetadata
@@ -44,3 +46,6 @@ from .guided_tours import GuidedTour, TourProgress
 from .email_verification import EmailVerification
 from .agent_update import AgentUpdateHistory
 from .analysis_config import TenantAnalysisPrompt, AnalysisExclusion, EntityType
+from .analysis_result_cache import AnalysisResultCache
+from .device_deletion_job import DeviceDeletionJob
+from .fleet_query import FleetQueryJob, FleetQueryResult
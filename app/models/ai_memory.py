@@ -1,5 +1,5 @@
 # Filepath: app/models/ai_memory.py
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from . import db
 import time
@@ -15,12 +15,40 @@ class AIMemory(db.Model):
     created_at = db.Column(db.BigInteger, nullable=False, default=lambda: int(time.time()))
     last_accessed = db.Column(db.BigInteger)
     importance_score = db.Column(db.Float)
+    memory_type = db.Column(db.String(20))  # 'conversation' or 'trickle_up'
+    topics = db.Column(db.Text)  # Comma-separated conversation topics
 
     tenant = relationship('Tenants', back_populates='ai_memories')
 
     def __repr__(self):
         return f'<AIMemory {self.memoryuuid}: {self.entity_type} {self.entity_uuid}>'
 
+
+class AIMemoryJob(db.Model):
+    """
+    Pending background memory work, see app/utilities/chat/memory_pipeline.py.
+
+    'condense' jobs hold one chat turn to summarise into a memory of the entity;
+    'trickle_up' jobs hold a note from a child entity to fold into a memory of
+    the parent entity named here.
+    """
+    __tablename__ = 'ai_memory_jobs'
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    job_type = db.Column(db.String(20), nullable=False)
+    tenantuuid = db.Column(UUID(as_uuid=True), db.ForeignKey('tenants.tenantuuid', ondelete="CASCADE"), nullable=False)
+    entity_uuid = db.Column(UUID(as_uuid=True), nullable=False)
+    entity_type = db.Column(db.String(20), nullable=False)
+    payload = db.Column(JSONB, nullable=False)
+    created_at = db.Column(db.BigInteger, nullable=False, default=lambda: int(time.time()))
+    claimed_at = db.Column(db.BigInteger)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<AIMemoryJob {self.id}: {self.job_type} {self.entity_type} {self.entity_uuid}>'
+
+# Workers claim the oldest unclaimed (or stale) jobs of a type
+db.Index('idx_ai_memory_jobs_claim', AIMemoryJob.job_type, AIMemoryJob.claimed_at, AIMemoryJob.id)
+
 # Utility functions for datetime conversion
 from datetime import datetime
 
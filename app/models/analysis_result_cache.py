@@ -0,0 +1,26 @@
+# Filepath: app/models/analysis_result_cache.py
+from . import db
+import time
+from sqlalchemy.dialects.postgresql import UUID
+
+
+class AnalysisResultCache(db.Model):
+    """Analysis results keyed by a hash of everything that went into the prompt"""
+    __tablename__ = 'analysis_result_cache'
+
+    cache_key = db.Column(db.String(64), primary_key=True)  # sha256 hex, see app/tasks/base/result_cache.py
+    tenantuuid = db.Column(UUID(as_uuid=True), db.ForeignKey('tenants.tenantuuid', ondelete="CASCADE"), nullable=False)
+    task_type = db.Column(db.String(100), nullable=False)
+    ai_analysis = db.Column(db.Text, nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.BigInteger, nullable=False, default=lambda: int(time.time()))
+    expires_at = db.Column(db.BigInteger, nullable=False)
+    last_used_at = db.Column(db.BigInteger, nullable=False, default=lambda: int(time.time()))
+    hits = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<AnalysisResultCache {self.cache_key[:12]}: {self.task_type} score={self.score} hits={self.hits}>'
+
+# Eviction scans by expiry and by least recent use
+db.Index('idx_analysis_result_cache_expires_at', AnalysisResultCache.expires_at)
+db.Index('idx_analysis_result_cache_last_used_at', AnalysisResultCache.last_used_at)
@@ -0,0 +1,49 @@
+# Filepath: app/models/device_deletion_job.py
+
+import time
+import uuid
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from app.models import db
+
+
+class DeviceDeletionJob(db.Model):
+    """
+    A bulk device deletion running in the background, see app/utilities/device_backup.py.
+
+    `results` gets one entry per device as it is backed up and deleted, so
+    `processed` / `total` is the job's progress.
+    """
+    __tablename__ = 'device_deletion_jobs'
+
+    jobuuid = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenantuuid = db.Column(UUID(as_uuid=True), db.ForeignKey('tenants.tenantuuid', ondelete="CASCADE"), nullable=True)
+    requested_by = db.Column(UUID(as_uuid=True), nullable=True)
+    deviceuuids = db.Column(JSONB, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    results = db.Column(JSONB, nullable=False, default=list)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.BigInteger, nullable=False, default=lambda: int(time.time()))
+    started_at = db.Column(db.BigInteger, nullable=True)
+    finished_at = db.Column(db.BigInteger, nullable=True)
+
+    def to_dict(self):
+        return {
+            'job_uuid': str(self.jobuuid),
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'success_count': self.processed - self.failed,
+            'error_count': self.failed,
+            'progress': round(100.0 * self.processed / self.total, 1) if self.total else 100.0,
+            'results': self.results or [],
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    def __repr__(self):
+        return f'<DeviceDeletionJob {self.jobuuid}: {self.status} {self.processed}/{self.total}>'
@@ -0,0 +1,40 @@
+# Filepath: app/models/device_metric_rollup.py
+
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, event, DDL
+from sqlalchemy.dialects.postgresql import UUID
+from app.models import db
+
+
+class DeviceMetricRollup(db.Model):
+    """
+    Numeric realtime metrics (CPU load, memory use, socket counts) per device.
+
+    One row per device, metric and bucket. `resolution` is the bucket width in
+    seconds (60, 300 or 3600) and `bucket` the unix time the bucket starts.
+    Samples posted by the realtime widgets are folded straight into the
+    1 minute buckets; app.utilities.device_metrics_timeseries builds the 5 minute
+    and 1 hour buckets from those and applies retention per resolution.
+    """
+    __tablename__ = 'device_metric_rollup'
+
+    deviceuuid = Column(UUID(as_uuid=True), ForeignKey('devices.deviceuuid', ondelete='CASCADE'), primary_key=True)
+    metric = Column(String(64), primary_key=True)
+    resolution = Column(Integer, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    value_sum = Column(Float, nullable=False)
+    value_min = Column(Float, nullable=False)
+    value_max = Column(Float, nullable=False)
+    samples = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<DeviceMetricRollup(deviceuuid='{self.deviceuuid}', metric='{self.metric}', resolution={self.resolution}, bucket={self.bucket}, samples={self.samples})>"
+
+# Minute buckets are updated in place several times; leave room on each page for HOT updates
+event.listen(
+    DeviceMetricRollup.__table__,
+    'after_create',
+    DDL('ALTER TABLE device_metric_rollup SET (fillfactor = 70)')
+)
+
+# Retention deletes by resolution and age
+db.Index('idx_device_metric_rollup_retention', DeviceMetricRollup.resolution, DeviceMetricRollup.bucket)
@@ -20,6 +20,8 @@ class DeviceMetadata(db.Model):
     created_at = db.Column(db.BigInteger, nullable=False, default=lambda: int(time.time()))
     analyzed_at = db.Column(db.BigInteger, nullable=True)
     processing_status = db.Column(db.String(20), nullable=False, default='pending')
+    # When an analysis worker claimed the row; 'processing' rows claimed long ago are released
+    claimed_at = db.Column(db.BigInteger, nullable=True)
     # New fields for health score calculation (AVT - 28072024)
     score = db.Column(db.Integer, nullable=True)
     weight = db.Column(Text, nullable=True, default = '1.0')
@@ -28,3 +30,7 @@ class DeviceMetadata(db.Model):
 
     def __repr__(self):
         return f'<DeviceMetadata {self.metadatauuid}: {self.deviceuuid} - {self.metalogos_type}>'
+
+# Incremental health score runs look up recently analysed metadata, then average per device
+db.Index('idx_devicemetadata_analyzed_at', DeviceMetadata.analyzed_at)
+db.Index('idx_devicemetadata_deviceuuid', DeviceMetadata.deviceuuid)
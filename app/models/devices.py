@@ -331,6 +331,9 @@ class DeviceStatus(db.Model):
     boot_time 			= db.Column(db.Integer, 	nullable=False)
     publicIp 			= db.Column(db.String(255), nullable=True)
     country 			= db.Column(db.String(255), nullable=True)
+    # Geolocation of publicIp, looked up when the audit is ingested
+    latitude 			= db.Column(db.Float, nullable=True)
+    longitude 			= db.Column(db.Float, nullable=True)
     system_model 		= db.Column(db.String(255), nullable=True)
     system_manufacturer = db.Column(db.String(255), nullable=True)
     system_locale 		= db.Column(db.String(255), nullable=True)
@@ -0,0 +1,96 @@
+# Filepath: app/models/fleet_query.py
+
+import time
+import uuid
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from app.models import db
+
+
+class FleetQueryJob(db.Model):
+    """
+    One osquery query fanned out to every online device of a group, organisation
+    or tenant, see app/utilities/fleet_query.py. Counters are updated as device
+    results arrive.
+    """
+    __tablename__ = 'fleet_query_jobs'
+
+    jobuuid = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenantuuid = db.Column(UUID(as_uuid=True), db.ForeignKey('tenants.tenantuuid', ondelete="CASCADE"), nullable=False)
+    requested_by = db.Column(UUID(as_uuid=True), nullable=True)
+    scope_type = db.Column(db.String(20), nullable=False)  # group, organisation, tenant
+    scope_uuid = db.Column(UUID(as_uuid=True), nullable=False)
+    # Not `query`, which would shadow Model.query
+    query_text = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    timed_out = db.Column(db.Integer, nullable=False, default=0)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.BigInteger, nullable=False, default=lambda: int(time.time()))
+    started_at = db.Column(db.BigInteger, nullable=True)
+    finished_at = db.Column(db.BigInteger, nullable=True)
+
+    results = db.relationship('FleetQueryResult', backref='job', lazy='dynamic', cascade='all, delete-orphan',
+                              passive_deletes=True)
+
+    def to_dict(self):
+        return {
+            'job_uuid': str(self.jobuuid),
+            'scope_type': self.scope_type,
+            'scope_uuid': str(self.scope_uuid),
+            'query': self.query_text,
+            'status': self.status,
+            'total': self.total,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'row_count': self.row_count,
+            'progress': round(100.0 * self.completed / self.total, 1) if self.total else 100.0,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    def __repr__(self):
+        return f'<FleetQueryJob {self.jobuuid}: {self.status} {self.completed}/{self.total}>'
+
+
+class FleetQueryResult(db.Model):
+    """One device's answer to a FleetQueryJob; `rows` holds the parsed result rows"""
+    __tablename__ = 'fleet_query_results'
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    jobuuid = db.Column(UUID(as_uuid=True), db.ForeignKey('fleet_query_jobs.jobuuid', ondelete="CASCADE"), nullable=False)
+    # No foreign key: results outlive devices deleted after the query ran
+    deviceuuid = db.Column(UUID(as_uuid=True), nullable=False)
+    devicename = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False)  # success, error, timeout
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    rows = db.Column(JSONB, nullable=False, default=list)
+    # Agent output that could not be parsed into rows
+    output = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    received_at = db.Column(db.BigInteger, nullable=False, default=lambda: int(time.time()))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'deviceuuid': str(self.deviceuuid),
+            'devicename': self.devicename,
+            'status': self.status,
+            'row_count': self.row_count,
+            'error': self.error,
+            'output': self.output,
+            'duration_ms': self.duration_ms,
+            'received_at': self.received_at,
+        }
+
+    def __repr__(self):
+        return f'<FleetQueryResult {self.jobuuid} {self.deviceuuid}: {self.status}>'
+
+# Results of a job in arrival order, for incremental polling and row pagination
+db.Index('idx_fleet_query_results_job', FleetQueryResult.jobuuid, FleetQueryResult.id)
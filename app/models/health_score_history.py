@@ -39,4 +39,6 @@ class HealthScoreHistory(db.Model):
 
 # Add indexes for better query performance
 db.Index('idx_health_score_history_entity_uuid', HealthScoreHistory.entity_uuid)
-db.Index('idx_health_score_history_timestamp', HealthScoreHistory.timestamp)
\ No newline at end of file
+db.Index('idx_health_score_history_timestamp', HealthScoreHistory.timestamp)
+# Trend queries and rollups read one entity over a time range
+db.Index('idx_health_score_history_entity_timestamp', HealthScoreHistory.entity_uuid, HealthScoreHistory.timestamp)
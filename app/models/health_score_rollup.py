@@ -0,0 +1,33 @@
+# Filepath: app/models/health_score_rollup.py
+
+from sqlalchemy import Column, Integer, Float, String, DateTime
+from sqlalchemy.dialects.postgresql import UUID
+from app.models import db
+
+
+class HealthScoreRollup(db.Model):
+    """
+    Downsampled health score history.
+
+    One row per entity per hour ('hour') or day ('day'), built from
+    health_score_history by app.utilities.health_score_timeseries. Raw history
+    is only kept for a few days; charts over longer ranges read these rows.
+    """
+    __tablename__ = 'health_score_rollup'
+
+    entity_type = Column(String(20), primary_key=True)
+    entity_uuid = Column(UUID(as_uuid=True), primary_key=True)
+    resolution = Column(String(5), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    avg_score = Column(Float, nullable=False)
+    min_score = Column(Float, nullable=False)
+    max_score = Column(Float, nullable=False)
+    samples = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<HealthScoreRollup(entity_type='{self.entity_type}', entity_uuid='{self.entity_uuid}', resolution='{self.resolution}', bucket='{self.bucket}', avg_score={self.avg_score})>"
+
+# Series queries filter by entity and resolution over a bucket range
+db.Index('idx_health_score_rollup_series', HealthScoreRollup.entity_uuid, HealthScoreRollup.resolution, HealthScoreRollup.bucket)
+# Retention deletes by resolution and age
+db.Index('idx_health_score_rollup_retention', HealthScoreRollup.resolution, HealthScoreRollup.bucket)
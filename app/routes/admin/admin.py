@@ -1,7 +1,7 @@
 # Filepath: app/routes/admin/admin.py
 # Filepath: app/routes/admin.py (add this to the existing file)
 import math
-from datetime import datetime, timedelta
+from datetime import datetime
 import redis
 from flask import jsonify
 import json
@@ -17,13 +17,15 @@ from app.models import (
     DeviceRealtimeData, DeviceRealtimeHistory, DeviceConnectivity, Messages,
     Tags, TagsXDevices, TagsXOrgs, TagsXGroups, TagsXTenants, TagsXAccounts, Accounts, UserXOrganisation,
     TenantMetadata, OrganizationMetadata, GroupMetadata, AIMemory, Context,
-    Conversations, WegcoinTransaction, HealthScoreHistory, Snippets, SnippetsHistory,
+    Conversations, WegcoinTransaction, HealthScoreHistory, HealthScoreRollup, Snippets, SnippetsHistory,
     Profiles, MFA, RSSFeed
 )
 from app.models.email_verification import EmailVerification
 from app.models.two_factor import UserTwoFactor
 from app.models import db, GuidedTour, TourProgress
-from app.utilities.app_logging_helper import log_with_route, reload_logging_config, update_logging_config, _logging_config
+from app.utilities.app_logging_helper import log_with_route, reload_logging_config, update_logging_config, _logging_config, get_remote_logging_stats
+from app.utilities.log_store import RedisLogStore
+from app.utilities.chat.memory_pipeline import get_memory_queue_depth
 from app.utilities.app_get_current_user import get_current_user
 from app.utilities.guided_tour_manager import create_tour, get_all_tours, get_tour_for_page, update_tour_steps, deactivate_tour
 import logging
@@ -329,70 +331,42 @@ def view_logs():
 @admin_permission.require(http_exception=403)
 def get_logs():
     try:
-        limit = int(request.args.get('limit', 100))
-        level = request.args.get('level')
-        source_type = request.args.get('source_type')
+        limit = min(int(request.args.get('limit', 100)), 500)
         time_filter = request.args.get('time')
 
         start_time = None
         if time_filter:
             if time_filter == '1h':
-                start_time = datetime.utcnow() - timedelta(hours=1)
+                start_time = time.time() - 3600
             elif time_filter == '24h':
-                start_time = datetime.utcnow() - timedelta(days=1)
+                start_time = time.time() - 86400
             elif time_filter == '7d':
-                start_time = datetime.utcnow() - timedelta(days=7)
-
-        logs = get_logs_from_redis(limit, level, source_type, start_time)
-        return jsonify({'logs': logs})
+                start_time = time.time() - 7 * 86400
+
+        page = RedisLogStore().query(
+            get_admin_redis_client(),
+            limit=limit,
+            before=request.args.get('before') or None,
+            start_time=start_time,
+            level=request.args.get('level'),
+            source_type=request.args.get('source_type'),
+            route=request.args.get('route'),
+            client_ip=request.args.get('client_ip'),
+            tenant_uuid=request.args.get('tenant'),
+        )
+        return jsonify(page)
     except Exception as e:
         log_with_route(logging.ERROR, f"Error fetching logs: {str(e)}")
         return jsonify({'error': 'Failed to fetch logs'}), 500
 
-        # Add to your admin.py route file
-
 @admin_bp.route('/api/logs/metrics')
 @admin_permission.require(http_exception=403)
 def get_log_metrics():
     try:
         redis_client = get_admin_redis_client()
 
-        # Get total logs count
-        total_logs = redis_client.llen('wegweiser_logs')
-
-        # Calculate error rate for last 24h
-        errors = 0
-        total = 0
-        now = datetime.utcnow()
-        logs = redis_client.lrange('wegweiser_logs', 0, 1000)  # Get last 1000 logs for sampling
-
-        for log_data in logs:
-            try:
-                log = json.loads(log_data)
-                log_time = datetime.fromisoformat(log['created_at'])
-                if now - log_time <= timedelta(hours=24):
-                    total += 1
-                    if log.get('level') == 'ERROR':
-                        errors += 1
-            except json.JSONDecodeError:
-                continue
-
-        error_rate = round((errors / total * 100) if total > 0 else 0, 2)
-
-        # Calculate logs per minute (last 5 minutes)
-        recent_logs = 0
-        five_mins_ago = now - timedelta(minutes=5)
-
-        for log_data in logs[:100]:  # Sample last 100 logs for recent activity
-            try:
-                log = json.loads(log_data)
-                log_time = datetime.fromisoformat(log['created_at'])
-                if log_time >= five_mins_ago:
-                    recent_logs += 1
-            except json.JSONDecodeError:
-                continue
-
-        logs_per_minute = round(recent_logs / 5, 1)
+        # Counts come from the level indexes of the log store
+        metrics = RedisLogStore().metrics(redis_client)
 
         # Get average health score from Redis if available
         try:
@@ -400,18 +374,28 @@ def get_log_metrics():
         except:
             avg_health_score = 0
 
-        return jsonify({
-            'total_logs': total_logs,
-            'error_rate': error_rate,
-            'logs_per_minute': logs_per_minute,
-            'avg_health_score': avg_health_score
-        })
+        return jsonify(dict(
+            metrics,
+            avg_health_score=avg_health_score,
+            shipper=get_remote_logging_stats()
+        ))
 
     except Exception as e:
         log_with_route(logging.ERROR, f"Error fetching log metrics: {str(e)}")
         return jsonify({'error': 'Failed to fetch metrics'}), 500
 
 
+@admin_bp.route('/api/ai-memory/queue')
+@admin_permission.require(http_exception=403)
+def ai_memory_queue():
+    """Chat turns and trickle-up notes waiting in the background memory pipeline"""
+    try:
+        return jsonify(get_memory_queue_depth())
+    except Exception as e:
+        log_with_route(logging.ERROR, f"Error fetching AI memory queue depth: {str(e)}")
+        return jsonify({'error': 'Failed to fetch AI memory queue depth'}), 500
+
+
 @admin_bp.route('/admin/celery-tasks')
 @admin_permission.require(http_exception=403)
 def celery_tasks():
@@ -1477,6 +1461,10 @@ def delete_tenant_cascade(tenant_uuid):
             HealthScoreHistory.entity_uuid.in_(all_entity_uuids)
         ).delete(synchronize_session=False)
         log_with_route(logging.DEBUG, f"Deleted {deleted_health_history} health score history records for tenant {tenant_uuid}")
+        deleted_health_rollups = HealthScoreRollup.query.filter(
+            HealthScoreRollup.entity_uuid.in_(all_entity_uuids)
+        ).delete(synchronize_session=False)
+        log_with_route(logging.DEBUG, f"Deleted {deleted_health_rollups} health score rollup records for tenant {tenant_uuid}")
 
         # Special handling for SnippetsHistory (related through snippetuuid)
         # First get all snippet UUIDs for this tenant
@@ -176,11 +176,7 @@ def debug_status():
 @admin_permission.require(http_exception=403)
 def agent_rpc():
     """Send RPC command to agent via NATS"""
-    import asyncio
-    import uuid
-    import json
-    import time
-    from app.utilities.nats_manager import nats_manager
+    from app.utilities.nats_command_bridge import run_device_command
     from app.models import Tenants
 
     user = get_current_user()
@@ -202,99 +198,8 @@ def agent_rpc():
 
         tenant_uuid = str(tenants[0].tenantuuid)
 
-        # Create RPC request
-        request_id = str(uuid.uuid4())
-        rpc_request = {
-            'action': action,
-            'args': args,
-            'request_id': request_id,
-            'requested_by': user_email,
-            'tenant_uuid': tenant_uuid,
-            'timestamp': int(time.time() * 1000)
-        }
-
-        # Send via NATS command pattern (matching existing infrastructure)
-        async def send_command():
-            try:
-                # Use direct NATS connection like the working agent
-                import nats
-                nc = await nats.connect("tls://nats.wegweiser.tech:443")
-
-                # Send command
-                command_subject = f"tenant.{tenant_uuid}.device.{device_uuid}.command"
-                command_payload = {
-                    'payload': {
-                        'command': action,
-                        'command_id': request_id,
-                        'parameters': args
-                    }
-                }
-
-                await nc.publish(command_subject, json.dumps(command_payload).encode())
-
-                # Listen for response
-                response_subject = f"tenant.{tenant_uuid}.device.{device_uuid}.response"
-                response_received = asyncio.Event()
-                response_data = {}
-
-                async def response_handler(msg):
-                    nonlocal response_data
-                    try:
-                        data = json.loads(msg.data.decode())
-                        if data.get('command_id') == request_id:
-                            response_data = data
-                            response_received.set()
-                    except Exception as e:
-                        log_with_route(logging.ERROR, f"Error parsing response: {e}")
-
-                # Subscribe to response
-                sub = await nc.subscribe(response_subject, cb=response_handler)
-
-                # Wait for response with timeout
-                try:
-                    await asyncio.wait_for(response_received.wait(), timeout=30.0)
-                    await sub.unsubscribe()
-                    return response_data.get('result', response_data)
-                except asyncio.TimeoutError:
-                    await sub.unsubscribe()
-                    return {'error': 'Command timeout - agent did not respond'}
-                finally:
-                    # Clean up NATS connection
-                    try:
-                        await nc.close()
-                    except:
-                        pass
-
-            except Exception as e:
-                log_with_route(logging.ERROR, f"Command error: {str(e)}")
-                return {'error': f'Command failed: {str(e)}'}
-
-        # Run async function with proper event loop handling
-        try:
-            # Try to get existing event loop
-            loop = asyncio.get_event_loop()
-            if loop.is_closed():
-                raise RuntimeError("Event loop is closed")
-        except RuntimeError:
-            # Create new event loop if none exists or is closed
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-        try:
-            result = loop.run_until_complete(send_command())
-        except Exception as e:
-            log_with_route(logging.ERROR, f"Event loop error: {str(e)}")
-            # Try with a fresh loop as fallback
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                result = loop.run_until_complete(send_command())
-            finally:
-                loop.close()
-        finally:
-            # Only close if we created a new loop
-            if not loop.is_running():
-                loop.close()
+        # Send via the shared NATS command bridge (one connection per worker)
+        result = run_device_command(tenant_uuid, device_uuid, action, args)
 
         log_with_route(logging.INFO, f"Agent RPC {action} to {device_uuid} by {user_email}")
 
@@ -12,7 +12,6 @@ from flask_wtf.csrf import CSRFProtect
 from sqlalchemy import text, desc
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from sqlalchemy.orm import joinedload, aliased
-from sqlalchemy.inspection import inspect
 
 # Standard library imports
 import logging
@@ -30,13 +29,9 @@ import string
 
 # Models and database
 from app.models import (
-    db, Devices, Organisations, Groups, DeviceMetadata, HealthScoreHistory,
+    db, Devices, Organisations, Groups,
     Accounts, Tenants, Roles, UserXOrganisation, TenantMetadata, Tags,
-    TagsXDevices, Snippets, DeviceBattery, DeviceDrives, DeviceMemory,
-    DeviceNetworks, DeviceStatus, Messages, DeviceUsers, DevicePartitions,
-    DeviceCpu, DeviceGpu, DeviceBios, DeviceCollector, DevicePrinters, DevicePciDevices,
-    DeviceUsbDevices, DeviceDrivers, Messages, TagsXDevices, DeviceRealtimeData, DeviceRealtimeHistory,
-    DeviceConnectivity, AgentUpdateHistory
+    TagsXDevices, Snippets, TagsXDevices, AgentUpdateHistory, DeviceDeletionJob
 )
 from app.utilities.guided_tour_manager import get_tour_for_page
 
@@ -46,7 +41,9 @@ from app.utilities.app_access_login_required import login_required
 from app.utilities.app_access_role_required import role_required
 from app.utilities.notifications import create_notification
 from app.utilities.ui_devices_delete_device import delete_devices
+from app.utilities.device_backup import backup_and_delete_devices, delete_devices_job_task
 from app.utilities.app_logging_helper import log_with_route
+from app.utilities.health_score_timeseries import get_chart_health_series
 from app.utilities.ui_devices_printers import fetch_printers_by_device
 from app.utilities.ui_devices_eventlogs import fetch_event_logs_by_device
 from app.utilities.ui_devices_devicetable import get_devices_table_data
@@ -299,223 +296,14 @@ def get_organisations_groups():
 
 
 
-def ensure_backup_directory():
-    """
-    Ensure the backup directory exists and is properly configured at /var/log/wegweiser/device_backups.
-    Falls back to /tmp if there are permission issues.
-    """
-    backup_dir = '/var/log/wegweiser/device_backups'
-
-    try:
-        # First try the preferred location
-        os.makedirs(backup_dir, mode=0o755, exist_ok=True)
-
-        # Verify we can actually write to it
-        test_file = os.path.join(backup_dir, '.write_test')
-        try:
-            with open(test_file, 'w') as f:
-                f.write('test')
-            os.remove(test_file)
-            log_with_route(logging.INFO, f"Using backup directory: {backup_dir}")
-        except Exception as e:
-            log_with_route(logging.WARNING, f"Cannot write to {backup_dir}: {str(e)}")
-            raise
-
-    except Exception as e:
-        log_with_route(logging.WARNING,
-            f"Failed to use {backup_dir}, falling back to /tmp/wegweiser/device_backups: {str(e)}")
-
-        # Fall back to /tmp
-        backup_dir = '/tmp/wegweiser/device_backups'
-        os.makedirs(backup_dir, mode=0o755, exist_ok=True)
-        log_with_route(logging.INFO, f"Using fallback backup directory: {backup_dir}")
-
-    return backup_dir
-
-def backup_device_data(device_uuid):
-    """
-    Create a complete backup of all device-related data before deletion.
-    Returns the path to the backup file.
-    """
-    device = Devices.query.get(device_uuid)
-    if not device:
-        raise ValueError(f"Device {device_uuid} not found")
-
-    # Initialize backup dictionary
-    backup_data = {
-        "device_info": {},
-        "tables": {}
-    }
-
-    # Get device name for the filename
-    device_name = device.devicename
-
-    # Backup main device info
-    device_mapper = inspect(Devices)
-    for column in device_mapper.columns:
-        value = getattr(device, column.key)
-        if isinstance(value, UUID):
-            value = str(value)
-        backup_data["device_info"][column.key] = value
-
-    # Define all related tables to backup
-    related_tables = {
-        "device_metadata": DeviceMetadata,
-        "device_battery": DeviceBattery,
-        "device_drives": DeviceDrives,
-        "device_memory": DeviceMemory,
-        "device_networks": DeviceNetworks,
-        "device_status": DeviceStatus,
-        "device_users": DeviceUsers,
-        "device_partitions": DevicePartitions,
-        "device_cpu": DeviceCpu,
-        "device_gpu": DeviceGpu,
-        "device_bios": DeviceBios,
-        "device_collector": DeviceCollector,
-        "device_printers": DevicePrinters,
-        "device_pci_devices": DevicePciDevices,
-        "device_usb_devices": DeviceUsbDevices,
-        "device_drivers": DeviceDrivers,
-        "device_connectivity": DeviceConnectivity,  # Add this line
-        "messages": Messages,
-        "tags_x_devices": TagsXDevices,
-        "device_realtime_data": DeviceRealtimeData,
-        "device_realtime_history": DeviceRealtimeHistory
-    }
-
-    # Backup data from each related table
-    for table_name, model in related_tables.items():
-        backup_data["tables"][table_name] = []
-
-        # Special handling for Messages table which uses entityuuid and entity_type
-        if model == Messages:
-            results = model.query.filter_by(entityuuid=device_uuid, entity_type='device').all()
-        else:
-            results = model.query.filter_by(deviceuuid=device_uuid).all()
-
-        for row in results:
-            row_data = {}
-            mapper = inspect(model)
-            for column in mapper.columns:
-                value = getattr(row, column.key)
-                if isinstance(value, UUID):
-                    value = str(value)
-                elif isinstance(value, bytes):
-                    value = value.decode('utf-8', errors='ignore')
-                row_data[column.key] = value
-            backup_data["tables"][table_name].append(row_data)
-
-    # Ensure backup directory exists
-    backup_dir = ensure_backup_directory()
-
-    # Create filename with timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    safe_device_name = "".join(x for x in device_name if x.isalnum() or x in ('-', '_'))
-    filename = f"{safe_device_name}_{device_uuid}_{timestamp}.json"
-    filepath = os.path.join(backup_dir, filename)
-
-    # Write backup to file
-    with open(filepath, 'w') as f:
-        json.dump(backup_data, f, indent=2, default=str)
-
-    log_with_route(logging.INFO, f"Created backup at {filepath}")
-    return filepath
-
-def delete_device_cascade(device_uuid):
-    """
-    Delete a device and all its related data with proper error handling and logging.
-    Uses dynamic discovery of dependent tables with correct deletion order.
-    """
-    try:
-        device = Devices.query.get(device_uuid)
-        if not device:
-            raise ValueError(f"Device {device_uuid} not found")
-
-        device_name = device.devicename  # Get name before deletion for the message
-
-        # Define explicit deletion order to respect foreign key constraints
-        # Messages must be deleted before conversations
-        # Conversations must be deleted before devices
-        deletion_order = [
-            # First: Delete leaf tables (no other tables depend on them)
-            ('messages', 'entityuuid', 'entity_type'),  # Special: uses entityuuid + entity_type
-            ('health_score_history', 'entity_uuid', 'entity_type'),  # Special: entity_uuid + entity_type
-
-            # Then: Delete all device-related data tables
-            ('devicebattery', 'deviceuuid', None),
-            ('devicebios', 'deviceuuid', None),
-            ('devicecollector', 'deviceuuid', None),
-            ('devicecpu', 'deviceuuid', None),
-            ('devicedrivers', 'deviceuuid', None),
-            ('devicedrives', 'deviceuuid', None),
-            ('devicegpu', 'deviceuuid', None),
-            ('devicememory', 'deviceuuid', None),
-            ('devicemetadata', 'deviceuuid', None),
-            ('devicenetworks', 'deviceuuid', None),
-            ('devicepartitions', 'deviceuuid', None),
-            ('devicepcidevices', 'deviceuuid', None),
-            ('deviceprinters', 'deviceuuid', None),
-            ('devicestatus', 'deviceuuid', None),
-            ('deviceusbdevices', 'deviceuuid', None),
-            ('deviceusers', 'deviceuuid', None),
-            ('devicerealtimedata', 'deviceuuid', None),
-            ('devicerealtimehistory', 'deviceuuid', None),
-            ('deviceconnectivity', 'deviceuuid', None),
-            ('device_osquery', 'deviceuuid', None),
-            ('device_audit_json_test', 'deviceuuid', None),
-            ('agent_update_history', 'deviceuuid', None),
-            ('snippetsschedule', 'deviceuuid', None),
-            ('tagsxdevices', 'deviceuuid', None),
-
-            # Finally: Delete conversations (after messages are gone)
-            ('conversations', 'deviceuuid', None),
-        ]
-
-        # Execute deletions in order
-        for table_info in deletion_order:
-            table_name = table_info[0]
-            column_name = table_info[1]
-            entity_type_column = table_info[2] if len(table_info) > 2 else None
-
-            try:
-                # Build the appropriate DELETE query
-                if entity_type_column:
-                    delete_query = text(
-                        f"DELETE FROM {table_name} WHERE {column_name} = :device_uuid AND {entity_type_column} = 'device'"
-                    )
-                else:
-                    delete_query = text(
-                        f"DELETE FROM {table_name} WHERE {column_name} = :device_uuid"
-                    )
-
-                result = db.session.execute(delete_query, {'device_uuid': device_uuid})
-                deleted_count = result.rowcount
-
-                if deleted_count > 0:
-                    log_with_route(logging.DEBUG, f"Deleted {deleted_count} records from {table_name} for device {device_uuid}")
-
-            except Exception as table_error:
-                # If a table doesn't exist or has issues, log and continue
-                log_with_route(logging.DEBUG, f"Skipping {table_name}: {str(table_error)}")
-                continue
-
-        # Delete the device itself using raw SQL
-        device_delete_query = text("DELETE FROM devices WHERE deviceuuid = :device_uuid")
-        db.session.execute(device_delete_query, {'device_uuid': device_uuid})
-        db.session.commit()
-
-        log_with_route(logging.INFO, f"Successfully deleted device {device_name} ({device_uuid})")
-        return True, device_name
-
-    except Exception as e:
-        db.session.rollback()
-        log_with_route(logging.ERROR, f"Error in cascade delete for device {device_uuid}: {str(e)}")
-        raise
-
 @devices_bp.route('/delete', methods=['POST'])
 def delete_device():
     """
-    Enhanced device deletion endpoint that creates a backup before deletion
+    Device deletion endpoint that creates a backup before deletion.
+
+    Up to DEVICE_DELETE_SYNC_MAX devices are deleted in the request; larger
+    selections (or "background": true) are queued as a deletion job whose
+    progress is reported by /devices/delete/jobs/<job_uuid>.
     """
     data = request.get_json()
     deviceuuids = data.get('deviceuuids')
@@ -524,39 +312,37 @@ def delete_device():
         flash('No devices selected for deletion', 'error')
         return jsonify({'error': 'No device UUIDs provided'}), 400
 
-    success_count = 0
-    error_count = 0
-    results = []
+    deviceuuids = [str(device_uuid) for device_uuid in deviceuuids]
 
     try:
-        for device_uuid in deviceuuids:
-            try:
-                # Create backup first
-                backup_path = backup_device_data(device_uuid)
-
-                # Perform cascade deletion
-                success, device_name = delete_device_cascade(device_uuid)
-
-                if success:
-                    success_count += 1
-                    flash(f'Successfully deleted device {device_name}', 'success')
-                    results.append({
-                        'deviceuuid': device_uuid,
-                        'status': 'success',
-                        'backup_path': backup_path,
-                        'message': f'Device {device_name} deleted successfully'
-                    })
-
-            except Exception as e:
-                error_count += 1
-                error_msg = str(e)
-                flash(f'Error deleting device: {error_msg}', 'error')
-                results.append({
-                    'deviceuuid': device_uuid,
-                    'status': 'error',
-                    'error': error_msg
-                })
-                log_with_route(logging.ERROR, f"Error deleting device {device_uuid}: {error_msg}")
+        if data.get('background') or len(deviceuuids) > current_app.config.get('DEVICE_DELETE_SYNC_MAX', 5):
+            job = DeviceDeletionJob(
+                tenantuuid=session.get('tenant_uuid'),
+                requested_by=session.get('user_id'),
+                deviceuuids=deviceuuids,
+                total=len(deviceuuids),
+                results=[]
+            )
+            db.session.add(job)
+            db.session.commit()
+            delete_devices_job_task.delay(str(job.jobuuid))
+
+            message = f"Deletion of {len(deviceuuids)} devices started in the background"
+            flash(message, 'info')
+            return jsonify({
+                'message': message,
+                'job_uuid': str(job.jobuuid),
+                'status_url': url_for('devices_bp.get_device_deletion_job', job_uuid=job.jobuuid)
+            }), 202
+
+        results = backup_and_delete_devices(deviceuuids)
+        success_count = sum(1 for result in results if result['status'] == 'success')
+        error_count = len(results) - success_count
+        for result in results:
+            if result['status'] == 'success':
+                flash(f"Successfully deleted device {result['devicename']}", 'success')
+            else:
+                flash(f"Error deleting device: {result['error']}", 'error')
 
         summary_message = f"Deletion complete. {success_count} devices deleted successfully"
         if error_count > 0:
@@ -577,6 +363,17 @@ def delete_device():
         return jsonify({'error': error_msg}), 500
 
 
+@devices_bp.route('/delete/jobs/<uuid:job_uuid>', methods=['GET'])
+@login_required
+def get_device_deletion_job(job_uuid):
+    """Progress and per-device results of a background deletion job"""
+    job = DeviceDeletionJob.query.get(job_uuid)
+    # Admins see every job; everyone else only their own tenant's
+    if not job or (session.get('role') != 'admin' and str(job.tenantuuid) != str(session.get('tenant_uuid'))):
+        return jsonify({'error': 'Deletion job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
 
 
 @devices_bp.route('/grouped', methods=['GET'])
@@ -890,13 +687,7 @@ def get_device_health_history(device_uuid):
         device = Devices.query.get_or_404(device_uuid)
 
         # Get historical health scores
-        history = HealthScoreHistory.query.filter_by(
-            entity_type='device',
-            entity_uuid=device_uuid
-        ).order_by(HealthScoreHistory.timestamp).all()
-
-        # Format data for response
-        data = [{'x': h.timestamp.isoformat(), 'y': h.health_score} for h in history]
+        data = get_chart_health_series('device', [device_uuid])
 
         # Add current health score if available
         if device.health_score is not None:
@@ -2,13 +2,13 @@
 """
 Device Restoration Routes
 
-Handles restoration of deleted devices from backup JSON files.
+Handles restoration of deleted devices from backup files.
 """
 
 import logging
 from flask import jsonify, request
 from app.routes.devices import devices_bp
-from app.utilities.device_restore import restore_device_from_backup, find_device_backup, list_available_backups
+from app.utilities.device_restore import restore_device_from_backup, find_device_backup, list_available_backups, read_backup_device_info
 from app.utilities.app_logging_helper import log_with_route
 from app.utilities.app_access_login_required import login_required
 from app import master_permission
@@ -19,7 +19,7 @@ from app import master_permission
 @master_permission.require(http_exception=403)
 def restore_device(device_uuid):
     """
-    Restore a deleted device from its backup JSON file.
+    Restore a deleted device from its backup file.
     
     This endpoint allows manual restoration of a device that was previously deleted.
     The device will be recreated with all its historical data from the backup.
@@ -70,7 +70,6 @@ def check_device_backup(device_uuid):
         
         if backup_path:
             import os
-            import json
             
             # Get backup file info
             file_size = os.path.getsize(backup_path)
@@ -79,9 +78,7 @@ def check_device_backup(device_uuid):
             # Try to read device name from backup
             device_name = None
             try:
-                with open(backup_path, 'r') as f:
-                    backup_data = json.load(f)
-                    device_name = backup_data.get('device_info', {}).get('devicename')
+                device_name = read_backup_device_info(backup_path).get('devicename')
             except:
                 pass
             
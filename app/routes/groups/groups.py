@@ -2,7 +2,7 @@
 # Filepath: app/routes/tenant/groups.py
 # Filepath: app/routes/groups.py
 from flask import Blueprint, request, jsonify, session, render_template, flash, redirect, url_for
-from app.models import db, Groups, Organisations, Devices, Tenants, Messages, Conversations, HealthScoreHistory, GroupMetadata
+from app.models import db, Groups, Organisations, Devices, Tenants, Messages, Conversations, GroupMetadata
 from app.forms.group_form import GroupForm
 from app.forms.chat_form import ChatForm
 import uuid
@@ -13,6 +13,7 @@ from sqlalchemy import text, desc
 from app.utilities.app_access_login_required import login_required
 import logging
 from app.utilities.app_logging_helper import log_with_route
+from app.utilities.health_score_timeseries import get_chart_health_series
 import bleach
 from app.utilities.langchain_utils import create_langchain_conversation, get_ai_response, adapt_response_style
 from app.routes.ai.ai import get_or_create_conversation
@@ -35,13 +36,7 @@ def get_group_health_history(group_uuid):
             return jsonify({'error': 'Group not found'}), 404
 
         # Retrieve health history records for the group
-        history = HealthScoreHistory.query.filter_by(
-            entity_type='group',
-            entity_uuid=group_uuid
-        ).order_by(HealthScoreHistory.timestamp).all()
-
-        # Format the health history data for the chart
-        data = [{'x': h.timestamp.isoformat(), 'y': h.health_score} for h in history]
+        data = get_chart_health_series('group', [group_uuid])
 
         # Append the current health score
         data.append({
@@ -2,13 +2,14 @@
 # Filepath: app/routes/tenant/organisations.py
 # Filepath: app/routes/organisations.py
 from flask import Blueprint, request, redirect, url_for, session, render_template, flash, jsonify
-from app.models import db, Organisations, Groups, HealthScoreHistory, UserXOrganisation, OrganizationMetadata, Tenants
+from app.models import db, Organisations, Groups, UserXOrganisation, OrganizationMetadata, Tenants
 from app.forms.organisation_form import OrganisationForm  # We'll create this form
 import uuid
 from sqlalchemy.exc import IntegrityError
 from app.utilities.app_access_login_required import login_required
 import logging
 from app.utilities.app_logging_helper import log_with_route
+from app.utilities.health_score_timeseries import get_chart_health_series
 from flask import request, jsonify
 from flask_wtf.csrf import CSRFProtect
 from app import csrf
@@ -90,13 +91,7 @@ def get_organisation_health_history(organisation_uuid):
             return jsonify({'error': 'Organisation not found'}), 404
 
         # Retrieve health history records for the organisation
-        history = HealthScoreHistory.query.filter_by(
-            entity_type='organisation',
-            entity_uuid=organisation_uuid
-        ).order_by(HealthScoreHistory.timestamp).all()
-
-        # Format the health history data for the chart
-        data = [{'x': h.timestamp.isoformat(), 'y': h.health_score} for h in history]
+        data = get_chart_health_series('organisation', [organisation_uuid])
 
         # Append the current health score
         data.append({
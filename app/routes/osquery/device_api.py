@@ -14,7 +14,8 @@ from app.utilities.app_get_current_user import get_current_user
 from app.utilities.app_access_login_required import login_required
 from app.models import Devices, Tenants
 from . import osquery_bp
-from .nats_utils import send_nats_command, execute_async_command
+from .nats_utils import send_nats_command
+from app.utilities.device_commands import queue_device_command
 
 # Permissions
 admin_permission = Permission(RoleNeed('admin'))
@@ -110,16 +111,20 @@ def send_device_command(device_uuid):
         if not action:
             return jsonify({'error': 'action is required'}), 400
         
+        # Asynchronous clients poll /api/device/commands/<command_id> for the result
+        if data.get('async'):
+            command_id = queue_device_command(tenantuuid, device_uuid_str, action, args)
+            log_with_route(logging.INFO, f"Device command {action} to {device_uuid_str} queued as {command_id} by {user_email}")
+            return jsonify({'command_id': command_id, 'status': 'pending'}), 202
+        
         # Send command via NATS using shared function
-        command_coro = send_nats_command(
+        result = send_nats_command(
             tenantuuid=tenantuuid,
             device_uuid=device_uuid_str,
             action=action,
             args=args,
             user_email=user_email
         )
-
-        result = execute_async_command(command_coro)
         
         log_with_route(logging.INFO, f"Device command {action} to {device_uuid_str} by {user_email}")
         return jsonify(result)
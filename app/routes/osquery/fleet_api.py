@@ -0,0 +1,98 @@
+# Filepath: app/routes/osquery/fleet_api.py
+"""
+Fleet Query API Routes
+Runs one osquery query across every online device of a group, organisation or tenant
+"""
+
+from flask import jsonify, request, session
+import logging
+
+from app import csrf
+from app.utilities.app_logging_helper import log_with_route
+from app.utilities.app_get_current_user import get_current_user
+from app.utilities.app_access_login_required import login_required
+from app.models import FleetQueryJob
+from app.utilities.fleet_query import (
+    SCOPE_TYPES, create_fleet_query, get_fleet_query_results, get_fleet_query_rows,
+    is_allowed_fleet_query, scope_exists
+)
+from . import osquery_bp
+
+
+def _tenant_job(job_uuid):
+    """The job if it belongs to the session's tenant"""
+    job = FleetQueryJob.query.get(job_uuid)
+    if job is None or str(job.tenantuuid) != str(session.get('tenant_uuid')):
+        return None
+    return job
+
+
+@osquery_bp.route('/api/fleet/query', methods=['POST'])
+@csrf.exempt
+@login_required
+def start_fleet_query():
+    """Queue a query for every online device in a scope"""
+    try:
+        tenant_uuid = session.get('tenant_uuid')
+        if not tenant_uuid:
+            return jsonify({'error': 'No tenant in session'}), 403
+
+        data = request.get_json() or {}
+        query = (data.get('query') or '').strip()
+        scope_type = data.get('scope_type', 'tenant')
+        scope_uuid = data.get('scope_uuid') or (tenant_uuid if scope_type == 'tenant' else None)
+
+        if not query:
+            return jsonify({'error': 'query is required'}), 400
+        if not is_allowed_fleet_query(query):
+            log_with_route(logging.WARNING, f"[FLEET] Rejected query: {query}")
+            return jsonify({'error': 'Only SELECT queries and CTEs can be run across devices'}), 400
+        if scope_type not in SCOPE_TYPES or not scope_uuid:
+            return jsonify({'error': f"scope_type must be one of {', '.join(SCOPE_TYPES)} with a scope_uuid"}), 400
+        if not scope_exists(tenant_uuid, scope_type, scope_uuid):
+            return jsonify({'error': 'Scope not found'}), 404
+
+        user = get_current_user()
+        job = create_fleet_query(tenant_uuid, scope_type, scope_uuid, query,
+                                 requested_by=user.useruuid if user else None)
+        log_with_route(logging.INFO, f"[FLEET] Queued fleet query {job.jobuuid} on {job.total} devices "
+                                     f"({scope_type} {scope_uuid})")
+        response = job.to_dict()
+        response['status_url'] = f"/osquery/api/fleet/query/{job.jobuuid}"
+        response['rows_url'] = f"/osquery/api/fleet/query/{job.jobuuid}/rows"
+        return jsonify(response), 202
+
+    except Exception as e:
+        log_with_route(logging.ERROR, f"[FLEET] Error starting fleet query: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@osquery_bp.route('/api/fleet/query/<uuid:job_uuid>', methods=['GET'])
+@login_required
+def fleet_query_status(job_uuid):
+    """Job progress plus the device results received after result id `since`"""
+    job = _tenant_job(job_uuid)
+    if job is None:
+        return jsonify({'error': 'Fleet query not found'}), 404
+
+    since = request.args.get('since', 0, type=int)
+    response = job.to_dict()
+    response['results'] = get_fleet_query_results(job.jobuuid, since=since)
+    response['next_since'] = response['results'][-1]['id'] if response['results'] else since
+    return jsonify(response), 200
+
+
+@osquery_bp.route('/api/fleet/query/<uuid:job_uuid>/rows', methods=['GET'])
+@login_required
+def fleet_query_rows(job_uuid):
+    """One page of the merged result rows, each tagged with its device"""
+    job = _tenant_job(job_uuid)
+    if job is None:
+        return jsonify({'error': 'Fleet query not found'}), 404
+
+    page = request.args.get('page', 1, type=int)
+    per_page = min(max(request.args.get('per_page', 100, type=int), 1), 1000)
+    response = get_fleet_query_rows(job.jobuuid, page=page, per_page=per_page)
+    response['total_rows'] = job.row_count
+    response['status'] = job.status
+    return jsonify(response), 200
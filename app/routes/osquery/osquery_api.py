@@ -13,11 +13,14 @@ from app import csrf
 from app.utilities.app_logging_helper import log_with_route
 from app.utilities.app_get_current_user import get_current_user
 from app.utilities.app_access_login_required import login_required
-from app.models import Devices, Messages, Conversations, db
+from app.models import Devices, Messages, Conversations
 from . import osquery_bp
-from .nats_utils import send_nats_command, execute_async_command
-import json
+from .nats_utils import send_nats_command, submit_nats_command, wait_for_command
 from app.utilities.osquery_utils import OSQueryUtility
+from app.utilities.device_commands import queue_device_command, get_queued_command, save_terminal_history
+
+# Schema requests sent to an agent at once while prefetching
+SCHEMA_PREFETCH_CONCURRENCY = 16
 
 @osquery_bp.route('/api/device/<uuid:device_uuid>/osquery', methods=['POST'])
 @csrf.exempt
@@ -90,8 +93,17 @@ def execute_osquery(device_uuid):
         log_with_route(logging.INFO, f"[OSQUERY] Sending NATS command to subject: tenant.{tenantuuid}.device.{device_uuid_str}.command")
         log_with_route(logging.INFO, f"[OSQUERY] Command payload - Action: {action}, Args: {args}")
 
+        # Asynchronous clients get a command id to poll instead of holding this worker
+        if data.get('async'):
+            command_id = queue_device_command(
+                tenantuuid, device_uuid_str, action, args,
+                history={'useruuid': str(user.useruuid) if user else None, 'query': query}
+            )
+            log_with_route(logging.INFO, f"[OSQUERY] Queued command {command_id} for {user_email}")
+            return jsonify({'command_id': command_id, 'status': 'pending'}), 202
+
         # Send osquery command via NATS (using exact same format as admin dashboard)
-        command_coro = send_nats_command(
+        result = send_nats_command(
             tenantuuid=tenantuuid,
             device_uuid=device_uuid_str,
             action=action,
@@ -99,52 +111,10 @@ def execute_osquery(device_uuid):
             user_email=user_email
         )
 
-        log_with_route(logging.INFO, f"[OSQUERY] Executing async command...")
-        result = execute_async_command(command_coro)
-
         log_with_route(logging.INFO, f"[OSQUERY] Result received: {result}")
 
-        # Save terminal history to Messages table
-        try:
-            # Get or create conversation for this device
-            conversation = Conversations.get_or_create_conversation(
-                tenantuuid=device.tenantuuid,
-                entityuuid=device.deviceuuid,
-                entity_type='device'
-            )
-
-            # Save query message (user)
-            query_msg = Messages(
-                conversationuuid=conversation.conversationuuid,
-                useruuid=user.useruuid if user else None,
-                tenantuuid=device.tenantuuid,
-                entityuuid=device.deviceuuid,
-                entity_type='device',
-                title='Terminal Query',
-                content=query,
-                message_type='terminal'
-            )
-            db.session.add(query_msg)
-
-            # Save result message (system/AI)
-            result_msg = Messages(
-                conversationuuid=conversation.conversationuuid,
-                useruuid=None,  # System message
-                tenantuuid=device.tenantuuid,
-                entityuuid=device.deviceuuid,
-                entity_type='device',
-                title='Terminal Result',
-                content=json.dumps(result),
-                message_type='terminal'
-            )
-            db.session.add(result_msg)
-            db.session.commit()
-
-            log_with_route(logging.INFO, f"[OSQUERY] Terminal history saved successfully")
-        except Exception as e:
-            log_with_route(logging.ERROR, f"[OSQUERY] Failed to save terminal history: {str(e)}")
-            db.session.rollback()
-            # Don't fail the request if history save fails
+        # Save terminal history to Messages table; a failure does not fail the request
+        save_terminal_history(device.tenantuuid, device.deviceuuid, user.useruuid if user else None, query, result)
 
         return jsonify(result)
 
@@ -152,6 +122,26 @@ def execute_osquery(device_uuid):
         log_with_route(logging.ERROR, f"Osquery execution error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@osquery_bp.route('/api/device/commands/<command_id>', methods=['GET'])
+@login_required
+def get_device_command(command_id):
+    """Poll a command queued with async=true; 202 while it is still running"""
+    try:
+        payload = get_queued_command(command_id)
+        if payload is None:
+            return jsonify({'command_id': command_id, 'status': 'pending'}), 202
+
+        # Only the device's tenant (or an admin) may read the result
+        if (session.get('role') != 'admin' and payload.get('tenantuuid')
+                and payload['tenantuuid'] != str(session.get('tenant_uuid'))):
+            return jsonify({'error': 'Command not found'}), 404
+
+        return jsonify({'command_id': command_id, 'status': 'completed', 'result': payload['result']})
+
+    except Exception as e:
+        log_with_route(logging.ERROR, f"Command poll error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @osquery_bp.route('/api/device/<uuid:device_uuid>/osquery/tables', methods=['GET'])
 @login_required
 def get_osquery_tables(device_uuid):
@@ -170,15 +160,13 @@ def get_osquery_tables(device_uuid):
         tenantuuid = str(device.tenantuuid)
 
         # Send .tables command via NATS
-        command_coro = send_nats_command(
+        result = send_nats_command(
             tenantuuid=tenantuuid,
             device_uuid=device_uuid_str,
             action='osquery',
             args={'query': '.tables'},
             user_email=user_email
         )
-
-        result = execute_async_command(command_coro)
         return jsonify(result)
 
     except Exception as e:
@@ -203,15 +191,13 @@ def get_table_schema(device_uuid, table_name):
         tenantuuid = str(device.tenantuuid)
 
         # Send .schema command via NATS
-        command_coro = send_nats_command(
+        result = send_nats_command(
             tenantuuid=tenantuuid,
             device_uuid=device_uuid_str,
             action='osquery',
             args={'query': f'.schema {table_name}'},
             user_email=user_email
         )
-
-        result = execute_async_command(command_coro)
         return jsonify(result)
 
     except Exception as e:
@@ -321,14 +307,13 @@ def prefetch_osquery_schema(device_uuid):
                 return []
 
         # 1) Get table names
-        tables_cmd = send_nats_command(
+        tables_result = send_nats_command(
             tenantuuid=tenantuuid,
             device_uuid=device_uuid_str,
             action='osquery',
             args={'query': '.tables'},
             user_email=user_email
         )
-        tables_result = execute_async_command(tables_cmd)
         table_names = _parse_tables_from_result(tables_result)
         if not table_names:
             return jsonify({'success': False, 'error': 'Failed to enumerate tables from device'}), 502
@@ -336,19 +321,25 @@ def prefetch_osquery_schema(device_uuid):
         # Cap number of tables to avoid long prefetch
         table_names = table_names[:max_tables]
 
-        # 2) Fetch schema per table and build snapshot
+        # 2) Fetch schema per table and build snapshot; a window of requests is in flight at a time
         snapshot = []
         fetched = 0
-        for name in table_names:
-            try:
-                schema_cmd = send_nats_command(
+        schema_results = []
+        for start in range(0, len(table_names), SCHEMA_PREFETCH_CONCURRENCY):
+            window = [
+                (name, submit_nats_command(
                     tenantuuid=tenantuuid,
                     device_uuid=device_uuid_str,
                     action='osquery',
                     args={'query': f'.schema {name}'},
                     user_email=user_email
-                )
-                schema_res = execute_async_command(schema_cmd)
+                ))
+                for name in table_names[start:start + SCHEMA_PREFETCH_CONCURRENCY]
+            ]
+            schema_results.extend((name, wait_for_command(future)) for name, future in window)
+
+        for name, schema_res in schema_results:
+            try:
                 payload = schema_res.get('result') if isinstance(schema_res, dict) else schema_res
                 text = None
                 if isinstance(payload, dict) and payload.get('output'):
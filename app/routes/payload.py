@@ -1,20 +1,14 @@
 # Filepath: app/routes/payload.py
 from flask import Blueprint, request, jsonify, current_app
-from sqlalchemy.dialects.postgresql import insert
 import json
 import os
 import time
 import logging
-from jsonschema import validate, ValidationError
 from random import randrange
 import shutil
 import uuid
-from app.models import db, Devices, Organisations, Groups, \
-    DeviceStatus, DeviceBattery, DeviceMemory, \
-    DeviceNetworks, DeviceDrives, DeviceUsers, DevicePartitions, \
-    DeviceCpu, DeviceGpu, DeviceBios, DeviceCollector, Tags, \
-	TagsXDevices, Tenants, DevicePrinters, DeviceDrivers, \
-	Conversations, Messages
+from app.models import db, Devices, Organisations, Groups, Tags, \
+	TagsXDevices, Tenants, Conversations, Messages
 import requests
 from app import csrf
 from sqlalchemy.exc import IntegrityError
@@ -69,7 +63,15 @@ def receive_audit():
 	status, deviceDataDict = validateData(data, payloadAuditSchema)
 	if status:
 		deviceUuid = deviceDataDict['data']['device']['deviceUuid']
-		result = writeJsonFile(queueDir, deviceDataDict, deviceUuid, 'audit')
+		if current_app.config.get('PAYLOAD_PUSH_INGEST', False):
+			# Hand the parsed dict straight to the ingest thread; the file is only the durable spill
+			from app.utilities.payload_push import get_audit_push_queue
+			pushQueue = get_audit_push_queue(current_app._get_current_object())
+			result = writeJsonFile(pushQueue.spill_dir, deviceDataDict, deviceUuid, 'audit')
+			if result:
+				pushQueue.submit(result, deviceDataDict)
+		else:
+			result = writeJsonFile(queueDir, deviceDataDict, deviceUuid, 'audit')
 		if result:
 			return jsonify({"status": "success", "data": 'ok'}), 200
 		else:
@@ -295,40 +297,69 @@ def receive_weglog():
 @payload_bp.route('/payload/processpayloads', methods=['GET'])
 @csrf.exempt
 def processpayloads():
+    from app.utilities.payload_queue import claim_payloads, clear_attempts, get_backlog_depth, new_worker_id
+    from app.utilities.sys_function_process_payloads import release_payload_claims
+
     # Log the processing request for security monitoring
     client_ip = request.headers.get('X-Forwarded-For', request.remote_addr)
     log_with_route(logging.INFO, f'Payload processing request from IP: {client_ip}')
     startTime = time.time()
 
-    # Get the root directory of the Flask project
-    project_root            = os.path.dirname(current_app.root_path)
-    logsDir                 = os.path.join(project_root, 'logs')
-    queueDir                = os.path.join(project_root, 'payloads', 'queue')
-    invalidDir              = os.path.join(project_root, 'payloads', 'invalid')
-    noDeviceUuidDir         = os.path.join(project_root, 'payloads', 'noDeviceUuid')
-    ophanedCollectorsDir    = os.path.join(project_root, 'payloads', 'ophanedCollectors')
-    successfulImportDir     = os.path.join(project_root, 'payloads', 'sucessfulImport')
-    deviceFilesDir          = os.path.join(project_root, 'deviceFiles')
-
-    checkDir(logsDir)
-    checkDir(queueDir)
-    checkDir(invalidDir)
-    checkDir(successfulImportDir)
-    checkDir(noDeviceUuidDir)
-    checkDir(ophanedCollectorsDir)
-    checkDir(deviceFilesDir)
-
+    payloadDirs = getPayloadDirs()
     log_with_route(logging.INFO, '/payload/processpayloads begins...')
 
-    log_with_route(logging.INFO, 'processing payloads...')
-    payloadstoProcessList   = getPayloadQueue(queueDir)
-    itemsToProcess = len(payloadstoProcessList)
-    for filename in payloadstoProcessList:
-        full_path = os.path.join(queueDir, filename)
-        log_with_route(logging.DEBUG, f'Processing file: {filename}')
+    # Claim the current queue so concurrent queue workers never see the same files
+    workerId = new_worker_id('http')
+    claimedPaths = claim_payloads(payloadDirs['queue'], payloadDirs['inflight'], workerId)
+    try:
+        itemsToProcess = processPayloadFiles(claimedPaths, payloadDirs)
+    finally:
+        returned = release_payload_claims(payloadDirs, workerId)
+    clear_attempts(payloadDirs['attempts'], {os.path.basename(path) for path in claimedPaths} - set(returned))
 
-        # CRITICAL: Initialize auditDict for EACH file to prevent data leakage between files
-        auditDict = None
+    execTime = time.time() - startTime
+    backlog = get_backlog_depth(payloadDirs['queue'])
+    log_with_route(logging.INFO, f'Processed {itemsToProcess} payload(s) in {execTime} seconds. Backlog: {backlog}' )
+    return jsonify({'success': f'Processed {itemsToProcess} payload(s) in {execTime} seconds.', 'backlog': backlog}), 200
+
+
+def getPayloadDirs():
+    """Resolve (and create) the payload queue directories under the project root"""
+    project_root = os.path.dirname(current_app.root_path)
+    payloadDirs = {
+        'logs':              os.path.join(project_root, 'logs'),
+        'queue':             os.path.join(project_root, 'payloads', 'queue'),
+        'inflight':          os.path.join(project_root, 'payloads', 'inflight'),
+        'attempts':          os.path.join(project_root, 'payloads', 'attempts'),
+        'invalid':           os.path.join(project_root, 'payloads', 'invalid'),
+        'noDeviceUuid':      os.path.join(project_root, 'payloads', 'noDeviceUuid'),
+        'ophanedCollectors': os.path.join(project_root, 'payloads', 'ophanedCollectors'),
+        'successfulImport':  os.path.join(project_root, 'payloads', 'sucessfulImport'),
+        'deviceFiles':       os.path.join(project_root, 'deviceFiles'),
+    }
+    for dirToCheck in payloadDirs.values():
+        checkDir(dirToCheck)
+    return payloadDirs
+
+
+def processPayloadFiles(payloadPaths, payloadDirs):
+    """
+    Process queued payload files by type. Paths may point into the queue or into a
+    worker's in-flight directory; files that cannot be processed are left where they are.
+
+    Returns:
+        int: number of files handled
+    """
+    invalidDir          = payloadDirs['invalid']
+    successfulImportDir = payloadDirs['successfulImport']
+    deviceFilesDir      = payloadDirs['deviceFiles']
+
+    itemsToProcess = len(payloadPaths)
+    batchSize = current_app.config.get('PAYLOAD_INGEST_BATCH_SIZE', 50)
+    auditBatch = []
+    for full_path in payloadPaths:
+        filename = os.path.basename(full_path)
+        log_with_route(logging.DEBUG, f'Processing file: {filename}')
 
         # Check if file still exists (race condition protection)
         if not os.path.exists(full_path):
@@ -337,90 +368,21 @@ def processpayloads():
 
         try:
             if filename.endswith('.audit.json'):           ## PROCESS AUDIT DATA
-                log_with_route(logging.DEBUG, f'Processing: {full_path}')
-                deviceUuid, \
-                    groupUuid  = validatePayloadJson(full_path)
-                if deviceUuid:
-                    isValidDevice = getDeviceValidity(deviceUuid)
-                else:
-                    log_with_route(logging.DEBUG, f'Renaming {full_path} to {os.path.join(noDeviceUuidDir, os.path.basename(full_path))}')
-                    os.rename(full_path, os.path.join(noDeviceUuidDir, os.path.basename(full_path)))
-                    continue
-
-                if not isValidDevice:
-                    log_with_route(logging.WARNING, f'{deviceUuid} does not exist in database. Attempting to re-register it.')
-                    auditDict = getAuditDict(full_path)
-                    registration_success = reregisterOrphanedDevice(deviceUuid, auditDict)
-
-                    if registration_success:
-                        log_with_route(logging.INFO, f"Successfully re-registered device {deviceUuid}, continuing with metadata processing")
-                        isValidDevice = True
-                    else:
-                        log_with_route(logging.ERROR, f"Failed to re-register device {deviceUuid} - original group not found or other error occurred")
-                        log_with_route(logging.DEBUG, f'Moving {full_path} to {os.path.join(ophanedCollectorsDir, os.path.basename(full_path))}')
-                        os.rename(full_path, os.path.join(ophanedCollectorsDir, os.path.basename(full_path)))
-                        continue
-
-                # Now that the device is validated or re-registered, continue with processing
-                if not auditDict:  # If we haven't loaded it yet during re-registration
-                    auditDict = getAuditDict(full_path)
-                log_with_route(logging.DEBUG, f'######### AUDITDICT #########')
-                log_with_route(logging.DEBUG, f'{json.dumps(auditDict, indent=4)}')
-                upsertDeviceStatus(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceStatus completed')
-                upsertDeviceBattery(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceBattery completed')
-                upsertDeviceMemory(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceMemory completed')
-                upsertDeviceNetworks(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceNetworks completed')
-                upsertDeviceUsers(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceUsers completed')
-                upsertDevicePartitions(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDevicePartitions completed')
-                upsertDeviceDrives(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceDrives completed')
-                upsertDeviceCpu(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceCpu completed')
-                upsertDeviceGpu(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceGpu completed')
-                upsertDeviceBios(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceBios completed')
-                upsertDeviceColl(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceColl completed')
-                upsertDevicePrinters(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDevicePrinters completed')
-                upsertDeviceDrivers(deviceUuid, auditDict)
-                log_with_route(logging.INFO, 'upsertDeviceDrivers completed')
-                log_with_route(logging.DEBUG, f'Renaming {full_path} to {os.path.join(successfulImportDir, os.path.basename(full_path))}')
-                if os.path.exists(full_path):
-                    os.renames(full_path, os.path.join(successfulImportDir, os.path.basename(full_path)))
-                else:
-                    log_with_route(logging.ERROR, f'File {full_path} does not exist, unable to move.')
-
-                autoAssignTags(auditDict, deviceUuid)
+                # Audits are collected and written in batches, one transaction per batch
+                auditBatch.append(full_path)
+                if len(auditBatch) >= batchSize:
+                    ingestAuditFiles(auditBatch, payloadDirs)
+                    auditBatch = []
 
             elif filename.endswith('.zip'):        ## PROCESS ZIPS
                 log_with_route(logging.DEBUG, f'Processing zip file: {full_path}')
-                deviceUuid = os.path.basename(full_path).split('.')[0]
+                deviceUuid = filename.split('.')[0]
                 log_with_route(logging.INFO, f'deviceUuid: {deviceUuid}')
                 unzipResult = unzipPayload(deviceFilesDir, full_path, deviceUuid)
                 if unzipResult == False:
-                    log_with_route(logging.DEBUG, f'Renaming {full_path} to {os.path.join(invalidDir, os.path.basename(full_path))}')
-                    if not os.path.exists(invalidDir):
-                        os.makedirs(invalidDir)
-                    if os.path.exists(full_path):
-                        os.renames(full_path, os.path.join(invalidDir, os.path.basename(full_path)))
-                    else:
-                        log_with_route(logging.ERROR, f'File {full_path} does not exist, unable to move to invalid directory.')
+                    movePayload(full_path, invalidDir)
                 else:
-                    log_with_route(logging.DEBUG, f'Renaming {full_path} to {os.path.join(successfulImportDir, os.path.basename(full_path))}')
-                    if not os.path.exists(successfulImportDir):
-                        os.makedirs(successfulImportDir)
-                    if os.path.exists(full_path):
-                        os.renames(full_path, os.path.join(successfulImportDir, os.path.basename(full_path)))
-                    else:
-                        log_with_route(logging.ERROR, f'File {full_path} does not exist, unable to move to successful directory.')
+                    movePayload(full_path, successfulImportDir)
 
             else:         ## PROCESS OTHER FILES
                 log_with_route(logging.DEBUG, f'Processing other file: {filename}')
@@ -441,15 +403,14 @@ def processpayloads():
                     os.makedirs(target_dir, exist_ok=True)
 
                     target_path = os.path.join(target_dir, original_name)
-                    source_path = os.path.join(queueDir, filename)
 
-                    log_with_route(logging.DEBUG, f'Moving {source_path} to {target_path}')
+                    log_with_route(logging.DEBUG, f'Moving {full_path} to {target_path}')
 
-                    if os.path.exists(source_path):
-                        shutil.move(source_path, target_path)
+                    if os.path.exists(full_path):
+                        shutil.move(full_path, target_path)
                         log_with_route(logging.INFO, f'Successfully moved file to {target_path}')
                     else:
-                        log_with_route(logging.ERROR, f'Source file not found: {source_path}')
+                        log_with_route(logging.ERROR, f'Source file not found: {full_path}')
 
                 except Exception as e:
                     log_with_route(logging.ERROR, f'Error processing file {filename}: {str(e)}', exc_info=True)
@@ -459,13 +420,93 @@ def processpayloads():
             log_with_route(logging.ERROR, f'Error processing file {filename}: {str(e)}', exc_info=True)
             continue
 
-    execTime = time.time() - startTime
-    log_with_route(logging.INFO, f'Processed {itemsToProcess} payload(s) in {execTime} seconds.' )
-    return jsonify({'success': f'Processed {itemsToProcess} payload(s) in {execTime} seconds.'}), 200
+    if auditBatch:
+        ingestAuditFiles(auditBatch, payloadDirs)
+
+    return itemsToProcess
 
 
 ################## ADDITIONAL FUNCTIONS ##################
 
+def ingestAuditFiles(auditFiles, payloadDirs, auditDicts=None):
+    """
+    Ingest a batch of queued audit files with one transaction for all their device rows.
+    auditDicts optionally maps file paths to already parsed payloads, which are then not read from disk.
+    A file that fails on its own is left in place for a retry without holding back the rest of the batch.
+    """
+    from app.utilities.payload_ingest import AuditIngestBatch, get_existing_device_uuids
+
+    log_with_route(logging.INFO, f'Ingesting batch of {len(auditFiles)} audit file(s)')
+    auditDicts = auditDicts or {}
+    ingestedCount = 0
+
+    # Read each payload once; the device uuid comes from the parsed dict
+    audits = []
+    for full_path in auditFiles:
+        try:
+            auditDict = auditDicts.get(full_path) or getAuditDict(full_path)
+            try:
+                deviceUuid = auditDict['data']['device']['deviceUuid']
+            except (KeyError, TypeError):
+                deviceUuid = None
+            if not deviceUuid:
+                log_with_route(logging.ERROR, f'{full_path} is invalid payload, no deviceUuid')
+                movePayload(full_path, payloadDirs['noDeviceUuid'])
+                continue
+            audits.append((full_path, deviceUuid, auditDict))
+        except Exception as e:
+            log_with_route(logging.ERROR, f'Error reading audit {full_path}: {str(e)}', exc_info=True)
+
+    try:
+        knownDevices = get_existing_device_uuids({deviceUuid for _, deviceUuid, _ in audits})
+    except Exception as e:
+        db.session.rollback()
+        log_with_route(logging.ERROR, f'Error ingesting audit batch: {str(e)}', exc_info=True)
+        return ingestedCount
+
+    batch = AuditIngestBatch()
+    for full_path, deviceUuid, auditDict in audits:
+        try:
+            if deviceUuid not in knownDevices:
+                log_with_route(logging.WARNING, f'{deviceUuid} does not exist in database. Attempting to re-register it.')
+                if reregisterOrphanedDevice(deviceUuid, auditDict):
+                    log_with_route(logging.INFO, f"Successfully re-registered device {deviceUuid}, continuing with metadata processing")
+                    knownDevices.add(deviceUuid)
+                else:
+                    log_with_route(logging.ERROR, f"Failed to re-register device {deviceUuid} - original group not found or other error occurred")
+                    movePayload(full_path, payloadDirs['ophanedCollectors'])
+                    continue
+            if not batch.add(full_path, deviceUuid, auditDict):
+                movePayload(full_path, payloadDirs['invalid'])
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f'Error preparing audit {full_path}: {str(e)}', exc_info=True)
+
+    # Failed writes are left in place and go back to the queue when the claim is released
+    committed, failed = batch.flush()
+    auditsByPath = {full_path: (deviceUuid, auditDict) for full_path, deviceUuid, auditDict in audits}
+    for full_path in committed:
+        try:
+            movePayload(full_path, payloadDirs['successfulImport'])
+            deviceUuid, auditDict = auditsByPath[full_path]
+            autoAssignTags(auditDict, deviceUuid)
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f'Error finishing ingested audit {full_path}: {str(e)}', exc_info=True)
+    ingestedCount = len(committed)
+    if failed:
+        log_with_route(logging.ERROR, f'{len(failed)} audit file(s) not ingested, will be retried')
+    return ingestedCount
+
+def movePayload(full_path, targetDir):
+    log_with_route(logging.DEBUG, f'Renaming {full_path} to {os.path.join(targetDir, os.path.basename(full_path))}')
+    if os.path.exists(full_path):
+        # Plain rename: os.renames would prune the (possibly shared) source directory
+        os.makedirs(targetDir, exist_ok=True)
+        os.rename(full_path, os.path.join(targetDir, os.path.basename(full_path)))
+    else:
+        log_with_route(logging.ERROR, f'File {full_path} does not exist, unable to move.')
+
 def unzipPayload(deviceFilesDir, payload, deviceUuid):
 	import zipfile
 	deviceFolder = f'{deviceFilesDir}/{deviceUuid}'
@@ -480,716 +521,6 @@ def unzipPayload(deviceFilesDir, payload, deviceUuid):
 		log_with_route(logging.ERROR, f'Failed to unzip {payload} to {deviceFolder}. Reason: {e}')
 		return(False)
 
-def upsertDeviceStatus(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert Device Status for {deviceUuid}')
-	if 'systemmodel' not in auditDict['data']['system']:
-		auditDict['data']['system']['systemmodel'] = 'n/a'
-	if 'systemlocale' not in auditDict['data']['system']:
-		auditDict['data']['system']['systemlocale'] = 'n/a'
-	if 'systemmanufacturer' not in auditDict['data']['system']:
-		auditDict['data']['system']['systemmanufacturer'] = 'n/a'
-	upsertDeviceStatusSql = insert(DeviceStatus).values(
-		deviceuuid     		= deviceUuid,
-		last_update     	= int(time.time()),
-		last_json     		= auditDict['data']['device']['systemtime'],
-		agent_platform  	= auditDict['data']['system']['devicePlatform'],
-		system_name      	= auditDict['data']['system']['systemName'],
-		logged_on_user    	= auditDict['data']['system']['currentUser'],
-		cpu_usage        	= auditDict['data']['system']['cpuUsage'],
-		cpu_count        	= auditDict['data']['system']['cpuCount'],
-		boot_time        	= auditDict['data']['system']['bootTime'],
-        publicIp			= auditDict['data']['system']['publicIp'],
-        system_model		= auditDict['data']['system']['systemmodel'],
-		system_locale		= auditDict['data']['system']['systemlocale'],
-		system_manufacturer = auditDict['data']['system']['systemmanufacturer']
-
-	).on_conflict_do_update (
-		index_elements=['deviceuuid'],
-		set_= dict(
-			last_update     	= int(time.time()),
-			last_json     		= auditDict['data']['device']['systemtime'],
-			agent_platform  	= auditDict['data']['system']['devicePlatform'],
-			system_name      	= auditDict['data']['system']['systemName'],
-			logged_on_user    	= auditDict['data']['system']['currentUser'],
-			cpu_usage        	= auditDict['data']['system']['cpuUsage'],
-			cpu_count        	= auditDict['data']['system']['cpuCount'],
-			boot_time        	= auditDict['data']['system']['bootTime'],
-            publicIp			= auditDict['data']['system']['publicIp'],
-            system_model		= auditDict['data']['system']['systemmodel'],
-			system_locale		= auditDict['data']['system']['systemlocale'],
-			system_manufacturer = auditDict['data']['system']['systemmanufacturer']
-		)
-	)
-	try:
-		db.session.execute(upsertDeviceStatusSql)
-		db.session.commit()
-		log_with_route(logging.INFO, 'Upserting Device Status processed')
-	except Exception as e:
-		log_with_route(logging.ERROR, f'error upserting payload: Reason: {e}')
-		log_with_route(logging.ERROR, f'Rolling back transaction...')
-		db.session.rollback()
-		log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-def upsertDeviceCpu(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert Device Cpu for {deviceUuid}')
-	if 'cpu' not in auditDict['data']:
-		auditDict['data']['cpu'] 			= {}
-		auditDict['data']['cpu']['cpuname'] = 'n/a'
-
-	# Extract CPU metrics if available
-	cpu_metrics_json = auditDict['data']['cpu'].get('cpu_metrics', None)
-
-	upsertDeviceCpuSql = insert(DeviceCpu).values(
-		deviceuuid			= deviceUuid,
-		last_update    		= int(time.time()),
-		last_json   		= auditDict['data']['device']['systemtime'],
-		cpu_name			= auditDict['data']['cpu']['cpuname'],
-		cpu_metrics_json	= cpu_metrics_json
-
-	).on_conflict_do_update (
-		index_elements=['deviceuuid'],
-		set_= dict(
-			deviceuuid			= deviceUuid,
-			last_update    		= int(time.time()),
-			last_json   		= auditDict['data']['device']['systemtime'],
-			cpu_name			= auditDict['data']['cpu']['cpuname'],
-			cpu_metrics_json	= cpu_metrics_json
-		)
-	)
-	try:
-		db.session.execute(upsertDeviceCpuSql)
-		db.session.commit()
-		log_with_route(logging.INFO, 'Upserting DeviceCpu processed')
-	except Exception as e:
-		log_with_route(logging.ERROR, f'error upserting DeviceCpu: Reason: {e}')
-		log_with_route(logging.ERROR, f'Rolling back transaction...')
-		db.session.rollback()
-		log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-def upsertDeviceGpu(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert Device Gpu for {deviceUuid}')
-	if 'gpuinfo' not in auditDict['data']:
-		auditDict['data']['gpuinfo'] 				= {}
-		auditDict['data']['gpuinfo']['gpuvendor'] 	= 'n/a'
-		auditDict['data']['gpuinfo']['gpuproduct']	= 'n/a'
-		auditDict['data']['gpuinfo']['gpucolour']	= 'n/a'
-		auditDict['data']['gpuinfo']['gpuhres']		= 'n/a'
-		auditDict['data']['gpuinfo']['gpuvres']		= 'n/a'
-
-	# Helper function to convert to integer or None if invalid
-	def safe_int(value, default=None):
-		"""Convert value to int, return default if conversion fails or value is 'No data found'"""
-		if value in (None, 'No data found', 'n/a', ''):
-			return default
-		try:
-			return int(value)
-		except (ValueError, TypeError):
-			return default
-
-	# Sanitize integer fields - convert "No data found" to None for integer columns
-	gpu_colour = safe_int(auditDict['data']['gpuinfo'].get('gpucolour'))
-	gpu_hres = safe_int(auditDict['data']['gpuinfo'].get('gpuhres'))
-	gpu_vres = safe_int(auditDict['data']['gpuinfo'].get('gpuvres'))
-	# Clamp colour depth to signed 32-bit integer range to avoid overflow
-	if gpu_colour is not None and gpu_colour > 2147483647:
-		gpu_colour = 2147483647
-
-
-	upsertDeviceGpuSql = insert(DeviceGpu).values(
-		deviceuuid			= deviceUuid,
-		last_update    		= int(time.time()),
-		last_json   		= auditDict['data']['device']['systemtime'],
-		gpu_vendor			= auditDict['data']['gpuinfo']['gpuvendor'],
-		gpu_product			= auditDict['data']['gpuinfo']['gpuproduct'],
-		gpu_colour			= gpu_colour,
-		gpu_hres			= gpu_hres,
-		gpu_vres			= gpu_vres
-
-	).on_conflict_do_update (
-		index_elements=['deviceuuid'],
-		set_= dict(
-			deviceuuid			= deviceUuid,
-			last_update    		= int(time.time()),
-			last_json   		= auditDict['data']['device']['systemtime'],
-			gpu_vendor			= auditDict['data']['gpuinfo']['gpuvendor'],
-			gpu_product			= auditDict['data']['gpuinfo']['gpuproduct'],
-            gpu_colour			= gpu_colour,
-            gpu_hres			= gpu_hres,
-            gpu_vres			= gpu_vres
-		)
-	)
-	try:
-		db.session.execute(upsertDeviceGpuSql)
-		db.session.commit()
-		log_with_route(logging.INFO, 'Upserting DeviceGpu processed')
-	except Exception as e:
-		log_with_route(logging.ERROR, f'error upserting DeviceGpu: Reason: {e}')
-		log_with_route(logging.ERROR, f'Rolling back transaction...')
-		db.session.rollback()
-		log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-def upsertDeviceBios(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert Device bios for {deviceUuid}')
-	if 'bios' not in auditDict['data']:
-		auditDict['data']['bios'] 					= {}
-		auditDict['data']['bios']['biosvendor']		= 'n/a'
-		auditDict['data']['bios']['serialnumber']	= 'n/a'
-		auditDict['data']['bios']['biosversion']	= 'n/a'
-	upsertDeviceBiosSql = insert(DeviceBios).values(
-		deviceuuid			= deviceUuid,
-		last_update    		= int(time.time()),
-		last_json   		= auditDict['data']['device']['systemtime'],
-		bios_vendor			= auditDict['data']['bios']['biosvendor'],
-		bios_name			= 'n/a',
-		bios_serial			= auditDict['data']['bios']['serialnumber'],
-		bios_version		= auditDict['data']['bios']['biosversion']
-
-	).on_conflict_do_update (
-		index_elements=['deviceuuid'],
-		set_= dict(
-			deviceuuid			= deviceUuid,
-			last_update    		= int(time.time()),
-			last_json   		= auditDict['data']['device']['systemtime'],
-			bios_vendor			= auditDict['data']['bios']['biosvendor'],
-			bios_name			= 'n/a',
-			bios_serial			= auditDict['data']['bios']['serialnumber'],
-			bios_version		= auditDict['data']['bios']['biosversion']
-		)
-	)
-	try:
-		db.session.execute(upsertDeviceBiosSql)
-		db.session.commit()
-		log_with_route(logging.INFO, 'Upserting DeviceBios processed')
-	except Exception as e:
-		log_with_route(logging.ERROR, f'error upserting DeviceBios: Reason: {e}')
-		log_with_route(logging.ERROR, f'Rolling back transaction...')
-		db.session.rollback()
-		log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-def upsertDeviceColl(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert Device Collector for {deviceUuid}')
-	if 'collector' not in auditDict['data']:
-		auditDict['data']['collector'] 						= {}
-		auditDict['data']['collector']['collversion']		= 0
-		auditDict['data']['collector']['collinstalldir']   	= 'collector needs upgrade'
-	upsertDeviceCollSql = insert(DeviceCollector).values(
-		deviceuuid			= deviceUuid,
-		last_update    		= int(time.time()),
-		last_json   		= auditDict['data']['device']['systemtime'],
-		coll_version		= auditDict['data']['collector']['collversion'],
-		coll_install_dir   	= auditDict['data']['collector']['collinstalldir']
-	).on_conflict_do_update (
-		index_elements=['deviceuuid'],
-		set_= dict(
-			deviceuuid			= deviceUuid,
-			last_update    		= int(time.time()),
-			last_json   		= auditDict['data']['device']['systemtime'],
-			coll_version		= auditDict['data']['collector'].get('collversion', 0),
-			coll_install_dir   	= auditDict['data']['collector'].get('collinstalldir', 'collector needs upgrade')
-		)
-	)
-	try:
-		db.session.execute(upsertDeviceCollSql)
-		db.session.commit()
-		log_with_route(logging.INFO, 'Upserting DeviceCollector processed')
-	except Exception as e:
-		log_with_route(logging.ERROR, f'error upserting DeviceCollector: Reason: {e}')
-		log_with_route(logging.ERROR, f'Rolling back transaction...')
-		db.session.rollback()
-		log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-def upsertDeviceAgent(deviceUuid, data):
-	log_with_route(logging.INFO, f'Attempting to upsert Device Agent for {deviceUuid}')
-	if 'agent' not in data['data']:
-		data['data']['agent'] 						= {}
-		data['data']['agent']['agentversion']		= 0
-		data['data']['agent']['agentinstalldir']   = 'agent needs upgrade'
-	upsertDeviceAgentSql = insert(DeviceCollector).values(
-		deviceuuid			= deviceUuid,
-		last_update    		= int(time.time()),
-		agent_version		= data['data']['agent']['agentversion'],
-		agent_install_dir   = data['data']['agent']['agentinstalldir']
-	).on_conflict_do_update (
-		index_elements=['deviceuuid'],
-		set_= dict(
-			deviceuuid			= deviceUuid,
-			last_update    		= int(time.time()),
-			last_json   		= data['data']['device']['systemtime'],
-			agent_version		= data['data']['agent']['agentversion'],
-			agent_install_dir   = data['data']['agent']['agentinstalldir']
-		)
-	)
-	try:
-		db.session.execute(upsertDeviceAgentSql)
-		db.session.commit()
-		log_with_route(logging.INFO, 'Upserting DeviceAgent processed')
-	except Exception as e:
-		log_with_route(logging.ERROR, f'error upserting DeviceAgent: Reason: {e}')
-		log_with_route(logging.ERROR, f'Rolling back transaction...')
-		db.session.rollback()
-		log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-
-def upsertDeviceBattery(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert Device Battery for {deviceUuid}')
-	# Sanitize secsLeft to numeric to avoid DB integer errors
-	battery_data = auditDict.get('data', {}).get('battery', {})
-	def _sanitize_secs(value):
-		if value in (None, 'N/A', 'n/a', 'No data found', ''):
-			return -1
-		try:
-			return int(value)
-		except (ValueError, TypeError):
-			return -1
-	secs_remaining_val = _sanitize_secs(battery_data.get('secsLeft'))
-
-	upsertDeviceBatterySql = insert(DeviceBattery).values(
-		deviceuuid			= deviceUuid,
-		last_update    		= int(time.time()),
-		last_json   		= auditDict['data']['device']['systemtime'],
-		battery_installed	= auditDict['data']['battery']['installed'],
-		percent_charged   	= auditDict['data']['battery']['pcCharged'],
-		secs_remaining   	= secs_remaining_val,
-		on_mains_power		= auditDict['data']['battery']['powerPlug']
-	).on_conflict_do_update (
-		index_elements=['deviceuuid'],
-		set_= dict(
-			deviceuuid			= deviceUuid,
-			last_update    		= int(time.time()),
-			last_json   		= auditDict['data']['device']['systemtime'],
-			battery_installed	= auditDict['data']['battery']['installed'],
-			percent_charged   	= auditDict['data']['battery']['pcCharged'],
-			secs_remaining   	= secs_remaining_val,
-			on_mains_power		= auditDict['data']['battery']['powerPlug']
-		)
-	)
-	try:
-		db.session.execute(upsertDeviceBatterySql)
-		db.session.commit()
-		log_with_route(logging.INFO, 'Upserting DeviceBattery processed')
-	except Exception as e:
-		log_with_route(logging.ERROR, f'error upserting DeviceBattery: Reason: {e}')
-		log_with_route(logging.ERROR, f'Rolling back transaction...')
-		db.session.rollback()
-		log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-def upsertDeviceMemory(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert DeviceMemory for {deviceUuid}')
-	totalMemory			= auditDict['data']['memory']['total']
-	availableMemory		= auditDict['data']['memory']['available']
-	usedMemory			= auditDict['data']['memory']['used']
-	freeMemory			= auditDict['data']['memory']['free']
-	memUsedPercent    	= (usedMemory/totalMemory) * 100
-	memFreePercent    	= 100 - memUsedPercent
-	cacheMemory        	= totalMemory - freeMemory - usedMemory
-
-	# Extract memory metrics if available
-	memory_metrics_json = auditDict['data']['memory'].get('memory_metrics', None)
-
-	upsertDeviceMemorySql = insert(DeviceMemory).values(
-		deviceuuid				= deviceUuid,
-		last_update    			= int(time.time()),
-		last_json   			= auditDict['data']['device']['systemtime'],
-		total_memory			= totalMemory,
-		available_memory   		= availableMemory,
-		used_memory   			= usedMemory,
-		free_memory				= freeMemory,
-		mem_used_percent		= memUsedPercent,
-		mem_free_percent		= memFreePercent,
-		cache_memory			= cacheMemory,
-		memory_metrics_json		= memory_metrics_json
-	).on_conflict_do_update (
-		index_elements=['deviceuuid'],
-		set_= dict(
-			deviceuuid				= deviceUuid,
-			last_update    			= int(time.time()),
-			last_json   			= auditDict['data']['device']['systemtime'],
-			total_memory			= totalMemory,
-			available_memory   		= availableMemory,
-			used_memory   			= usedMemory,
-			free_memory				= freeMemory,
-			mem_used_percent		= memUsedPercent,
-			mem_free_percent		= memFreePercent,
-			cache_memory			= cacheMemory,
-			memory_metrics_json		= memory_metrics_json
-		)
-	)
-	try:
-		db.session.execute(upsertDeviceMemorySql)
-		db.session.commit()
-		log_with_route(logging.INFO, 'Upserting DeviceMemory processed')
-	except Exception as e:
-		log_with_route(logging.ERROR, f'error upserting DeviceMemory: Reason: {e}')
-		log_with_route(logging.ERROR, f'Rolling back transaction...')
-		db.session.rollback()
-		log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-def upsertDeviceNetworks(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert DeviceNetworks for {deviceUuid}')
-	for network in auditDict['data']['networkList']:
-		for key, value in network.items():
-			log_with_route(logging.INFO, f'Processing key: {key}')
-			address_4           = value.get('address4', 'Not Present')
-			netmask_4           = value.get('netmask4', 'Not Present')
-			broadcast_4         = value.get('broadcast4', 'Not Present')
-			address_6           = value.get('address6', 'Not Present')
-			netmask_6           = value.get('netmask6', 'Not Present')
-			broadcast_6         = value.get('broadcast6', 'Not Present')
-			if not address_4:
-				address_4 = 'Not Present'
-			if not netmask_4:
-				netmask_4 = 'Not Present'
-			if not broadcast_4:
-				broadcast_4 = 'Not Present'
-			if not address_6:
-				address_6 = 'Not Present'
-			if not netmask_6:
-				netmask_6 = 'Not Present'
-			if not broadcast_6:
-				broadcast_6 = 'Not Present'
-
-			upsertDeviceNetworksSql = insert(DeviceNetworks).values(
-				deviceuuid 		    = deviceUuid,
-				last_update 	    = int(time.time()),
-				last_json 		    = auditDict['data']['device']['systemtime'],
-				network_name        = key,
-				if_is_up            = value['ifIsUp'],
-				if_speed            = value['ifSpeed'],
-				if_mtu              = value['ifMtu'],
-				bytes_sent          = value['bytesSent'],
-				bytes_rec           = value['bytesRecv'],
-				err_in              = value['errIn'],
-				err_out             = value['errOut'],
-				address_4           = address_4,
-				netmask_4           = netmask_4,
-				broadcast_4         = broadcast_4,
-				address_6           = address_6,
-				netmask_6           = netmask_6,
-				broadcast_6         = broadcast_6
-			).on_conflict_do_update (
-				index_elements=['deviceuuid', 'network_name'],
-				set_= dict(
-						deviceuuid 		    = deviceUuid,
-						last_update 	    = int(time.time()),
-						last_json 		    = auditDict['data']['device']['systemtime'],
-						network_name        = key,
-						if_is_up            = value['ifIsUp'],
-						if_speed            = value['ifSpeed'],
-						if_mtu              = value['ifMtu'],
-						bytes_sent          = value['bytesSent'],
-						bytes_rec           = value['bytesRecv'],
-						err_in              = value['errIn'],
-						err_out             = value['errOut'],
-						address_4           = address_4,
-						netmask_4           = netmask_4,
-						broadcast_4         = broadcast_4,
-						address_6           = address_6,
-						netmask_6           = netmask_6,
-						broadcast_6         = broadcast_6
-				)
-			)
-			try:
-				db.session.execute(upsertDeviceNetworksSql)
-				db.session.commit()
-				log_with_route(logging.INFO, 'Upserting DeviceNetworks processed')
-			except Exception as e:
-				log_with_route(logging.ERROR, f'Error upserting DeviceNetworks: Reason: {e}')
-				log_with_route(logging.ERROR, f'Rolling back transaction...')
-				db.session.rollback()
-				log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-def upsertDeviceUsers(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert DeviceUsers for {deviceUuid}')
-	for user in auditDict['data']['Users']:
-		for key, value in user.items():
-			log_with_route(logging.INFO, f'Processing key: {key}')
-
-			upsertDeviceUsersSql = insert(DeviceUsers).values(
-                deviceuuid 		    = deviceUuid,
-                last_update 	    = int(time.time()),
-                last_json 		    = auditDict['data']['device']['systemtime'],
-                users_name        	= value['username'],
-                terminal            = value['terminal'],
-                host            	= value['host'],
-                loggedin           	= value['loggedIn'],
-                pid          		= value['pid']
-			).on_conflict_do_update (
-				index_elements=['deviceuuid', 'users_name'],
-					set_= dict(
-					deviceuuid 		    = deviceUuid,
-					last_update 	    = int(time.time()),
-					last_json 		    = auditDict['data']['device']['systemtime'],
-					users_name        	= value['username'],
-					terminal            = value['terminal'],
-					host            	= value['host'],
-					loggedin           	= value['loggedIn'],
-					pid          		= value['pid']
-				)
-			)
-			try:
-				db.session.execute(upsertDeviceUsersSql)
-				db.session.commit()
-				log_with_route(logging.INFO, 'Upserting DeviceUsers processed')
-			except Exception as e:
-				log_with_route(logging.ERROR, f'Error upserting DeviceUsers: Reason: {e}')
-				log_with_route(logging.ERROR, f'Rolling back transaction...')
-				db.session.rollback()
-				log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-def upsertDevicePartitions(deviceUuid, auditDict):
-	if 'partitions' in auditDict['data']:
-		log_with_route(logging.INFO, f'Attempting to upsert DevicePartitions for {deviceUuid}')
-		for partition in auditDict['data']['partitions']:
-			for key, value in partition.items():
-				log_with_route(logging.INFO, f'Processing key: {key}')
-
-				upsertDevicePartitionsSql = insert(DevicePartitions).values(
-					deviceuuid 		    = deviceUuid,
-					last_update 	    = int(time.time()),
-					last_json 		    = auditDict['data']['device']['systemtime'],
-					partition_name      = key,
-					partition_device    = value['device'],
-					partition_fs_type   = value['fstype']
-				).on_conflict_do_update (
-					index_elements=['deviceuuid', 'partition_name'],
-						set_= dict(
-								deviceuuid 		    = deviceUuid,
-								last_update 	    = int(time.time()),
-								last_json 		    = auditDict['data']['device']['systemtime'],
-								partition_name      = key,
-								partition_device    = value['device'],
-								partition_fs_type   = value['fstype']
-					)
-				)
-				try:
-					db.session.execute(upsertDevicePartitionsSql)
-					db.session.commit()
-					log_with_route(logging.INFO, 'Upserting DevicePartitions processed')
-				except Exception as e:
-					log_with_route(logging.ERROR, f'Error upserting DevicePartitions: Reason: {e}')
-					log_with_route(logging.ERROR, f'Rolling back transaction...')
-					db.session.rollback()
-					log_with_route(logging.ERROR, f'Transaction rolled back.')
-	else:
-		log_with_route(logging.INFO, 'No DevicePartitions data to process')
-
-def upsertDeviceDrives(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert DeviceDrives for {deviceUuid}')
-
-	# Check if drives data exists
-	if 'drives' not in auditDict['data']:
-		log_with_route(logging.WARNING, f'No drives data found for device {deviceUuid}')
-		return
-
-	for drive in auditDict['data']['drives']:
-		# Validate required drive fields
-		required_fields = ['name', 'total', 'used', 'free', 'usedPer', 'freePer']
-		if not all(field in drive for field in required_fields):
-			log_with_route(logging.ERROR, f'Missing required fields in drive data: {drive}')
-			continue
-
-		log_with_route(logging.INFO, f'Processing drive: {drive["name"]}')
-
-		upsertDeviceDriveSql = insert(DeviceDrives).values(
-			deviceuuid 		        = deviceUuid,
-			last_update 	        = int(time.time()),
-			last_json 		        = auditDict['data']['device']['systemtime'],
-			drive_name              = drive['name'],
-			drive_total             = drive['total'],
-			drive_used              = drive['used'],
-			drive_free              = drive['free'],
-			drive_used_percentage   = drive['usedPer'],
-			drive_free_percentage   = drive['freePer']
-		).on_conflict_do_update (
-			index_elements=['deviceuuid', 'drive_name'],
-				set_= dict(
-					deviceuuid 		        = deviceUuid,
-					last_update 	        = int(time.time()),
-					last_json 		        = auditDict['data']['device']['systemtime'],
-					drive_name              = drive['name'],
-					drive_total             = drive['total'],
-					drive_used              = drive['used'],
-					drive_free              = drive['free'],
-					drive_used_percentage   = drive['usedPer'],
-					drive_free_percentage   = drive['freePer']
-			)
-		)
-		try:
-			db.session.execute(upsertDeviceDriveSql)
-			db.session.commit()
-			log_with_route(logging.INFO, f'Successfully upserted drive: {drive["name"]}')
-		except Exception as e:
-			log_with_route(logging.ERROR, f'Error upserting drive {drive["name"]}: Reason: {e}')
-			log_with_route(logging.ERROR, f'Rolling back transaction...')
-			db.session.rollback()
-			log_with_route(logging.ERROR, f'Transaction rolled back.')
-
-	log_with_route(logging.INFO, f'Completed processing drives for device {deviceUuid}')
-
-def upsertDevicePrinters(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert DevicePrinters for {deviceUuid}')
-	if 'printers' in auditDict['data']:
-		printers_raw = auditDict['data']['printers']
-		# Accept both dict and list formats from collectors
-		if isinstance(printers_raw, list):
-			printers_dict = {}
-			for name in printers_raw:
-				if isinstance(name, str) and name.strip():
-					printers_dict[name.strip()] = {
-						'drivername': 'unknown',
-						'location': 'unknown',
-						'printerstatus': 'unknown',
-						'portname': 'unknown',
-						'default': False
-					}
-		else:
-			printers_dict = printers_raw if isinstance(printers_raw, dict) else {}
-
-		if len(printers_dict) > 0:
-			for printerName, printerData in printers_dict.items():
-				log_with_route(logging.INFO, f'Processing key: {printerName}')
-				if not 'drivername' in printerData:
-					printerData['drivername'] = 'unknown'
-				if not 'location' in printerData:
-					printerData['location'] = 'unknown'
-				if not 'printerstatus' in printerData:
-					printerData['printerstatus'] = 'unknown'
-				if 'port' in printerData:
-					printerData['portname'] = printerData.pop('port')
-				if not 'portname' in printerData:
-					printerData['portname'] = 'unknown'
-				if not 'default' in printerData:
-					printerData['default'] = False
-				log_with_route(logging.DEBUG, f'printerData: {printerData}')
-				log_with_route(logging.DEBUG, f"printerData-portname: {printerData['portname']}")
-				upsertDevicePrinterSql = insert(DevicePrinters).values(
-					deviceuuid 		        = deviceUuid,
-					last_update 	        = int(time.time()),
-					last_json 		        = auditDict['data']['device']['systemtime'],
-					printer_name            = printerName,
-					printer_driver          = printerData['drivername'],
-					printer_port			= printerData['portname'],
-					printer_location        = printerData['location'],
-					printer_status          = printerData['printerstatus'],
-					printer_default 		= printerData['default']
-				).on_conflict_do_update (
-					index_elements=['deviceuuid', 'printer_name'],
-						set_= dict(
-							deviceuuid 		        = deviceUuid,
-							last_update 	        = int(time.time()),
-							last_json 		        = auditDict['data']['device']['systemtime'],
-							printer_name            = printerName,
-							printer_driver          = printerData['drivername'],
-							printer_port			= printerData['portname'],
-							printer_location        = printerData['location'],
-							printer_status          = printerData['printerstatus'],
-							printer_default 		= printerData['default']
-					)
-				)
-				try:
-					db.session.execute(upsertDevicePrinterSql)
-					db.session.commit()
-					log_with_route(logging.INFO, 'Upserting DevicePrinters processed')
-				except Exception as e:
-					log_with_route(logging.ERROR, f'Error upserting DevicePrinters: Reason: {e}')
-					log_with_route(logging.ERROR, f'Rolling back transaction...')
-					db.session.rollback()
-					log_with_route(logging.ERROR, f'Transaction rolled back.')
-	else:
-		log_with_route(logging.INFO, 'No DevicePrinters data.')
-
-def upsertDeviceDrivers(deviceUuid, auditDict):
-	log_with_route(logging.INFO, f'Attempting to upsert DeviceDrivers for {deviceUuid}')
-
-	# Check if device is Windows before processing driver data
-	from app.models import DeviceStatus
-	device_status = DeviceStatus.query.filter_by(deviceuuid=deviceUuid).first()
-	if not device_status or not device_status.agent_platform.startswith('Windows'):
-		platform = device_status.agent_platform if device_status else 'Unknown'
-		log_with_route(logging.INFO, f'Skipping driver data processing for non-Windows device {deviceUuid} (platform: {platform})')
-		return
-
-	if 'drivers' in auditDict['data']:
-		drivers_raw = auditDict['data']['drivers']
-		# Accept both dict and list formats from collectors
-		if isinstance(drivers_raw, list):
-			drivers_dict = {}
-			for entry in drivers_raw:
-				if isinstance(entry, str):
-					# Format seen: "Name<spaces>Status"; take first token as name
-					name = entry.strip().split()[0] if entry.strip() else None
-					if not name:
-						continue
-					drivers_dict[name] = {
-						'description': 'unknown',
-						'driverpath': 'unknown',
-						'drivertype': 'unknown',
-						'version': 'unknown',
-						'driverdate': 0
-					}
-		else:
-			drivers_dict = drivers_raw if isinstance(drivers_raw, dict) else {}
-
-		if len(drivers_dict) > 0:
-			for driverName, driverData in drivers_dict.items():
-				log_with_route(logging.INFO, f'Processing key: {driverName}')
-				# Ensure required keys exist with safe defaults
-				if 'driverdate' not in driverData:
-					driverData['driverdate'] = 0
-				for req in ['description','driverpath','drivertype','version']:
-					if req not in driverData:
-						driverData[req] = 'unknown'
-
-				upsertDeviceDriversSql = insert(DeviceDrivers).values(
-					deviceuuid 		        = deviceUuid,
-					last_update 	        = int(time.time()),
-					last_json 		        = auditDict['data']['device']['systemtime'],
-					driver_name            	= driverName,
-					driver_description      = driverData['description'],
-					driver_path				= driverData['driverpath'],
-					driver_type        		= driverData['drivertype'],
-					driver_version         	= driverData['version'],
-					driver_date				= driverData['driverdate']
-				).on_conflict_do_update (
-					index_elements=['deviceuuid', 'driver_name'],
-						set_= dict(
-							deviceuuid 		        = deviceUuid,
-							last_update 	        = int(time.time()),
-							last_json 		        = auditDict['data']['device']['systemtime'],
-							driver_name            	= driverName,
-							driver_description      = driverData['description'],
-							driver_path				= driverData['driverpath'],
-							driver_type        		= driverData['drivertype'],
-							driver_version         	= driverData['version'],
-							driver_date				= driverData['driverdate']
-							)
-				)
-				try:
-					db.session.execute(upsertDeviceDriversSql)
-					db.session.commit()
-					log_with_route(logging.INFO, 'Upserting DeviceDrivers processed')
-				except Exception as e:
-					log_with_route(logging.ERROR, f'Error upserting DeviceDrivers: Reason: {e}')
-					log_with_route(logging.ERROR, f'Rolling back transaction...')
-					db.session.rollback()
-					log_with_route(logging.ERROR, f'Transaction rolled back.')
-	else:
-		log_with_route(logging.INFO, 'No DeviceDrivers data.')
-
-def validatePayloadJson(payload):
-	log_with_route(logging.INFO, f'Validating: {payload}')
-	try:
-		with open(payload, 'r') as f:
-			tmpDict = json.load(f)
-		log_with_route(logging.INFO, f'{payload} is valid JSON')
-		deviceUuid  = tmpDict['data']['device']['deviceUuid']
-		groupUuid = tmpDict['data']['device'].get('groupUuid', '999999999-9999-9999-9999-999999999999')
-		log_with_route(logging.INFO, f'deviceUuid: {deviceUuid} | groupUuid: {groupUuid}')
-		return(deviceUuid, groupUuid)
-	except Exception as e:
-		log_with_route(logging.ERROR, f'{payload} is invalid payload. Reason: {e}')
-		return(None, None)
-
 def getAuditDict(auditFile):
     log_with_route(logging.INFO, f'Getting auditDict from {auditFile}')
     try:
@@ -1201,36 +532,6 @@ def getAuditDict(auditFile):
     except Exception as e:
         log_with_route(logging.ERROR, f'Failed to open {auditFile}')
 
-def getPayloadQueue(queueDir):
-    payloadstoProcessList = []
-    log_with_route(logging.INFO, f'Getting list of files from: {queueDir}')
-    try:
-        for payloadFile in os.listdir(queueDir):
-            # Get the full path but preserve the original filename format
-            full_path = os.path.join(queueDir, payloadFile)
-            if os.path.isfile(full_path):  # Only add if it's a file
-                payloadstoProcessList.append(payloadFile)
-
-        log_with_route(logging.DEBUG, f'payloadstoProcessList: {payloadstoProcessList}')
-        return payloadstoProcessList
-    except Exception as e:
-        log_with_route(logging.ERROR, f'Error reading directory {queueDir}: {str(e)}')
-        return []
-
-def getDeviceValidity(deviceUuid):
-    log_with_route(logging.INFO, f'Validating device: {deviceUuid}')
-    try:
-        isValidDevice = Devices.query.filter_by(deviceuuid=deviceUuid).first()
-    except Exception as e:
-        log_with_route(logging.ERROR, f'Failed to query device: {deviceUuid}. Reason: {e}')
-        return(False)
-    if isValidDevice:
-        log_with_route(logging.INFO, f'device {deviceUuid} found in devices table.')
-        return(True)
-    else:
-        log_with_route(logging.ERROR, f'device {deviceUuid} not found in devices table.')
-        return(False)
-
 def reregisterOrphanedDevice(deviceUuid, audit_data=None):
     """Attempt to re-register a device that was deleted, with strict tenant isolation"""
     log_with_route(logging.INFO, f'Attempting to re-register orphaned device: {deviceUuid}')
@@ -1356,35 +657,18 @@ def reregisterOrphanedDevice(deviceUuid, audit_data=None):
         return False
 
 def readJsonSchema(payloadAuditSchemaFile):
-	log_with_route(logging.INFO, f'Reading payloadAuditSchema file: {payloadAuditSchemaFile}')
-
-	payloadAuditSchema = None
-	try:
-		with open(payloadAuditSchemaFile, 'r') as f:
-			payloadAuditSchema = json.load(f)
-		log_with_route(logging.INFO, 'payloadAuditSchema read successfully.')
-	except Exception as e:
-		log_with_route(logging.ERROR, f'Failed to read {payloadAuditSchemaFile}. Reason: {e}')
-		return None
-
-	if not isinstance(payloadAuditSchema, dict):
-		log_with_route(
-			logging.ERROR,
-			f'Invalid schema type in {payloadAuditSchemaFile}: expected object/dict, got {type(payloadAuditSchema).__name__}'
-		)
-		return None
-
-	return payloadAuditSchema
+	"""Return the compiled schema from the process-wide registry; the file is only re-read when it changes"""
+	from app.utilities.schema_registry import schema_registry
+	return schema_registry.get(payloadAuditSchemaFile)
 
 def validateData(data, payloadAuditSchema):
     log_with_route(logging.INFO, 'Validating data...')
-    try:
-        validate(instance=data, schema=payloadAuditSchema)
+    isValid, reason = payloadAuditSchema.validate(data)
+    if isValid:
         log_with_route(logging.INFO, 'Received JSON is valid.')
         return True, data
-    except ValidationError as e:
-        log_with_route(logging.ERROR, f'Received JSON is invalid. Reason: {e}')
-        return False, data
+    log_with_route(logging.ERROR, f'Received JSON is invalid. Reason: {reason}')
+    return False, data
 
 def writeBadFile(badDir, data, type):
     outFile = os.path.join(badDir, f'{time.time()}.{type}.json')
@@ -1403,7 +687,7 @@ def writeJsonFile(queueDir, jsonData, deviceUuid, type):
         with open(outFile, 'w') as f:
             f.write(json.dumps(jsonData, indent=4))
         log_with_route(logging.INFO, f'Data written to: {outFile}')
-        return True
+        return outFile
     except Exception as e:
         log_with_route(logging.ERROR, f'Failed to write to {outFile}. Reason: {e}')
         return False
@@ -29,7 +29,7 @@ from app.utilities.app_logging_helper import log_with_route
 import logging
 
 # Models and database
-from app.models import db, Accounts, Tenants, Organisations, Devices, Groups, Roles, UserXOrganisation, DeviceMetadata, HealthScoreHistory
+from app.models import db, Accounts, Tenants, Organisations, Devices, Groups, Roles, UserXOrganisation, DeviceMetadata
 from flask_mail import Message
 from app import mail, master_permission, admin_or_master_permission
 
@@ -52,9 +52,9 @@ import secrets
 import string
 import uuid
 from dotenv import load_dotenv
-from collections import defaultdict
 
 from app.utilities.guided_tour_manager import get_tour_for_page
+from app.utilities.health_score_timeseries import get_chart_health_series, RESOLUTION_SECONDS
 
 # Import CSV import blueprint
 from app.routes.tenant.csv_import import csv_import_bp
@@ -367,9 +367,7 @@ def tenant_profile():
 def get_tenant_health_history(tenant_uuid):
     try:
         tenant_info = get_tenant_info(tenant_uuid)
-        history = HealthScoreHistory.query.filter_by(entity_type='tenant', entity_uuid=tenant_uuid).order_by(HealthScoreHistory.timestamp).all()
-
-        data = aggregate_by_day(history)
+        data = get_chart_health_series('tenant', [tenant_uuid], min_step=RESOLUTION_SECONDS['day'])
         data.append({'x': datetime.utcnow().date().isoformat(), 'y': tenant_info['health_score']})
 
         return jsonify(data)
@@ -388,20 +386,16 @@ def get_cascading_health_history(tenant_uuid):
         # Add logging for query execution
         log_with_route(logging.INFO, f"Fetching health history for tenant {tenant_uuid}")
 
-        tenant_history = HealthScoreHistory.query.filter_by(entity_type='tenant', entity_uuid=tenant_uuid).order_by(HealthScoreHistory.timestamp).all()
-        org_history = HealthScoreHistory.query.filter_by(entity_type='organisation').join(Organisations, HealthScoreHistory.entity_uuid == Organisations.orguuid).filter(Organisations.tenantuuid == tenant_uuid).order_by(HealthScoreHistory.timestamp).all()
-        group_history = HealthScoreHistory.query.filter_by(entity_type='group').join(Groups, HealthScoreHistory.entity_uuid == Groups.groupuuid).filter(Groups.tenantuuid == tenant_uuid).order_by(HealthScoreHistory.timestamp).all()
-
-        # Log counts to identify empty datasets
-        log_with_route(logging.INFO, f"Health history counts - Tenant: {len(tenant_history)}, Org: {len(org_history)}, Group: {len(group_history)}")
+        org_uuids = [row.orguuid for row in Organisations.query.with_entities(Organisations.orguuid).filter_by(tenantuuid=tenant_uuid)]
+        group_uuids = [row.groupuuid for row in Groups.query.with_entities(Groups.groupuuid).filter_by(tenantuuid=tenant_uuid)]
 
         # Always ensure we have at least the current health score point for tenant
-        tenant_data = aggregate_by_day(tenant_history)
+        tenant_data = get_chart_health_series('tenant', [tenant_uuid], min_step=RESOLUTION_SECONDS['day'])
         current_time = datetime.utcnow().date().isoformat()
         tenant_data.append({'x': current_time, 'y': tenant_info['health_score']})
 
         # If no org or group history, provide at least one data point with current time
-        org_data = aggregate_by_day(org_history)
+        org_data = get_chart_health_series('organisation', org_uuids, min_step=RESOLUTION_SECONDS['day'])
         if not org_data:
             # Calculate average org health score or use tenant score as fallback
             orgs = Organisations.query.filter_by(tenantuuid=tenant_uuid).all()
@@ -411,7 +405,7 @@ def get_cascading_health_history(tenant_uuid):
             else:
                 org_data.append({'x': current_time, 'y': tenant_info['health_score']})
 
-        group_data = aggregate_by_day(group_history)
+        group_data = get_chart_health_series('group', group_uuids, min_step=RESOLUTION_SECONDS['day'])
         if not group_data:
             # Calculate average group health score or use tenant score as fallback
             groups = Groups.query.filter_by(tenantuuid=tenant_uuid).all()
@@ -443,10 +437,8 @@ def get_cascading_health_history(tenant_uuid):
 @login_required
 def get_group_health_history(tenant_uuid):
     try:
-        history = HealthScoreHistory.query.filter_by(entity_type='group').join(
-            Groups, HealthScoreHistory.entity_uuid == Groups.groupuuid
-        ).filter(Groups.tenantuuid == tenant_uuid).order_by(HealthScoreHistory.timestamp).all()
-        data = aggregate_by_day(history)
+        group_uuids = [row.groupuuid for row in Groups.query.with_entities(Groups.groupuuid).filter_by(tenantuuid=tenant_uuid)]
+        data = get_chart_health_series('group', group_uuids, min_step=RESOLUTION_SECONDS['day'])
         return jsonify(data)
     except Exception as e:
         log_with_route(logging.ERROR, f"Error in get_group_health_history: {str(e)}", exc_info=True)
@@ -456,10 +448,8 @@ def get_group_health_history(tenant_uuid):
 @login_required
 def get_org_health_history(tenant_uuid):
     try:
-        history = HealthScoreHistory.query.filter_by(entity_type='organisation').join(
-            Organisations, HealthScoreHistory.entity_uuid == Organisations.orguuid
-        ).filter(Organisations.tenantuuid == tenant_uuid).order_by(HealthScoreHistory.timestamp).all()
-        data = aggregate_by_day(history)
+        org_uuids = [row.orguuid for row in Organisations.query.with_entities(Organisations.orguuid).filter_by(tenantuuid=tenant_uuid)]
+        data = get_chart_health_series('organisation', org_uuids, min_step=RESOLUTION_SECONDS['day'])
         return jsonify(data)
     except Exception as e:
         log_with_route(logging.ERROR, f"Error in get_org_health_history: {str(e)}", exc_info=True)
@@ -469,10 +459,8 @@ def get_org_health_history(tenant_uuid):
 @login_required
 def get_device_health_history(tenant_uuid):
     try:
-        history = HealthScoreHistory.query.filter_by(entity_type='device').join(
-            Devices, HealthScoreHistory.entity_uuid == Devices.deviceuuid
-        ).filter(Devices.tenantuuid == tenant_uuid).order_by(HealthScoreHistory.timestamp).all()
-        data = aggregate_by_day(history)
+        device_uuids = [row.deviceuuid for row in Devices.query.with_entities(Devices.deviceuuid).filter_by(tenantuuid=tenant_uuid)]
+        data = get_chart_health_series('device', device_uuids, min_step=RESOLUTION_SECONDS['day'])
         return jsonify(data)
     except Exception as e:
         log_with_route(logging.ERROR, f"Error in get_device_health_history: {str(e)}", exc_info=True)
@@ -608,17 +596,6 @@ def get_device_info(tenant_uuid):
         'devices': [{'devicename': device.devicename, 'deviceuuid': device.deviceuuid} for device in devices]
     }
 
-def aggregate_by_day(history):
-    daily = defaultdict(list)
-    for h in history:
-        day = h.timestamp.date().isoformat()
-        daily[day].append(h.health_score)
-    return [
-        {"x": day, "y": sum(scores) / len(scores)}
-        for day, scores in sorted(daily.items())
-    ]
-
-
 def get_pending_and_processed_counts(tenant_uuid):
     """Get pending and processed analysis counts for a tenant from devicemetadata"""
     try:
@@ -25,10 +25,11 @@ from app.utilities.ui_wegcoins_currencystate import get_tenant_wegcoin_balance
 
 # Logging
 from app.utilities.app_logging_helper import log_with_route
+from app.utilities.health_score_timeseries import get_chart_health_series
 import logging
 
 # Models and database
-from app.models import db, Accounts, Tenants, Organisations, Devices, Groups, Roles, UserXOrganisation, DeviceMetadata, HealthScoreHistory
+from app.models import db, Accounts, Tenants, Organisations, Devices, Groups, Roles, UserXOrganisation, DeviceMetadata
 from flask_mail import Message
 from app import mail, master_permission, admin_or_master_permission
 
@@ -346,13 +347,7 @@ def get_device_health_history(device_uuid):
         device = Devices.query.get_or_404(device_uuid)
         
         # Get historical health scores
-        history = HealthScoreHistory.query.filter_by(
-            entity_type='device',
-            entity_uuid=device_uuid
-        ).order_by(HealthScoreHistory.timestamp).all()
-        
-        # Format data for response
-        data = [{'x': h.timestamp.isoformat(), 'y': h.health_score} for h in history]
+        data = get_chart_health_series('device', [device_uuid])
         
         # Add current health score if available
         if device.health_score is not None:
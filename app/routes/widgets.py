@@ -4,7 +4,8 @@ from flask import Blueprint, render_template, request, jsonify, session, g
 from flask_principal import Permission, RoleNeed
 from sqlalchemy import func
 from datetime import datetime, timedelta
-from app.models import db, Devices, Tenants, Organisations, Groups, DeviceStatus, DeviceRealtimeData,  DeviceRealtimeHistory, DeviceMetadata
+from app.models import db, Devices, Tenants, Organisations, Groups, DeviceStatus, DeviceRealtimeData, DeviceMetadata
+from app.utilities.device_metrics_timeseries import extract_metrics, record_metric_samples, get_chart_metric_series
 from app.utilities.ui_widgets_get_coordinates_from_ip import get_coordinates_from_ip
 from app.utilities.app_access_login_required import login_required
 import logging
@@ -25,6 +26,15 @@ admin_permission = Permission(RoleNeed('admin'))
 master_permission = Permission(RoleNeed('master'))
 master_or_admin_permission = Permission(RoleNeed('master'), RoleNeed('admin'))
 
+# Socket history stats -> device metric names
+SOCKET_STAT_METRICS = {
+    'total_connections': 'sockets_total',
+    'listening_ports': 'sockets_listening',
+    'established_connections': 'sockets_established',
+    'unusual_ports': 'sockets_unusual',
+    'foreign_connections': 'sockets_foreign',
+}
+
 @widgets_bp.route('/widgets/devices/onboarded')
 def devices_onboarded():
     now = datetime.utcnow()
@@ -121,36 +131,35 @@ def map():
 @master_or_admin_permission.require(http_exception=403)
 def map_data():
     try:
-        devices = db.session.query(DeviceStatus).filter(DeviceStatus.publicIp != None, DeviceStatus.country != None).all()
-        
-        # Use a dictionary to group devices by their public IP address
-        ip_to_device_map = {}
-        for device in devices:
-            if device.publicIp not in ip_to_device_map:
-                lat, lon = get_coordinates_from_ip(device.publicIp)
-                if lat and lon:
-                    ip_to_device_map[device.publicIp] = {
-                        'latitude': lat,
-                        'longitude': lon,
-                        'devices': []
-                    }
-            
-            # Append device information to the list associated with the IP
-            ip_to_device_map[device.publicIp]['devices'].append({
-                'deviceuuid': str(device.deviceuuid),
-                'devicename': device.system_name,
-                'country': device.country
-            })
+        # One row per public IP; coordinates were stored when the audit was ingested
+        rows = db.session.query(
+            DeviceStatus.publicIp,
+            func.max(DeviceStatus.latitude).label('latitude'),
+            func.max(DeviceStatus.longitude).label('longitude'),
+            func.count().label('device_count'),
+            func.json_agg(func.json_build_object(
+                'deviceuuid', DeviceStatus.deviceuuid,
+                'devicename', DeviceStatus.system_name,
+                'country', DeviceStatus.country
+            )).label('devices')
+        ).filter(
+            DeviceStatus.publicIp != None
+        ).group_by(DeviceStatus.publicIp).all()
 
-        # Convert the dictionary to a list for JSON serialization
         device_list = []
-        for ip, data in ip_to_device_map.items():
+        for row in rows:
+            latitude, longitude = row.latitude, row.longitude
+            if latitude is None or longitude is None:
+                # Audited before geolocation was stored; served from the process-wide lookup cache
+                latitude, longitude = get_coordinates_from_ip(row.publicIp)
+                if latitude is None or longitude is None:
+                    continue
             device_list.append({
-                'publicIp': ip,
-                'latitude': data['latitude'],
-                'longitude': data['longitude'],
-                'device_count': len(data['devices']),  # Count of devices
-                'devices': data['devices']
+                'publicIp': row.publicIp,
+                'latitude': latitude,
+                'longitude': longitude,
+                'device_count': row.device_count,
+                'devices': row.devices
             })
 
         log_with_route(logging.INFO, f"Map data fetched successfully with {len(device_list)} unique IPs.")
@@ -171,39 +180,38 @@ def map_embed():
         return jsonify({"error": "Failed to render map widget"}), 500
 
 
-@widgets_bp.route('/widgets/<uuid:device_uuid>/realtime-data', methods=['POST'])
-@csrf.exempt
-def add_realtime_data(device_uuid):
-    try:
-        data = request.get_json()
-        current_time = int(time.time())
-        data_value_json = json.dumps(data['data_value'])
-
-        # Add to history
-        new_history = DeviceRealtimeHistory(
+def _store_realtime_sample(device_uuid, data):
+    """
+    Keep the latest value of a realtime data type and fold its numeric fields
+    into the device metric time series. Commits.
+    """
+    current_time = int(time.time())
+    data_value_json = json.dumps(data['data_value'])
+
+    updated = DeviceRealtimeData.query.filter_by(
+        deviceuuid=device_uuid,
+        data_type=data['data_type']
+    ).update({'data_value': data_value_json, 'last_updated': current_time}, synchronize_session=False)
+    if not updated:
+        db.session.add(DeviceRealtimeData(
             deviceuuid=device_uuid,
             data_type=data['data_type'],
             data_value=data_value_json,
-            timestamp=current_time
-        )
-        db.session.add(new_history)
+            last_updated=current_time
+        ))
 
-        # Delete existing realtime entries
-        DeviceRealtimeData.query.filter_by(
-            deviceuuid=device_uuid,
-            data_type=data['data_type']
-        ).delete()
+    metrics = extract_metrics(data['data_type'], data['data_value'])
+    if metrics:
+        record_metric_samples([(device_uuid, current_time, metrics)])
+    db.session.commit()
 
-        # Create new realtime entry
-        new_realtime = DeviceRealtimeData(
-            deviceuuid=device_uuid,
-            data_type=data['data_type'],
-            data_value=data_value_json,
-            last_updated=current_time
-        )
-        db.session.add(new_realtime)
 
-        db.session.commit()
+@widgets_bp.route('/widgets/<uuid:device_uuid>/realtime-data', methods=['POST'])
+@csrf.exempt
+def add_realtime_data(device_uuid):
+    try:
+        data = request.get_json()
+        _store_realtime_sample(device_uuid, data)
         log_with_route(logging.INFO, f"Real-time data for device {device_uuid} added successfully.")
         return jsonify({"message": "Real-time data added successfully"}), 201
 
@@ -320,29 +328,8 @@ def get_latest_cpu_data():
 @login_required
 def get_device_cpu_history(device_uuid):
     try:
-        # Get the last 24 hours of CPU data
-        cutoff_time = int(time.time()) - (24 * 60 * 60)
-        
-        history_data = db.session.query(
-            DeviceRealtimeHistory.timestamp,
-            DeviceRealtimeHistory.data_value
-        ).filter(
-            DeviceRealtimeHistory.deviceuuid == device_uuid,
-            DeviceRealtimeHistory.data_type == 'osquery-info',
-            DeviceRealtimeHistory.timestamp >= cutoff_time
-        ).order_by(DeviceRealtimeHistory.timestamp.asc()).all()
-
-        # Format data for ApexCharts
-        formatted_data = []
-        for timestamp, data_value in history_data:
-            try:
-                data_dict = json.loads(data_value)
-                load_percentage = float(data_dict.get('load_percentage', 0))
-                # Convert timestamp to milliseconds for ApexCharts
-                formatted_data.append([timestamp * 1000, load_percentage])
-            except (json.JSONDecodeError, ValueError, TypeError) as e:
-                log_with_route(logging.ERROR, f"Error parsing data value: {str(e)}")
-                continue
+        # Last 24 hours of CPU load as [[ms, percent], ...] for ApexCharts
+        formatted_data = get_chart_metric_series(device_uuid, ['cpu_load'])['cpu_load']
 
         log_with_route(logging.INFO, f"Successfully retrieved CPU history for device {device_uuid}")
         return jsonify(formatted_data)
@@ -358,32 +345,7 @@ def get_device_cpu_history(device_uuid):
 def add_realtime_ram_data(device_uuid):
     try:
         data = request.get_json()
-        current_time = int(time.time())
-
-        # Add to history
-        new_history = DeviceRealtimeHistory(
-            deviceuuid=device_uuid,
-            data_type=data['data_type'],
-            data_value=json.dumps(data['data_value']),
-            timestamp=current_time
-        )
-        db.session.add(new_history)
-
-        # Update realtime data
-        DeviceRealtimeData.query.filter_by(
-            deviceuuid=device_uuid,
-            data_type=data['data_type']
-        ).delete()
-        
-        new_realtime = DeviceRealtimeData(
-            deviceuuid=device_uuid,
-            data_type=data['data_type'],
-            data_value=json.dumps(data['data_value']),
-            last_updated=current_time
-        )
-        db.session.add(new_realtime)
-
-        db.session.commit()
+        _store_realtime_sample(device_uuid, data)
         return jsonify({"message": "Success"}), 201
 
     except Exception as e:
@@ -430,25 +392,7 @@ def get_latest_ram_data():
 @login_required
 def get_device_ram_history(device_uuid):
     try:
-        cutoff_time = int(time.time()) - (24 * 60 * 60)
-        
-        history_data = db.session.query(
-            DeviceRealtimeHistory.timestamp,
-            DeviceRealtimeHistory.data_value
-        ).filter(
-            DeviceRealtimeHistory.deviceuuid == device_uuid,
-            DeviceRealtimeHistory.data_type == 'osquery-info-ram',
-            DeviceRealtimeHistory.timestamp >= cutoff_time
-        ).order_by(DeviceRealtimeHistory.timestamp.asc()).all()
-
-        formatted_data = []
-        for timestamp, data_value in history_data:
-            try:
-                data_dict = json.loads(data_value)
-                memory_percentage = float(data_dict.get('memory_percentage', 0))
-                formatted_data.append([timestamp * 1000, memory_percentage])
-            except Exception as e:
-                continue
+        formatted_data = get_chart_metric_series(device_uuid, ['memory_percentage'])['memory_percentage']
 
         return jsonify(formatted_data)
 
@@ -464,32 +408,7 @@ def get_device_ram_history(device_uuid):
 def add_realtime_socket_data(device_uuid):
     try:
         data = request.get_json()
-        current_time = int(time.time())
-
-        # Add to history
-        new_history = DeviceRealtimeHistory(
-            deviceuuid=device_uuid,
-            data_type=data['data_type'],
-            data_value=json.dumps(data['data_value']),
-            timestamp=current_time
-        )
-        db.session.add(new_history)
-
-        # Update realtime data
-        DeviceRealtimeData.query.filter_by(
-            deviceuuid=device_uuid,
-            data_type=data['data_type']
-        ).delete()
-        
-        new_realtime = DeviceRealtimeData(
-            deviceuuid=device_uuid,
-            data_type=data['data_type'],
-            data_value=json.dumps(data['data_value']),
-            last_updated=current_time
-        )
-        db.session.add(new_realtime)
-
-        db.session.commit()
+        _store_realtime_sample(device_uuid, data)
         return jsonify({"message": "Success"}), 201
 
     except Exception as e:
@@ -532,29 +451,17 @@ def get_latest_socket_data():
 @login_required
 def get_device_socket_history(device_uuid):
     try:
-        cutoff_time = int(time.time()) - (24 * 60 * 60)  # Last 24 hours
-        
-        history_data = db.session.query(
-            DeviceRealtimeHistory.timestamp,
-            DeviceRealtimeHistory.data_value
-        ).filter(
-            DeviceRealtimeHistory.deviceuuid == device_uuid,
-            DeviceRealtimeHistory.data_type == 'osquery-info-sockets',
-            DeviceRealtimeHistory.timestamp >= cutoff_time
-        ).order_by(DeviceRealtimeHistory.timestamp.asc()).all()
-
-        formatted_data = []
-        for timestamp, data_value in history_data:
-            try:
-                data_dict = json.loads(data_value)
-                stats = data_dict.get('stats', {})
-                formatted_data.append({
-                    'timestamp': timestamp * 1000,  # Convert to milliseconds for charts
-                    'stats': stats,
-                    'connections': data_dict.get('connections', [])
-                })
-            except Exception as e:
-                continue
+        # Last 24 hours of socket counts; connection lists are only kept for the latest sample
+        series = get_chart_metric_series(device_uuid, SOCKET_STAT_METRICS.values())
+        stats_by_timestamp = {}
+        for stat, metric in SOCKET_STAT_METRICS.items():
+            for timestamp, value in series[metric]:
+                stats_by_timestamp.setdefault(timestamp, {})[stat] = value
+
+        formatted_data = [
+            {'timestamp': timestamp, 'stats': stats}
+            for timestamp, stats in sorted(stats_by_timestamp.items())
+        ]
 
         return jsonify(formatted_data)
 
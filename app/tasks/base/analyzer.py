@@ -2,14 +2,16 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-from app.models import db, DeviceMetadata, Devices
+from app.models import db, DeviceMetadata, Devices, Tenants
 import logging
 import json
 import jsonschema
 import bleach
 
 from .definitions import AnalysisDefinitions
-from .exclusions import build_exclusion_block, get_tenant_prompt_config, get_density_config
+from .exclusions import build_exclusion_block
+from .tenant_context import tenant_context_cache, TenantContext
+from .result_cache import build_cache_key, lookup_result, store_result
 from flask import current_app
 
 # JSON Schema for validating AI responses
@@ -34,6 +36,17 @@ ANALYSIS_RESPONSE_SCHEMA = {
 class BaseAnalyzer(ABC):
     """Base class for all analyzers"""
 
+    # Bump when the prompt template changes so cached results are not reused
+    prompt_version = 1
+    # Input keys that differ between otherwise identical payloads (e.g. collection timestamps)
+    dedup_ignore_keys = ()
+
+    # Set by prepare(): result cache key, a cached result to reuse, or the
+    # identical item earlier in the same batch whose result to reuse
+    cache_key = None
+    cached_result = None
+    leader = None
+
     def __init__(self, device_id: str, metadata_id: str):
         self.device_id = device_id
         self.metadata_id = metadata_id
@@ -70,13 +83,16 @@ class BaseAnalyzer(ABC):
         """Get tenant ID for the current device"""
         if hasattr(self, 'device_id') and self.device_id:
             try:
-                device = db.session.get(Devices, self.device_id)
-                if device:
-                    return str(device.tenantuuid)
+                return tenant_context_cache.tenant_for_device(self.device_id)
             except Exception as e:
                 logging.error(f"Error getting tenant ID: {e}")
         return None
 
+    def get_tenant_context(self) -> Optional[TenantContext]:
+        """Cached settings and balance of the current device's tenant"""
+        tenant_id = self.get_tenant_id()
+        return tenant_context_cache.get(tenant_id) if tenant_id else None
+
     def get_custom_criteria(self, default_criteria: str) -> str:
         """Get tenant's custom criteria prompt or return default.
         
@@ -86,11 +102,9 @@ class BaseAnalyzer(ABC):
         Returns:
             Tenant's custom criteria if set, otherwise the default
         """
-        tenant_id = self.get_tenant_id()
-        if tenant_id:
-            prompt_config = get_tenant_prompt_config(tenant_id, self.task_type)
-            if prompt_config and prompt_config.criteria_prompt:
-                return prompt_config.criteria_prompt
+        tenant_context = self.get_tenant_context()
+        if tenant_context:
+            return tenant_context.get_criteria(self.task_type, default_criteria)
         return default_criteria
 
     def get_density(self) -> Dict[str, int]:
@@ -98,9 +112,9 @@ class BaseAnalyzer(ABC):
         
         Returns tenant's custom config if set, otherwise defaults.
         """
-        tenant_id = self.get_tenant_id()
-        if tenant_id:
-            return get_density_config(tenant_id, self.task_type)
+        tenant_context = self.get_tenant_context()
+        if tenant_context:
+            return tenant_context.get_density(self.task_type)
         from app.models.analysis_config import get_default_density_config
         return get_default_density_config()
 
@@ -225,32 +239,33 @@ class BaseAnalyzer(ABC):
                 return False
 
             try:
-                device_pk = _uuid.UUID(str(self.device_id))
+                _uuid.UUID(str(self.device_id))
             except Exception:
                 logging.error(f"Invalid device_id format: {self.device_id}")
                 return False
 
             metadata = db.session.get(DeviceMetadata, metadata_pk)
-            device = db.session.get(Devices, device_pk)
 
             if not metadata or not metadata.metalogos:
                 logging.error(f"Missing or invalid metadata for {self.metadata_id}")
                 return False
 
-            # Check tenant has enough wegcoins
-            if not device.tenant.available_wegcoins >= self.get_cost():
-                # Disable all analyses for this tenant instead of repeatedly logging
-                if device.tenant.recurring_analyses_enabled:
-                    device.tenant.disable_all_analyses()
-                    db.session.commit()
-                    logging.warning(f"Disabled all analyses for tenant {device.tenant.tenantuuid} due to insufficient wegcoins")
-                return False
-
             # Verify device exists and belongs to tenant
-            if not device:
+            tenant_context = self.get_tenant_context()
+            if not tenant_context:
                 logging.error(f"Device not found: {self.device_id}")
                 return False
 
+            # Check tenant has enough wegcoins (advisory; bill_tenant reserves atomically)
+            if not tenant_context.available_wegcoins >= self.get_cost():
+                # Disable all analyses for this tenant instead of repeatedly logging
+                if tenant_context.recurring_analyses_enabled:
+                    tenant = db.session.get(Tenants, _uuid.UUID(tenant_context.tenant_id))
+                    tenant.disable_all_analyses()
+                    db.session.commit()
+                    logging.warning(f"Disabled all analyses for tenant {tenant_context.tenant_id} due to insufficient wegcoins")
+                return False
+
             # Verify metadata belongs to device
             if str(metadata.deviceuuid) != str(self.device_id):
                 logging.error(f"Metadata {self.metadata_id} does not belong to device {self.device_id}")
@@ -272,14 +287,16 @@ class BaseAnalyzer(ABC):
             logging.error(f"Validation error: {str(e)}")
             return False
 
-    def bill_tenant(self, device: Devices) -> bool:
-        """Process billing for the analysis"""
+    def bill_tenant(self, device: Optional[Devices] = None, reused: bool = False) -> bool:
+        """Process billing for the analysis; reused results are free if ANALYSIS_DEDUP_BILLING is 'free'"""
+        if reused and current_app.config.get('ANALYSIS_DEDUP_BILLING', 'full') == 'free':
+            return True
         try:
             cost = self.get_cost()
-            tenant = device.tenant
-            logging.info(f"Billing tenant {tenant.tenantuuid} {cost} wegcoins for {self.task_type}")
+            tenant_id = str(device.tenantuuid) if device else self.get_tenant_id()
+            logging.info(f"Billing tenant {tenant_id} {cost} wegcoins for {self.task_type}")
 
-            return tenant.deduct_wegcoins(cost, f"{self.task_type} analysis")
+            return tenant_context_cache.reserve_wegcoins(tenant_id, cost, f"{self.task_type} analysis")
 
         except Exception as e:
             logging.error(f"Billing error: {str(e)}")
@@ -294,77 +311,156 @@ class BaseAnalyzer(ABC):
             azure_endpoint=current_app.config["AZURE_OPENAI_ENDPOINT"]
         )
 
+    def get_cache_key(self, data: Dict[str, Any], device_data: Any = None) -> Optional[str]:
+        """Result cache key for this input, or None if deduplication is off"""
+        if not current_app.config.get('ANALYSIS_DEDUP_ENABLED', True):
+            return None
+        tenant_context = self.get_tenant_context()
+        if not tenant_context:
+            return None
+        return build_cache_key(
+            self.task_type,
+            self.prompt_version,
+            tenant_context.tenant_id,
+            tenant_context.get_prompt_config(self.task_type),
+            self.get_exclusion_block(),
+            data,
+            device_data,
+            self.dedup_ignore_keys
+        )
+
+    def prepare(self, data: Dict[str, Any], in_flight: Optional[Dict[str, 'BaseAnalyzer']] = None) -> Optional[str]:
+        """Validate, bill and build the prompt for this item.
+
+        Returns None if no prompt is needed because the result can be reused:
+        either from the result cache (self.cached_result) or from an identical
+        item earlier in the same batch (self.leader, found through in_flight).
+        Raises ValueError if the item must not be sent to the model.
+        """
+        if not self.validate():
+            raise ValueError("Validation failed")
+
+        # Add device data to context if analyzer has get_data_sources method
+        device_data = None
+        if hasattr(self, 'get_data_sources'):
+            device_data = self.get_data_sources(self.device_id)
+
+        self.cache_key = self.get_cache_key(data, device_data)
+        if self.cache_key:
+            leader = in_flight.get(self.cache_key) if in_flight is not None else None
+            cached = None if leader else lookup_result(self.cache_key)
+            if leader or cached:
+                if not self.bill_tenant(reused=True):
+                    raise ValueError("Billing failed")
+                self.leader, self.cached_result = leader, cached
+                logging.info(f"Reusing {'in-flight' if leader else 'cached'} {self.task_type} result "
+                             f"for device {self.device_id}")
+                return None
+
+        # Process billing first - this handles its own transaction
+        if not self.bill_tenant():
+            raise ValueError("Billing failed")
+
+        if self.cache_key and in_flight is not None:
+            in_flight[self.cache_key] = self
+
+        # Get historical context
+        context = self.get_historical_context()
+        if hasattr(self, 'get_data_sources'):
+            context['device_data'] = device_data
+
+        # Create prompt with context
+        return self.create_prompt(data, context)
+
+    def reused_result(self) -> Dict[str, Any]:
+        """The cached result prepare() found for this item"""
+        return dict(self.cached_result, timestamp=datetime.utcnow().isoformat())
+
+    def request_completion(self, prompt: str, client=None) -> str:
+        """Send the prompt to the model and return the raw response text.
+
+        Does not touch the database, so it can run outside the app context
+        when a client is passed in.
+        """
+        client = client or self.get_ai_client()
+        response = client.chat.completions.create(
+            model="wegweiser",
+            messages=[
+                {"role": "system", "content": "You are a Linux system analyst."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=self.config.get('max_tokens', 1500),
+            temperature=self.config.get('temperature', 0.5)
+        )
+        return response.choices[0].message.content
+
+    def apply_result(self, result: Dict[str, Any]) -> None:
+        """Write a parsed result to the metadata row and, if fresh, the result cache (caller commits)"""
+        import uuid as _uuid
+        metadata = db.session.get(DeviceMetadata, _uuid.UUID(str(self.metadata_id)))
+        metadata.ai_analysis = result['analysis']
+        metadata.score = result['score']
+        metadata.processing_status = 'processed'
+        metadata.analyzed_at = int(datetime.utcnow().timestamp())
+
+        if self.cache_key and self.cached_result is None and self.leader is None:
+            store_result(self.cache_key, self.get_tenant_id(), self.task_type, result,
+                         current_app.config.get('ANALYSIS_DEDUP_TTL', 86400))
+
+    def apply_failure(self, error: Exception) -> Dict[str, Any]:
+        """Mark the metadata row as failed (caller commits) and return the failure result"""
+        import uuid as _uuid
+        metadata = db.session.get(DeviceMetadata, _uuid.UUID(str(self.metadata_id)))
+        if metadata:
+            metadata.processing_status = 'failed'
+            metadata.ai_analysis = f'<p>Analysis failed: {str(error)}</p>'
+            metadata.score = 0
+            metadata.analyzed_at = int(datetime.utcnow().timestamp())
+        return {
+            'analysis': f'<p>Analysis failed: {str(error)}</p>',
+            'score': 0,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+    def log_failure(self, error: Exception) -> None:
+        msg = f"Analysis error for {self.task_type} on device {self.device_id}: {str(error)}"
+        if str(error) == "Validation failed":
+            logging.info(msg)
+        else:
+            logging.error(msg)
+
     def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute analysis with historical context"""
         try:
-            # Get device and validate before transaction
-            import uuid as _uuid
-            device = db.session.get(Devices, _uuid.UUID(str(self.device_id)))
-            if not self.validate():
-                raise ValueError("Validation failed")
-
-            # Process billing first - this handles its own transaction
-            if not self.bill_tenant(device):
-                raise ValueError("Billing failed")
-
-            # Get historical context
-            context = self.get_historical_context()
-
-            # Add device data to context if analyzer has get_data_sources method
-            if hasattr(self, 'get_data_sources'):
-                context['device_data'] = self.get_data_sources(self.device_id)
-
-            # Create prompt with context
-            prompt = self.create_prompt(data, context)
-
-            # Get AI response
-            client = self.get_ai_client()
-            response = client.chat.completions.create(
-                model="wegweiser",
-                messages=[
-                    {"role": "system", "content": "You are a Linux system analyst."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.config.get('max_tokens', 1500),
-                temperature=self.config.get('temperature', 0.5)
-            )
+            prompt = self.prepare(data)
+
+            if prompt is None:
+                result = self.reused_result()
+            else:
+                # Get AI response
+                response = self.request_completion(prompt)
 
-            # Parse response
-            result = self.parse_response(response.choices[0].message.content)
+                # Parse response
+                result = self.parse_response(response)
 
             # Update metadata
-            metadata = db.session.get(DeviceMetadata, _uuid.UUID(str(self.metadata_id)))
-            metadata.ai_analysis = result['analysis']
-            metadata.score = result['score']
-            metadata.processing_status = 'processed'
-            metadata.analyzed_at = int(datetime.utcnow().timestamp())
+            self.apply_result(result)
 
             db.session.commit()
             return result
 
         except Exception as e:
-            msg = f"Analysis error for {self.task_type} on device {self.device_id}: {str(e)}"
-            if str(e) == "Validation failed":
-                logging.info(msg)
-            else:
-                logging.error(msg)
+            self.log_failure(e)
             # Best-effort mark as failed to avoid stuck 'processing' items
             try:
-                import uuid as _uuid
-                metadata = db.session.get(DeviceMetadata, _uuid.UUID(str(self.metadata_id)))
-                if metadata:
-                    metadata.processing_status = 'failed'
-                    metadata.ai_analysis = f'<p>Analysis failed: {str(e)}</p>'
-                    metadata.score = 0
-                    metadata.analyzed_at = int(datetime.utcnow().timestamp())
-                    db.session.commit()
-                else:
-                    db.session.rollback()
+                result = self.apply_failure(e)
+                db.session.commit()
             except Exception as _e:
                 logging.error(f"Failed to mark metadata as failed: {_e}")
                 db.session.rollback()
-            return {
-                'analysis': f'<p>Analysis failed: {str(e)}</p>',
-                'score': 0,
-                'timestamp': datetime.utcnow().isoformat()
-            }
\ No newline at end of file
+                result = {
+                    'analysis': f'<p>Analysis failed: {str(e)}</p>',
+                    'score': 0,
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+            return result
@@ -0,0 +1,128 @@
+# Filepath: app/tasks/base/result_cache.py
+"""
+Content-addressed cache of analysis results.
+
+Devices built from the same image often submit identical metalogos. The cache
+key is a sha256 over everything that shapes the prompt apart from the device's
+own history: the analysis type and prompt version, the tenant, the tenant's
+criteria/density configuration, the device's exclusion block, any extra
+device data the analyzer adds, and the input itself in canonical JSON form.
+A hit reuses the stored analysis and score instead of calling the model.
+
+Entries are scoped to one tenant, expire after ANALYSIS_DEDUP_TTL seconds and
+are trimmed to ANALYSIS_DEDUP_MAX_ENTRIES (least recently used first) by
+evict_analysis_result_cache_task. ANALYSIS_DEDUP_BILLING decides whether a
+hit is billed like a fresh analysis ('full') or not at all ('free').
+"""
+
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from app.extensions import celery
+from app.models import db, AnalysisResultCache
+
+
+def normalize_input(data: Any, ignore_keys: Iterable[str] = ()) -> Any:
+    """Canonical form of analysis input: volatile keys dropped, text whitespace normalised"""
+    ignore_keys = frozenset(ignore_keys)
+    if isinstance(data, dict):
+        return {str(key): normalize_input(value, ignore_keys)
+                for key, value in data.items() if key not in ignore_keys}
+    if isinstance(data, (list, tuple)):
+        return [normalize_input(value, ignore_keys) for value in data]
+    if isinstance(data, str):
+        return data.replace('\r\n', '\n').strip()
+    return data
+
+
+def build_cache_key(task_type: str, prompt_version: Any, tenant_id: str, prompt_config: Optional[Dict],
+                    exclusion_block: str, data: Any, device_data: Any = None,
+                    ignore_keys: Iterable[str] = ()) -> str:
+    material = {
+        'task_type': task_type,
+        'prompt_version': prompt_version,
+        'tenant': str(tenant_id),
+        'prompt_config': prompt_config,
+        'exclusions': exclusion_block,
+        'device_data': device_data,
+        'input': normalize_input(data, ignore_keys),
+    }
+    canonical = json.dumps(material, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def lookup_result(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Unexpired cached result for this key, recording the hit (caller commits)"""
+    now = int(time.time())
+    row = db.session.execute(text("""
+        UPDATE analysis_result_cache
+        SET hits = hits + 1, last_used_at = :now
+        WHERE cache_key = :cache_key
+        AND expires_at > :now
+        RETURNING ai_analysis, score
+    """), {'cache_key': cache_key, 'now': now}).first()
+    if row is None:
+        return None
+    return {'analysis': row.ai_analysis, 'score': row.score, 'parsing_method': 'dedup_cache'}
+
+
+def store_result(cache_key: str, tenant_id: str, task_type: str, result: Dict[str, Any], ttl: int) -> None:
+    """Insert or refresh a cached result (caller commits)"""
+    now = int(time.time())
+    stmt = insert(AnalysisResultCache).values(
+        cache_key=cache_key,
+        tenantuuid=tenant_id,
+        task_type=task_type,
+        ai_analysis=result['analysis'],
+        score=result['score'],
+        created_at=now,
+        expires_at=now + ttl,
+        last_used_at=now,
+        hits=0,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AnalysisResultCache.cache_key],
+        set_={
+            'ai_analysis': stmt.excluded.ai_analysis,
+            'score': stmt.excluded.score,
+            'created_at': stmt.excluded.created_at,
+            'expires_at': stmt.excluded.expires_at,
+            'last_used_at': stmt.excluded.last_used_at,
+        }
+    )
+    db.session.execute(stmt)
+
+
+def evict_results(max_entries: int) -> Dict[str, int]:
+    """Delete expired entries, then the least recently used beyond max_entries (caller commits)"""
+    expired = db.session.execute(
+        text("DELETE FROM analysis_result_cache WHERE expires_at <= :now"), {'now': int(time.time())}
+    ).rowcount
+    overflow = db.session.execute(text("""
+        DELETE FROM analysis_result_cache
+        WHERE cache_key IN (
+            SELECT cache_key FROM analysis_result_cache
+            ORDER BY last_used_at DESC
+            OFFSET :max_entries
+        )
+    """), {'max_entries': max_entries}).rowcount
+    return {'expired': expired, 'overflow': overflow}
+
+
+@celery.task(name='app.tasks.evict_analysis_result_cache')
+def evict_analysis_result_cache_task():
+    with current_app.app_context():
+        try:
+            evicted = evict_results(current_app.config.get('ANALYSIS_DEDUP_MAX_ENTRIES', 50000))
+            db.session.commit()
+            logging.info(f"Analysis result cache eviction: {evicted}")
+            return evicted
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Analysis result cache eviction failed: {e}")
+            return None
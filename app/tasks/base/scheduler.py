@@ -3,13 +3,16 @@ from typing import Type, Dict, Any
 from app.extensions import celery
 from app.models import db
 from app.tasks.base.analyzer import BaseAnalyzer
+from app.tasks.base.tenant_context import tenant_context_cache
 import logging
 from flask import current_app
 from sqlalchemy import desc, select, text
 from datetime import datetime
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 import time
+import uuid
 from sqlalchemy.exc import OperationalError, DatabaseError, SQLAlchemyError, NoSuchColumnError
 
 class AnalysisScheduler:
@@ -140,7 +143,8 @@ def get_pending_analysis(session, analysis_type: str, skip_ids=None):
                            DeviceMetadata.metadatauuid == row[0],
                            DeviceMetadata.processing_status == 'pending'
                        )
-                       .update({DeviceMetadata.processing_status: 'processing'}, synchronize_session=False))
+                       .update({DeviceMetadata.processing_status: 'processing',
+                                DeviceMetadata.claimed_at: int(time.time())}, synchronize_session=False))
 
             # Commit to release the row lock and persist the claim
             session.commit()
@@ -167,10 +171,226 @@ def get_pending_analysis(session, analysis_type: str, skip_ids=None):
 
     return None
 
+def claim_pending_analyses(session, analysis_type: str, limit: int):
+    """Claim up to `limit` pending rows in one statement using SKIP LOCKED.
+
+    Returns lightweight dicts like get_pending_analysis, oldest first.
+    """
+    rows = session.execute(text("""
+        UPDATE devicemetadata
+        SET processing_status = 'processing', claimed_at = :now
+        WHERE metadatauuid IN (
+            SELECT metadatauuid
+            FROM devicemetadata
+            WHERE metalogos_type = :analysis_type
+            AND processing_status = 'pending'
+            ORDER BY created_at
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING metadatauuid, deviceuuid, metalogos, created_at
+    """), {'analysis_type': analysis_type, 'limit': limit, 'now': int(time.time())}).fetchall()
+    session.commit()
+
+    return [
+        {'metadatauuid': row.metadatauuid, 'deviceuuid': row.deviceuuid, 'metalogos': row.metalogos}
+        for row in sorted(rows, key=lambda row: row.created_at)
+    ]
+
+def release_analyses(session, metadata_uuids, status: str = 'pending') -> int:
+    """Set claimed rows that are still 'processing' to status and commit"""
+    if not metadata_uuids:
+        return 0
+    released = session.execute(text("""
+        UPDATE devicemetadata
+        SET processing_status = :status, claimed_at = NULL
+        WHERE metadatauuid = ANY(CAST(:ids AS uuid[]))
+        AND processing_status = 'processing'
+    """), {'status': status, 'ids': [str(metadata_uuid) for metadata_uuid in metadata_uuids]}).rowcount
+    session.commit()
+    return released
+
+def recover_stale_analyses(session, analysis_type: str, max_age: int) -> int:
+    """Return rows claimed more than max_age seconds ago, whose worker is gone, to 'pending'. Commits."""
+    recovered = session.execute(text("""
+        UPDATE devicemetadata
+        SET processing_status = 'pending', claimed_at = NULL
+        WHERE metalogos_type = :analysis_type
+        AND processing_status = 'processing'
+        AND COALESCE(claimed_at, created_at) < :stale_before
+    """), {'analysis_type': analysis_type, 'stale_before': int(time.time()) - max_age}).rowcount
+    session.commit()
+    if recovered:
+        logging.warning(f"Recovered {recovered} stale {analysis_type} analysis claim(s)")
+    return recovered
+
+def is_analysis_eligible(session, tenant_context, analysis_type: str) -> bool:
+    """Check the tenant allows and can pay for this analysis type"""
+    if not tenant_context:
+        return False
+
+    # Skip if recurring analyses are disabled globally
+    if not tenant_context.recurring_analyses_enabled:
+        return False
+
+    # Skip if this specific analysis type is disabled
+    if not tenant_context.is_analysis_enabled(analysis_type):
+        return False
+
+    # Check if tenant has insufficient wegcoins
+    analysis_cost = tenant_context.get_analysis_cost(analysis_type)
+    if tenant_context.available_wegcoins < analysis_cost:
+        # Disable all analyses for this tenant instead of repeatedly logging
+        from app.models import Tenants
+        tenant = session.get(Tenants, uuid.UUID(tenant_context.tenant_id))
+        if tenant and tenant.recurring_analyses_enabled:
+            tenant.disable_all_analyses()
+            session.commit()
+            logging.warning(f"Disabled all analyses for tenant {tenant_context.tenant_id} due to insufficient wegcoins (has {tenant_context.available_wegcoins}, needs {analysis_cost})")
+        return False
+
+    return True
+
+def run_analysis_batch(session, analyzer_cls, analysis_type: str, batch_size: int,
+                       concurrency: int, tenant_concurrency: int) -> int:
+    """Claim a batch, run its model calls concurrently and write every result in one commit.
+
+    Prompts are built and results written on the calling thread, which owns the
+    session; only request_completion runs in the pool. At most
+    tenant_concurrency calls per tenant are in flight at once. Items whose
+    result is cached, or identical to an earlier item in the batch, are not sent.
+    If the batch raises, rows without a written result go back to 'pending'.
+    """
+    claimed = claim_pending_analyses(session, analysis_type, max(1, int(batch_size)))
+    if not claimed:
+        logging.info(f"No pending {analysis_type} analyses found")
+        return 0
+
+    try:
+        return _process_claimed(session, claimed, analyzer_cls, analysis_type, concurrency, tenant_concurrency)
+    except BaseException:
+        # Rows without a written result go back to the queue rather than stay claimed
+        session.rollback()
+        try:
+            released = release_analyses(session, [pending['metadatauuid'] for pending in claimed])
+            logging.warning(f"Released {released} unfinished {analysis_type} analyses after a batch error")
+        except SQLAlchemyError as release_error:
+            session.rollback()
+            logging.error(f"Failed to release {analysis_type} claims; they are recovered once stale: {release_error}")
+        raise
+
+def _process_claimed(session, claimed, analyzer_cls, analysis_type: str, concurrency: int,
+                     tenant_concurrency: int) -> int:
+    jobs = []
+    in_flight = {}
+    ineligible = []
+    for pending in claimed:
+        tenant_context = tenant_context_cache.for_device(pending['deviceuuid'])
+        if not is_analysis_eligible(session, tenant_context, analysis_type):
+            if not tenant_context:
+                logging.error(f"Device or tenant not found for {pending['deviceuuid']}")
+            ineligible.append(pending['metadatauuid'])
+            continue
+
+        analyzer = analyzer_cls(str(pending['deviceuuid']), str(pending['metadatauuid']))
+        try:
+            prompt = analyzer.prepare(pending['metalogos'], in_flight)
+        except Exception as e:
+            analyzer.log_failure(e)
+            jobs.append((analyzer, tenant_context.tenant_id, None, e))
+            continue
+        jobs.append((analyzer, tenant_context.tenant_id, prompt, None))
+
+    # Model calls run in the pool; everything that touches the session stays on this thread
+    responses = {}
+    to_send = {index: job for index, job in enumerate(jobs) if job[2] is not None}
+    if to_send:
+        logging.info(f"Processing {len(to_send)} {analysis_type} analyses with up to {concurrency} concurrent calls")
+        client = next(iter(to_send.values()))[0].get_ai_client()
+        tenant_slots = {
+            tenant_id: threading.BoundedSemaphore(max(1, tenant_concurrency))
+            for _, tenant_id, _, _ in to_send.values()
+        }
+
+        def complete(analyzer, tenant_id, prompt):
+            with tenant_slots[tenant_id]:
+                return analyzer.request_completion(prompt, client)
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(to_send))) as pool:
+            futures = {
+                pool.submit(complete, analyzer, tenant_id, prompt): index
+                for index, (analyzer, tenant_id, prompt, _) in to_send.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    responses[futures[future]] = future.result()
+                except Exception as e:
+                    responses[futures[future]] = e
+
+    # Parse once up front so a fallback to per-item writes does not parse twice
+    outcomes = {}
+    for index, (analyzer, _, prompt, error) in enumerate(jobs):
+        if error is not None:
+            outcome = error
+        elif prompt is None:
+            if analyzer.leader is not None:
+                leader_outcome = outcomes[id(analyzer.leader)]
+                outcome = leader_outcome if isinstance(leader_outcome, Exception) else dict(leader_outcome)
+            else:
+                outcome = analyzer.reused_result()
+        elif isinstance(responses.get(index), Exception):
+            outcome = responses[index]
+            analyzer.log_failure(outcome)
+        else:
+            try:
+                outcome = analyzer.parse_response(responses[index])
+            except Exception as e:
+                analyzer.log_failure(e)
+                outcome = e
+        outcomes[id(analyzer)] = outcome
+
+    def write_back(index, job):
+        analyzer = job[0]
+        outcome = outcomes[id(analyzer)]
+        if isinstance(outcome, Exception):
+            analyzer.apply_failure(outcome)
+            return 0
+        analyzer.apply_result(outcome)
+        logging.info(f"Processed {analyzer.metadata_id} with score {outcome.get('score')}")
+        return 1
+
+    try:
+        succeeded = sum(write_back(index, job) for index, job in enumerate(jobs))
+        session.commit()
+    except SQLAlchemyError as e:
+        # Fall back to one transaction per item so one bad row does not lose the batch
+        logging.warning(f"Batched write of {len(jobs)} {analysis_type} results failed, writing individually: {e}")
+        session.rollback()
+        succeeded = 0
+        for index, job in enumerate(jobs):
+            try:
+                succeeded += write_back(index, job)
+                session.commit()
+            except SQLAlchemyError as item_error:
+                session.rollback()
+                logging.error(f"Failed to write {analysis_type} result for {job[0].metadata_id}: {item_error}")
+                release_analyses(session, [job[0].metadata_id], 'failed')
+
+    # Parked so they are not claimed again ahead of eligible rows
+    release_analyses(session, ineligible, 'skipped')
+
+    if succeeded < len(jobs):
+        logging.warning(f"{len(jobs) - succeeded} of {len(jobs)} {analysis_type} analyses failed")
+    return len(jobs)
+
 # Filepath: app/tasks/base/scheduler.py
 @celery.task(name="app.tasks.run_analysis_worker", bind=True)
 def run_analysis_worker(self, analysis_type: str, batch_size: int = 1):
-    """Worker task that processes up to batch_size pending analyses of a specific type"""
+    """Worker task that processes up to batch_size pending analyses of a specific type.
+
+    With ANALYSIS_BATCH_CONCURRENCY > 1 the batch is claimed in one statement and
+    its model calls run concurrently (see run_analysis_batch).
+    """
     with current_app.app_context():
         scheduler = AnalysisScheduler()
         analyzer_cls = scheduler.get_analyzer(analysis_type)
@@ -183,9 +403,16 @@ def run_analysis_worker(self, analysis_type: str, batch_size: int = 1):
         processed = 0
         try:
             session = db.session()
-
-            # Import here to avoid circular import issues
-            from app.models import Devices
+            recover_stale_analyses(session, analysis_type, current_app.config.get('ANALYSIS_CLAIM_TIMEOUT', 1800))
+
+            # Batch mode for analyzers that use the standard analyze() flow
+            concurrency = current_app.config.get('ANALYSIS_BATCH_CONCURRENCY', 1)
+            if concurrency > 1 and analyzer_cls.analyze is BaseAnalyzer.analyze:
+                processed = run_analysis_batch(
+                    session, analyzer_cls, analysis_type, batch_size, concurrency,
+                    current_app.config.get('ANALYSIS_TENANT_CONCURRENCY', 2)
+                )
+                return {"processed": processed}
 
             skipped_ids = set()
             max_attempts = max(1, int(batch_size)) * 5  # allow skipping ineligible items without blocking
@@ -201,30 +428,10 @@ def run_analysis_worker(self, analysis_type: str, batch_size: int = 1):
                     break
 
                 # Get device and check if analysis is enabled for tenant
-                device = session.get(Devices, pending['deviceuuid'])
-                if not device or not device.tenant:
-                    logging.error(f"Device or tenant not found for {pending['deviceuuid']}")
-                    skipped_ids.add(pending['metadatauuid'])
-                    continue
-
-                # Skip if recurring analyses are disabled globally
-                if not device.tenant.recurring_analyses_enabled:
-                    skipped_ids.add(pending['metadatauuid'])
-                    continue
-
-                # Skip if this specific analysis type is disabled
-                if not device.tenant.is_analysis_enabled(analysis_type):
-                    skipped_ids.add(pending['metadatauuid'])
-                    continue
-
-                # Check if tenant has insufficient wegcoins
-                analysis_cost = device.tenant.get_analysis_cost(analysis_type)
-                if device.tenant.available_wegcoins < analysis_cost:
-                    # Disable all analyses for this tenant instead of repeatedly logging
-                    if device.tenant.recurring_analyses_enabled:
-                        device.tenant.disable_all_analyses()
-                        session.commit()
-                        logging.warning(f"Disabled all analyses for tenant {device.tenant.tenantuuid} due to insufficient wegcoins (has {device.tenant.available_wegcoins}, needs {analysis_cost})")
+                tenant_context = tenant_context_cache.for_device(pending['deviceuuid'])
+                if not is_analysis_eligible(session, tenant_context, analysis_type):
+                    if not tenant_context:
+                        logging.error(f"Device or tenant not found for {pending['deviceuuid']}")
                     skipped_ids.add(pending['metadatauuid'])
                     continue
 
@@ -243,6 +450,7 @@ def run_analysis_worker(self, analysis_type: str, batch_size: int = 1):
 
                 processed += 1
 
+            release_analyses(session, skipped_ids, 'skipped')
             # No pending transactional work here; analyzers manage their own commits
             return {"processed": processed}
 
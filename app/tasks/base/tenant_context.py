@@ -0,0 +1,187 @@
+# Filepath: app/tasks/base/tenant_context.py
+"""
+Per-process cache of the tenant state the analysis hot path needs.
+
+One TenantContext per tenant holds the analysis toggles, cost overrides,
+wegcoin balance and (lazily) the prompt configuration for each analysis type,
+so a batch of analyses for the same tenant does one tenant lookup instead of
+several per item. Device -> tenant lookups are cached too.
+
+Entries expire after ANALYSIS_TENANT_CACHE_TTL seconds and are dropped as soon
+as this process flushes a change to the tenant or its prompt configuration.
+Wegcoins are never spent from the cached balance: reserve_wegcoins() deducts
+with a single conditional UPDATE, so concurrent workers cannot overdraw.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+from flask import current_app
+from sqlalchemy import event, text
+from app.models import db, Devices, Tenants, WegcoinTransaction
+from app.models.analysis_config import TenantAnalysisPrompt, get_default_density_config
+from app.models.tenants import get_default_analysis_toggles
+
+# Marks "no prompt configuration" so misses are cached too
+_NO_PROMPT_CONFIG = object()
+
+
+class TenantContext:
+    """Snapshot of one tenant's analysis settings and balance"""
+
+    def __init__(self, tenant: Tenants):
+        self.tenant_id = str(tenant.tenantuuid)
+        self.recurring_analyses_enabled = bool(tenant.recurring_analyses_enabled)
+        self.analysis_toggles = dict(tenant.analysis_toggles or get_default_analysis_toggles())
+        self.analysis_costs = dict(tenant.analysis_costs or {})
+        self.available_wegcoins = tenant.available_wegcoins or 0
+        self.loaded_at = time.monotonic()
+        self._prompt_configs = {}
+
+    def is_analysis_enabled(self, analysis_type: str) -> bool:
+        """Same rules as Tenants.is_analysis_enabled"""
+        if not self.recurring_analyses_enabled:
+            return False
+        return self.analysis_toggles.get(analysis_type, True)
+
+    def get_analysis_cost(self, analysis_type: str) -> int:
+        """Same rules as Tenants.get_analysis_cost"""
+        if analysis_type in self.analysis_costs:
+            return self.analysis_costs[analysis_type]
+        from app.tasks.base.definitions import AnalysisDefinitions
+        return AnalysisDefinitions.get_cost(analysis_type)
+
+    def get_prompt_config(self, analysis_type: str) -> Optional[Dict]:
+        """The tenant's criteria_prompt and density_config for this type, or None"""
+        config = self._prompt_configs.get(analysis_type)
+        if config is None:
+            row = TenantAnalysisPrompt.query.filter_by(
+                tenant_id=self.tenant_id,
+                analysis_type=analysis_type
+            ).first()
+            config = {
+                'criteria_prompt': row.criteria_prompt,
+                'density_config': row.density_config,
+            } if row else _NO_PROMPT_CONFIG
+            self._prompt_configs[analysis_type] = config
+        return None if config is _NO_PROMPT_CONFIG else config
+
+    def get_criteria(self, analysis_type: str, default_criteria: str) -> str:
+        config = self.get_prompt_config(analysis_type)
+        if config and config['criteria_prompt']:
+            return config['criteria_prompt']
+        return default_criteria
+
+    def get_density(self, analysis_type: str) -> Dict[str, int]:
+        config = self.get_prompt_config(analysis_type)
+        if config and config['density_config']:
+            return config['density_config']
+        return get_default_density_config()
+
+
+class TenantContextCache:
+    """Process-wide TenantContext cache with TTL and explicit invalidation"""
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._contexts = {}
+        self._device_tenants = {}
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id) -> Optional[TenantContext]:
+        tenant_id = str(tenant_id)
+        ttl = current_app.config.get('ANALYSIS_TENANT_CACHE_TTL', self.ttl)
+        context = self._contexts.get(tenant_id)
+        if context is not None and time.monotonic() - context.loaded_at < ttl:
+            return context
+
+        tenant = db.session.get(Tenants, uuid.UUID(tenant_id))
+        if tenant is None:
+            return None
+        context = TenantContext(tenant)
+        with self._lock:
+            self._contexts[tenant_id] = context
+        return context
+
+    def tenant_for_device(self, device_id) -> Optional[str]:
+        """Tenant of a device; devices never change tenant, so this is cached without expiry"""
+        device_id = str(device_id)
+        tenant_id = self._device_tenants.get(device_id)
+        if tenant_id is None:
+            device = db.session.get(Devices, uuid.UUID(device_id))
+            if device is None:
+                return None
+            tenant_id = str(device.tenantuuid)
+            with self._lock:
+                self._device_tenants[device_id] = tenant_id
+        return tenant_id
+
+    def for_device(self, device_id) -> Optional[TenantContext]:
+        tenant_id = self.tenant_for_device(device_id)
+        return self.get(tenant_id) if tenant_id else None
+
+    def invalidate(self, tenant_id=None) -> None:
+        """Drop one tenant's context, or everything if tenant_id is None"""
+        with self._lock:
+            if tenant_id is None:
+                self._contexts.clear()
+                self._device_tenants.clear()
+            else:
+                self._contexts.pop(str(tenant_id), None)
+
+    def reserve_wegcoins(self, tenant_id, amount: int, description: str) -> bool:
+        """
+        Atomically deduct `amount` wegcoins and record the transaction.
+
+        Returns:
+            bool: False if the balance was insufficient (nothing is deducted)
+        """
+        tenant_id = str(tenant_id)
+        try:
+            balance = db.session.execute(text("""
+                UPDATE tenants
+                SET available_wegcoins = available_wegcoins - :amount
+                WHERE tenantuuid = :tenant_id
+                AND available_wegcoins >= :amount
+                RETURNING available_wegcoins
+            """), {'tenant_id': tenant_id, 'amount': amount}).scalar()
+
+            if balance is None:
+                db.session.rollback()
+                self.invalidate(tenant_id)
+                return False
+
+            db.session.add(WegcoinTransaction(
+                tenantuuid=uuid.UUID(tenant_id),
+                amount=-amount,  # Negative for deduction
+                transaction_type='usage',
+                description=description or 'AI usage'
+            ))
+            db.session.commit()
+        except Exception as e:
+            logging.error(f"Wegcoin reservation failed for tenant {tenant_id}: {e}")
+            db.session.rollback()
+            self.invalidate(tenant_id)
+            return False
+
+        context = self._contexts.get(tenant_id)
+        if context is not None:
+            context.available_wegcoins = balance
+        return True
+
+
+tenant_context_cache = TenantContextCache()
+
+
+@event.listens_for(Tenants, 'after_update')
+def _invalidate_tenant(mapper, connection, target):
+    tenant_context_cache.invalidate(target.tenantuuid)
+
+
+@event.listens_for(TenantAnalysisPrompt, 'after_insert')
+@event.listens_for(TenantAnalysisPrompt, 'after_update')
+@event.listens_for(TenantAnalysisPrompt, 'after_delete')
+def _invalidate_tenant_prompts(mapper, connection, target):
+    tenant_context_cache.invalidate(target.tenant_id)
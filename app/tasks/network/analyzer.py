@@ -1,10 +1,6 @@
 # Filepath: app/tasks/network/analyzer.py
 from app.tasks.base.analyzer import BaseAnalyzer
-from app.tasks.base.exclusions import (
-    build_exclusion_block, 
-    get_tenant_prompt_config,
-    get_density_config
-)
+from app.tasks.base.exclusions import build_exclusion_block
 import json
 import re
 import bleach
@@ -50,20 +46,11 @@ class NetworkAnalyzer(BaseAnalyzer):
         with open(os.path.join(os.path.dirname(__file__), 'prompts', 'base.prompt'), 'r') as f:
             base_prompt = f.read()
 
-        # Get tenant customizations
-        from app.models import db, Devices
-        device = db.session.get(Devices, self.device_id)
-        tenant_id = str(device.tenantuuid) if device else None
-        
         # Get custom criteria or use default
-        criteria = DEFAULT_CRITERIA
-        if tenant_id:
-            prompt_config = get_tenant_prompt_config(tenant_id, self.task_type)
-            if prompt_config and prompt_config.criteria_prompt:
-                criteria = prompt_config.criteria_prompt
+        criteria = self.get_custom_criteria(DEFAULT_CRITERIA)
         
         # Get density configuration
-        density = get_density_config(tenant_id, self.task_type) if tenant_id else {}
+        density = self.get_density()
         
         # Build exclusion block (sandboxed)
         exclusion_block = build_exclusion_block(self.device_id, self.task_type)
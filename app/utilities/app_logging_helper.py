@@ -3,6 +3,7 @@ import os
 import logging
 from flask import current_app, request, has_request_context, has_app_context, g
 from app.utilities.app_get_client_ip import get_client_ip
+from app.utilities.log_store import RedisLogStore
 import time
 import json
 import redis
@@ -11,6 +12,8 @@ from psycopg2.extras import Json
 from datetime import datetime, timezone
 import uuid
 import threading
+import atexit
+from collections import deque
 
 # Global lock for thread-safe configuration updates
 _config_lock = threading.RLock()
@@ -30,6 +33,19 @@ DEFAULT_LOGGING_CONFIG = {
 # Global configuration storage
 _logging_config = DEFAULT_LOGGING_CONFIG.copy()
 
+# Snapshot of the enabled levels read by should_log(); replaced whenever the config changes
+_levels_enabled = {}
+
+def _refresh_levels_enabled():
+    global _levels_enabled
+    with _config_lock:
+        _levels_enabled = {
+            logging.INFO: _logging_config['levels'].get('INFO', False),
+            logging.DEBUG: _logging_config['levels'].get('DEBUG', False),
+            logging.ERROR: _logging_config['levels'].get('ERROR', True),
+            logging.WARNING: _logging_config['levels'].get('WARNING', True),
+        }
+
 def get_config_file_path():
     """Get the path to the logging configuration file."""
     return os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config', 'logging_config.json')
@@ -60,6 +76,7 @@ def load_logging_config():
         print(f"Error loading logging config: {e}. Using defaults.")
         with _config_lock:
             _logging_config = DEFAULT_LOGGING_CONFIG.copy()
+    _refresh_levels_enabled()
 
 def save_logging_config(config):
     """Save logging configuration to file."""
@@ -81,13 +98,7 @@ def save_logging_config(config):
 
 def get_logging_levels_enabled():
     """Get current logging levels as a dictionary compatible with the original format."""
-    with _config_lock:
-        return {
-            logging.INFO: _logging_config['levels'].get('INFO', False),
-            logging.DEBUG: _logging_config['levels'].get('DEBUG', False),
-            logging.ERROR: _logging_config['levels'].get('ERROR', True),
-            logging.WARNING: _logging_config['levels'].get('WARNING', True),
-        }
+    return dict(_levels_enabled)
 
 def update_logging_config(new_levels, updated_by="unknown"):
     """Update logging configuration and save to file."""
@@ -96,6 +107,7 @@ def update_logging_config(new_levels, updated_by="unknown"):
     with _config_lock:
         _logging_config['levels'].update(new_levels)
         _logging_config['updated_by'] = updated_by
+        _refresh_levels_enabled()
 
         if save_logging_config(_logging_config):
             return True
@@ -109,9 +121,129 @@ def reload_logging_config():
 # Initialize configuration on module load
 load_logging_config()
 
+class RemoteLogShipper:
+    """
+    Bounded in-process buffer of remote log entries drained by a background thread.
+
+    Callers only append to the buffer; the thread writes entries to the
+    structured log store (see log_store) in pipelined batches. When the
+    buffer is full new entries are dropped. With the 'sample' overload policy,
+    once the buffer is half full only every SAMPLE_EVERY-th INFO/DEBUG entry is
+    kept so warnings and errors still get through.
+    """
+
+    SAMPLE_EVERY = 10
+
+    def __init__(self, client, store=None, queue_size=10000, batch_size=500,
+                 flush_interval=0.5, overload_policy='sample', retry_count=1):
+        self.client = client
+        self.store = store or RedisLogStore()
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overload_policy = overload_policy
+        self.retry_count = retry_count
+        self.pid = None
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._sampled = 0
+        self.stats = {'emitted': 0, 'shipped': 0, 'dropped': 0, 'sampled_out': 0, 'batches': 0, 'ship_errors': 0}
+        atexit.register(self.stop)
+
+    def _ensure_thread(self):
+        # Started lazily, and again in a forked child where the parent's thread does not exist
+        if self.pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            if self.pid != os.getpid():
+                self._buffer.clear()
+                self.pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='remote-log-shipper', daemon=True)
+            self._thread.start()
+
+    def submit(self, level, entry):
+        """Queue a log entry; returns False if it was dropped"""
+        with self._cond:
+            self._ensure_thread()
+            depth = len(self._buffer)
+            if depth >= self.queue_size:
+                self.stats['dropped'] += 1
+                return False
+            if self.overload_policy == 'sample' and level < logging.WARNING and depth >= self.queue_size // 2:
+                self._sampled += 1
+                if self._sampled % self.SAMPLE_EVERY:
+                    self.stats['sampled_out'] += 1
+                    return False
+            self._buffer.append(entry)
+            self.stats['emitted'] += 1
+            if depth + 1 >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def _take_batch(self):
+        return [self._buffer.popleft() for _ in range(min(len(self._buffer), self.batch_size))]
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self._cond:
+                if len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                batch = self._take_batch()
+            if batch:
+                self._ship(batch)
+
+    def _ship(self, batch):
+        # Each stage is retried on its own: repeating the append after a failed
+        # index write would add the batch to the stream twice
+        stream_ids, error = None, None
+        for attempt in range(self.retry_count + 1):
+            try:
+                if stream_ids is None:
+                    stream_ids = self.store.append(self.client, batch)
+                self.store.index(self.client, stream_ids, batch)
+                self.stats['shipped'] += len(batch)
+                self.stats['batches'] += 1
+                return True
+            except Exception as e:
+                self.stats['ship_errors'] += 1
+                error = e
+        logger = logging.getLogger(__name__)
+        # Not log_with_route: that would feed the failure back into this buffer
+        if stream_ids is not None:
+            self.stats['shipped'] += len(batch)
+            logger.error(f"Shipped {len(batch)} log entries but could not index them: {str(error)}")
+            return False
+        self.stats['dropped'] += len(batch)
+        logger.error(f"Failed to ship {len(batch)} log entries to remote server: {str(error)}")
+        return False
+
+    def flush(self):
+        """Ship everything buffered now, on the calling thread"""
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self._ship(batch)
+
+    def stop(self, timeout=2):
+        if self.pid != os.getpid():
+            return
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+        self.flush()
+
+    def get_stats(self):
+        return dict(self.stats, buffered=len(self._buffer), queue_size=self.queue_size)
+
 class RemoteLogger:
     _instance = None
     _redis_client = None
+    _shipper = None
     _pg_conn = None
 
     def __new__(cls):
@@ -146,6 +278,16 @@ class RemoteLogger:
 
             # Test Redis connection
             cls._redis_client.ping()
+            cls._shipper = RemoteLogShipper(
+                cls._redis_client,
+                store=RedisLogStore(max_entries=current_app.config.get('REMOTE_LOGGING_MAX_ENTRIES', 100000),
+                                    index_ttl=current_app.config.get('REMOTE_LOGGING_INDEX_TTL', 604800)),
+                queue_size=current_app.config.get('REMOTE_LOGGING_QUEUE_SIZE', 10000),
+                batch_size=current_app.config.get('REMOTE_LOGGING_BATCH_SIZE', 500),
+                flush_interval=current_app.config.get('REMOTE_LOGGING_FLUSH_INTERVAL', 0.5),
+                overload_policy=current_app.config.get('REMOTE_LOGGING_OVERLOAD_POLICY', 'sample'),
+                retry_count=current_app.config.get('REMOTE_LOGGING_RETRY_COUNT', 1),
+            )
             if has_app_context():
                 current_app.logger.info(f"Remote logging initialized successfully to {host}:{port}")
 
@@ -156,7 +298,7 @@ class RemoteLogger:
 
     def log(self, level: int, message: str, metadata: dict, source_type: str = "Application"):
         # Skip if Redis client isn't available or remote logging is disabled
-        if not self._redis_client:
+        if not self._redis_client or not self._shipper:
             return False
 
         # Check if we should fall back to local logging only
@@ -176,24 +318,28 @@ class RemoteLogger:
                 'created_at': datetime.now(timezone.utc).isoformat()
             }
 
-            # Queue in Redis for batch processing
-            self._redis_client.lpush('wegweiser_logs', json.dumps(log_entry))
-            return True
+            # Buffered here; the shipper thread pushes to Redis in batches
+            return self._shipper.submit(level, log_entry)
         except Exception as e:
             if has_app_context():
                 current_app.logger.error(f"Failed to send log to remote server: {str(e)}")
             return False
 
+    def get_stats(self):
+        return self._shipper.get_stats() if self._shipper else None
+
+def get_remote_logging_stats():
+    """Counters of the remote log shipper in this process, or None if remote logging is off"""
+    return RemoteLogger().get_stats()
+
 class LogLevelFilter(logging.Filter):
     """Filter that only allows records where the level is enabled in the current configuration."""
     def filter(self, record):
-        levels_enabled = get_logging_levels_enabled()
-        return levels_enabled.get(record.levelno, True)
+        return _levels_enabled.get(record.levelno, True)
 
 def should_log(level):
     """Determine if logging should occur for this level."""
-    levels_enabled = get_logging_levels_enabled()
-    return levels_enabled.get(level, True)
+    return _levels_enabled.get(level, True)
 
 def setup_logger(app):
     """Set up the application logger with the level filter."""
@@ -267,7 +413,8 @@ def log_with_route(
             'request_type': request_type,
             'request_method': request_method,
             'request_url': request_url,
-            'route': route or request.path
+            # The URL rule rather than the path, so IDs in URLs do not each get a log index
+            'route': route or (request.url_rule.rule if request.url_rule else '')
         })
 
     # Format the message
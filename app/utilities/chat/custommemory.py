@@ -6,8 +6,11 @@ from app.models import (
     TenantMetadata, Conversations, Messages
 )
 from app.utilities.app_logging_helper import log_with_route
+from app.utilities.chat.memory_index import get_memory_index, rebuild_memory_index
+from app.utilities.chat.memory_pipeline import MAX_TOKENS_PER_MEMORY, enqueue_conversation_turn
 
 import json
+import logging
 import tiktoken
 from typing import List, Dict, Any, Optional
 from pydantic import Field, BaseModel
@@ -16,6 +19,7 @@ from datetime import datetime, timedelta
 
 # Constants
 MEMORY_WINDOW_SIZE = 5  # Number of recent conversations to keep in memory
+LONG_TERM_RECALL_SIZE = 5  # Number of long-term memories given to the model
 
 
 class CustomMemory(BaseModel):
@@ -145,7 +149,7 @@ class CustomMemory(BaseModel):
         return {
             "chat_history": self.messages,
             "history": self.messages,  # For backward compatibility
-            "long_term_context": self._load_long_term_memories(),
+            "long_term_context": self._load_long_term_memories(inputs.get('input') if inputs else None),
             "msp_context": msp_context
         }
 
@@ -399,14 +403,53 @@ class CustomMemory(BaseModel):
             elif message['type'] == 'ai':
                 self.messages.append(AIMessage(content=message['content']))
 
-    def _load_long_term_memories(self) -> List[str]:
+    def _load_long_term_memories(self, query: Optional[str] = None) -> List[str]:
+        """
+        Long-term memories for this entity: the ones most relevant to `query` from
+        the tenant's vector index, or the most important ones without a query or a match.
+        """
+        if query:
+            try:
+                memories = self._recall_relevant_memories(query)
+                if memories:
+                    return [self._detokenize_memory(memory.content) for memory in memories]
+            except Exception as e:
+                log_with_route(logging.ERROR, f"Error recalling memories from the vector index: {str(e)}")
+
         memories = AIMemory.query.filter_by(
             entity_uuid=self.entity_uuid,
             entity_type=self.entity_type,
             tenantuuid=self.tenant_uuid
-        ).order_by(AIMemory.importance_score.desc(), AIMemory.last_accessed.desc()).limit(5).all()
+        ).order_by(AIMemory.importance_score.desc(), AIMemory.last_accessed.desc()).limit(LONG_TERM_RECALL_SIZE).all()
         return [self._detokenize_memory(memory.content) for memory in memories]
 
+    def _recall_relevant_memories(self, query: str) -> List[AIMemory]:
+        index = get_memory_index(self.tenant_uuid)
+        if index is None:
+            return []
+        if not index.is_built():
+            self._rebuild_memory_index()
+
+        # Over-fetch: memories deleted since they were indexed are still in the index
+        hits = index.search(query, self.entity_uuid, self.entity_type, k=LONG_TERM_RECALL_SIZE * 3)
+        if not hits:
+            return []
+        rows = {str(memory.memoryuuid): memory for memory in AIMemory.query.filter(
+            AIMemory.memoryuuid.in_([memory_uuid for memory_uuid, _ in hits])
+        ).all()}
+        return [rows[memory_uuid] for memory_uuid, _ in hits if memory_uuid in rows][:LONG_TERM_RECALL_SIZE]
+
+    def _rebuild_memory_index(self) -> int:
+        """Index every stored memory of the tenant, e.g. the first time the index is used"""
+        memories = AIMemory.query.filter_by(tenantuuid=self.tenant_uuid).all()
+        count = rebuild_memory_index(self.tenant_uuid, (
+            (memory.memoryuuid, memory.entity_uuid, memory.entity_type, memory.importance_score,
+             self._detokenize_memory(memory.content))
+            for memory in memories if memory.content
+        ))
+        log_with_route(logging.INFO, f"Rebuilt memory index for tenant {self.tenant_uuid} with {count} memories")
+        return count
+
     def _save_long_term_memory(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
         if not inputs or not outputs:
             recent_messages = self.messages[-2:]
@@ -428,49 +471,12 @@ class CustomMemory(BaseModel):
                 'topics': self.conversation_topics
             }
 
-        condensed_memory = self._condense_memory(content)
-        importance_score = self._calculate_importance(condensed_memory)
-        
-        if importance_score > 0.7:  # Only save memories with high importance
-            tokenized_memory = self._tokenize_memory(condensed_memory)
-            new_memory = AIMemory(
-                memoryuuid=uuid.uuid4(),
-                entity_uuid=self.entity_uuid,
-                entity_type=self.entity_type,
-                tenantuuid=self.tenant_uuid,
-                content=tokenized_memory,
-                created_at=int(time.time()),
-                last_accessed=int(time.time()),
-                importance_score=importance_score,
-                memory_type='conversation',  # Add memory type
-                topics=','.join(self.conversation_topics) if self.conversation_topics else 'general'  # Add topics
-            )
-            db.session.add(new_memory)
-            db.session.commit()
-
-            self._trickle_up_memory(new_memory)
-
-    def _condense_memory(self, content: Dict[str, Any]) -> str:
-        # Create a more MSP-focused memory condensation prompt
-        topics_text = ', '.join(content.get('topics', [])) if content.get('topics') else 'general conversation'
-        
-        prompt = f"""
-        Condense the following MSP support conversation into a brief, informative summary focused on:
-        1. Core technical or business issues discussed
-        2. Decisions made or actions recommended
-        3. Important client information revealed
-        4. Follow-up items or pending issues
-        
-        Conversation topics: {topics_text}
-        
-        User: {content.get('user_message', '')}
-        
-        Assistant: {content.get('ai_message', '')}
-        
-        Create a concise summary that would be useful for an MSP technician reviewing this case later:
-        """
-        response = self.llm.invoke(prompt)
-        return response.content
+        # Condensation and trickle-up run in the background memory pipeline
+        try:
+            enqueue_conversation_turn(self.tenant_uuid, self.entity_uuid, self.entity_type, **content)
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f"Error queueing conversation turn for memory: {str(e)}")
 
     def _tokenize_memory(self, content: str) -> str:
         tokens = self.tokenizer.encode(content)
@@ -483,168 +489,5 @@ class CustomMemory(BaseModel):
         tokens = json.loads(tokenized_content)
         return self.tokenizer.decode(tokens)
 
-    def _calculate_importance(self, content: str) -> float:
-        # Add MSP-specific important keywords
-        msp_keywords = [
-            'SLA', 'breach', 'critical', 'urgent', 'compliance', 'audit', 
-            'security', 'performance', 'outage', 'downtime', 'client', 
-            'billing', 'license', 'renewal', 'migration', 'project', 
-            'ransomware', 'attack', 'disaster', 'recovery', 'backup', 
-            'failed', 'error', 'vulnerable'
-        ]
-        
-        # Calculate base score from keywords
-        keyword_score = sum(keyword.lower() in content.lower() for keyword in msp_keywords) * 0.05
-        
-        # Check for common MSP conversation patterns
-        pattern_scores = 0.0
-        
-        # Check for problem-solution pattern (problem followed by solution)
-        if re.search(r'(issue|problem|error|failure|outage|malfunction).*?(fix|solution|resolve|mitigate|repair)', content, re.IGNORECASE):
-            pattern_scores += 0.2
-            
-        # Check for decision pattern
-        if re.search(r'(decide|decision|choose|recommend|approve|implement)', content, re.IGNORECASE):
-            pattern_scores += 0.15
-            
-       # Check for follow-up pattern
-        if re.search(r'(follow.up|next.steps|action.items|schedule|will.be|future)', content, re.IGNORECASE):
-            pattern_scores += 0.15
-            
-        # Higher importance for client-facing information
-        if re.search(r'(client|customer|end.user|business)', content, re.IGNORECASE):
-            pattern_scores += 0.1
-            
-        # Add together with base importance
-        base_importance = 0.2  # Every conversation has some importance
-        total_score = min(base_importance + keyword_score + pattern_scores, 1.0)
-        
-        return total_score
-
-    def _trickle_up_memory(self, memory: AIMemory):
-        """Propagate important memories up the hierarchy with MSP context"""
-        try:
-            # Add MSP-specific context to memories as they trickle up
-            if self.entity_type == 'device':
-                device = Devices.query.get(self.entity_uuid)
-                if device and memory.importance_score > 0.8:
-                    # Add device metadata to provide better context
-                    device_context = f"Device: {device.devicename} ({device.agent_platform if hasattr(device, 'agent_platform') else 'Unknown platform'})"
-                    
-                    # Include health score if available
-                    health_context = f", Health score: {device.health_score}" if device.health_score is not None else ""
-                    
-                    # Get core memory content
-                    memory_content = self._detokenize_memory(memory.content)
-                    
-                    # Create enhanced group memory with MSP context
-                    group_memory_content = f"{device_context}{health_context} | {memory_content}"
-                    
-                    # Condense for group level (remove device-specific details)
-                    group_memory_prompt = f"""
-                    Convert this device-specific note into a brief group-level observation that would be relevant for MSP management:
-                    {group_memory_content}
-                    
-                    Group-level summary (be brief and focus on business impact):
-                    """
-                    
-                    condensed_content = self.llm.invoke(group_memory_prompt).content
-                    
-                    # Create new memory at group level
-                    group_memory = AIMemory(
-                        memoryuuid=uuid.uuid4(),
-                        entity_uuid=device.groupuuid,
-                        entity_type='group',
-                        tenantuuid=self.tenant_uuid,
-                        content=self._tokenize_memory(condensed_content),
-                        created_at=int(time.time()),
-                        last_accessed=int(time.time()),
-                        importance_score=memory.importance_score * 0.9,
-                        memory_type='trickle_up',
-                        topics=memory.topics
-                    )
-                    db.session.add(group_memory)
-                    db.session.commit()
-                    
-            elif self.entity_type == 'group':
-                group = Groups.query.get(self.entity_uuid)
-                if group and memory.importance_score > 0.8:
-                    # Get device count for context
-                    device_count = Devices.query.filter_by(groupuuid=self.entity_uuid).count()
-                    
-                    # Get core memory content
-                    memory_content = self._detokenize_memory(memory.content)
-                    
-                    # Create enhanced organization memory with MSP context
-                    group_context = f"Group: {group.groupname} ({device_count} devices)"
-                    org_memory_content = f"{group_context} | {memory_content}"
-                    
-                    # Condense for organization level
-                    org_memory_prompt = f"""
-                    Convert this group-specific note into a brief organization-level insight that would be relevant for MSP management:
-                    {org_memory_content}
-                    
-                    Organization-level insight (focus on business impact and client relationship):
-                    """
-                    
-                    condensed_content = self.llm.invoke(org_memory_prompt).content
-                    
-                    # Create new memory at organization level
-                    org_memory = AIMemory(
-                        memoryuuid=uuid.uuid4(),
-                        entity_uuid=group.orguuid,
-                        entity_type='organisation',
-                        tenantuuid=self.tenant_uuid,
-                        content=self._tokenize_memory(condensed_content),
-                        created_at=int(time.time()),
-                        last_accessed=int(time.time()),
-                        importance_score=memory.importance_score * 0.9,
-                        memory_type='trickle_up',
-                        topics=memory.topics
-                    )
-                    db.session.add(org_memory)
-                    db.session.commit()
-                    
-            elif self.entity_type == 'organisation':
-                org = Organisations.query.get(self.entity_uuid)
-                if org and memory.importance_score > 0.9:
-                    # Get core memory content
-                    memory_content = self._detokenize_memory(memory.content)
-                    
-                    # Create enhanced tenant memory with MSP business context
-                    org_context = f"Client: {org.orgname}"
-                    tenant_memory_content = f"{org_context} | {memory_content}"
-                    
-                    # Condense for tenant level (business management perspective)
-                    tenant_memory_prompt = f"""
-                    Convert this client-specific note into a brief MSP business insight:
-                    {tenant_memory_content}
-                    
-                    MSP business insight (focus on trends, opportunities, risks, and business implications):
-                    """
-                    
-                    condensed_content = self.llm.invoke(tenant_memory_prompt).content
-                    
-                    # Create new memory at tenant level
-                    tenant_memory = AIMemory(
-                        memoryuuid=uuid.uuid4(),
-                        entity_uuid=org.tenantuuid,
-                        entity_type='tenant',
-                        tenantuuid=self.tenant_uuid,
-                        content=self._tokenize_memory(condensed_content),
-                        created_at=int(time.time()),
-                        last_accessed=int(time.time()),
-                        importance_score=memory.importance_score * 0.9,
-                        memory_type='trickle_up',
-                        topics=memory.topics
-                    )
-                    db.session.add(tenant_memory)
-                    db.session.commit()
-                    
-        except Exception as e:
-            log_with_route(logging.ERROR, f"Error in trickle-up memory: {str(e)}")
-            # Don't let memory errors crash the system
-            pass
-
     def chat_memory_messages(self) -> List[BaseMessage]:
         return self.messages
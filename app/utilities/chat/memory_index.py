@@ -0,0 +1,260 @@
+# Filepath: app/utilities/chat/memory_index.py
+"""
+Semantic recall index for AI long-term memories
+
+Each memory's text is turned into a fixed-size vector by a hashing vectorizer
+(word unigrams and bigrams hashed into AI_MEMORY_INDEX_DIM signed buckets,
+log-scaled and L2-normalised), so no model or network call is needed. Vectors
+are kept per tenant in an append-only file of fixed-size records under
+AI_MEMORY_INDEX_DIR:
+
+    header:  magic, format version, dimension
+    record:  memory uuid, entity uuid + entity type, importance, vector
+
+Saving a memory appends one record. Searching loads the file into a NumPy
+array once per process and afterwards only reads what other processes have
+appended since. Records of deleted memories stay in the file until the index
+is rebuilt; callers drop ids that no longer exist in the database.
+"""
+
+import fcntl
+import hashlib
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from flask import current_app, has_app_context
+from app.utilities.app_logging_helper import log_with_route
+
+MAGIC = b'WGMEMIDX'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sII')
+ENTITY_TYPE_BYTES = 12
+DEFAULT_DIM = 512
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9_.\-]*[a-z0-9]|[a-z0-9]")
+
+
+def _record_dtype(dim: int):
+    return np.dtype([
+        ('memory', 'V16'),
+        ('entity', 'V{}'.format(16 + ENTITY_TYPE_BYTES)),
+        ('importance', '<f4'),
+        ('vector', '<f4', (dim,)),
+    ])
+
+
+def _uuid_bytes(value) -> bytes:
+    return uuid.UUID(str(value)).bytes
+
+
+def _entity_key(entity_uuid, entity_type: str) -> bytes:
+    """Entity uuid followed by its type, padded to a fixed width"""
+    return _uuid_bytes(entity_uuid) + (entity_type or '').encode('ascii')[:ENTITY_TYPE_BYTES].ljust(ENTITY_TYPE_BYTES, b'\0')
+
+
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+    return digest % dim, (1.0 if digest >> 63 else -1.0)
+
+
+def vectorize(text: str, dim: int = DEFAULT_DIM):
+    """Hashed bag of word unigrams and bigrams, L2-normalised; all zeros for text without words"""
+    counts = {}
+    tokens = TOKEN_RE.findall((text or '').lower())
+    features = tokens + [f'{first} {second}' for first, second in zip(tokens, tokens[1:])]
+    for feature in features:
+        index, sign = _bucket(feature, dim)
+        counts[index] = counts.get(index, 0.0) + sign
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for index, count in counts.items():
+        if count:
+            vector[index] = math.copysign(1.0 + math.log(abs(count)), count)
+    norm = float(np.linalg.norm(vector))
+    if norm:
+        vector /= norm
+    return vector
+
+
+class MemoryVectorIndex:
+    """One tenant's memory vectors, backed by an append-only record file"""
+
+    def __init__(self, path: str, dim: int = DEFAULT_DIM):
+        self.path = path
+        self.dim = dim
+        self.dtype = _record_dtype(dim)
+        self._loaded_size = 0
+        self._inode = None
+        self._reset()
+        self._lock = threading.Lock()
+
+    def _reset(self) -> None:
+        self._memories = np.zeros(0, dtype='V16')
+        self._entities = np.zeros(0, dtype=self.dtype['entity'])
+        self._importance = np.zeros(0, dtype=np.float32)
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+    def is_built(self) -> bool:
+        """Whether the file exists and was written with this format and dimension"""
+        try:
+            with open(self.path, 'rb') as handle:
+                header = handle.read(HEADER.size)
+        except OSError:
+            return False
+        return len(header) == HEADER.size and HEADER.unpack(header) == (MAGIC, FORMAT_VERSION, self.dim)
+
+    def add(self, memory_uuid, entity_uuid, entity_type: str, importance: float, text: str) -> None:
+        self.add_many([(memory_uuid, entity_uuid, entity_type, importance, text)])
+
+    def add_many(self, memories: Iterable[Tuple], replace: bool = False) -> int:
+        """
+        Append (memory uuid, entity uuid, entity type, importance, text) records.
+        With replace=True a new file with only these records takes the old one's place.
+        """
+        records = [
+            (_uuid_bytes(memory_uuid), _entity_key(entity_uuid, entity_type), importance or 0.0, vectorize(text, self.dim))
+            for memory_uuid, entity_uuid, entity_type, importance, text in memories
+        ]
+        if not records and not replace:
+            return 0
+        payload = np.array(records, dtype=self.dtype).tobytes()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        if replace:
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as handle:
+                handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.dim))
+                handle.write(payload)
+            os.replace(temp_path, self.path)
+            return len(records)
+
+        with open(self.path, 'a+b') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                handle.seek(0)
+                header = handle.read(HEADER.size)
+                if len(header) != HEADER.size or HEADER.unpack(header) != (MAGIC, FORMAT_VERSION, self.dim):
+                    # New file, or one written with another dimension: start over
+                    handle.truncate(0)
+                    handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.dim))
+                handle.write(payload)
+                handle.flush()
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        return len(records)
+
+    def _refresh(self) -> None:
+        """Read records appended since the last call; everything again if the file was replaced"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._reset()
+            self._loaded_size, self._inode = 0, None
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._loaded_size:
+            self._reset()
+            self._loaded_size, self._inode = 0, stat.st_ino
+        if stat.st_size == self._loaded_size:
+            return
+
+        with open(self.path, 'rb') as handle:
+            fcntl.flock(handle, fcntl.LOCK_SH)
+            try:
+                if not self._loaded_size:
+                    header = handle.read(HEADER.size)
+                    if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, FORMAT_VERSION, self.dim):
+                        return
+                    self._loaded_size = HEADER.size
+                handle.seek(self._loaded_size)
+                appended = np.fromfile(handle, dtype=self.dtype, count=(stat.st_size - self._loaded_size) // self.dtype.itemsize)
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        if len(appended):
+            # Kept as separate contiguous arrays so a search only gathers the entity's own vectors
+            self._memories = np.concatenate([self._memories, appended['memory']])
+            self._entities = np.concatenate([self._entities, appended['entity']])
+            self._importance = np.concatenate([self._importance, appended['importance']])
+            self._vectors = np.concatenate([self._vectors, appended['vector']])
+        self._loaded_size += len(appended) * self.dtype.itemsize
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._memories)
+
+    def search(self, query: str, entity_uuid, entity_type: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Up to k (memory uuid, similarity) pairs for one entity, most similar first.
+        Memories with no words in common with the query are not returned.
+        """
+        query_vector = vectorize(query, self.dim)
+        if not query_vector.any():
+            return []
+
+        with self._lock:
+            self._refresh()
+            memories, entities, importance, vectors = self._memories, self._entities, self._importance, self._vectors
+
+        rows = np.flatnonzero(entities == np.void(_entity_key(entity_uuid, entity_type)))
+        if not len(rows):
+            return []
+
+        scores = vectors[rows] @ query_vector
+        # Small nudge towards important memories among equally similar ones
+        top = np.argsort(-(scores + 0.01 * importance[rows]))[:k]
+        return [
+            (str(uuid.UUID(bytes=bytes(memories[rows[i]]))), float(scores[i]))
+            for i in top if scores[i] > 0
+        ]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def get_memory_index(tenant_uuid) -> Optional[MemoryVectorIndex]:
+    """The process-wide index for a tenant, or None when NumPy is not installed"""
+    if not NUMPY_AVAILABLE:
+        return None
+    directory = _config('AI_MEMORY_INDEX_DIR', os.path.join('app', 'data', 'memory_index'))
+    dim = _config('AI_MEMORY_INDEX_DIM', DEFAULT_DIM)
+    path = os.path.join(directory, f'{uuid.UUID(str(tenant_uuid))}.idx')
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None or index.dim != dim:
+            index = _indexes[path] = MemoryVectorIndex(path, dim)
+        return index
+
+
+def index_memory(memory, text: str) -> None:
+    """Append one saved AIMemory to its tenant's index; failures are logged, never raised"""
+    try:
+        index = get_memory_index(memory.tenantuuid)
+        if index is not None:
+            index.add(memory.memoryuuid, memory.entity_uuid, memory.entity_type, memory.importance_score, text)
+    except Exception as e:
+        log_with_route(logging.ERROR, f"Error indexing memory {memory.memoryuuid}: {e}")
+
+
+def rebuild_memory_index(tenant_uuid, memories: Iterable[Tuple]) -> int:
+    """Rewrite a tenant's index from (memory uuid, entity uuid, entity type, importance, text) tuples"""
+    index = get_memory_index(tenant_uuid)
+    if index is None:
+        return 0
+    return index.add_many(memories, replace=True)
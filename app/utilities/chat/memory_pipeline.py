@@ -0,0 +1,455 @@
+# Filepath: app/utilities/chat/memory_pipeline.py
+"""
+Background long-term memory pipeline
+
+Chat requests only queue the finished turn (enqueue_conversation_turn, one
+INSERT into ai_memory_jobs). process_ai_memory_jobs_task then:
+
+1. Claims 'condense' jobs and summarises up to AI_MEMORY_CONDENSE_BATCH_SIZE
+   turns per model call. Summaries scoring above the importance threshold are
+   saved as AIMemory rows and added to the tenant's memory index.
+2. Queues a 'trickle_up' job for the parent entity (device -> group ->
+   organisation -> tenant) of each memory important enough to propagate.
+3. Claims 'trickle_up' jobs and writes one memory per parent entity from all
+   notes pending for it, so a busy device costs its group one model call per
+   run rather than one per memory.
+
+Jobs are claimed with FOR UPDATE SKIP LOCKED, so several workers can run at
+once. A condense claim only takes turns of one tenant and entity, so a batched
+prompt never mixes conversations of different tenants. A claim not finished
+within AI_MEMORY_JOB_CLAIM_TIMEOUT seconds is picked up again, and a job is
+dropped after AI_MEMORY_JOB_MAX_ATTEMPTS claims. get_memory_queue_depth()
+reports what is waiting.
+"""
+
+import json
+import logging
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import tiktoken
+from flask import current_app
+from langchain_openai import AzureChatOpenAI
+from sqlalchemy import text, bindparam
+from app.extensions import celery
+from app.models import db, AIMemory, AIMemoryJob, Devices, Groups, Organisations
+from app.utilities.app_logging_helper import log_with_route
+from app.utilities.chat.memory_index import index_memory
+
+MAX_TOKENS_PER_MEMORY = 300  # Maximum number of tokens per memory item
+SAVE_THRESHOLD = 0.7
+# Lowest importance (exclusive) a memory needs to be passed on to its parent entity
+TRICKLE_UP_THRESHOLDS = {'device': 0.8, 'group': 0.8, 'organisation': 0.9}
+TRICKLE_UP_DECAY = 0.9
+
+MSP_KEYWORDS = [
+    'SLA', 'breach', 'critical', 'urgent', 'compliance', 'audit',
+    'security', 'performance', 'outage', 'downtime', 'client',
+    'billing', 'license', 'renewal', 'migration', 'project',
+    'ransomware', 'attack', 'disaster', 'recovery', 'backup',
+    'failed', 'error', 'vulnerable'
+]
+
+# Prompt wording per parent entity type: (what the notes are, what to write)
+TRICKLE_UP_PROMPTS = {
+    'group': ('device-specific', 'group-level observation that would be relevant for MSP management',
+              'Group-level summary (be brief and focus on business impact):'),
+    'organisation': ('group-specific', 'organization-level insight that would be relevant for MSP management',
+                     'Organization-level insight (focus on business impact and client relationship):'),
+    'tenant': ('client-specific', 'MSP business insight',
+               'MSP business insight (focus on trends, opportunities, risks, and business implications):'),
+}
+
+# Condense jobs are claimed for the (tenant, entity) of the oldest claimable job only
+claim_condense_jobs_sql = text("""
+    WITH head AS (
+        SELECT tenantuuid, entity_uuid FROM ai_memory_jobs
+        WHERE job_type = 'condense'
+        AND (claimed_at IS NULL OR claimed_at < :stale_before)
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE ai_memory_jobs
+    SET claimed_at = :now, attempts = attempts + 1
+    WHERE id IN (
+        SELECT j.id FROM ai_memory_jobs j, head
+        WHERE j.job_type = 'condense'
+        AND j.tenantuuid = head.tenantuuid
+        AND j.entity_uuid = head.entity_uuid
+        AND (j.claimed_at IS NULL OR j.claimed_at < :stale_before)
+        ORDER BY j.id
+        LIMIT :limit
+        FOR UPDATE OF j SKIP LOCKED
+    )
+    RETURNING id, tenantuuid, entity_uuid, entity_type, payload, attempts
+""")
+
+claim_jobs_sql = text("""
+    UPDATE ai_memory_jobs
+    SET claimed_at = :now, attempts = attempts + 1
+    WHERE id IN (
+        SELECT id FROM ai_memory_jobs
+        WHERE job_type = :job_type
+        AND (claimed_at IS NULL OR claimed_at < :stale_before)
+        ORDER BY id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, tenantuuid, entity_uuid, entity_type, payload, attempts
+""")
+
+delete_jobs_sql = text("DELETE FROM ai_memory_jobs WHERE id IN :ids").bindparams(bindparam('ids', expanding=True))
+
+queue_depth_sql = text("""
+    SELECT job_type, COUNT(*) AS jobs, COUNT(claimed_at) AS claimed, MIN(created_at) AS oldest
+    FROM ai_memory_jobs
+    GROUP BY job_type
+""")
+
+_tokenizer = None
+
+
+def _get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = tiktoken.get_encoding("cl100k_base")
+    return _tokenizer
+
+
+def tokenize_memory(content: str) -> str:
+    tokens = _get_tokenizer().encode(content)
+    # Limit tokens to prevent excessive storage
+    return json.dumps(tokens[:MAX_TOKENS_PER_MEMORY])
+
+
+def detokenize_memory(tokenized_content: str) -> str:
+    return _get_tokenizer().decode(json.loads(tokenized_content))
+
+
+def calculate_importance(content: str) -> float:
+    # Calculate base score from keywords
+    keyword_score = sum(keyword.lower() in content.lower() for keyword in MSP_KEYWORDS) * 0.05
+
+    # Check for common MSP conversation patterns
+    pattern_scores = 0.0
+
+    # Check for problem-solution pattern (problem followed by solution)
+    if re.search(r'(issue|problem|error|failure|outage|malfunction).*?(fix|solution|resolve|mitigate|repair)', content, re.IGNORECASE):
+        pattern_scores += 0.2
+
+    # Check for decision pattern
+    if re.search(r'(decide|decision|choose|recommend|approve|implement)', content, re.IGNORECASE):
+        pattern_scores += 0.15
+
+    # Check for follow-up pattern
+    if re.search(r'(follow.up|next.steps|action.items|schedule|will.be|future)', content, re.IGNORECASE):
+        pattern_scores += 0.15
+
+    # Higher importance for client-facing information
+    if re.search(r'(client|customer|end.user|business)', content, re.IGNORECASE):
+        pattern_scores += 0.1
+
+    # Add together with base importance
+    base_importance = 0.2  # Every conversation has some importance
+    return min(base_importance + keyword_score + pattern_scores, 1.0)
+
+
+def enqueue_conversation_turn(tenant_uuid, entity_uuid, entity_type: str, user_message: str, ai_message: str,
+                              conversation_uuid: Optional[str] = None, topics: Optional[List[str]] = None) -> None:
+    """Queue a finished chat turn for condensation into long-term memory. Commits."""
+    db.session.add(AIMemoryJob(
+        job_type='condense',
+        tenantuuid=tenant_uuid,
+        entity_uuid=entity_uuid,
+        entity_type=entity_type,
+        payload={
+            'user_message': user_message,
+            'ai_message': ai_message,
+            'conversation_uuid': conversation_uuid,
+            'topics': topics or [],
+        },
+    ))
+    db.session.commit()
+
+
+def get_memory_queue_depth() -> Dict[str, Any]:
+    """Jobs waiting per type, how many of them are claimed, and the age of the oldest in seconds"""
+    now = int(time.time())
+    depth = {job_type: {'jobs': 0, 'claimed': 0, 'oldest_age': 0} for job_type in ('condense', 'trickle_up')}
+    for row in db.session.execute(queue_depth_sql):
+        depth[row.job_type] = {'jobs': row.jobs, 'claimed': row.claimed, 'oldest_age': now - row.oldest}
+    depth['total'] = sum(entry['jobs'] for entry in depth.values())
+    return depth
+
+
+def _get_llm():
+    return AzureChatOpenAI(
+        openai_api_key=current_app.config['AZURE_OPENAI_API_KEY'],
+        azure_endpoint=current_app.config['AZURE_OPENAI_ENDPOINT'],
+        azure_deployment="wegweiser",
+        openai_api_version=current_app.config['AZURE_OPENAI_API_VERSION'],
+    )
+
+
+def _claim_jobs(job_type: str, limit: int, claim_timeout: int, max_attempts: int) -> List[Any]:
+    """Claim up to `limit` jobs and commit the claim; jobs past max_attempts are dropped instead"""
+    now = int(time.time())
+    claim_sql = claim_condense_jobs_sql if job_type == 'condense' else claim_jobs_sql
+    rows = db.session.execute(claim_sql, {
+        'now': now, 'job_type': job_type, 'stale_before': now - claim_timeout, 'limit': limit
+    }).fetchall()
+    exhausted = [row.id for row in rows if row.attempts > max_attempts]
+    if exhausted:
+        db.session.execute(delete_jobs_sql, {'ids': exhausted})
+        log_with_route(logging.ERROR, f"Dropped {len(exhausted)} {job_type} memory job(s) after {max_attempts} attempts")
+    db.session.commit()
+    return sorted((row for row in rows if row.attempts <= max_attempts), key=lambda row: row.id)
+
+
+def _condense_prompt(turn: Dict[str, Any]) -> str:
+    topics_text = ', '.join(turn.get('topics') or []) or 'general conversation'
+    return f"""
+        Condense the following MSP support conversation into a brief, informative summary focused on:
+        1. Core technical or business issues discussed
+        2. Decisions made or actions recommended
+        3. Important client information revealed
+        4. Follow-up items or pending issues
+
+        Conversation topics: {topics_text}
+
+        User: {turn.get('user_message', '')}
+
+        Assistant: {turn.get('ai_message', '')}
+
+        Create a concise summary that would be useful for an MSP technician reviewing this case later:
+        """
+
+
+def _batch_condense_prompt(turns: List[Dict[str, Any]]) -> str:
+    conversations = "\n\n".join(
+        f"Conversation {number}\n"
+        f"Conversation topics: {', '.join(turn.get('topics') or []) or 'general conversation'}\n"
+        f"User: {turn.get('user_message', '')}\n"
+        f"Assistant: {turn.get('ai_message', '')}"
+        for number, turn in enumerate(turns, 1)
+    )
+    return f"""
+        Condense each of the following {len(turns)} MSP support conversations into a brief, informative summary focused on:
+        1. Core technical or business issues discussed
+        2. Decisions made or actions recommended
+        3. Important client information revealed
+        4. Follow-up items or pending issues
+
+        Each summary should be useful for an MSP technician reviewing the case later.
+        Answer with only a JSON array of {len(turns)} strings, one summary per conversation, in the same order.
+
+        {conversations}
+        """
+
+
+def _parse_summaries(content: str, expected: int) -> Optional[List[str]]:
+    content = re.sub(r'^```(?:json)?\s*|\s*```$', '', content.strip())
+    try:
+        summaries = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(summaries, list) or len(summaries) != expected \
+            or not all(isinstance(summary, str) for summary in summaries):
+        return None
+    return summaries
+
+
+def condense_turns(llm, turns: List[Dict[str, Any]]) -> List[str]:
+    """One summary per turn, from a single model call when its answer can be parsed"""
+    if len(turns) > 1:
+        summaries = _parse_summaries(llm.invoke(_batch_condense_prompt(turns)).content, len(turns))
+        if summaries is not None:
+            return summaries
+        log_with_route(logging.WARNING, f"Batched memory condensation of {len(turns)} turns was not parseable; condensing one by one")
+    return [llm.invoke(_condense_prompt(turn)).content for turn in turns]
+
+
+def _save_memory(tenant_uuid, entity_uuid, entity_type: str, content: str, importance: float,
+                 memory_type: str, topics: str) -> AIMemory:
+    now = int(time.time())
+    memory = AIMemory(
+        memoryuuid=uuid.uuid4(),
+        entity_uuid=entity_uuid,
+        entity_type=entity_type,
+        tenantuuid=tenant_uuid,
+        content=tokenize_memory(content),
+        created_at=now,
+        last_accessed=now,
+        importance_score=importance,
+        memory_type=memory_type,
+        topics=topics,
+    )
+    db.session.add(memory)
+    return memory
+
+
+def _trickle_up_job(memory: AIMemory, content: str) -> Optional[AIMemoryJob]:
+    """A trickle_up job carrying this memory to its parent entity, with context for the parent's summary"""
+    threshold = TRICKLE_UP_THRESHOLDS.get(memory.entity_type)
+    if threshold is None or memory.importance_score <= threshold:
+        return None
+
+    if memory.entity_type == 'device':
+        device = Devices.query.get(memory.entity_uuid)
+        if not device or not device.groupuuid:
+            return None
+        parent_type, parent_uuid = 'group', device.groupuuid
+        platform = getattr(device, 'agent_platform', None) or 'Unknown platform'
+        health = f", Health score: {device.health_score}" if device.health_score is not None else ""
+        note = f"Device: {device.devicename} ({platform}){health} | {content}"
+    elif memory.entity_type == 'group':
+        group = Groups.query.get(memory.entity_uuid)
+        if not group:
+            return None
+        parent_type, parent_uuid = 'organisation', group.orguuid
+        device_count = Devices.query.filter_by(groupuuid=memory.entity_uuid).count()
+        note = f"Group: {group.groupname} ({device_count} devices) | {content}"
+    else:
+        org = Organisations.query.get(memory.entity_uuid)
+        if not org:
+            return None
+        parent_type, parent_uuid = 'tenant', org.tenantuuid
+        note = f"Client: {org.orgname} | {content}"
+
+    return AIMemoryJob(
+        job_type='trickle_up',
+        tenantuuid=memory.tenantuuid,
+        entity_uuid=parent_uuid,
+        entity_type=parent_type,
+        payload={
+            'note': note,
+            'importance': memory.importance_score,
+            'topics': memory.topics,
+            'source_memory': str(memory.memoryuuid),
+        },
+    )
+
+
+def group_jobs_by_entity(jobs: List[Any]) -> List[List[Any]]:
+    """Jobs split per (tenant, entity), in claim order; turns of different tenants never share a prompt"""
+    groups = {}
+    for job in jobs:
+        groups.setdefault((str(job.tenantuuid), str(job.entity_uuid)), []).append(job)
+    return list(groups.values())
+
+
+def process_condense_jobs(llm, batch_size: int, max_jobs: int, claim_timeout: int, max_attempts: int) -> Dict[str, int]:
+    stats = {'turns': 0, 'memories': 0, 'batches': 0}
+    while stats['turns'] < max_jobs:
+        jobs = _claim_jobs('condense', min(batch_size, max_jobs - stats['turns']), claim_timeout, max_attempts)
+        if not jobs:
+            break
+        try:
+            saved = []
+            condensed = [(job, summary) for group in group_jobs_by_entity(jobs)
+                         for job, summary in zip(group, condense_turns(llm, [job.payload for job in group]))]
+            for job, summary in condensed:
+                importance = calculate_importance(summary)
+                if importance > SAVE_THRESHOLD:
+                    topics = ','.join(job.payload.get('topics') or []) or 'general'
+                    memory = _save_memory(job.tenantuuid, job.entity_uuid, job.entity_type, summary, importance,
+                                          'conversation', topics)
+                    saved.append((memory, summary))
+            for memory, summary in saved:
+                trickle_job = _trickle_up_job(memory, summary)
+                if trickle_job is not None:
+                    db.session.add(trickle_job)
+            db.session.execute(delete_jobs_sql, {'ids': [job.id for job in jobs]})
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f"Error condensing {len(jobs)} memory job(s): {str(e)}")
+            break
+
+        for memory, summary in saved:
+            index_memory(memory, summary)
+        stats['batches'] += 1
+        stats['turns'] += len(jobs)
+        stats['memories'] += len(saved)
+    return stats
+
+
+def _trickle_up_prompt(parent_type: str, notes: List[str]) -> str:
+    source, target, answer = TRICKLE_UP_PROMPTS[parent_type]
+    if len(notes) == 1:
+        return f"""
+                    Convert this {source} note into a brief {target}:
+                    {notes[0]}
+
+                    {answer}
+                    """
+    listed = "\n".join(f"- {note}" for note in notes)
+    return f"""
+                    Convert these {len(notes)} {source} notes into one brief {target}, highlighting anything they have in common:
+                    {listed}
+
+                    {answer}
+                    """
+
+
+def process_trickle_up_jobs(llm, max_jobs: int, claim_timeout: int, max_attempts: int) -> Dict[str, int]:
+    stats = {'notes': 0, 'memories': 0, 'llm_calls': 0}
+    jobs = _claim_jobs('trickle_up', max_jobs, claim_timeout, max_attempts)
+
+    parents = {}
+    for job in jobs:
+        parents.setdefault((job.tenantuuid, job.entity_type, job.entity_uuid), []).append(job)
+
+    for (tenant_uuid, parent_type, parent_uuid), parent_jobs in parents.items():
+        try:
+            notes = [job.payload['note'] for job in parent_jobs]
+            content = llm.invoke(_trickle_up_prompt(parent_type, notes)).content
+            stats['llm_calls'] += 1
+            importance = max(job.payload.get('importance') or 0 for job in parent_jobs) * TRICKLE_UP_DECAY
+            topics = sorted({topic for job in parent_jobs
+                             for topic in (job.payload.get('topics') or 'general').split(',') if topic})
+            memory = _save_memory(tenant_uuid, parent_uuid, parent_type, content, importance,
+                                  'trickle_up', ','.join(topics) or 'general')
+            db.session.execute(delete_jobs_sql, {'ids': [job.id for job in parent_jobs]})
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f"Error in trickle-up memory for {parent_type} {parent_uuid}: {str(e)}")
+            continue
+
+        index_memory(memory, content)
+        stats['notes'] += len(parent_jobs)
+        stats['memories'] += 1
+    return stats
+
+
+def run_memory_pipeline(llm=None) -> Dict[str, Any]:
+    config = current_app.config
+    llm = llm or _get_llm()
+    claim_timeout = config.get('AI_MEMORY_JOB_CLAIM_TIMEOUT', 600)
+    max_attempts = config.get('AI_MEMORY_JOB_MAX_ATTEMPTS', 3)
+    max_jobs = config.get('AI_MEMORY_PIPELINE_MAX_JOBS', 200)
+    return {
+        'condense': process_condense_jobs(llm, config.get('AI_MEMORY_CONDENSE_BATCH_SIZE', 10), max_jobs,
+                                          claim_timeout, max_attempts),
+        'trickle_up': process_trickle_up_jobs(llm, max_jobs, claim_timeout, max_attempts),
+    }
+
+
+@celery.task(name='app.utilities.process_ai_memory_jobs')
+def process_ai_memory_jobs_task():
+    """Celery task: condense queued chat turns into memories and trickle them up the hierarchy"""
+    with current_app.app_context():
+        try:
+            if not get_memory_queue_depth()['total']:
+                return None
+            stats = run_memory_pipeline()
+            log_with_route(logging.INFO, f"AI memory pipeline: {stats}; queue now {get_memory_queue_depth()}")
+            return stats
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f"AI memory pipeline failed: {str(e)}")
+            return None
@@ -0,0 +1,337 @@
+# Filepath: app/utilities/device_backup.py
+"""
+Device backup before deletion, and set-based device deletion
+
+A backup is a gzip-compressed JSON Lines archive written row by row from
+server-side cursors, so memory use does not grow with a device's history:
+
+    {"format": 2, "deviceuuid": ..., "device_info": {...}}     first line
+    {"table": "device_metadata", "row": {...}}                 one line per row
+    {"table_counts": {"device_metadata": 12, ...}}             last line
+
+The archive is written under a temporary name and renamed when complete.
+app.utilities.device_restore reads it back, as well as the older single JSON
+document backups.
+
+delete_devices_cascade() removes any number of devices with one DELETE per
+dependent table. Deleting more than DEVICE_DELETE_SYNC_MAX devices at once runs
+as a DeviceDeletionJob in Celery (delete_devices_job_task), which backs up and
+deletes DEVICE_DELETE_BATCH_SIZE devices per transaction and records progress
+on the job row.
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List
+from uuid import UUID
+
+from flask import current_app
+from sqlalchemy import inspect, select, text
+from app.extensions import celery
+from app.models import (
+    db, Devices, DeviceMetadata, DeviceBattery, DeviceDrives, DeviceMemory, DeviceNetworks,
+    DeviceStatus, DeviceUsers, DevicePartitions, DeviceCpu, DeviceGpu, DeviceBios, DeviceCollector,
+    DevicePrinters, DevicePciDevices, DeviceUsbDevices, DeviceDrivers, DeviceConnectivity, Messages,
+    TagsXDevices, DeviceRealtimeData, DeviceRealtimeHistory, DeviceMetricRollup, DeviceDeletionJob,
+    HealthScoreHistory, HealthScoreRollup
+)
+from app.utilities.app_logging_helper import log_with_route
+
+BACKUP_FORMAT_VERSION = 2
+BACKUP_LOCATIONS = ('/var/log/wegweiser/device_backups', '/tmp/wegweiser/device_backups')
+BACKUP_EXTENSION = '.jsonl.gz'
+# Rows fetched per round trip from the server-side cursor
+STREAM_BATCH_SIZE = 1000
+
+# Archive table name -> model, in the order rows are written and restored
+BACKUP_TABLES = (
+    ('device_metadata', DeviceMetadata),
+    ('device_battery', DeviceBattery),
+    ('device_drives', DeviceDrives),
+    ('device_memory', DeviceMemory),
+    ('device_networks', DeviceNetworks),
+    ('device_status', DeviceStatus),
+    ('device_users', DeviceUsers),
+    ('device_partitions', DevicePartitions),
+    ('device_cpu', DeviceCpu),
+    ('device_gpu', DeviceGpu),
+    ('device_bios', DeviceBios),
+    ('device_collector', DeviceCollector),
+    ('device_printers', DevicePrinters),
+    ('device_pci_devices', DevicePciDevices),
+    ('device_usb_devices', DeviceUsbDevices),
+    ('device_drivers', DeviceDrivers),
+    ('device_connectivity', DeviceConnectivity),
+    ('messages', Messages),
+    ('tags_x_devices', TagsXDevices),
+    ('device_realtime_data', DeviceRealtimeData),
+    ('device_realtime_history', DeviceRealtimeHistory),
+    ('device_metric_rollup', DeviceMetricRollup),
+    ('health_score_history', HealthScoreHistory),
+    ('health_score_rollup', HealthScoreRollup),
+)
+
+# (table, device column, entity type column) in an order that respects foreign keys:
+# messages before conversations, everything before devices
+DEVICE_DELETION_ORDER = (
+    ('messages', 'entityuuid', 'entity_type'),
+    ('health_score_history', 'entity_uuid', 'entity_type'),
+    ('health_score_rollup', 'entity_uuid', 'entity_type'),
+    ('ai_memory_jobs', 'entity_uuid', 'entity_type'),
+    ('devicebattery', 'deviceuuid', None),
+    ('devicebios', 'deviceuuid', None),
+    ('devicecollector', 'deviceuuid', None),
+    ('devicecpu', 'deviceuuid', None),
+    ('devicedrivers', 'deviceuuid', None),
+    ('devicedrives', 'deviceuuid', None),
+    ('devicegpu', 'deviceuuid', None),
+    ('devicememory', 'deviceuuid', None),
+    ('devicemetadata', 'deviceuuid', None),
+    ('devicenetworks', 'deviceuuid', None),
+    ('devicepartitions', 'deviceuuid', None),
+    ('devicepcidevices', 'deviceuuid', None),
+    ('deviceprinters', 'deviceuuid', None),
+    ('devicestatus', 'deviceuuid', None),
+    ('deviceusbdevices', 'deviceuuid', None),
+    ('deviceusers', 'deviceuuid', None),
+    ('devicerealtimedata', 'deviceuuid', None),
+    ('devicerealtimehistory', 'deviceuuid', None),
+    ('device_metric_rollup', 'deviceuuid', None),
+    ('deviceconnectivity', 'deviceuuid', None),
+    ('device_osquery', 'deviceuuid', None),
+    ('device_audit_json_test', 'deviceuuid', None),
+    ('agent_update_history', 'deviceuuid', None),
+    ('snippetsschedule', 'deviceuuid', None),
+    ('snippetshistory', 'deviceuuid', None),
+    ('tagsxdevices', 'deviceuuid', None),
+    ('conversations', 'deviceuuid', None),
+    ('devices', 'deviceuuid', None),
+)
+
+
+def ensure_backup_directory():
+    """
+    Ensure the backup directory exists and is properly configured at /var/log/wegweiser/device_backups.
+    Falls back to /tmp if there are permission issues.
+    """
+    backup_dir = BACKUP_LOCATIONS[0]
+
+    try:
+        # First try the preferred location
+        os.makedirs(backup_dir, mode=0o755, exist_ok=True)
+
+        # Verify we can actually write to it
+        test_file = os.path.join(backup_dir, '.write_test')
+        try:
+            with open(test_file, 'w') as f:
+                f.write('test')
+            os.remove(test_file)
+        except Exception as e:
+            log_with_route(logging.WARNING, f"Cannot write to {backup_dir}: {str(e)}")
+            raise
+
+    except Exception as e:
+        log_with_route(logging.WARNING,
+            f"Failed to use {backup_dir}, falling back to {BACKUP_LOCATIONS[1]}: {str(e)}")
+
+        # Fall back to /tmp
+        backup_dir = BACKUP_LOCATIONS[1]
+        os.makedirs(backup_dir, mode=0o755, exist_ok=True)
+        log_with_route(logging.INFO, f"Using fallback backup directory: {backup_dir}")
+
+    return backup_dir
+
+
+def _json_default(value):
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('utf-8', errors='ignore')
+    return str(value)
+
+
+def _dumps(record) -> str:
+    return json.dumps(record, default=_json_default, separators=(',', ':')) + '\n'
+
+
+def _device_filter(model, device_uuid):
+    # Messages and health scores belong to entities rather than devices
+    if model is Messages:
+        return (Messages.entityuuid == device_uuid) & (Messages.entity_type == 'device')
+    columns = model.__table__.c
+    if 'entity_uuid' in columns:
+        return (columns.entity_uuid == device_uuid) & (columns.entity_type == 'device')
+    return columns.deviceuuid == device_uuid
+
+
+def backup_device_data(device_uuid, backup_dir=None) -> str:
+    """
+    Write a backup archive of a device and all its related rows.
+    Returns the path to the backup file.
+    """
+    device_row = db.session.execute(
+        select(Devices.__table__).where(Devices.__table__.c.deviceuuid == device_uuid)
+    ).mappings().first()
+    if not device_row:
+        raise ValueError(f"Device {device_uuid} not found")
+
+    backup_dir = backup_dir or ensure_backup_directory()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    safe_device_name = "".join(x for x in device_row['devicename'] if x.isalnum() or x in ('-', '_'))
+    filepath = os.path.join(backup_dir, f"{safe_device_name}_{device_uuid}_{timestamp}{BACKUP_EXTENSION}")
+    temp_path = f"{filepath}.part"
+
+    table_counts = {}
+    try:
+        with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=6) as archive:
+            archive.write(_dumps({
+                'format': BACKUP_FORMAT_VERSION,
+                'deviceuuid': str(device_uuid),
+                'created_at': int(time.time()),
+                'device_info': dict(device_row),
+            }))
+            for table_name, model in BACKUP_TABLES:
+                rows = db.session.execute(
+                    select(model.__table__).where(_device_filter(model, device_uuid))
+                    .execution_options(yield_per=STREAM_BATCH_SIZE)
+                ).mappings()
+                count = 0
+                for row in rows:
+                    archive.write(_dumps({'table': table_name, 'row': dict(row)}))
+                    count += 1
+                table_counts[table_name] = count
+            archive.write(_dumps({'table_counts': table_counts}))
+        os.replace(temp_path, filepath)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    log_with_route(logging.INFO,
+        f"Created backup at {filepath} ({sum(table_counts.values())} rows, {os.path.getsize(filepath)} bytes)")
+    return filepath
+
+
+def delete_devices_cascade(device_uuids: Iterable, session=None) -> Dict[str, int]:
+    """
+    Delete devices and their rows in every dependent table, one statement per table.
+    Tables missing from the database are skipped. Does not commit.
+
+    Returns:
+        dict: rows deleted per table
+    """
+    session = session or db.session
+    uuids = [str(device_uuid) for device_uuid in device_uuids]
+    if not uuids:
+        return {}
+
+    existing_tables = set(inspect(session.connection()).get_table_names())
+    deleted = {}
+    for table_name, column_name, entity_type_column in DEVICE_DELETION_ORDER:
+        if table_name not in existing_tables:
+            continue
+        entity_clause = f" AND {entity_type_column} = 'device'" if entity_type_column else ""
+        deleted[table_name] = session.execute(
+            text(f"DELETE FROM {table_name} WHERE {column_name} = ANY(CAST(:uuids AS uuid[])){entity_clause}"),
+            {'uuids': uuids}
+        ).rowcount
+    return deleted
+
+
+def backup_and_delete_devices(device_uuids: List) -> List[Dict]:
+    """
+    Back up each device, then delete every device that was backed up in one
+    transaction. Devices whose backup fails are left in place. Commits.
+
+    Returns:
+        list: one result dict per device, as returned by the delete endpoint
+    """
+    results, backed_up = [], []
+    for device_uuid in device_uuids:
+        device_uuid = str(device_uuid)
+        try:
+            device_name = db.session.execute(
+                select(Devices.devicename).where(Devices.deviceuuid == device_uuid)
+            ).scalar()
+            backup_path = backup_device_data(device_uuid)
+            backed_up.append(device_uuid)
+            results.append({
+                'deviceuuid': device_uuid,
+                'devicename': device_name,
+                'status': 'success',
+                'backup_path': backup_path,
+                'message': f'Device {device_name} deleted successfully'
+            })
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f"Error backing up device {device_uuid}: {str(e)}")
+            results.append({'deviceuuid': device_uuid, 'status': 'error', 'error': str(e)})
+
+    if backed_up:
+        try:
+            deleted = delete_devices_cascade(backed_up)
+            db.session.commit()
+            log_with_route(logging.INFO, f"Deleted {len(backed_up)} devices: {deleted}")
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f"Error in cascade delete for devices {backed_up}: {str(e)}")
+            for result in results:
+                if result['status'] == 'success':
+                    result.update(status='error', error=str(e))
+                    result.pop('message', None)
+    return results
+
+
+def _chunks(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run_device_deletion_job(job_uuid) -> DeviceDeletionJob:
+    """Back up and delete a job's devices batch by batch, committing progress after each batch"""
+    job = DeviceDeletionJob.query.get(job_uuid)
+    if job is None:
+        raise ValueError(f"Device deletion job {job_uuid} not found")
+
+    job.status = 'running'
+    job.started_at = int(time.time())
+    db.session.commit()
+
+    batch_size = max(current_app.config.get('DEVICE_DELETE_BATCH_SIZE', 25), 1)
+    done = {result['deviceuuid'] for result in job.results or []}
+    remaining = [device_uuid for device_uuid in job.deviceuuids if device_uuid not in done]
+    for batch in _chunks(remaining, batch_size):
+        results = backup_and_delete_devices(batch)
+        job.results = (job.results or []) + results
+        job.processed += len(results)
+        job.failed += sum(1 for result in results if result['status'] != 'success')
+        db.session.commit()
+
+    job.status = 'completed'
+    job.finished_at = int(time.time())
+    db.session.commit()
+    log_with_route(logging.INFO,
+        f"Device deletion job {job_uuid} finished: {job.processed - job.failed} deleted, {job.failed} failed")
+    return job
+
+
+@celery.task(name='app.utilities.delete_devices_job')
+def delete_devices_job_task(job_uuid):
+    """Celery task: run a bulk DeviceDeletionJob"""
+    with current_app.app_context():
+        try:
+            return run_device_deletion_job(job_uuid).to_dict()
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f"Device deletion job {job_uuid} failed: {str(e)}")
+            job = DeviceDeletionJob.query.get(job_uuid)
+            if job is not None:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = int(time.time())
+                db.session.commit()
+            return None
@@ -0,0 +1,78 @@
+# Filepath: app/utilities/device_commands.py
+"""
+Device commands run off the web workers
+
+Routes answer a synchronous device command by holding a gunicorn sync worker
+for up to NATS_COMMAND_TIMEOUT seconds. queue_device_command() instead hands
+the command to a Celery worker, which sends it through the NATS command bridge,
+and returns the task id as the command id. Clients poll get_queued_command()
+(GET /osquery/api/device/commands/<command_id>) until the result is there; the
+result backend keeps it for result_expires seconds.
+"""
+
+import json
+import logging
+import uuid
+from typing import Any, Dict, Optional
+
+from app.extensions import celery
+from app.models import db, Conversations, Messages
+from app.utilities.app_logging_helper import log_with_route
+from app.utilities.nats_command_bridge import run_device_command
+
+
+def save_terminal_history(tenantuuid, device_uuid, useruuid, query: str, result: Any) -> None:
+    """Store a terminal query and its result in the device's conversation. Commits."""
+    try:
+        # IDs arrive as strings from Celery
+        tenantuuid, device_uuid = uuid.UUID(str(tenantuuid)), uuid.UUID(str(device_uuid))
+        useruuid = uuid.UUID(str(useruuid)) if useruuid else None
+        conversation = Conversations.get_or_create_conversation(
+            tenantuuid=tenantuuid,
+            entityuuid=device_uuid,
+            entity_type='device'
+        )
+        for title, content, author in (('Terminal Query', query, useruuid),
+                                       ('Terminal Result', json.dumps(result), None)):
+            db.session.add(Messages(
+                conversationuuid=conversation.conversationuuid,
+                useruuid=author,
+                tenantuuid=tenantuuid,
+                entityuuid=device_uuid,
+                entity_type='device',
+                title=title,
+                content=content,
+                message_type='terminal'
+            ))
+        db.session.commit()
+        log_with_route(logging.INFO, "[OSQUERY] Terminal history saved successfully")
+    except Exception as e:
+        log_with_route(logging.ERROR, f"[OSQUERY] Failed to save terminal history: {str(e)}")
+        db.session.rollback()
+
+
+@celery.task(name='app.utilities.run_device_command')
+def run_device_command_task(tenantuuid, device_uuid, action, args=None, history=None):
+    """Celery task: send a device command and wait for its result; history ({'useruuid', 'query'}) is saved with it"""
+    result = run_device_command(tenantuuid, device_uuid, action, args)
+    if history:
+        save_terminal_history(tenantuuid, device_uuid, history.get('useruuid'), history.get('query', ''), result)
+    return {'tenantuuid': str(tenantuuid), 'device_uuid': str(device_uuid), 'action': action, 'result': result}
+
+
+def queue_device_command(tenantuuid, device_uuid, action: str, args: Optional[dict] = None,
+                         history: Optional[dict] = None) -> str:
+    """Run a device command in a Celery worker; returns the command id to poll"""
+    task = run_device_command_task.delay(str(tenantuuid), str(device_uuid), action, args or {}, history)
+    return task.id
+
+
+def get_queued_command(command_id: str) -> Optional[Dict[str, Any]]:
+    """A queued command's {'tenantuuid', 'device_uuid', 'action', 'result'}, or None while it runs"""
+    task = celery.AsyncResult(command_id)
+    if not task.ready():
+        return None
+    if task.failed():
+        return {'tenantuuid': None, 'device_uuid': None, 'action': None,
+                'result': {'error': f'Command failed: {task.result}'}}
+    return task.result
@@ -4,10 +4,25 @@ Device Data Aggregator
 
 Central service that coordinates all device data providers and provides
 a clean interface for fetching device information modularly.
+
+Providers that are not cached run concurrently, each on its own app context
+and session, up to DEVICE_DATA_CONCURRENCY at a time. Components read from
+audit tables (status and hardware) are cached per process for
+DEVICE_DATA_CACHE_TTL seconds. Each one is keyed by its table's last_update
+and row count, read for all of them in one query, so a new audit invalidates
+it immediately. Results are also memoized for the rest of the request.
 """
 
 from typing import Dict, Any, Optional, List, Set
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import copy
 import logging
+import threading
+import time
+from flask import current_app, g, has_app_context
+from sqlalchemy import text
+from app.models import db
 from app.utilities.app_logging_helper import log_with_route
 from .device_basic_provider import DeviceBasicProvider
 from .device_status_provider import DeviceStatusProvider
@@ -25,6 +40,45 @@ from .device_users_provider import DeviceUsersProvider
 from .device_printers_provider import DevicePrintersProvider
 from .device_usb_devices_provider import DeviceUsbDevicesProvider
 
+# Components whose data comes from one audit table with a last_update column
+CACHEABLE_COMPONENT_TABLES = {
+    'status': 'devicestatus',
+    'battery': 'devicebattery',
+    'memory': 'devicememory',
+    'cpu': 'devicecpu',
+    'gpu': 'devicegpu',
+    'bios': 'devicebios',
+    'drives': 'devicedrives',
+    'networks': 'devicenetworks',
+    'partitions': 'devicepartitions',
+    'users': 'deviceusers',
+    'printers': 'deviceprinters',
+    'usb_devices': 'deviceusbdevices',
+}
+
+# Process-wide cache: (deviceuuid, tenantuuid, component) -> (version, data, stored_at)
+_component_cache = OrderedDict()
+_component_cache_lock = threading.Lock()
+
+
+def component_versions_sql(components: List[str]):
+    """One round-trip for the (last_update, row count) of each component's table"""
+    return text(" UNION ALL ".join(
+        f"SELECT '{component}' AS component, MAX(last_update) AS last_update, COUNT(*) AS row_count "
+        f"FROM {CACHEABLE_COMPONENT_TABLES[component]} WHERE deviceuuid = CAST(:deviceuuid AS uuid)"
+        for component in components
+    ))
+
+
+def clear_device_data_cache(deviceuuid: Optional[str] = None) -> None:
+    """Drop cached components for one device, or for every device"""
+    with _component_cache_lock:
+        if deviceuuid is None:
+            _component_cache.clear()
+        else:
+            for key in [key for key in _component_cache if key[0] == str(deviceuuid)]:
+                del _component_cache[key]
+
 
 class DeviceDataAggregator:
     """
@@ -74,26 +128,18 @@ class DeviceDataAggregator:
             Dictionary containing all device data organized by component
         """
         device_data = {}
-        
-        for component_name, provider in self.providers.items():
-            try:
-                data = provider.get_data()
-                if data is not None:
-                    device_data[component_name] = data
-                else:
-                    log_with_route(
-                        logging.DEBUG,
-                        f"No data returned from {component_name} provider for device {self.deviceuuid}"
-                    )
-            except Exception as e:
+
+        for component_name, data in self._fetch(list(self.providers)).items():
+            if data is not None:
+                device_data[component_name] = data
+            else:
                 log_with_route(
-                    logging.ERROR,
-                    f"Error fetching data from {component_name} provider: {str(e)}",
-                    exc_info=True
+                    logging.DEBUG,
+                    f"No data returned from {component_name} provider for device {self.deviceuuid}"
                 )
-        
+
         return device_data
-    
+
     def get_components_data(self, components: List[str]) -> Dict[str, Any]:
         """
         Fetch data from specific components only.
@@ -104,8 +150,7 @@ class DeviceDataAggregator:
         Returns:
             Dictionary containing requested component data
         """
-        device_data = {}
-        
+        known = []
         for component_name in components:
             if component_name not in self.providers:
                 log_with_route(
@@ -113,21 +158,99 @@ class DeviceDataAggregator:
                     f"Unknown component requested: {component_name}"
                 )
                 continue
-            
-            try:
-                provider = self.providers[component_name]
-                data = provider.get_data()
-                if data is not None:
-                    device_data[component_name] = data
-            except Exception as e:
-                log_with_route(
-                    logging.ERROR,
-                    f"Error fetching data from {component_name} provider: {str(e)}",
-                    exc_info=True
-                )
-        
-        return device_data
-    
+            known.append(component_name)
+
+        return {
+            component_name: data
+            for component_name, data in self._fetch(known).items()
+            if data is not None
+        }
+
+    def _fetch(self, components: List[str]) -> Dict[str, Any]:
+        """
+        Data for each component (None where a provider has none or failed),
+        served from the request memo, then the process cache, then the providers.
+        """
+        memo = self._request_memo()
+        results = {component: memo[component] for component in components if component in memo}
+        missing = [component for component in components if component not in results]
+
+        ttl = current_app.config.get('DEVICE_DATA_CACHE_TTL', 300) if has_app_context() else 0
+        versions = self._get_versions([c for c in missing if c in CACHEABLE_COMPONENT_TABLES]) if ttl else {}
+
+        to_load = []
+        now = time.monotonic()
+        with _component_cache_lock:
+            for component in missing:
+                key = (self.deviceuuid, self.tenantuuid, component)
+                cached = _component_cache.get(key)
+                if component in versions and cached and cached[0] == versions[component] and now - cached[2] < ttl:
+                    _component_cache.move_to_end(key)
+                    results[component] = copy.deepcopy(cached[1])
+                else:
+                    to_load.append(component)
+
+        loaded = self._load(to_load)
+        if versions:
+            max_entries = current_app.config.get('DEVICE_DATA_CACHE_MAX_ENTRIES', 10000)
+            with _component_cache_lock:
+                for component, data in loaded.items():
+                    if component in versions:
+                        _component_cache[(self.deviceuuid, self.tenantuuid, component)] = (
+                            versions[component], copy.deepcopy(data), now
+                        )
+                while len(_component_cache) > max_entries:
+                    _component_cache.popitem(last=False)
+
+        results.update(loaded)
+        memo.update({component: results[component] for component in missing})
+        return {component: results[component] for component in components}
+
+    def _request_memo(self) -> Dict[str, Any]:
+        """Per-request store of component data already fetched for this device"""
+        if not has_app_context():
+            return {}
+        memos = g.setdefault('device_data_memo', {})
+        return memos.setdefault((self.deviceuuid, self.tenantuuid), {})
+
+    def _get_versions(self, components: List[str]) -> Dict[str, tuple]:
+        if not components:
+            return {}
+        try:
+            rows = db.session.execute(component_versions_sql(components), {'deviceuuid': self.deviceuuid})
+            return {row.component: (row.last_update, row.row_count) for row in rows}
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.WARNING, f"Could not read component versions for device {self.deviceuuid}: {str(e)}")
+            return {}
+
+    def _load_component(self, component_name: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.providers[component_name].get_data()
+        except Exception as e:
+            log_with_route(
+                logging.ERROR,
+                f"Error fetching data from {component_name} provider: {str(e)}",
+                exc_info=True
+            )
+            return None
+
+    def _load(self, components: List[str]) -> Dict[str, Any]:
+        """Run providers, concurrently when there is more than one to run"""
+        concurrency = current_app.config.get('DEVICE_DATA_CONCURRENCY', 4) if has_app_context() else 1
+        if concurrency <= 1 or len(components) <= 1:
+            return {component: self._load_component(component) for component in components}
+
+        app = current_app._get_current_object()
+
+        def load_in_context(component_name):
+            # Each worker gets its own app context, so its own session and connection
+            with app.app_context():
+                return self._load_component(component_name)
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(components))) as pool:
+            return dict(zip(components, pool.map(load_in_context, components)))
+
     def get_essential_data(self) -> Dict[str, Any]:
         """
         Fetch only essential device data for basic display.
@@ -169,14 +292,9 @@ class DeviceDataAggregator:
         """
         if component not in self.providers:
             return False
-        
-        try:
-            provider = self.providers[component]
-            data = provider.get_data()
-            return data is not None
-        except Exception:
-            return False
-    
+
+        return self._fetch([component])[component] is not None
+
     def get_device_summary(self) -> Dict[str, Any]:
         """
         Get a summary of device information suitable for dashboard display.
@@ -0,0 +1,319 @@
+# Filepath: app/utilities/device_metrics_timeseries.py
+"""
+Realtime device metrics as a typed, downsampled time series
+
+The realtime widgets post CPU, memory and socket samples every few seconds.
+Instead of one JSON row per sample, the numeric fields are extracted on ingest
+(extract_metrics) and folded into 1 minute buckets in device_metric_rollup
+(sum/min/max/sample count per device, metric and bucket) with one upsert.
+maintain_device_metrics_task builds 5 minute buckets from the minute buckets
+and 1 hour buckets from the 5 minute ones, then trims each resolution to its
+own retention: by default 2 days of minutes, 14 days of 5 minutes and 180 days
+of hours.
+
+get_device_metric_series() picks the finest resolution that still covers the
+requested range in no more than max_points buckets and returns chart-ready
+[[ms, value], ...] arrays computed in SQL.
+"""
+
+import logging
+import math
+import time
+from flask import current_app
+from sqlalchemy import text, bindparam
+from app.extensions import celery
+from app.models import db
+from app.utilities.app_logging_helper import log_with_route
+
+MINUTE = 60
+FIVE_MINUTES = 300
+HOUR = 3600
+RESOLUTIONS = (MINUTE, FIVE_MINUTES, HOUR)
+
+# Numeric fields kept per realtime data type: metric name -> path into data_value
+METRICS_BY_DATA_TYPE = {
+    'osquery-info': {
+        'cpu_load': ('load_percentage',),
+    },
+    'osquery-info-ram': {
+        'memory_percentage': ('memory_percentage',),
+        'memory_used': ('used_memory',),
+        'memory_total': ('total_memory',),
+    },
+    'osquery-info-sockets': {
+        'sockets_total': ('stats', 'total_connections'),
+        'sockets_listening': ('stats', 'listening_ports'),
+        'sockets_established': ('stats', 'established_connections'),
+        'sockets_unusual': ('stats', 'unusual_ports'),
+        'sockets_foreign': ('stats', 'foreign_connections'),
+    },
+}
+
+STAT_EXPRESSIONS = {
+    'avg': 'SUM(value_sum) / SUM(samples)',
+    'min': 'MIN(value_min)',
+    'max': 'MAX(value_max)',
+}
+
+# Samples for the same minute bucket are merged before the upsert, which can touch each row only once
+record_samples_sql = text("""
+    INSERT INTO device_metric_rollup (deviceuuid, metric, resolution, bucket, value_sum, value_min, value_max, samples)
+    SELECT deviceuuid, metric, 60, bucket, SUM(value), MIN(value), MAX(value), COUNT(*)
+    FROM unnest(CAST(:uuids AS uuid[]), CAST(:metrics AS text[]), CAST(:buckets AS integer[]),
+                CAST(:metric_values AS double precision[])) AS s(deviceuuid, metric, bucket, value)
+    GROUP BY deviceuuid, metric, bucket
+    ON CONFLICT (deviceuuid, metric, resolution, bucket) DO UPDATE
+    SET value_sum = device_metric_rollup.value_sum + EXCLUDED.value_sum,
+        value_min = LEAST(device_metric_rollup.value_min, EXCLUDED.value_min),
+        value_max = GREATEST(device_metric_rollup.value_max, EXCLUDED.value_max),
+        samples = device_metric_rollup.samples + EXCLUDED.samples
+""")
+
+# Re-aggregates whole target buckets from `since` (aligned to the target width), so re-running is safe
+rollup_sql = text("""
+    INSERT INTO device_metric_rollup (deviceuuid, metric, resolution, bucket, value_sum, value_min, value_max, samples)
+    SELECT deviceuuid,
+           metric,
+           :target,
+           bucket - bucket % :target,
+           SUM(value_sum),
+           MIN(value_min),
+           MAX(value_max),
+           SUM(samples)
+    FROM device_metric_rollup
+    WHERE resolution = :source
+    AND bucket >= :since
+    GROUP BY deviceuuid, metric, bucket - bucket % :target
+    ON CONFLICT (deviceuuid, metric, resolution, bucket) DO UPDATE
+    SET value_sum = EXCLUDED.value_sum,
+        value_min = EXCLUDED.value_min,
+        value_max = EXCLUDED.value_max,
+        samples = EXCLUDED.samples
+""")
+
+series_sql = """
+    SELECT metric, bucket - bucket % :step AS bucket_start, {stat} AS value
+    FROM device_metric_rollup
+    WHERE deviceuuid = :deviceuuid
+    AND metric IN :metrics
+    AND resolution = :resolution
+    AND bucket >= :start
+    AND bucket <= :end
+    GROUP BY metric, bucket_start
+    ORDER BY metric, bucket_start
+"""
+series_sql_by_stat = {
+    stat: text(series_sql.format(stat=expression)).bindparams(bindparam('metrics', expanding=True))
+    for stat, expression in STAT_EXPRESSIONS.items()
+}
+
+
+def extract_metrics(data_type, data_value):
+    """
+    Numeric metrics in a realtime sample, e.g. {'cpu_load': 12.5}.
+
+    Fields that are missing or not numbers are skipped; data types without
+    metrics give an empty dict.
+    """
+    metrics = {}
+    for metric, path in METRICS_BY_DATA_TYPE.get(data_type, {}).items():
+        value = data_value
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is None or isinstance(value, bool):
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if math.isfinite(value):
+            metrics[metric] = value
+    return metrics
+
+
+def record_metric_samples(samples, session=None):
+    """
+    Fold samples into their 1 minute buckets with a single upsert. Does not commit.
+
+    Args:
+        samples: iterable of (deviceuuid, unix timestamp, {metric: value})
+
+    Returns:
+        int: number of metric values written
+    """
+    session = session or db.session
+    uuids, metrics, buckets, values = [], [], [], []
+    for deviceuuid, timestamp, sample_metrics in samples:
+        bucket = int(timestamp) - int(timestamp) % MINUTE
+        for metric, value in sample_metrics.items():
+            uuids.append(str(deviceuuid))
+            metrics.append(metric)
+            buckets.append(bucket)
+            values.append(value)
+
+    if uuids:
+        session.execute(record_samples_sql, {
+            'uuids': uuids, 'metrics': metrics, 'buckets': buckets, 'metric_values': values
+        })
+    return len(uuids)
+
+
+def rollup_device_metrics(session=None):
+    """
+    Build 5 minute buckets from minute buckets, then hourly buckets from 5 minute buckets.
+
+    Each step resumes at the newest bucket it already has (which may have been
+    partial), or at the oldest source bucket on the first run. Does not commit.
+
+    Returns:
+        dict: target resolution -> unix time it was rolled up from, or None if there was nothing to do
+    """
+    session = session or db.session
+    rolled_up_from = {}
+    for source, target in ((MINUTE, FIVE_MINUTES), (FIVE_MINUTES, HOUR)):
+        since = session.execute(
+            text("SELECT MAX(bucket) FROM device_metric_rollup WHERE resolution = :target"), {'target': target}
+        ).scalar()
+        if since is None:
+            since = session.execute(
+                text("SELECT MIN(bucket) FROM device_metric_rollup WHERE resolution = :source"), {'source': source}
+            ).scalar()
+        if since is None:
+            rolled_up_from[target] = None
+            continue
+
+        since -= since % target
+        session.execute(rollup_sql, {'source': source, 'target': target, 'since': since})
+        rolled_up_from[target] = since
+    return rolled_up_from
+
+
+def apply_device_metrics_retention(minute_days=2, five_minute_days=14, hourly_days=180,
+                                   rolled_up_from=None, now=None, session=None):
+    """
+    Delete buckets older than their resolution's retention; 0 keeps a resolution forever.
+
+    Buckets not yet rolled up into the next resolution (at or after
+    rolled_up_from[next resolution]) are never deleted. Does not commit.
+
+    Returns:
+        dict: rows deleted per resolution
+    """
+    session = session or db.session
+    now = int(now or time.time())
+    rolled_up_from = rolled_up_from or {}
+    retention = ((MINUTE, minute_days, FIVE_MINUTES), (FIVE_MINUTES, five_minute_days, HOUR), (HOUR, hourly_days, None))
+
+    deleted = {}
+    for resolution, days, next_resolution in retention:
+        deleted[resolution] = 0
+        if not days:
+            continue
+        cutoff = now - days * 86400
+        if rolled_up_from.get(next_resolution) is not None:
+            cutoff = min(cutoff, rolled_up_from[next_resolution])
+        deleted[resolution] = session.execute(
+            text("DELETE FROM device_metric_rollup WHERE resolution = :resolution AND bucket < :cutoff"),
+            {'resolution': resolution, 'cutoff': cutoff}
+        ).rowcount
+    return deleted
+
+
+def choose_resolution(start, end, max_points, now, retention_days):
+    """
+    Pick the stored resolution and bucket width (seconds) for a series query.
+
+    Uses the coarsest resolution whose retention covers `start` and that is no
+    wider than the range split into max_points buckets (the finest covering one
+    if all are wider), then widens the bucket to a multiple of that resolution
+    so the result has at most max_points points.
+
+    Args:
+        retention_days: {resolution: days}, 0 meaning kept forever
+    """
+    step = max((end - start) / max_points, 1)
+    covered = [candidate for candidate in RESOLUTIONS
+               if not retention_days.get(candidate, 0) or start >= now - retention_days[candidate] * 86400]
+    resolution = covered[0] if covered else HOUR
+    for candidate in covered:
+        if candidate <= step:
+            resolution = candidate
+    return resolution, int(math.ceil(step / resolution) * resolution)
+
+
+def get_device_metric_series(deviceuuid, metrics, start, end=None, max_points=1440, stat='avg',
+                             retention_days=None, session=None):
+    """
+    Downsampled series for one or more metrics of a device.
+
+    Args:
+        start, end: unix timestamps (end defaults to now)
+        stat: 'avg', 'min' or 'max' of each bucket
+
+    Returns:
+        dict: metric -> [[bucket start in ms, value], ...] in time order, [] for metrics without data
+    """
+    session = session or db.session
+    metrics = list(metrics)
+    series = {metric: [] for metric in metrics}
+    if not metrics:
+        return series
+
+    now = int(time.time())
+    end = int(end or now)
+    start = int(start)
+    if retention_days is None:
+        retention_days = {MINUTE: 2, FIVE_MINUTES: 14, HOUR: 180}
+    resolution, step = choose_resolution(start, end, max_points, now, retention_days)
+
+    rows = session.execute(series_sql_by_stat[stat], {
+        'deviceuuid': str(deviceuuid),
+        'metrics': metrics,
+        'resolution': resolution,
+        'step': step,
+        'start': start - start % step,
+        'end': end,
+    })
+    for row in rows:
+        series[row.metric].append([row.bucket_start * 1000, round(row.value, 2)])
+    return series
+
+
+def get_chart_metric_series(deviceuuid, metrics, hours=24, stat='avg'):
+    """get_device_metric_series() over the last `hours`, using the app's retention and point limits"""
+    config = current_app.config
+    return get_device_metric_series(
+        deviceuuid,
+        metrics,
+        start=time.time() - hours * 3600,
+        max_points=config.get('DEVICE_METRICS_MAX_POINTS', 1440),
+        stat=stat,
+        retention_days={
+            MINUTE: config.get('DEVICE_METRICS_MINUTE_DAYS', 2),
+            FIVE_MINUTES: config.get('DEVICE_METRICS_FIVE_MINUTE_DAYS', 14),
+            HOUR: config.get('DEVICE_METRICS_HOURLY_DAYS', 180),
+        },
+    )
+
+
+@celery.task(name='app.utilities.maintain_device_metrics')
+def maintain_device_metrics_task():
+    """Celery task: roll realtime device metrics up into 5 minute/hourly buckets and apply retention"""
+    with current_app.app_context():
+        try:
+            rolled_up_from = rollup_device_metrics()
+            deleted = apply_device_metrics_retention(
+                minute_days=current_app.config.get('DEVICE_METRICS_MINUTE_DAYS', 2),
+                five_minute_days=current_app.config.get('DEVICE_METRICS_FIVE_MINUTE_DAYS', 14),
+                hourly_days=current_app.config.get('DEVICE_METRICS_HOURLY_DAYS', 180),
+                rolled_up_from=rolled_up_from,
+            )
+            db.session.commit()
+
+            log_with_route(logging.INFO, f"Rolled up device metrics from {rolled_up_from}; deleted {deleted}")
+            return True
+
+        except Exception as e:
+            log_with_route(logging.ERROR, f"Error maintaining device metrics: {str(e)}")
+            db.session.rollback()
+            return False
@@ -2,9 +2,12 @@
 """
 Device Restoration Utility
 
-Restores a deleted device and all its related data from a backup JSON file.
+Restores a deleted device and all its related data from a backup file: the
+compressed JSON Lines archives written by app.utilities.device_backup, which
+are read and inserted in batches, or the older single JSON document backups.
 """
 
+import gzip
 import json
 import logging
 import os
@@ -12,14 +15,51 @@ import glob
 import time
 import uuid as uuid_module
 from uuid import UUID
-from app.models import (
-    db, Devices, DeviceMetadata, DeviceBattery, DeviceDrives, DeviceMemory,
-    DeviceNetworks, DeviceStatus, DeviceUsers, DevicePartitions, DeviceCpu,
-    DeviceGpu, DeviceBios, DeviceCollector, DevicePrinters, DevicePciDevices,
-    DeviceUsbDevices, DeviceDrivers, DeviceRealtimeData, DeviceRealtimeHistory,
-    DeviceConnectivity, Messages, TagsXDevices, Conversations
-)
+from app.models import db, Devices, Messages, Conversations
 from app.utilities.app_logging_helper import log_with_route
+from app.utilities.device_backup import BACKUP_LOCATIONS, BACKUP_EXTENSION, BACKUP_TABLES
+
+# Rows inserted per statement while restoring
+RESTORE_BATCH_SIZE = 1000
+BACKUP_PATTERNS = (f'*{BACKUP_EXTENSION}', '*.json')
+
+
+def _backup_files(backup_dir, device_uuid=None):
+    prefix = f'*{device_uuid}' if device_uuid else ''
+    return [path for pattern in BACKUP_PATTERNS for path in glob.glob(os.path.join(backup_dir, prefix + pattern))]
+
+
+def iter_backup_records(backup_path):
+    """
+    Yield ('device_info', {...}) and then (table name, row) for every row in a backup.
+    Archives are read line by line; older JSON backups are loaded whole.
+    """
+    if backup_path.endswith(BACKUP_EXTENSION):
+        with gzip.open(backup_path, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                record = json.loads(line)
+                if 'device_info' in record:
+                    yield 'device_info', record['device_info']
+                elif 'table' in record:
+                    yield record['table'], record['row']
+        return
+
+    with open(backup_path, 'r') as f:
+        backup_data = json.load(f)
+    yield 'device_info', backup_data.get('device_info', {})
+    for table_name, records in backup_data.get('tables', {}).items():
+        for record in records:
+            yield table_name, record
+
+
+def read_backup_device_info(backup_path):
+    """The device_info section of a backup, without reading the rest of an archive"""
+    records = iter_backup_records(backup_path)
+    try:
+        section, data = next(records, (None, None))
+        return data if section == 'device_info' else {}
+    finally:
+        records.close()
 
 
 def find_device_backup(device_uuid):
@@ -32,18 +72,12 @@ def find_device_backup(device_uuid):
     Returns:
         str: Path to backup file, or None if not found
     """
-    backup_locations = [
-        '/var/log/wegweiser/device_backups',
-        '/tmp/wegweiser/device_backups'
-    ]
-    
-    for backup_dir in backup_locations:
+    for backup_dir in BACKUP_LOCATIONS:
         if not os.path.exists(backup_dir):
             continue
             
         # Find all backup files for this device UUID
-        pattern = os.path.join(backup_dir, f'*{device_uuid}*.json')
-        matching_files = glob.glob(pattern)
+        matching_files = _backup_files(backup_dir, device_uuid)
         
         if matching_files:
             # Return the most recent backup (sorted by modification time)
@@ -57,7 +91,7 @@ def find_device_backup(device_uuid):
 
 def restore_device_from_backup(device_uuid, backup_path=None):
     """
-    Restore a device and all its related data from a backup JSON file.
+    Restore a device and all its related data from a backup file.
     
     Args:
         device_uuid: UUID of the device to restore
@@ -77,19 +111,17 @@ def restore_device_from_backup(device_uuid, backup_path=None):
         if not os.path.exists(backup_path):
             return False, f"Backup file not found: {backup_path}"
         
-        # Load backup data
         log_with_route(logging.INFO, f"Loading backup from {backup_path}")
-        with open(backup_path, 'r') as f:
-            backup_data = json.load(f)
-        
+        records = iter_backup_records(backup_path)
+
         # Check if device already exists
         existing_device = Devices.query.get(device_uuid)
         if existing_device:
             return False, f"Device {device_uuid} already exists in database"
         
         # Restore main device record
-        device_info = backup_data.get('device_info', {})
-        if not device_info:
+        section, device_info = next(records, (None, None))
+        if section != 'device_info' or not device_info:
             return False, "Backup file missing device_info section"
         
         log_with_route(logging.INFO, f"Restoring device: {device_info.get('devicename')} ({device_uuid})")
@@ -125,84 +157,35 @@ def restore_device_from_backup(device_uuid, backup_path=None):
             tenantuuid=device_info['tenantuuid']
         )
         db.session.add(conversation)
-        # Flush to ensure conversation exists before adding messages
+        # Flush to ensure device and conversation exist before adding related rows
         db.session.flush()
 
-        # Restore related tables
-        tables_data = backup_data.get('tables', {})
+        # Archive table name -> table; rows of other tables in a backup are skipped
+        table_models = {table_name: model.__table__ for table_name, model in BACKUP_TABLES}
         restored_counts = {}
+        pending_table, pending_rows = None, []
 
-        # Map table names to model classes (excluding messages and conversations - we handle those specially)
-        table_models = {
-            'device_metadata': DeviceMetadata,
-            'device_battery': DeviceBattery,
-            'device_drives': DeviceDrives,
-            'device_memory': DeviceMemory,
-            'device_networks': DeviceNetworks,
-            'device_status': DeviceStatus,
-            'device_users': DeviceUsers,
-            'device_partitions': DevicePartitions,
-            'device_cpu': DeviceCpu,
-            'device_gpu': DeviceGpu,
-            'device_bios': DeviceBios,
-            'device_collector': DeviceCollector,
-            'device_printers': DevicePrinters,
-            'device_pci_devices': DevicePciDevices,
-            'device_usb_devices': DeviceUsbDevices,
-            'device_drivers': DeviceDrivers,
-            'device_realtime_data': DeviceRealtimeData,
-            'device_realtime_history': DeviceRealtimeHistory,
-            'device_connectivity': DeviceConnectivity,
-            'tags_x_devices': TagsXDevices
-        }
+        def insert_pending():
+            if pending_rows:
+                db.session.execute(table_models[pending_table].insert(), pending_rows)
+                restored_counts[pending_table] = restored_counts.get(pending_table, 0) + len(pending_rows)
+                log_with_route(logging.DEBUG, f"Restored {len(pending_rows)} records for {pending_table}")
 
-        # Restore each table's data
-        for table_name, model_class in table_models.items():
-            if table_name not in tables_data:
+        # Rows are inserted in batches per table, so only one batch is held in memory
+        for table_name, record_data in records:
+            if table_name not in table_models:
                 continue
+            if table_name != pending_table or len(pending_rows) >= RESTORE_BATCH_SIZE:
+                insert_pending()
+                pending_table, pending_rows = table_name, []
 
-            records = tables_data[table_name]
-            restored_count = 0
-
-            for record_data in records:
-                try:
-                    # Create model instance from record data
-                    record = model_class(**record_data)
-                    db.session.add(record)
-                    restored_count += 1
-                except Exception as e:
-                    log_with_route(logging.WARNING,
-                        f"Failed to restore {table_name} record: {str(e)}")
-                    continue
-
-            if restored_count > 0:
-                restored_counts[table_name] = restored_count
-                log_with_route(logging.DEBUG,
-                    f"Restored {restored_count} records for {table_name}")
-
-        # Restore messages with NEW conversation UUID
-        if 'messages' in tables_data:
-            messages_records = tables_data['messages']
-            restored_message_count = 0
-
-            for message_data in messages_records:
-                try:
-                    # Update the conversation UUID to the new one
-                    message_data['conversationuuid'] = new_conversation_uuid
-
-                    # Create message instance
-                    message = Messages(**message_data)
-                    db.session.add(message)
-                    restored_message_count += 1
-                except Exception as e:
-                    log_with_route(logging.WARNING,
-                        f"Failed to restore message record: {str(e)}")
-                    continue
-
-            if restored_message_count > 0:
-                restored_counts['messages'] = restored_message_count
-                log_with_route(logging.DEBUG,
-                    f"Restored {restored_message_count} messages with new conversation UUID")
+            columns = table_models[table_name].columns
+            row = {key: value for key, value in record_data.items() if key in columns}
+            if table_name == 'messages':
+                # Restore messages with NEW conversation UUID
+                row['conversationuuid'] = new_conversation_uuid
+            pending_rows.append(row)
+        insert_pending()
 
         # Add a system message about the restoration
         system_useruuid = '00000000-0000-0000-0000-000000000000'
@@ -248,28 +231,16 @@ def list_available_backups(device_uuid=None):
     Returns:
         list: List of dicts with backup information
     """
-    backup_locations = [
-        '/var/log/wegweiser/device_backups',
-        '/tmp/wegweiser/device_backups'
-    ]
-    
     backups = []
     
-    for backup_dir in backup_locations:
+    for backup_dir in BACKUP_LOCATIONS:
         if not os.path.exists(backup_dir):
             continue
         
-        if device_uuid:
-            pattern = os.path.join(backup_dir, f'*{device_uuid}*.json')
-        else:
-            pattern = os.path.join(backup_dir, '*.json')
-        
-        for backup_file in glob.glob(pattern):
+        for backup_file in _backup_files(backup_dir, device_uuid):
             try:
-                # Extract info from filename: devicename_uuid_timestamp.json
                 filename = os.path.basename(backup_file)
-                parts = filename.replace('.json', '').split('_')
-                
+
                 # Get file modification time
                 mtime = os.path.getmtime(backup_file)
                 
@@ -0,0 +1,355 @@
+# Filepath: app/utilities/firewall_backends.py
+"""
+Firewall enforcement backends for IPBlocker.
+
+- IpsetBackend (default): blocked addresses live in ipsets (hash:ip for
+  single addresses, hash:net for CIDR ranges, each once for IPv4 and once for
+  IPv6 with a "6" suffix) referenced by one iptables/ip6tables DROP rule each,
+  so the INPUT chain stays short however many IPs are blocked.
+  Adds are queued and written with a single `ipset restore` per batch
+  (IP_BLOCKER_FIREWALL_BATCH_DELAY), and entries can carry a timeout so bans
+  expire in the kernel (IP_BLOCKER_BAN_TIMEOUT).
+- IptablesBackend: the previous behaviour, one `-s <ip> -j DROP` rule per
+  address (ip6tables for IPv6), now checked with -C first so rules are not
+  duplicated.
+- DryRunBackend: keeps the blocked set in memory and records the commands it
+  would have run; needs no root, for development and tests.
+
+reconcile() brings the kernel in line with the blacklist held in LMDB and is
+called when IPBlocker starts.
+"""
+
+import ipaddress
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from app.utilities.app_logging_helper import log_with_route
+
+SUDO_PATH = '/usr/bin/sudo'
+IPTABLES_PATH = '/usr/sbin/iptables'
+IP6TABLES_PATH = '/usr/sbin/ip6tables'
+IPSET_PATH = '/usr/sbin/ipset'
+
+
+def run_command(cmd: List[str], input_text: Optional[str] = None, quiet: bool = False) -> Optional[str]:
+    """Run a firewall command; returns stdout, or None if it failed (logged unless quiet)"""
+    try:
+        result = subprocess.run(cmd, input=input_text, capture_output=True, text=True, check=False)
+    except Exception as e:
+        log_with_route(logging.ERROR, f"Error executing firewall command {' '.join(cmd)}: {str(e)}")
+        return None
+    if result.returncode != 0:
+        if quiet:
+            return None
+        log_with_route(
+            logging.ERROR,
+            f"Firewall command failed: Command: {' '.join(cmd)}, "
+            f"Return code: {result.returncode}, Stderr: {result.stderr.strip()}"
+        )
+        return None
+    return result.stdout
+
+
+def is_network(entry: str) -> bool:
+    """True for a CIDR range wider than one address"""
+    try:
+        return ipaddress.ip_network(entry, strict=False).num_addresses > 1
+    except ValueError:
+        return False
+
+
+def ip_version(entry: str) -> int:
+    """6 for IPv6 addresses and ranges, otherwise 4"""
+    try:
+        return ipaddress.ip_network(entry, strict=False).version
+    except ValueError:
+        return 4
+
+
+def legacy_drop_rules(sudo_path: str = SUDO_PATH, iptables_path: str = IPTABLES_PATH, runner=run_command) -> Dict[str, int]:
+    """Per-IP `-A INPUT -s <ip> -j DROP` rules currently installed, with their count"""
+    output = runner([sudo_path, iptables_path, '-S', 'INPUT']) or ''
+    rules = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if parts[:2] == ['-A', 'INPUT'] and parts[2:3] == ['-s'] and parts[4:] == ['-j', 'DROP']:
+            source = parts[3][:-3] if parts[3].endswith('/32') else parts[3]
+            rules[source] = rules.get(source, 0) + 1
+    return rules
+
+
+class FirewallBackend:
+    """Interface shared by the enforcement backends"""
+
+    name = 'base'
+
+    def block(self, ips: Iterable[str], timeout: Optional[int] = None) -> bool:
+        """Drop traffic from these addresses/ranges; timeout in seconds (None = permanent)"""
+        raise NotImplementedError
+
+    def unblock(self, ips: Iterable[str]) -> bool:
+        raise NotImplementedError
+
+    def reconcile(self, desired: Dict[str, Optional[int]]) -> Dict[str, int]:
+        """Make the kernel state match `desired` (entry -> remaining timeout or None)"""
+        raise NotImplementedError
+
+    def flush(self) -> bool:
+        """Apply anything queued"""
+        return True
+
+
+class IptablesBackend(FirewallBackend):
+    """One iptables rule per blocked address"""
+
+    name = 'iptables'
+
+    def __init__(self, sudo_path: str = SUDO_PATH, iptables_path: str = IPTABLES_PATH,
+                 ip6tables_path: str = IP6TABLES_PATH):
+        self.sudo_path = sudo_path
+        self.iptables_path = iptables_path
+        self.ip6tables_path = ip6tables_path
+
+    def _rule(self, action: str, ip: str) -> List[str]:
+        iptables_path = self.ip6tables_path if ip_version(ip) == 6 else self.iptables_path
+        return [self.sudo_path, iptables_path, action, 'INPUT', '-s', ip, '-j', 'DROP']
+
+    def _rule_exists(self, ip: str) -> bool:
+        # -C reports a missing rule through its exit code; not an error
+        return run_command(self._rule('-C', ip), quiet=True) is not None
+
+    def block(self, ips: Iterable[str], timeout: Optional[int] = None) -> bool:
+        success = True
+        for ip in ips:
+            if self._rule_exists(ip):
+                continue
+            if run_command(self._rule('-A', ip)) is None:
+                success = False
+            else:
+                log_with_route(logging.INFO, f"iptables command succeeded: {' '.join(self._rule('-A', ip))}")
+        return success
+
+    def unblock(self, ips: Iterable[str]) -> bool:
+        success = True
+        for ip in ips:
+            removed = False
+            # Older versions could append the same rule several times
+            while self._rule_exists(ip):
+                if run_command(self._rule('-D', ip)) is None:
+                    success = False
+                    break
+                removed = True
+            if removed:
+                log_with_route(logging.INFO, f"Removed iptables DROP rule(s) for {ip}")
+        return success
+
+    def reconcile(self, desired: Dict[str, Optional[int]]) -> Dict[str, int]:
+        present = legacy_drop_rules(self.sudo_path, self.iptables_path)
+        missing = [ip for ip in desired if ip not in present]
+        self.block(missing)
+        return {'added': len(missing), 'removed': 0}
+
+
+class IpsetBackend(FirewallBackend):
+    """Blocked addresses in ipsets behind a single iptables rule per set"""
+
+    name = 'ipset'
+
+    def __init__(self, set_name: str = 'wegweiser_blocked', net_set_name: str = 'wegweiser_blocked_net',
+                 batch_delay: float = 0.5, sudo_path: str = SUDO_PATH, ipset_path: str = IPSET_PATH,
+                 iptables_path: str = IPTABLES_PATH, ip6tables_path: str = IP6TABLES_PATH, runner=run_command):
+        self.set_name = set_name
+        self.net_set_name = net_set_name
+        self.batch_delay = batch_delay
+        self.sudo_path = sudo_path
+        self.ipset_path = ipset_path
+        self.iptables_path = iptables_path
+        self.ip6tables_path = ip6tables_path
+        self.run = runner
+        # (set name, ipset type, family, maxelem, iptables binary) per set
+        self.sets = [
+            (set_name, 'hash:ip', 'inet', 1048576, iptables_path),
+            (net_set_name, 'hash:net', 'inet', 65536, iptables_path),
+            (f'{set_name}6', 'hash:ip', 'inet6', 1048576, ip6tables_path),
+            (f'{net_set_name}6', 'hash:net', 'inet6', 65536, ip6tables_path),
+        ]
+        self._ready = False
+        self._pending = {}  # entry -> timeout
+        self._timer = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available(ipset_path: str = IPSET_PATH) -> bool:
+        return os.path.exists(ipset_path)
+
+    def _set_for(self, entry: str) -> str:
+        set_name = self.net_set_name if is_network(entry) else self.set_name
+        return f'{set_name}6' if ip_version(entry) == 6 else set_name
+
+    def _restore(self, lines: List[str]) -> bool:
+        if not lines:
+            return True
+        script = '\n'.join(lines) + '\n'
+        return self.run([self.sudo_path, self.ipset_path, 'restore', '-exist'], script) is not None
+
+    def ensure(self) -> bool:
+        """Create the sets and their iptables rules if missing"""
+        if self._ready:
+            return True
+        # timeout 0 enables per-entry timeouts while keeping entries permanent by default
+        if not self._restore([
+            f'create {set_name} {set_type} family {family} timeout 0 maxelem {maxelem}'
+            for set_name, set_type, family, maxelem, _ in self.sets
+        ]):
+            return False
+        for set_name, _, family, _, iptables_path in self.sets:
+            match = ['INPUT', '-m', 'set', '--match-set', set_name, 'src', '-j', 'DROP']
+            if self.run([self.sudo_path, iptables_path, '-C'] + match, quiet=True) is not None:
+                continue
+            if self.run([self.sudo_path, iptables_path, '-I'] + match[:1] + ['1'] + match[1:]) is None:
+                if family == 'inet6':
+                    # Hosts without IPv6 filtering still enforce IPv4 blocks
+                    log_with_route(logging.WARNING, f"Could not install ip6tables rule for ipset {set_name}")
+                    continue
+                return False
+            log_with_route(logging.INFO, f"Installed {os.path.basename(iptables_path)} rule for ipset {set_name}")
+        self._ready = True
+        return True
+
+    @staticmethod
+    def _add_line(set_name: str, entry: str, timeout: Optional[int]) -> str:
+        return f'add {set_name} {entry} timeout {int(timeout)}' if timeout else f'add {set_name} {entry}'
+
+    def block(self, ips: Iterable[str], timeout: Optional[int] = None) -> bool:
+        with self._lock:
+            for ip in ips:
+                self._pending[ip] = timeout
+            if self.batch_delay <= 0:
+                flush_now = True
+            else:
+                flush_now = False
+                if self._timer is None:
+                    self._timer = threading.Timer(self.batch_delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        return self.flush() if flush_now else True
+
+    def flush(self) -> bool:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        if not pending or not self.ensure():
+            return not pending
+        lines = [self._add_line(self._set_for(entry), entry, timeout) for entry, timeout in pending.items()]
+        if not self._restore(lines):
+            return False
+        log_with_route(logging.INFO, f"Added {len(lines)} entries to the {self.set_name} ipsets")
+        return True
+
+    def unblock(self, ips: Iterable[str]) -> bool:
+        ips = list(ips)
+        with self._lock:
+            for ip in ips:
+                self._pending.pop(ip, None)
+        if not self.ensure():
+            return False
+        return self._restore([f'del {self._set_for(ip)} {ip}' for ip in ips])
+
+    def members(self) -> Dict[str, Optional[int]]:
+        """Entries currently in the sets, with their remaining timeout"""
+        members = {}
+        for set_name, *_ in self.sets:
+            output = self.run([self.sudo_path, self.ipset_path, 'save', set_name]) or ''
+            for line in output.splitlines():
+                parts = line.split()
+                if parts[:2] == ['add', set_name] and len(parts) >= 3:
+                    timeout = int(parts[parts.index('timeout') + 1]) if 'timeout' in parts else None
+                    members[parts[2]] = timeout
+        return members
+
+    def reconcile(self, desired: Dict[str, Optional[int]]) -> Dict[str, int]:
+        if not self.ensure():
+            return {'added': 0, 'removed': 0, 'legacy_rules_removed': 0}
+        present = self.members()
+        lines = [self._add_line(self._set_for(entry), entry, timeout)
+                 for entry, timeout in desired.items() if entry not in present]
+        lines += [f'del {self._set_for(entry)} {entry}' for entry in present if entry not in desired]
+        self._restore(lines)
+
+        # Per-IP rules left by the iptables backend are redundant now
+        legacy_removed = 0
+        for ip, count in legacy_drop_rules(self.sudo_path, self.iptables_path, self.run).items():
+            if ip in desired:
+                for _ in range(count):
+                    if self.run([self.sudo_path, self.iptables_path, '-D', 'INPUT', '-s', ip, '-j', 'DROP']) is not None:
+                        legacy_removed += 1
+
+        added = sum(1 for line in lines if line.startswith('add '))
+        return {'added': added, 'removed': len(lines) - added, 'legacy_rules_removed': legacy_removed}
+
+
+class DryRunBackend(FirewallBackend):
+    """Records what would be enforced without touching the firewall"""
+
+    name = 'dry-run'
+
+    def __init__(self):
+        self.entries = {}   # entry -> expiry (monotonic) or None
+        self.commands = []
+        self._lock = threading.Lock()
+
+    def _record(self, command: str):
+        self.commands.append(command)
+        log_with_route(logging.INFO, f"[firewall dry-run] {command}")
+
+    def _expire(self):
+        now = time.monotonic()
+        for entry, expires in list(self.entries.items()):
+            if expires is not None and expires <= now:
+                del self.entries[entry]
+
+    def is_blocked(self, ip: str) -> bool:
+        with self._lock:
+            self._expire()
+            return ip in self.entries
+
+    def block(self, ips: Iterable[str], timeout: Optional[int] = None) -> bool:
+        with self._lock:
+            for ip in ips:
+                self.entries[ip] = time.monotonic() + timeout if timeout else None
+                self._record(f"block {ip}" + (f" timeout {timeout}" if timeout else ""))
+        return True
+
+    def unblock(self, ips: Iterable[str]) -> bool:
+        with self._lock:
+            for ip in ips:
+                self.entries.pop(ip, None)
+                self._record(f"unblock {ip}")
+        return True
+
+    def reconcile(self, desired: Dict[str, Optional[int]]) -> Dict[str, int]:
+        with self._lock:
+            self._expire()
+            added = [entry for entry in desired if entry not in self.entries]
+            removed = [entry for entry in self.entries if entry not in desired]
+        self.unblock(removed)
+        for entry in added:
+            self.block([entry], desired[entry])
+        return {'added': len(added), 'removed': len(removed)}
+
+
+def create_firewall_backend(name: str = 'ipset', batch_delay: float = 0.5) -> FirewallBackend:
+    """Backend for IP_BLOCKER_FIREWALL_BACKEND ('ipset', 'iptables' or 'dry-run')"""
+    name = (name or 'ipset').lower()
+    if name in ('dry-run', 'dryrun', 'dry_run'):
+        return DryRunBackend()
+    if name == 'ipset':
+        if IpsetBackend.available():
+            return IpsetBackend(batch_delay=batch_delay)
+        log_with_route(logging.WARNING, f"ipset not found at {IPSET_PATH}, falling back to per-IP iptables rules")
+    elif name != 'iptables':
+        log_with_route(logging.WARNING, f"Unknown firewall backend '{name}', using iptables")
+    return IptablesBackend()
@@ -0,0 +1,334 @@
+# Filepath: app/utilities/fleet_query.py
+"""
+Fleet-wide osquery execution
+
+create_fleet_query() records a FleetQueryJob for every online device of a
+group, organisation or tenant and queues run_fleet_query_task. The task sends
+the query to the devices through the NATS command bridge with at most
+FLEET_QUERY_CONCURRENCY commands in flight. Each device has its own
+FLEET_QUERY_DEVICE_TIMEOUT, so a slow device only costs its own slot.
+
+Every answer is stored as a FleetQueryResult as soon as it arrives, with the
+agent's osqueryi output parsed into rows, and the job counters move with it.
+Clients poll the job (get_fleet_query_results(since=...)) for device results
+as they come in, and page through the merged rows of all devices
+(get_fleet_query_rows), each row tagged with its device.
+"""
+
+import concurrent.futures
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import text
+from app.extensions import celery
+from app.models import db, Devices, Groups, Organisations, FleetQueryJob, FleetQueryResult
+from app.utilities.app_logging_helper import log_with_route
+from app.utilities.nats_command_bridge import COMMAND_TIMEOUT_ERROR, submit_device_command, wait_for_command
+
+SCOPE_TYPES = ('group', 'organisation', 'tenant')
+MAX_OUTPUT_CHARS = 65536
+# Results written per commit while a job runs, and the longest a result waits for its commit
+COMMIT_EVERY_RESULTS = 25
+COMMIT_EVERY_SECONDS = 1.0
+
+# Running jobs whose last result (or start) is older than :stale_before; their worker is gone
+fail_stale_jobs_sql = text("""
+    UPDATE fleet_query_jobs j
+    SET status = 'failed', error = :error, finished_at = :now
+    WHERE j.status = 'running'
+    AND COALESCE(
+        (SELECT MAX(r.received_at) FROM fleet_query_results r WHERE r.jobuuid = j.jobuuid),
+        j.started_at, j.created_at
+    ) < :stale_before
+""")
+
+rows_page_sql = text("""
+    SELECT r.deviceuuid, r.devicename, e.row
+    FROM fleet_query_results r
+    CROSS JOIN LATERAL jsonb_array_elements(r.rows) WITH ORDINALITY AS e(row, n)
+    WHERE r.jobuuid = :jobuuid
+    AND r.row_count > 0
+    ORDER BY r.id, e.n
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def is_allowed_fleet_query(query: str) -> bool:
+    """Only read-only SQL is fanned out: SELECT statements and CTEs"""
+    query_lower = (query or '').strip().lower()
+    return query_lower.startswith('select') or query_lower.startswith('with')
+
+
+def get_scope_devices(tenant_uuid, scope_type: str, scope_uuid) -> List[Devices]:
+    """Online devices of a group, organisation or tenant that belongs to tenant_uuid"""
+    devices = Devices.query.filter(Devices.tenantuuid == tenant_uuid, Devices.is_online.is_(True))
+    if scope_type == 'group':
+        devices = devices.filter(Devices.groupuuid == scope_uuid)
+    elif scope_type == 'organisation':
+        devices = devices.filter(Devices.orguuid == scope_uuid)
+    elif scope_type == 'tenant':
+        if str(scope_uuid) != str(tenant_uuid):
+            return []
+    else:
+        raise ValueError(f"Unknown scope type: {scope_type}")
+    return devices.order_by(Devices.devicename).all()
+
+
+def scope_exists(tenant_uuid, scope_type: str, scope_uuid) -> bool:
+    if scope_type == 'group':
+        return Groups.query.join(Organisations, Groups.orguuid == Organisations.orguuid).filter(
+            Groups.groupuuid == scope_uuid, Organisations.tenantuuid == tenant_uuid).first() is not None
+    if scope_type == 'organisation':
+        return Organisations.query.filter_by(orguuid=scope_uuid, tenantuuid=tenant_uuid).first() is not None
+    return scope_type == 'tenant' and str(scope_uuid) == str(tenant_uuid)
+
+
+def create_fleet_query(tenant_uuid, scope_type: str, scope_uuid, query: str, requested_by=None) -> FleetQueryJob:
+    """Record a fleet query job over the scope's online devices and queue it. Commits."""
+    devices = get_scope_devices(tenant_uuid, scope_type, scope_uuid)
+    job = FleetQueryJob(
+        tenantuuid=tenant_uuid,
+        requested_by=requested_by,
+        scope_type=scope_type,
+        scope_uuid=scope_uuid,
+        query_text=query.strip(),
+        total=len(devices),
+    )
+    db.session.add(job)
+    db.session.commit()
+    run_fleet_query_task.delay(str(job.jobuuid))
+    return job
+
+
+def _split_table_line(line: str) -> List[str]:
+    return [cell.strip() for cell in line.strip()[1:-1].split('|')]
+
+
+def parse_osquery_rows(result: Any) -> Tuple[Optional[List[Dict[str, Any]]], int]:
+    """
+    Rows from an agent's osquery result: a list of rows, JSON output, or the
+    table osqueryi prints by default. Rows are None if the output has no
+    recognisable rows. The count is of table lines that were skipped because
+    their cells did not match the header, e.g. values containing '|'.
+    """
+    if isinstance(result, dict):
+        for key in ('rows', 'data'):
+            if isinstance(result.get(key), list):
+                return result[key], 0
+        output = result.get('output')
+    else:
+        output = result
+    if isinstance(output, list):
+        return output, 0
+    if not isinstance(output, str):
+        return None, 0
+
+    output = output.strip()
+    if not output:
+        return [], 0
+    if output[0] == '[':
+        try:
+            rows = json.loads(output)
+            return (rows if isinstance(rows, list) else None), 0
+        except ValueError:
+            return None, 0
+
+    # +-----+------+
+    # | pid | name |
+    # +-----+------+
+    # | 1   | init |
+    # +-----+------+
+    lines = [line for line in output.splitlines() if line.strip()]
+    if not lines or not lines[0].startswith('+'):
+        return None, 0
+    table_lines = [line for line in lines if line.startswith('|')]
+    if not table_lines:
+        return [], 0
+    columns = _split_table_line(table_lines[0])
+    rows, skipped = [], 0
+    for line in table_lines[1:]:
+        cells = _split_table_line(line)
+        if len(cells) == len(columns):
+            rows.append(dict(zip(columns, cells)))
+        else:
+            skipped += 1
+    return rows, skipped
+
+
+def _device_result(job: FleetQueryJob, device: Tuple, response: Dict[str, Any], duration_ms: int,
+                   max_rows: int) -> FleetQueryResult:
+    """A device's answer as a result row; cut or partly unparseable answers are flagged in `error`"""
+    deviceuuid, devicename = device
+    result = FleetQueryResult(jobuuid=job.jobuuid, deviceuuid=deviceuuid, devicename=devicename,
+                              duration_ms=duration_ms, rows=[], row_count=0)
+    error = response.get('error') if isinstance(response, dict) else None
+    if isinstance(response, dict) and response.get('status') == 'error' and not error:
+        error = 'Agent reported an error'
+    if error:
+        result.status = 'timeout' if error == COMMAND_TIMEOUT_ERROR else 'error'
+        result.error = str(error)
+        result.output = (response.get('stderr') or '')[:MAX_OUTPUT_CHARS] or None
+        return result
+
+    # Agents wrap the tool's own result in {'status', 'result'}
+    payload = response.get('result', response) if isinstance(response, dict) else response
+    if isinstance(payload, dict) and payload.get('error'):
+        result.status = 'error'
+        result.error = str(payload['error'])
+        return result
+
+    rows, skipped = parse_osquery_rows(payload)
+    result.status = 'success'
+    notes = []
+    if rows is None or skipped:
+        output = payload.get('output') if isinstance(payload, dict) else payload
+        result.output = str(output)[:MAX_OUTPUT_CHARS] if output is not None else None
+        rows = rows or []
+    if skipped:
+        notes.append(f"{skipped} table row(s) could not be parsed and are only in the raw output")
+    if len(rows) > max_rows:
+        notes.append(f"Result cut to the first {max_rows} of {len(rows)} rows")
+        rows = rows[:max_rows]
+    result.error = '; '.join(notes) or None
+    result.rows = rows
+    result.row_count = len(rows)
+    return result
+
+
+def _record(job: FleetQueryJob, result: FleetQueryResult) -> None:
+    db.session.add(result)
+    job.completed += 1
+    job.row_count += result.row_count
+    if result.status == 'timeout':
+        job.timed_out += 1
+    elif result.status == 'error':
+        job.failed += 1
+
+
+def run_fleet_query(job_uuid) -> FleetQueryJob:
+    """Send a job's query to its devices, storing each answer as it arrives"""
+    job = FleetQueryJob.query.get(job_uuid)
+    if job is None:
+        raise ValueError(f"Fleet query job {job_uuid} not found")
+
+    config = current_app.config
+    concurrency = max(config.get('FLEET_QUERY_CONCURRENCY', 50), 1)
+    device_timeout = config.get('FLEET_QUERY_DEVICE_TIMEOUT', 30)
+    max_rows = config.get('FLEET_QUERY_MAX_ROWS_PER_DEVICE', 10000)
+
+    answered = {str(deviceuuid) for (deviceuuid,) in
+                db.session.query(FleetQueryResult.deviceuuid).filter_by(jobuuid=job.jobuuid)}
+    devices = [(device.deviceuuid, device.devicename)
+               for device in get_scope_devices(job.tenantuuid, job.scope_type, job.scope_uuid)
+               if str(device.deviceuuid) not in answered]
+    job.status = 'running'
+    job.started_at = job.started_at or int(time.time())
+    # Devices that came online or went away since the job was created
+    job.total = job.completed + len(devices)
+    db.session.commit()
+
+    queue = list(reversed(devices))
+    in_flight = {}
+    unsaved, last_commit = 0, time.monotonic()
+    while queue or in_flight:
+        while queue and len(in_flight) < concurrency:
+            device = queue.pop()
+            future = submit_device_command(job.tenantuuid, device[0], 'osquery', {'query': job.query_text},
+                                           timeout=device_timeout)
+            in_flight[future] = (device, time.monotonic())
+
+        done, _ = concurrent.futures.wait(list(in_flight), timeout=COMMIT_EVERY_SECONDS,
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            device, started = in_flight.pop(future)
+            response = wait_for_command(future, device_timeout)
+            duration_ms = int((time.monotonic() - started) * 1000)
+            _record(job, _device_result(job, device, response, duration_ms, max_rows))
+            unsaved += 1
+
+        if unsaved and (unsaved >= COMMIT_EVERY_RESULTS or time.monotonic() - last_commit >= COMMIT_EVERY_SECONDS):
+            db.session.commit()
+            unsaved, last_commit = 0, time.monotonic()
+
+    job.status = 'completed'
+    job.finished_at = int(time.time())
+    db.session.commit()
+    log_with_route(logging.INFO,
+        f"Fleet query {job.jobuuid} finished: {job.completed} devices, {job.row_count} rows, "
+        f"{job.failed} failed, {job.timed_out} timed out")
+    return job
+
+
+def get_fleet_query_results(job_uuid, since: int = 0, limit: int = 500) -> List[Dict[str, Any]]:
+    """Device results of a job received after result id `since`, oldest first, without their rows"""
+    results = FleetQueryResult.query.filter(
+        FleetQueryResult.jobuuid == job_uuid, FleetQueryResult.id > since
+    ).order_by(FleetQueryResult.id).limit(limit).all()
+    return [result.to_dict() for result in results]
+
+
+def get_fleet_query_rows(job_uuid, page: int = 1, per_page: int = 100) -> Dict[str, Any]:
+    """
+    One page of the merged rows of every device, in arrival order.
+    Each row gets deviceuuid and devicename columns ahead of the query's own.
+    """
+    page = max(page, 1)
+    rows, columns = [], ['devicename', 'deviceuuid']
+    for deviceuuid, devicename, row in db.session.execute(rows_page_sql, {
+        'jobuuid': str(job_uuid), 'limit': per_page, 'offset': (page - 1) * per_page
+    }):
+        merged = {'devicename': devicename, 'deviceuuid': str(deviceuuid)}
+        if isinstance(row, dict):
+            merged.update((key, value) for key, value in row.items() if key not in merged)
+        else:
+            merged['value'] = row
+        for key in merged:
+            if key not in columns:
+                columns.append(key)
+        rows.append(merged)
+    return {'page': page, 'per_page': per_page, 'columns': columns, 'rows': rows}
+
+
+def delete_expired_fleet_queries(retention_days: int) -> int:
+    """Delete jobs (and their results) created more than retention_days ago. Does not commit."""
+    if not retention_days:
+        return 0
+    cutoff = int(time.time()) - retention_days * 86400
+    return db.session.execute(
+        text("DELETE FROM fleet_query_jobs WHERE created_at < :cutoff"), {'cutoff': cutoff}
+    ).rowcount
+
+
+def fail_stale_fleet_queries(stale_after: int) -> int:
+    """Mark running jobs without a result for stale_after seconds as failed. Does not commit."""
+    if not stale_after:
+        return 0
+    now = int(time.time())
+    return db.session.execute(fail_stale_jobs_sql, {
+        'now': now, 'stale_before': now - stale_after,
+        'error': 'Worker stopped before the query finished',
+    }).rowcount
+
+
+@celery.task(name='app.utilities.run_fleet_query')
+def run_fleet_query_task(job_uuid):
+    """Celery task: fan a fleet query job out to its devices"""
+    with current_app.app_context():
+        try:
+            delete_expired_fleet_queries(current_app.config.get('FLEET_QUERY_RETENTION_DAYS', 7))
+            fail_stale_fleet_queries(current_app.config.get('FLEET_QUERY_STALE_AFTER', 600))
+            db.session.commit()
+            return run_fleet_query(job_uuid).to_dict()
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.ERROR, f"Fleet query {job_uuid} failed: {str(e)}")
+            job = FleetQueryJob.query.get(job_uuid)
+            if job is not None:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = int(time.time())
+                db.session.commit()
+            return None
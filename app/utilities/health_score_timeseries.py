@@ -0,0 +1,241 @@
+# Filepath: app/utilities/health_score_timeseries.py
+"""
+Health score history as a downsampled time series
+
+health_score_history holds the raw samples written by the health score task.
+Hourly and daily rollups (avg/min/max/sample count per entity per bucket) are
+kept in health_score_rollup, and each tier is trimmed to its own retention:
+by default raw for 7 days, hourly for 90 days and daily indefinitely.
+
+get_health_series() picks the finest tier that still covers the requested
+range at no more than max_points buckets, so a trend query reads at most a
+few hundred rows per entity however long the history is.
+"""
+
+import calendar
+import math
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import text, bindparam
+from app.models import db
+
+RESOLUTION_SECONDS = {'raw': 0, 'hour': 3600, 'day': 86400}
+
+hourly_rollup_sql = text("""
+    INSERT INTO health_score_rollup (entity_type, entity_uuid, resolution, bucket, avg_score, min_score, max_score, samples)
+    SELECT entity_type,
+           entity_uuid,
+           'hour',
+           date_trunc('hour', timestamp),
+           AVG(health_score),
+           MIN(health_score),
+           MAX(health_score),
+           COUNT(*)
+    FROM health_score_history
+    WHERE timestamp >= :since
+    AND health_score IS NOT NULL
+    GROUP BY entity_type, entity_uuid, date_trunc('hour', timestamp)
+    ON CONFLICT (entity_type, entity_uuid, resolution, bucket) DO UPDATE
+    SET avg_score = EXCLUDED.avg_score,
+        min_score = EXCLUDED.min_score,
+        max_score = EXCLUDED.max_score,
+        samples = EXCLUDED.samples
+""")
+
+daily_rollup_sql = text("""
+    INSERT INTO health_score_rollup (entity_type, entity_uuid, resolution, bucket, avg_score, min_score, max_score, samples)
+    SELECT entity_type,
+           entity_uuid,
+           'day',
+           date_trunc('day', bucket),
+           SUM(avg_score * samples) / SUM(samples),
+           MIN(min_score),
+           MAX(max_score),
+           SUM(samples)
+    FROM health_score_rollup
+    WHERE resolution = 'hour'
+    AND bucket >= :since
+    GROUP BY entity_type, entity_uuid, date_trunc('day', bucket)
+    ON CONFLICT (entity_type, entity_uuid, resolution, bucket) DO UPDATE
+    SET avg_score = EXCLUDED.avg_score,
+        min_score = EXCLUDED.min_score,
+        max_score = EXCLUDED.max_score,
+        samples = EXCLUDED.samples
+""")
+
+# Buckets are aligned to multiples of :step seconds since the epoch (UTC)
+raw_series_sql = text("""
+    SELECT to_timestamp(floor(extract(epoch FROM timestamp) / :step) * :step) AT TIME ZONE 'UTC' AS bucket,
+           AVG(health_score) AS score
+    FROM health_score_history
+    WHERE entity_type = :entity_type
+    AND entity_uuid IN :uuids
+    AND timestamp >= :start
+    AND timestamp <= :end
+    AND health_score IS NOT NULL
+    GROUP BY 1
+    ORDER BY 1
+""").bindparams(bindparam('uuids', expanding=True))
+
+rollup_series_sql = text("""
+    SELECT to_timestamp(floor(extract(epoch FROM bucket) / :step) * :step) AT TIME ZONE 'UTC' AS bucket,
+           SUM(avg_score * samples) / SUM(samples) AS score
+    FROM health_score_rollup
+    WHERE entity_type = :entity_type
+    AND entity_uuid IN :uuids
+    AND resolution = :resolution
+    AND bucket >= :start
+    AND bucket <= :end
+    GROUP BY 1
+    ORDER BY 1
+""").bindparams(bindparam('uuids', expanding=True))
+
+first_sample_sql = text("""
+    SELECT LEAST(
+        (SELECT MIN(bucket) FROM health_score_rollup
+         WHERE entity_type = :entity_type AND entity_uuid IN :uuids AND resolution = 'day'),
+        (SELECT MIN(timestamp) FROM health_score_history
+         WHERE entity_type = :entity_type AND entity_uuid IN :uuids)
+    )
+""").bindparams(bindparam('uuids', expanding=True))
+
+
+def rollup_health_history(since=None, session=None):
+    """
+    Build hourly and daily rollups for raw history from `since` onwards.
+
+    Without `since`, resumes one hour before the newest hourly rollup (or from the
+    oldest raw sample on the first run). Rollups are upserted, so re-running a
+    range is safe. Does not commit.
+
+    Returns:
+        datetime: start of the oldest hour rolled up, or None if there was nothing to do
+    """
+    session = session or db.session
+    if since is None:
+        last_hour = session.execute(text(
+            "SELECT MAX(bucket) FROM health_score_rollup WHERE resolution = 'hour'"
+        )).scalar()
+        if last_hour is not None:
+            # The last hour may have been partial, and history rows are stamped before they commit
+            since = last_hour - timedelta(hours=1)
+        else:
+            since = session.execute(text("SELECT MIN(timestamp) FROM health_score_history")).scalar()
+        if since is None:
+            return None
+
+    hour_start = since.replace(minute=0, second=0, microsecond=0)
+    session.execute(hourly_rollup_sql, {'since': hour_start})
+    session.execute(daily_rollup_sql, {'since': hour_start.replace(hour=0)})
+    return hour_start
+
+
+def apply_health_history_retention(raw_days=7, hourly_days=90, daily_days=0, rolled_up_to=None, now=None, session=None):
+    """
+    Delete raw history and rollups older than their retention. daily_days=0 keeps
+    daily rollups forever. Raw rows newer than rolled_up_to are never deleted, so
+    nothing is dropped before it has been rolled up. Does not commit.
+
+    Returns:
+        dict: rows deleted per tier
+    """
+    session = session or db.session
+    now = now or datetime.utcnow()
+
+    raw_cutoff = now - timedelta(days=raw_days)
+    if rolled_up_to is not None:
+        raw_cutoff = min(raw_cutoff, rolled_up_to)
+
+    deleted = {
+        'raw': session.execute(
+            text("DELETE FROM health_score_history WHERE timestamp < :cutoff"), {'cutoff': raw_cutoff}
+        ).rowcount,
+        'hour': session.execute(
+            text("DELETE FROM health_score_rollup WHERE resolution = 'hour' AND bucket < :cutoff"),
+            {'cutoff': now - timedelta(days=hourly_days)}
+        ).rowcount,
+        'day': 0,
+    }
+    if daily_days:
+        deleted['day'] = session.execute(
+            text("DELETE FROM health_score_rollup WHERE resolution = 'day' AND bucket < :cutoff"),
+            {'cutoff': now - timedelta(days=daily_days)}
+        ).rowcount
+    return deleted
+
+
+def choose_resolution(start, end, max_points, now, raw_days=7, hourly_days=90):
+    """
+    Pick the storage tier and bucket width (seconds) for a series query.
+
+    Uses the finest tier whose retention covers `start` and whose native width
+    would not exceed max_points buckets, then widens the bucket to a multiple of
+    that tier's width so the result has at most max_points points.
+    """
+    step = max((end - start).total_seconds() / max_points, 1)
+    if step < RESOLUTION_SECONDS['hour'] and start >= now - timedelta(days=raw_days):
+        resolution = 'raw'
+    elif step < RESOLUTION_SECONDS['day'] and start >= now - timedelta(days=hourly_days):
+        resolution = 'hour'
+    else:
+        resolution = 'day'
+
+    base = RESOLUTION_SECONDS[resolution] or 1
+    return resolution, int(math.ceil(step / base) * base)
+
+
+def get_health_series(entity_type, entity_uuids, start=None, end=None, max_points=500,
+                      min_step=None, raw_days=7, hourly_days=90, session=None):
+    """
+    Downsampled health score series for one or more entities of the same type.
+
+    Scores of several entities are averaged per bucket (weighted by sample count).
+    With no `start` the series begins at the entities' oldest retained sample.
+    min_step (seconds) sets a floor on the bucket width, e.g. 86400 for daily points.
+
+    Returns:
+        list: [{'x': ISO timestamp, 'y': score}, ...] in time order
+    """
+    session = session or db.session
+    uuids = [str(entity_uuid) for entity_uuid in entity_uuids]
+    if not uuids:
+        return []
+
+    now = datetime.utcnow()
+    end = end or now
+    if start is None:
+        start = session.execute(first_sample_sql, {'entity_type': entity_type, 'uuids': uuids}).scalar()
+        if start is None:
+            return []
+
+    resolution, step = choose_resolution(start, end, max_points, now, raw_days, hourly_days)
+    if min_step and step < min_step:
+        resolution, step = choose_resolution(start, start + timedelta(seconds=min_step * max_points),
+                                             max_points, now, raw_days, hourly_days)
+
+    # Align the start to a bucket boundary so the first bucket is not cut short
+    start = datetime.utcfromtimestamp(calendar.timegm(start.utctimetuple()) // step * step)
+    params = {'entity_type': entity_type, 'uuids': uuids, 'start': start, 'end': end, 'step': step}
+    if resolution == 'raw':
+        rows = session.execute(raw_series_sql, params)
+    else:
+        rows = session.execute(rollup_series_sql, dict(params, resolution=resolution))
+
+    daily = step % RESOLUTION_SECONDS['day'] == 0
+    return [
+        {'x': row.bucket.date().isoformat() if daily else row.bucket.isoformat(), 'y': row.score}
+        for row in rows
+    ]
+
+
+def get_chart_health_series(entity_type, entity_uuids, min_step=None):
+    """get_health_series() over all retained history, using the app's retention and point limits"""
+    config = current_app.config
+    return get_health_series(
+        entity_type,
+        entity_uuids,
+        max_points=config.get('HEALTH_HISTORY_MAX_POINTS', 500),
+        min_step=min_step,
+        raw_days=config.get('HEALTH_HISTORY_RAW_DAYS', 7),
+        hourly_days=config.get('HEALTH_HISTORY_HOURLY_DAYS', 90),
+    )
@@ -1,5 +1,4 @@
 # Filepath: app/utilities/ip_blocker.py
-import subprocess
 import logging
 from flask import current_app
 import time
@@ -8,49 +7,71 @@ import os
 import threading
 from typing import Optional, Dict, Set, List, Any, Union
 from app.utilities.app_logging_helper import log_with_route
+from app.utilities.ip_matcher import IPMatcher
+from app.utilities.firewall_backends import create_firewall_backend
 import lmdb
 from collections import defaultdict
 
+# Sets store one entry per member in a dupsort database, hashes one entry per
+# field under "<key>\x00<field>", so membership checks and updates touch a
+# single entry instead of decoding and rewriting the whole collection.
+SET_MEMBERS_DB = 'set_members'
+HASH_FIELDS_DB = 'hash_fields'
+# Previous layout: a whole set or hash JSON-encoded under one key. Migrated on open.
+LEGACY_SETS_DB = 'sets'
+LEGACY_HASHES_DB = 'hashes'
+HASH_FIELD_SEPARATOR = b'\x00'
+
+
 class LMDBStorage:
     """LMDB storage adapter with Redis-like interface for IP blocker"""
     
-    def __init__(self):
+    def __init__(self, storage_path=None, map_size=None, sync=None):
         self.env = None
         self.lock = threading.RLock()
         # Add cached DB handles to avoid repeatedly opening new ones
         self._db_cache = {}
-        self._initialize_db()
+        self._initialize_db(storage_path, map_size, sync)
         
-    def _initialize_db(self):
+    def _initialize_db(self, storage_path=None, map_size=None, sync=None):
         """Initialize the LMDB environment"""
         try:
-            storage_path = self._get_storage_path()
+            storage_path = storage_path or self._get_storage_path()
             os.makedirs(os.path.dirname(storage_path), exist_ok=True)
             
             # Default map size of 10MB - adjust as needed
-            map_size = 10485760
-            if hasattr(current_app, 'config'):
-                map_size = current_app.config.get('IP_BLOCKER_LMDB_MAP_SIZE', map_size)
+            if map_size is None:
+                map_size = 10485760
+                if hasattr(current_app, 'config'):
+                    map_size = current_app.config.get('IP_BLOCKER_LMDB_MAP_SIZE', map_size)
+
+            # Without per-commit fsync a system crash can lose the last few commits, but the
+            # database stays consistent (writemap is off). flush() forces a sync when it matters.
+            if sync is None:
+                sync = current_app.config.get('IP_BLOCKER_LMDB_SYNC', False) if hasattr(current_app, 'config') else False
                 
             self.env = lmdb.open(
                 storage_path, 
                 map_size=map_size,
-                metasync=True,
-                sync=True,
+                metasync=sync,
+                sync=sync,
                 subdir=True,
-                writemap=True,
-                map_async=False,
+                writemap=False,
                 mode=0o644,
                 max_dbs=20  # Increase from default 5 to 20
             )
             
             # Pre-open the databases we'll be using to avoid "DBS_FULL" errors
             with self.env.begin(write=True) as txn:
-                self._get_db('sets', txn)
-                self._get_db('hashes', txn)
+                self._get_db(SET_MEMBERS_DB, txn, dupsort=True)
+                self._get_db(HASH_FIELDS_DB, txn)
+                self._get_db(LEGACY_SETS_DB, txn)
+                self._get_db(LEGACY_HASHES_DB, txn)
                 self._get_db('lists', txn)
                 self._get_db('counters', txn)
                 self._get_db('expire', txn)
+
+            self._migrate_legacy_layout()
             
             log_with_route(logging.INFO, f"Initialized LMDB storage at {storage_path}")
         except Exception as e:
@@ -67,17 +88,47 @@ class LMDBStorage:
             base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
             return os.path.join(base_dir, 'app', 'data', 'ip_blocker', 'lmdb_storage')
         
-    def _get_db(self, db_name, txn):
+    def _get_db(self, db_name, txn, dupsort=False):
         """Get a database handle, either from cache or open a new one"""
         if db_name not in self._db_cache:
             try:
-                self._db_cache[db_name] = self.env.open_db(db_name.encode('utf-8'), txn=txn)
+                self._db_cache[db_name] = self.env.open_db(db_name.encode('utf-8'), txn=txn, dupsort=dupsort)
                 log_with_route(logging.DEBUG, f"Opened LMDB database: {db_name}")
             except lmdb.DbsFullError:
                 log_with_route(logging.ERROR, f"Failed to open database {db_name}: MDB_DBS_FULL error")
                 # Return None if we can't open the database
                 return None
         return self._db_cache[db_name]
+
+    def _migrate_legacy_layout(self):
+        """Move JSON-encoded sets and hashes into the per-member / per-field layout"""
+        with self.lock:
+            with self.env.begin(write=True) as txn:
+                legacy_sets = self._db_cache[LEGACY_SETS_DB]
+                legacy_hashes = self._db_cache[LEGACY_HASHES_DB]
+                if not txn.stat(legacy_sets)['entries'] and not txn.stat(legacy_hashes)['entries']:
+                    return
+
+                sets_db = self._db_cache[SET_MEMBERS_DB]
+                members = 0
+                for key_bytes, value in txn.cursor(db=legacy_sets):
+                    current_set = self._deserialize(value)
+                    for member in (current_set if isinstance(current_set, list) else []):
+                        txn.put(key_bytes, self._encode(member), db=sets_db, dupdata=False)
+                        members += 1
+
+                hashes_db = self._db_cache[HASH_FIELDS_DB]
+                fields = 0
+                for key_bytes, value in txn.cursor(db=legacy_hashes):
+                    current_hash = self._deserialize(value)
+                    for field, field_value in (current_hash.items() if isinstance(current_hash, dict) else []):
+                        txn.put(self._field_key(key_bytes, field), self._serialize(field_value), db=hashes_db)
+                        fields += 1
+
+                txn.drop(legacy_sets, delete=False)
+                txn.drop(legacy_hashes, delete=False)
+            self.flush()
+            log_with_route(logging.INFO, f"Migrated IP blocker LMDB storage: {members} set members, {fields} hash fields")
     
     # Helper methods for serialization
     def _serialize(self, value):
@@ -107,10 +158,33 @@ class LMDBStorage:
                 return value.decode('utf-8')
             except:
                 return str(value)
+
+    @staticmethod
+    def _encode(value):
+        """Set members and hash fields are stored as plain UTF-8"""
+        return str(value).encode('utf-8')
+
+    @staticmethod
+    def _field_key(key_bytes, field):
+        return key_bytes + HASH_FIELD_SEPARATOR + str(field).encode('utf-8')
+
+    def _iter_fields(self, txn, key_bytes):
+        """(field key, value) pairs of one hash, in key order"""
+        prefix = key_bytes + HASH_FIELD_SEPARATOR
+        cursor = txn.cursor(db=self._db_cache[HASH_FIELDS_DB])
+        if cursor.set_range(prefix):
+            for field_key, value in cursor:
+                if not field_key.startswith(prefix):
+                    break
+                yield field_key, value
     
     def ping(self):
         """Test connection"""
         return self.env is not None
+
+    def flush(self):
+        """Force committed data to disk"""
+        self.env.sync(True)
     
     def sadd(self, key, *values):
         """Add values to a set"""
@@ -118,79 +192,40 @@ class LMDBStorage:
             added = 0
             
             with self.env.begin(write=True) as txn:
-                sets_db = self._get_db('sets', txn)
+                sets_db = self._get_db(SET_MEMBERS_DB, txn, dupsort=True)
                 if sets_db is None:
                     log_with_route(logging.ERROR, f"Failed to open sets database, cannot add to {key}")
                     return 0
                     
                 key_bytes = key.encode('utf-8')
-                current_set_bytes = txn.get(key_bytes, db=sets_db)
-                
-                if current_set_bytes is None:
-                    # New set
-                    current_set = []
-                else:
-                    try:
-                        # JSON decoding
-                        current_set = json.loads(current_set_bytes.decode('utf-8'))
-                    except:
-                        current_set = []
-                
-                # Convert to list if it's another iterable
-                if not isinstance(current_set, list):
-                    current_set = list(current_set) if hasattr(current_set, '__iter__') else []
-                
-                # Add new values
                 for value in values:
-                    if value not in current_set:
-                        current_set.append(value)
+                    # Returns False if the member is already present
+                    if txn.put(key_bytes, self._encode(value), db=sets_db, dupdata=False):
                         added += 1
-                
-                # Store the updated set
-                if added > 0:
-                    txn.put(key_bytes, json.dumps(current_set).encode('utf-8'), db=sets_db)
-                    log_with_route(logging.INFO, f"Added {added} items to set {key}, new size: {len(current_set)}")
-            
+
+            if added > 0:
+                log_with_route(logging.INFO, f"Added {added} items to set {key}")
             return added
     
     def sismember(self, key, value):
         """Check if value is in a set"""
         with self.env.begin() as txn:
-            sets_db = self._get_db('sets', txn)
-            if sets_db is None:
-                return False
-                
-            key_bytes = key.encode('utf-8')
-            current_set_bytes = txn.get(key_bytes, db=sets_db)
-            
-            if current_set_bytes is None:
-                return False
-            
-            try:
-                current_set = json.loads(current_set_bytes.decode('utf-8'))
-            except:
-                return False
-                
-            return value in current_set
+            cursor = txn.cursor(db=self._db_cache[SET_MEMBERS_DB])
+            return cursor.set_key_dup(key.encode('utf-8'), self._encode(value))
     
     def smembers(self, key):
         """Get all members of a set"""
         with self.env.begin() as txn:
-            sets_db = self._get_db('sets', txn)
-            if sets_db is None:
-                return set()
-                
-            key_bytes = key.encode('utf-8')
-            current_set_bytes = txn.get(key_bytes, db=sets_db)
-            
-            if current_set_bytes is None:
-                return set()
-            
-            try:
-                current_set = json.loads(current_set_bytes.decode('utf-8'))
-                return set(current_set)
-            except:
+            cursor = txn.cursor(db=self._db_cache[SET_MEMBERS_DB])
+            if not cursor.set_key(key.encode('utf-8')):
                 return set()
+            return {member.decode('utf-8') for member in cursor.iternext_dup()}
+
+    def scard(self, key):
+        """Number of members in a set"""
+        with self.env.begin() as txn:
+            cursor = txn.cursor(db=self._db_cache[SET_MEMBERS_DB])
+            return cursor.count() if cursor.set_key(key.encode('utf-8')) else 0
     
     def srem(self, key, *values):
         """Remove values from a set"""
@@ -199,38 +234,26 @@ class LMDBStorage:
             removed = 0
             
             with self.env.begin(write=True) as txn:
-                sets_db = self._get_db('sets', txn)
+                sets_db = self._get_db(SET_MEMBERS_DB, txn, dupsort=True)
                 if sets_db is None:
                     log_with_route(logging.ERROR, f"Failed to open sets database, cannot remove from {key}")
                     return 0
                 
-                # Get current set
-                current_set_bytes = txn.get(key_bytes, db=sets_db)
-                if current_set_bytes is None:
-                    return 0
-                
-                current_set = self._deserialize(current_set_bytes)
-                if not isinstance(current_set, list):
-                    current_set = list(current_set) if hasattr(current_set, '__iter__') else []
-                
-                # Remove values
                 for value in values:
-                    if value in current_set:
-                        current_set.remove(value)
+                    if txn.delete(key_bytes, self._encode(value), db=sets_db):
                         removed += 1
                 
-                # Store the updated set or delete if empty
-                if not current_set:
-                    txn.delete(key_bytes, db=sets_db)
-                else:
-                    txn.put(key_bytes, json.dumps(current_set).encode('utf-8'), db=sets_db)
-                
             return removed
     
     def exists(self, key):
         """Check if key exists"""
+        key_bytes = key.encode('utf-8')
         with self.env.begin() as txn:
-            for prefix in ["set:", "hash:", "list:", "counter:", "expire:"]:
+            if txn.get(key_bytes, db=self._db_cache[SET_MEMBERS_DB]) is not None:
+                return True
+            if next(self._iter_fields(txn, key_bytes), None) is not None:
+                return True
+            for prefix in ["list:", "counter:", "expire:"]:
                 if txn.get(f"{prefix}{key}".encode('utf-8')) is not None:
                     return True
             return False
@@ -239,12 +262,21 @@ class LMDBStorage:
         """Delete a key"""
         with self.lock:
             deleted = 0
+            key_bytes = key.encode('utf-8')
             
             with self.env.begin(write=True) as txn:
-                for prefix in ["set:", "hash:", "list:", "counter:", "expire:"]:
-                    key_bytes = f"{prefix}{key}".encode('utf-8')
-                    if txn.get(key_bytes) is not None:
-                        txn.delete(key_bytes)
+                # Deleting a key without a value removes all of a set's members
+                if txn.delete(key_bytes, db=self._db_cache[SET_MEMBERS_DB]):
+                    deleted += 1
+
+                field_keys = [field_key for field_key, _ in self._iter_fields(txn, key_bytes)]
+                for field_key in field_keys:
+                    txn.delete(field_key, db=self._db_cache[HASH_FIELDS_DB])
+                if field_keys:
+                    deleted += 1
+
+                for prefix in ["list:", "counter:", "expire:"]:
+                    if txn.delete(f"{prefix}{key}".encode('utf-8')):
                         deleted += 1
             
             return deleted
@@ -253,26 +285,16 @@ class LMDBStorage:
         """Set hash field to value"""
         with self.lock:
             with self.env.begin(write=True) as txn:
-                hashes_db = self._get_db('hashes', txn)
+                hashes_db = self._get_db(HASH_FIELDS_DB, txn)
                 if hashes_db is None:
                     log_with_route(logging.ERROR, f"Failed to open hashes database, cannot set field {field} in {key}")
                     return 0
                 
-                key_bytes = key.encode('utf-8')
-                
-                # Get current hash
-                current_hash_bytes = txn.get(key_bytes, db=hashes_db)
-                current_hash = {} if current_hash_bytes is None else self._deserialize(current_hash_bytes)
-                
-                if not isinstance(current_hash, dict):
-                    current_hash = {}
-                
-                # Set field
-                is_new = field not in current_hash
-                current_hash[field] = value
-                
-                # Store the updated hash
-                txn.put(key_bytes, self._serialize(current_hash), db=hashes_db)
+                # overwrite=False returns False if the field already exists
+                field_key = self._field_key(key.encode('utf-8'), field)
+                is_new = txn.put(field_key, self._serialize(value), db=hashes_db, overwrite=False)
+                if not is_new:
+                    txn.put(field_key, self._serialize(value), db=hashes_db)
                 
                 # Log the key update
                 log_with_route(logging.DEBUG, f"Updated hash field {field} in key {key}")
@@ -286,25 +308,14 @@ class LMDBStorage:
             
         with self.lock:
             with self.env.begin(write=True) as txn:
-                hashes_db = self._get_db('hashes', txn)
+                hashes_db = self._get_db(HASH_FIELDS_DB, txn)
                 if hashes_db is None:
                     log_with_route(logging.ERROR, f"Failed to open hashes database, cannot set fields in {key}")
                     return False
                 
                 key_bytes = key.encode('utf-8')
-                
-                # Get current hash
-                current_hash_bytes = txn.get(key_bytes, db=hashes_db)
-                current_hash = {} if current_hash_bytes is None else self._deserialize(current_hash_bytes)
-                
-                if not isinstance(current_hash, dict):
-                    current_hash = {}
-                
-                # Update with new values
-                current_hash.update(mapping)
-                
-                # Store the updated hash
-                txn.put(key_bytes, self._serialize(current_hash), db=hashes_db)
+                for field, value in mapping.items():
+                    txn.put(self._field_key(key_bytes, field), self._serialize(value), db=hashes_db)
                 
                 # Log update
                 log_with_route(logging.DEBUG, f"Updated hash {key} with {len(mapping)} fields")
@@ -313,14 +324,14 @@ class LMDBStorage:
     
     def hgetall(self, key):
         """Get all fields and values in a hash"""
-        hash_key = f"hash:{key}".encode('utf-8')
-        
+        key_bytes = key.encode('utf-8')
+        offset = len(key_bytes) + len(HASH_FIELD_SEPARATOR)
+
         with self.env.begin() as txn:
-            current_hash_bytes = txn.get(hash_key)
-            if current_hash_bytes is None:
-                return {}
-            
-            return self._deserialize(current_hash_bytes)
+            return {
+                field_key[offset:].decode('utf-8'): self._deserialize(value)
+                for field_key, value in self._iter_fields(txn, key_bytes)
+            }
     
     def lpush(self, key, *values):
         """Prepend values to a list"""
@@ -390,11 +401,18 @@ class LMDBStorage:
             
             return new_value
 
+    def get_counter(self, key):
+        """Current value of a counter (0 if it was never incremented)"""
+        with self.env.begin() as txn:
+            value_bytes = txn.get(f"counter:{key}".encode('utf-8'))
+        return 0 if value_bytes is None else self._deserialize(value_bytes)
+
 class IPBlocker:
     _instance = None
-    IPTABLES_PATH = '/usr/sbin/iptables'
-    SUDO_PATH = '/usr/bin/sudo'
     ERROR_THRESHOLD = 2  # Number of failed requests before blocking
+    WHITELIST_STAT_INTERVAL = 1.0  # Seconds between mtime checks of whitelist.json
+    # Bumped on every whitelist/blacklist change so all processes recompile their matchers
+    GENERATION_KEY = "wegweiser:ip_blocker:generation"
 
     # INTERNAL SERVICES PROTECTION - Never block these IPs
     # If someone can access localhost, they're already on the server and game is over anyway
@@ -403,15 +421,13 @@ class IPBlocker:
         '::1',            # IPv6 localhost
         'localhost',      # Hostname
     }
-    INTERNAL_WHITELISTED_PREFIXES = (
-        '127.',           # All 127.x.x.x addresses (loopback range)
-        '10.',            # Private network
-        '172.16.', '172.17.', '172.18.', '172.19.',  # Private network
-        '172.20.', '172.21.', '172.22.', '172.23.',
-        '172.24.', '172.25.', '172.26.', '172.27.',
-        '172.28.', '172.29.', '172.30.', '172.31.',
-        '192.168.',       # Private network
-    )
+    INTERNAL_WHITELISTED_NETWORKS = IPMatcher((
+        '127.0.0.0/8',    # Loopback range
+        '::1/128',        # IPv6 loopback
+        '10.0.0.0/8',     # Private network
+        '172.16.0.0/12',  # Private network
+        '192.168.0.0/16', # Private network
+    ))
 
     def __new__(cls):
         if cls._instance is None:
@@ -422,6 +438,26 @@ class IPBlocker:
     def __init__(self):
         if self.initialized:
             return
+
+        # Compiled whitelist/blacklist, rebuilt when whitelist.json or the generation changes
+        self._matcher_lock = threading.Lock()
+        self._matchers = None
+        self._matchers_generation = None
+        self._whitelist_file_entries = []
+        self._whitelist_file_state = None
+        self._whitelist_checked_at = None
+
+        # Firewall enforcement (ipset by default, see firewall_backends)
+        try:
+            config = current_app.config
+        except RuntimeError:
+            config = {}
+        self.ban_timeout = int(config.get('IP_BLOCKER_BAN_TIMEOUT', 0))
+        self.firewall = create_firewall_backend(
+            config.get('IP_BLOCKER_FIREWALL_BACKEND', 'ipset'),
+            config.get('IP_BLOCKER_FIREWALL_BATCH_DELAY', 0.5)
+        )
+        log_with_route(logging.INFO, f"Using {self.firewall.name} firewall backend for IP blocking")
         
         try:
             # Initialize LMDB storage
@@ -430,6 +466,9 @@ class IPBlocker:
             
             # Sync whitelist from file to storage
             self._sync_whitelist_to_storage()
+
+            # Bring the kernel's blocked set in line with storage
+            self._reconcile_firewall()
             
         except Exception as e:
             log_with_route(logging.CRITICAL, f"Failed to initialize storage: {str(e)}. IP blocking will not work!")
@@ -441,16 +480,21 @@ class IPBlocker:
         
         self.initialized = True
         
+    def _get_whitelist_path(self):
+        """Path to whitelist.json"""
+        try:
+            if hasattr(current_app, 'config') and 'IP_BLOCKER_DATA_DIR' in current_app.config:
+                return os.path.join(current_app.config['IP_BLOCKER_DATA_DIR'], 'whitelist.json')
+        except RuntimeError:
+            pass  # No application context
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        return os.path.join(base_dir, 'app', 'data', 'ip_blocker', 'whitelist.json')
+
     def _load_whitelist_from_file(self):
         """Load whitelisted IPs from whitelist.json file"""
         try:
-            # Determine the path to whitelist.json
-            if hasattr(current_app, 'config') and 'IP_BLOCKER_DATA_DIR' in current_app.config:
-                whitelist_path = os.path.join(current_app.config['IP_BLOCKER_DATA_DIR'], 'whitelist.json')
-            else:
-                base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-                whitelist_path = os.path.join(base_dir, 'app', 'data', 'ip_blocker', 'whitelist.json')
-                
+            whitelist_path = self._get_whitelist_path()
+
             # Check if the file exists
             if not os.path.exists(whitelist_path):
                 log_with_route(logging.WARNING, f"Whitelist file not found at {whitelist_path}")
@@ -470,6 +514,46 @@ class IPBlocker:
             log_with_route(logging.ERROR, f"Error loading whitelist file: {str(e)}")
             return []
 
+    def _get_whitelist_file_entries(self):
+        """Whitelist file entries, re-read only when the file's mtime or size changes"""
+        now = time.monotonic()
+        if self._whitelist_checked_at is not None and now - self._whitelist_checked_at < self.WHITELIST_STAT_INTERVAL:
+            return self._whitelist_file_entries
+        self._whitelist_checked_at = now
+
+        try:
+            stat = os.stat(self._get_whitelist_path())
+            state = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            state = None
+        if state != self._whitelist_file_state:
+            self._whitelist_file_entries = self._load_whitelist_from_file()
+            self._whitelist_file_state = state
+            self._matchers = None
+        return self._whitelist_file_entries
+
+    def _get_matchers(self):
+        """(whitelist, blacklist) matchers, recompiled when the file or the storage generation changes"""
+        whitelist_entries = self._get_whitelist_file_entries()
+        generation = self.storage.get_counter(self.GENERATION_KEY)
+        matchers = self._matchers
+        if matchers is not None and generation == self._matchers_generation:
+            return matchers
+
+        with self._matcher_lock:
+            whitelist = IPMatcher(list(whitelist_entries) + list(self.storage.smembers("wegweiser:ip_blocker:whitelist") or ()))
+            blacklist = IPMatcher(self.storage.smembers("wegweiser:ip_blocker:blacklist") or ())
+            if whitelist.invalid:
+                log_with_route(logging.WARNING, f"Ignoring invalid whitelist entries: {', '.join(map(str, whitelist.invalid))}")
+            self._matchers = (whitelist, blacklist)
+            self._matchers_generation = generation
+        log_with_route(logging.DEBUG, f"Compiled IP matchers: {len(whitelist)} whitelist, {len(blacklist)} blacklist entries")
+        return whitelist, blacklist
+
+    def _bump_generation(self):
+        """Tell every process its compiled matchers are stale"""
+        self.storage.incr(self.GENERATION_KEY)
+
     def _sync_whitelist_to_storage(self):
         """Sync whitelist from file to storage and unblock any currently blocked IPs"""
         try:
@@ -518,11 +602,8 @@ class IPBlocker:
         if ip in self.INTERNAL_WHITELISTED_IPS:
             return True
 
-        # Check IP prefixes (loopback and private networks)
-        if any(ip.startswith(prefix) for prefix in self.INTERNAL_WHITELISTED_PREFIXES):
-            return True
-
-        return False
+        # Loopback and private networks
+        return ip in self.INTERNAL_WHITELISTED_NETWORKS
 
     def is_whitelisted(self, ip: str) -> bool:
         """Check if an IP is whitelisted using file as primary source"""
@@ -532,13 +613,12 @@ class IPBlocker:
             log_with_route(logging.DEBUG, f"IP {ip} is internal/localhost, automatically whitelisted")
             return True
 
-        # Second: Check the JSON file (authoritative source for user-defined whitelist)
+        # Second: The compiled whitelist (JSON file entries plus storage, CIDR ranges included)
         try:
-            whitelist_ips = self._load_whitelist_from_file()
-            if ip in whitelist_ips:
-                return True
+            whitelist, _ = self._get_matchers()
+            return ip in whitelist
         except Exception as e:
-            log_with_route(logging.ERROR, f"Error checking whitelist file: {str(e)}")
+            log_with_route(logging.ERROR, f"Error checking compiled whitelist: {str(e)}")
 
         # Third: Fallback to storage check
         try:
@@ -548,38 +628,56 @@ class IPBlocker:
             # If all checks fail, assume IP is not whitelisted
             return False
 
-    def _execute_iptables_command(self, action: str, ip: str) -> bool:
-        """Execute an iptables command to block or unblock an IP"""
+    def is_blacklisted(self, ip: str) -> bool:
+        """Check if an IP is blacklisted, directly or through a blacklisted CIDR range"""
         try:
-            cmd = [
-                self.SUDO_PATH,
-                self.IPTABLES_PATH,
-                action,
-                'INPUT',
-                '-s', ip,
-                '-j', 'DROP'
-            ]
-
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=False
-            )
+            _, blacklist = self._get_matchers()
+            return ip in blacklist
+        except Exception as e:
+            log_with_route(logging.ERROR, f"Error checking compiled blacklist: {str(e)}")
+            return bool(self.storage.sismember("wegweiser:ip_blocker:blacklist", ip))
 
-            if result.returncode != 0:
-                log_with_route(
-                    logging.ERROR,
-                    f"iptables command failed: Command: {' '.join(cmd)}, "
-                    f"Return code: {result.returncode}, Stderr: {result.stderr.strip()}"
-                )
-                return False
+    def _ban_remaining(self, ip: str) -> Optional[int]:
+        """Seconds left on a timed ban (0 once expired), or None for a permanent one"""
+        if not self.ban_timeout:
+            return None
+        block_data = self.storage.hgetall(f"wegweiser:ip_blocker:blacklist_data:{ip}") or {}
+        try:
+            blocked_at = int(block_data["block_timestamp"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return max(0, blocked_at + self.ban_timeout - int(time.time()))
 
-            log_with_route(logging.INFO, f"iptables command succeeded: {' '.join(cmd)}")
-            return True
+    def _reconcile_firewall(self) -> Dict[str, int]:
+        """Make the firewall match the stored blacklist, dropping bans that have expired"""
+        try:
+            blacklist = self.storage.smembers("wegweiser:ip_blocker:blacklist") or set()
+            whitelist, _ = self._get_matchers()
+            desired = {}
+            expired = []
+            for ip in blacklist:
+                if ip in whitelist:
+                    continue
+                remaining = self._ban_remaining(ip)
+                if remaining == 0:
+                    expired.append(ip)
+                else:
+                    desired[ip] = remaining
+
+            if expired:
+                self.storage.srem("wegweiser:ip_blocker:blacklist", *expired)
+                for ip in expired:
+                    self.storage.delete(f"wegweiser:ip_blocker:blacklist_data:{ip}")
+                self._bump_generation()
+                self.storage.flush()
+
+            result = self.firewall.reconcile(desired)
+            result['expired'] = len(expired)
+            log_with_route(logging.INFO, f"Reconciled {self.firewall.name} firewall with {len(desired)} blocked IPs: {result}")
+            return result
         except Exception as e:
-            log_with_route(logging.ERROR, f"Error executing iptables command: {str(e)}")
-            return False
+            log_with_route(logging.ERROR, f"Error reconciling firewall state: {str(e)}")
+            return {}
 
     def block_ip(self, ip: str) -> Dict[str, bool]:
         """Block an IP address"""
@@ -600,13 +698,15 @@ class IPBlocker:
                 "block_reason": "Manual block or threshold exceeded",
             }
             self.storage.hmset(f"wegweiser:ip_blocker:blacklist_data:{ip}", block_data)
+            self._bump_generation()
+            self.storage.flush()
 
-            # Block IP using iptables
-            if self._execute_iptables_command('-A', ip):
+            # Enforce in the firewall
+            if self.firewall.block([ip], timeout=self.ban_timeout or None):
                 log_with_route(logging.INFO, f"Blocked IP: {ip}")
                 return {"success": True, "reason": "IP blocked successfully"}
 
-            return {"success": False, "reason": "Failed to execute iptables command"}
+            return {"success": False, "reason": "Failed to execute firewall command"}
         except Exception as e:
             log_with_route(logging.ERROR, f"Error blocking IP: {str(e)}")
             return {"success": False, "reason": str(e)}
@@ -618,13 +718,15 @@ class IPBlocker:
         try:
             self.storage.srem("wegweiser:ip_blocker:blacklist", ip)
             self.storage.delete(f"wegweiser:ip_blocker:blacklist_data:{ip}")
+            self._bump_generation()
+            self.storage.flush()
 
-            # Unblock IP using iptables
-            if self._execute_iptables_command('-D', ip):
+            # Remove from the firewall
+            if self.firewall.unblock([ip]):
                 log_with_route(logging.INFO, f"Unblocked IP: {ip}")
                 return {"success": True, "reason": "IP unblocked successfully"}
 
-            return {"success": False, "reason": "Failed to execute iptables unblock command"}
+            return {"success": False, "reason": "Failed to execute firewall unblock command"}
         except Exception as e:
             log_with_route(logging.ERROR, f"Error unblocking IP: {str(e)}")
             return {"success": False, "reason": str(e)}
@@ -640,13 +742,12 @@ class IPBlocker:
                     log_with_route(logging.WARNING, f"Failed to unblock IP {ip} before whitelisting: {unblock_result.get('reason')}")
                     # Continue anyway - we'll still add to whitelist
             else:
-                # Even if not in blacklist, there might be an orphaned iptables rule
-                # Try to remove it (this will fail silently if rule doesn't exist)
+                # Even if not in blacklist, there might be an orphaned firewall entry
+                # Try to remove it (this is a no-op if there is none)
                 try:
-                    self._execute_iptables_command('-D', ip)
-                    log_with_route(logging.INFO, f"Removed any existing iptables rule for {ip}")
+                    self.firewall.unblock([ip])
                 except Exception:
-                    # Ignore errors - rule probably didn't exist
+                    # Ignore errors - entry probably didn't exist
                     pass
 
             # Add to whitelist
@@ -656,6 +757,8 @@ class IPBlocker:
             # Clear any failed request history for this IP
             self.storage.delete(f"wegweiser:ip_blocker:failed:{ip}:count")
             self.storage.delete(f"wegweiser:ip_blocker:failed:{ip}:history")
+            self._bump_generation()
+            self.storage.flush()
 
             log_with_route(logging.INFO, f"Added IP to whitelist: {ip}")
             return {"success": True, "reason": "IP added to whitelist"}
@@ -670,6 +773,8 @@ class IPBlocker:
         try:
             self.storage.srem("wegweiser:ip_blocker:whitelist", ip)
             self.storage.delete(f"wegweiser:ip_blocker:whitelist_data:{ip}")
+            self._bump_generation()
+            self.storage.flush()
             log_with_route(logging.INFO, f"Removed IP from whitelist: {ip}")
             return {"success": True, "reason": "IP removed from whitelist"}
         except Exception as e:
@@ -680,7 +785,7 @@ class IPBlocker:
         """Get the whitelist and blacklist"""
         try:
             # For the whitelist, combine file-based and storage-based whitelists
-            whitelist_from_file = set(self._load_whitelist_from_file())
+            whitelist_from_file = set(self._get_whitelist_file_entries())
             whitelist_from_storage = self.storage.smembers("wegweiser:ip_blocker:whitelist")
             combined_whitelist = whitelist_from_file.union(whitelist_from_storage)
 
@@ -750,11 +855,16 @@ class IPBlocker:
             log_with_route(logging.INFO, f"WHITELIST PROTECTED: IP {ip} is whitelisted, ignoring 404 on {url}")
             return {"success": False, "reason": "IP is whitelisted"}
 
-        # Check if already blacklisted - with immediate iptables check for race conditions
-        if self.storage.sismember("wegweiser:ip_blocker:blacklist", ip):
-            # Double-check iptables rule exists (in case of race condition)
-            self._execute_iptables_command('-A', ip)  # Will fail silently if rule already exists
-            return {"success": True, "reason": "IP already blocked"}
+        # Check if already blacklisted
+        if self.is_blacklisted(ip):
+            remaining = self._ban_remaining(ip)
+            if remaining == 0:
+                # The timed ban has run out in the kernel; forget it and count afresh
+                self.unblock_ip(ip)
+            else:
+                # Re-assert the firewall entry in case it was lost (idempotent)
+                self.firewall.block([ip], timeout=remaining)
+                return {"success": True, "reason": "IP already blocked"}
 
         try:
             now = int(time.time())
@@ -0,0 +1,69 @@
+# Filepath: app/utilities/ip_matcher.py
+"""
+Compiled IP address matcher.
+
+IPMatcher takes a list of addresses and CIDR ranges (IPv4 and IPv6) and
+answers membership from memory: single addresses go into a set, ranges are
+merged into sorted, non-overlapping intervals searched with bisect. IPv4
+addresses written in IPv4-mapped IPv6 form (::ffff:a.b.c.d) match IPv4 entries.
+"""
+
+import ipaddress
+from bisect import bisect_right
+from typing import Iterable, List, Optional, Tuple
+
+
+def parse_ip(ip: str) -> Optional[Tuple[int, int]]:
+    """(version, integer value) of an address, or None if it is not an IP address"""
+    try:
+        address = ipaddress.ip_address(ip.strip())
+    except (AttributeError, ValueError):
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.version, int(address)
+
+
+class IPMatcher:
+    """Immutable set of addresses and CIDR ranges"""
+
+    def __init__(self, entries: Iterable[str] = ()):
+        self.invalid: List[str] = []
+        self._addresses = set()
+        ranges = {4: [], 6: []}
+        for entry in entries:
+            try:
+                network = ipaddress.ip_network(str(entry).strip(), strict=False)
+            except ValueError:
+                self.invalid.append(entry)
+                continue
+            if network.num_addresses == 1:
+                self._addresses.add(parse_ip(str(network.network_address)))
+            else:
+                ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        self._starts = {}
+        self._ends = {}
+        for version, version_ranges in ranges.items():
+            merged = []
+            for start, end in sorted(version_ranges):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._starts[version] = [start for start, _ in merged]
+            self._ends[version] = [end for _, end in merged]
+
+    def __len__(self) -> int:
+        return len(self._addresses) + sum(len(starts) for starts in self._starts.values())
+
+    def __contains__(self, ip: str) -> bool:
+        parsed = parse_ip(ip)
+        return parsed is not None and self.contains_parsed(parsed)
+
+    def contains_parsed(self, parsed: Tuple[int, int]) -> bool:
+        if parsed in self._addresses:
+            return True
+        version, value = parsed
+        index = bisect_right(self._starts[version], value) - 1
+        return index >= 0 and value <= self._ends[version][index]
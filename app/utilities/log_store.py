@@ -0,0 +1,262 @@
+# Filepath: app/utilities/log_store.py
+"""
+Structured log store in Redis.
+
+Remote log entries are appended to a Redis Stream capped with
+MAXLEN ~ REMOTE_LOGGING_MAX_ENTRIES. Each entry's stream ID is also added to a
+sorted set per indexed value (level, source type, URL rule, client IP, tenant),
+scored by its timestamp. The admin log view can then filter and page
+newest-first with ZREVRANGEBYSCORE + XRANGE and never reads more than a page
+plus a bounded scan.
+
+Every TRIM_EVERY writes, TRIM_KEYS_PER_CALL index keys are pruned of entries
+older than the oldest entry left in the stream, continuing an SSCAN of the key
+registry where the previous trim stopped. Index keys expire after index_ttl
+seconds without writes, so values that stop appearing (client IPs) go away.
+"""
+
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+STREAM_KEY = 'wegweiser_logs:stream'
+INDEX_PREFIX = 'wegweiser_logs:idx:'
+INDEX_REGISTRY_KEY = 'wegweiser_logs:indexes'
+INDEXED_FIELDS = ('level', 'source_type', 'route', 'client_ip', 'tenant_uuid')
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+
+def index_key(field: str, value: str) -> str:
+    return f'{INDEX_PREFIX}{field}:{value}'
+
+
+def _str(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+
+def _id_ms(stream_id: str) -> int:
+    return int(stream_id.split('-', 1)[0])
+
+
+def _id_tuple(stream_id: str):
+    ms, _, seq = stream_id.partition('-')
+    return int(ms), int(seq or 0)
+
+
+def _previous_id(stream_id: str) -> str:
+    """The ID just below stream_id, for an exclusive upper bound on servers without '(' ranges"""
+    ms, seq = _id_tuple(stream_id)
+    if seq > 0:
+        return f'{ms}-{seq - 1}'
+    return f'{ms - 1}-18446744073709551615'
+
+
+def flatten_entry(entry: Dict[str, Any]) -> Dict[str, str]:
+    """Stream fields for a RemoteLogger entry"""
+    metadata = entry.get('metadata') or {}
+    return {
+        'created_at': entry.get('created_at') or '',
+        'level': entry.get('level') or '',
+        'source_type': entry.get('source_type') or '',
+        'tenant_uuid': entry.get('tenant_uuid') or '',
+        'route': metadata.get('route') or '',
+        'client_ip': metadata.get('client_ip') or '',
+        'message': entry.get('message') or '',
+        'metadata': json.dumps(metadata, default=str),
+    }
+
+
+def _decode_entry(stream_id, fields) -> Dict[str, Any]:
+    entry = {_str(key): _str(value) for key, value in fields.items()}
+    try:
+        entry['metadata'] = json.loads(entry.get('metadata') or '{}')
+    except ValueError:
+        pass
+    entry['id'] = _str(stream_id)
+    entry['tenant_uuid'] = entry.get('tenant_uuid') or None
+    return entry
+
+
+class RedisLogStore:
+    """Capped log stream with per-value secondary indexes"""
+
+    TRIM_EVERY = 20
+    TRIM_KEYS_PER_CALL = 100
+
+    def __init__(self, max_entries: int = 100000, index_ttl: int = 7 * 86400):
+        self.max_entries = max_entries
+        self.index_ttl = index_ttl
+        self._writes = 0
+        self._trim_cursor = 0
+
+    def add(self, client, entries: Iterable[Dict[str, Any]]) -> List[str]:
+        """Append entries and index them; two pipelined round trips per batch"""
+        entries = list(entries)
+        stream_ids = self.append(client, entries)
+        self.index(client, stream_ids, entries)
+        return stream_ids
+
+    def append(self, client, entries: Iterable[Dict[str, Any]]) -> List[str]:
+        """Append entries to the stream only; returns their stream IDs for index()"""
+        rows = [flatten_entry(entry) for entry in entries]
+        if not rows:
+            return []
+
+        pipe = client.pipeline(transaction=False)
+        for row in rows:
+            if self.max_entries:
+                pipe.xadd(STREAM_KEY, row, maxlen=self.max_entries, approximate=True)
+            else:
+                pipe.xadd(STREAM_KEY, row)
+        return [_str(stream_id) for stream_id in pipe.execute()]
+
+    def index(self, client, stream_ids: List[str], entries: Iterable[Dict[str, Any]]) -> None:
+        """Index appended entries. Safe to repeat: re-adding a sorted set member only rewrites its score."""
+        index_members = {}
+        for stream_id, entry in zip(stream_ids, entries):
+            row = flatten_entry(entry)
+            score = _id_ms(stream_id)
+            for field in INDEXED_FIELDS:
+                if row[field]:
+                    index_members.setdefault(index_key(field, row[field]), {})[stream_id] = score
+        if not index_members:
+            return
+        pipe = client.pipeline(transaction=False)
+        for key, members in index_members.items():
+            pipe.zadd(key, members)
+            if self.index_ttl:
+                pipe.expire(key, self.index_ttl)
+        pipe.sadd(INDEX_REGISTRY_KEY, *index_members)
+        pipe.execute()
+
+        self._writes += 1
+        if self.max_entries and self._writes % self.TRIM_EVERY == 0:
+            self.trim_indexes(client)
+
+    def trim_indexes(self, client, count: Optional[int] = None) -> int:
+        """
+        Drop index entries for stream entries already trimmed away, from about `count`
+        index keys after the previous call's; returns index keys removed
+        """
+        oldest = client.xrange(STREAM_KEY, count=1)
+        self._trim_cursor, keys = client.sscan(INDEX_REGISTRY_KEY, self._trim_cursor,
+                                               count=count or self.TRIM_KEYS_PER_CALL)
+        keys = [_str(key) for key in keys]
+        if not keys:
+            return 0
+        cutoff = _id_ms(_str(oldest[0][0])) if oldest else None
+
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            if cutoff is None:
+                pipe.delete(key)
+            else:
+                pipe.zremrangebyscore(key, '-inf', f'({cutoff}')
+            pipe.zcard(key)
+        results = pipe.execute()
+        empty = [key for key, count in zip(keys, results[1::2]) if not count]
+        if empty:
+            client.srem(INDEX_REGISTRY_KEY, *empty)
+        return len(empty)
+
+    def query(self, client, limit: int = 100, before: Optional[str] = None, start_time: Optional[float] = None,
+              scan_limit: int = 5000, **filters) -> Dict[str, Any]:
+        """
+        Newest-first page of entries matching all filters (level, source_type, route, client_ip, tenant_uuid).
+
+        Args:
+            before: Stream ID cursor; only entries older than it are returned
+            start_time: Unix time; only entries newer than it are returned
+            scan_limit: Most index entries examined per page when several filters are combined
+
+        Returns:
+            {'logs': [...], 'next_cursor': stream ID for the next page, or None}
+        """
+        filters = {field: value for field, value in filters.items() if field in INDEXED_FIELDS and value}
+        max_id = _previous_id(before) if before else '+'
+        min_id = str(int(start_time * 1000)) if start_time else '-'
+
+        if not filters:
+            rows = client.xrevrange(STREAM_KEY, max=max_id, min=min_id, count=limit)
+            logs = [_decode_entry(stream_id, fields) for stream_id, fields in rows]
+            return {'logs': logs, 'next_cursor': logs[-1]['id'] if len(logs) == limit else None}
+
+        # Walk the smallest matching index and check the other filters on the entries themselves
+        pipe = client.pipeline(transaction=False)
+        for field, value in filters.items():
+            pipe.zcard(index_key(field, value))
+        sizes = pipe.execute()
+        driver_field = min(zip(sizes, filters), key=lambda pair: pair[0])[1]
+        driver_key = index_key(driver_field, filters[driver_field])
+        others = {field: value for field, value in filters.items() if field != driver_field}
+
+        max_score = _id_ms(before) if before else '+inf'
+        min_score = int(start_time * 1000) if start_time else '-inf'
+        before_tuple = _id_tuple(before) if before else None
+
+        logs = []
+        offset = 0
+        scanned = 0
+        chunk = max(limit, 100)
+        exhausted = False
+        last_scanned = None
+        while len(logs) < limit and scanned < scan_limit:
+            stream_ids = [_str(stream_id) for stream_id in
+                          client.zrevrangebyscore(driver_key, max_score, min_score, start=offset, num=chunk)]
+            if not stream_ids:
+                exhausted = True
+                break
+            offset += len(stream_ids)
+            scanned += len(stream_ids)
+            if before_tuple:
+                stream_ids = [stream_id for stream_id in stream_ids if _id_tuple(stream_id) < before_tuple]
+            # Same-millisecond members come back in lexical order; keep the page newest first
+            stream_ids.sort(key=_id_tuple, reverse=True)
+            if stream_ids:
+                last_scanned = stream_ids[-1]
+
+            pipe = client.pipeline(transaction=False)
+            for stream_id in stream_ids:
+                pipe.xrange(STREAM_KEY, min=stream_id, max=stream_id, count=1)
+            for rows in pipe.execute():
+                if not rows:
+                    continue  # Trimmed from the stream, index not pruned yet
+                entry = _decode_entry(*rows[0])
+                if all(entry.get(field) == value for field, value in others.items()):
+                    logs.append(entry)
+                    if len(logs) == limit:
+                        break
+
+        if len(logs) == limit:
+            next_cursor = logs[-1]['id']
+        elif not exhausted and scanned >= scan_limit:
+            # Nothing more matched within the scan budget; resume where the scan stopped
+            next_cursor = last_scanned
+        else:
+            next_cursor = None
+        return {'logs': logs, 'next_cursor': next_cursor}
+
+    def metrics(self, client, now: Optional[float] = None) -> Dict[str, Any]:
+        """Entry count, 24h error rate and logs per minute over the last 5 minutes, from the level indexes"""
+        now_ms = int((now or time.time()) * 1000)
+        day_ago = now_ms - 24 * 3600 * 1000
+        five_minutes_ago = now_ms - 5 * 60 * 1000
+
+        pipe = client.pipeline(transaction=False)
+        pipe.xlen(STREAM_KEY)
+        for level in LEVELS:
+            pipe.zcount(index_key('level', level), day_ago, '+inf')
+            pipe.zcount(index_key('level', level), five_minutes_ago, '+inf')
+        results = pipe.execute()
+
+        total = results[0]
+        day_counts = dict(zip(LEVELS, results[1::2]))
+        recent = sum(results[2::2])
+        day_total = sum(day_counts.values())
+        errors = day_counts['ERROR'] + day_counts['CRITICAL']
+        return {
+            'total_logs': total,
+            'error_rate': round((errors / day_total * 100) if day_total else 0, 2),
+            'logs_per_minute': round(recent / 5, 1),
+        }
+
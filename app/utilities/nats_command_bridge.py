@@ -0,0 +1,257 @@
+# Filepath: app/utilities/nats_command_bridge.py
+"""
+Process-wide NATS request/reply bridge for commands sent to devices from the web app
+
+One NATS connection per process lives on a dedicated asyncio loop thread, so a
+command costs one publish instead of a TLS connection, and Flask routes (sync
+gunicorn workers) hand commands to that loop instead of running their own.
+
+Each command gets a command_id and a future. Replies are matched to the future
+by command_id from two places:
+
+  * the bridge's reply inbox (<inbox>.<command_id>, sent as the reply subject),
+    for responders that answer msg.reply
+  * tenant.<tenant>.device.<device>.response, where agents publish responses.
+    The bridge subscribes to it before publishing the command and drops the
+    subscription when no command for that device is waiting.
+
+Usage from a route:
+
+    future = submit_device_command(tenantuuid, device_uuid, 'osquery', {'query': q})
+    ...                                   # submit more, or do other work
+    result = wait_for_command(future)     # agent's result, or {'error': ...}
+
+run_device_command() does both in one call.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Dict, Optional
+
+try:
+    import nats
+    NATS_AVAILABLE = True
+except ImportError:
+    NATS_AVAILABLE = False
+
+from flask import current_app, has_app_context
+from app.utilities.app_logging_helper import log_with_route
+
+DEFAULT_SERVER_URL = 'tls://nats.wegweiser.tech:443'
+DEFAULT_COMMAND_TIMEOUT = 30.0
+# Extra seconds a caller waits beyond the command timeout, covering a (re)connect
+WAIT_GRACE = 10.0
+COMMAND_TIMEOUT_ERROR = 'Command timeout - agent did not respond'
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+class NATSCommandBridge:
+    """A NATS connection on its own event loop thread, sending device commands and matching their replies"""
+
+    def __init__(self, servers: str):
+        self.servers = servers
+        self.pid = os.getpid()
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Only touched on the bridge loop
+        self._nc = None
+        self._inbox_prefix = None
+        self._connect_lock = asyncio.Lock()
+        self._pending = {}         # command_id -> asyncio.Future
+        self._response_subs = {}   # device response subject -> {'users', 'ready', 'subscription'}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                thread = threading.Thread(target=run, name='nats-command-bridge', daemon=True)
+                thread.start()
+                ready.wait()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    async def _connection(self):
+        if self._nc is not None and not self._nc.is_closed:
+            return self._nc
+        async with self._connect_lock:
+            if self._nc is not None and not self._nc.is_closed:
+                return self._nc
+            nc = await nats.connect(
+                servers=[self.servers],
+                name=f'wegweiser-web-{os.getpid()}',
+                max_reconnect_attempts=-1,
+                reconnect_time_wait=2,
+                connect_timeout=5,
+            )
+            inbox_prefix = nc.new_inbox()
+            await nc.subscribe(f'{inbox_prefix}.*', cb=self._on_response)
+            # Subscriptions of a previous, closed connection are gone with it
+            self._response_subs = {}
+            self._nc, self._inbox_prefix = nc, inbox_prefix
+            log_with_route(logging.INFO, f"[NATS] Command bridge connected to {self.servers}")
+            return nc
+
+    async def _on_response(self, msg):
+        try:
+            data = json.loads(msg.data.decode())
+        except ValueError as e:
+            log_with_route(logging.WARNING, f"[NATS] Unparseable response on {msg.subject}: {e}")
+            return
+        if not isinstance(data, dict):
+            return
+
+        command_id = data.get('command_id')
+        if command_id not in self._pending and isinstance(data.get('result'), dict):
+            command_id = data['result'].get('command_id')
+        future = self._pending.get(command_id)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    async def _acquire_response_subscription(self, nc, subject: str) -> Dict[str, Any]:
+        """Subscribe to a device's response subject, shared by all commands waiting on that device"""
+        entry = self._response_subs.get(subject)
+        created = entry is None
+        if created:
+            entry = self._response_subs[subject] = {
+                'users': 0, 'ready': self._loop.create_future(), 'subscription': None
+            }
+        entry['users'] += 1
+
+        if created:
+            try:
+                entry['subscription'] = await nc.subscribe(subject, cb=self._on_response)
+            except Exception:
+                entry['users'] -= 1
+                self._response_subs.pop(subject, None)
+                entry['ready'].set_result(False)
+                raise
+            entry['ready'].set_result(True)
+        elif not await asyncio.shield(entry['ready']):
+            entry['users'] -= 1
+            raise ConnectionError(f"Could not subscribe to {subject}")
+        return entry
+
+    async def _release_response_subscription(self, subject: str, entry: Dict[str, Any]) -> None:
+        entry['users'] -= 1
+        if entry['users'] > 0 or self._response_subs.get(subject) is not entry:
+            return
+        del self._response_subs[subject]
+        try:
+            await entry['subscription'].unsubscribe()
+        except Exception as e:
+            log_with_route(logging.DEBUG, f"[NATS] Error unsubscribing from {subject}: {e}")
+
+    async def _request(self, tenantuuid: str, device_uuid: str, action: str, args: dict,
+                       timeout: float) -> Dict[str, Any]:
+        nc = await self._connection()
+        command_id = str(uuid.uuid4())
+        command_subject = f"tenant.{tenantuuid}.device.{device_uuid}.command"
+        response_subject = f"tenant.{tenantuuid}.device.{device_uuid}.response"
+        future = self._loop.create_future()
+        self._pending[command_id] = future
+        try:
+            entry = await self._acquire_response_subscription(nc, response_subject)
+            try:
+                command_payload = {
+                    'payload': {
+                        'command': action,
+                        'command_id': command_id,
+                        'parameters': args
+                    }
+                }
+                await nc.publish(command_subject, json.dumps(command_payload).encode(),
+                                 reply=f'{self._inbox_prefix}.{command_id}')
+                log_with_route(logging.DEBUG, f"[NATS] Published {action} ({command_id}) to {command_subject}")
+                try:
+                    data = await asyncio.wait_for(future, timeout=timeout)
+                except asyncio.TimeoutError:
+                    log_with_route(logging.ERROR, f"[NATS] Timeout waiting for {action} ({command_id}) from device {device_uuid}")
+                    return {'error': COMMAND_TIMEOUT_ERROR}
+                return data.get('result', data)
+            finally:
+                await self._release_response_subscription(response_subject, entry)
+        finally:
+            self._pending.pop(command_id, None)
+
+    def submit(self, tenantuuid: str, device_uuid: str, action: str, args: Optional[dict] = None,
+               timeout: float = DEFAULT_COMMAND_TIMEOUT) -> concurrent.futures.Future:
+        """Send a command from any thread; the future resolves to the agent's result or an {'error': ...} dict"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(
+            self._request(str(tenantuuid), str(device_uuid), action, args or {}, timeout), loop
+        )
+
+    def close(self) -> None:
+        if self._loop is None or not self._loop.is_running():
+            return
+
+        async def shutdown():
+            if self._nc is not None and not self._nc.is_closed:
+                await self._nc.drain()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=5)
+        except Exception as e:
+            log_with_route(logging.WARNING, f"[NATS] Error closing command bridge: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_bridge = None
+_bridge_lock = threading.Lock()
+
+
+def get_command_bridge() -> NATSCommandBridge:
+    """This process's bridge; a forked worker gets its own rather than its parent's"""
+    global _bridge
+    servers = _config('NATS_SERVER_URL', DEFAULT_SERVER_URL)
+    with _bridge_lock:
+        if _bridge is None or _bridge.pid != os.getpid() or _bridge.servers != servers:
+            _bridge = NATSCommandBridge(servers)
+        return _bridge
+
+
+def submit_device_command(tenantuuid, device_uuid, action: str, args: Optional[dict] = None,
+                          timeout: Optional[float] = None) -> concurrent.futures.Future:
+    """Send a command to a device without waiting for the reply"""
+    if not NATS_AVAILABLE:
+        future = concurrent.futures.Future()
+        future.set_exception(RuntimeError('NATS client library is not installed'))
+        return future
+    timeout = timeout or _config('NATS_COMMAND_TIMEOUT', DEFAULT_COMMAND_TIMEOUT)
+    return get_command_bridge().submit(tenantuuid, device_uuid, action, args, timeout=timeout)
+
+
+def wait_for_command(future: concurrent.futures.Future, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """The result of a submitted command, or an {'error': ...} dict if it failed"""
+    timeout = timeout or _config('NATS_COMMAND_TIMEOUT', DEFAULT_COMMAND_TIMEOUT)
+    try:
+        return future.result(timeout=timeout + WAIT_GRACE)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        log_with_route(logging.ERROR, "[NATS] Timeout waiting for the command bridge")
+        return {'error': COMMAND_TIMEOUT_ERROR}
+    except Exception as e:
+        log_with_route(logging.ERROR, f"[NATS] Command error: {str(e)}")
+        return {'error': f'Command failed: {str(e)}'}
+
+
+def run_device_command(tenantuuid, device_uuid, action: str, args: Optional[dict] = None,
+                       timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Send a command to a device and wait for its result"""
+    return wait_for_command(submit_device_command(tenantuuid, device_uuid, action, args, timeout), timeout)
@@ -53,6 +53,7 @@ class NATSMessage:
     payload: Dict[str, Any]
     timestamp: int
     message_id: str
+    subject: Optional[str] = None
 
 
 class NATSSubjectValidator:
@@ -350,7 +351,8 @@ class NATSSubscriber:
                         message_type=data["message_type"],
                         payload=data["payload"],
                         timestamp=data["timestamp"],
-                        message_id=data["message_id"]
+                        message_id=data["message_id"],
+                        subject=msg.subject
                     )
                     await message_handler(nats_message)
                 except json.JSONDecodeError as e:
@@ -0,0 +1,402 @@
+# Filepath: app/utilities/payload_ingest.py
+"""
+Batched audit ingest engine
+
+Turns a batch of agent audit payloads into per-table row sets and writes each
+table with one multi-row INSERT ... ON CONFLICT DO UPDATE, committing once per
+batch. A payload whose rows cannot be built is rejected on its own, and if the
+batch write fails the engine falls back to writing each payload in its own
+transaction so one bad audit cannot hold back the rest.
+"""
+
+import logging
+import time
+from sqlalchemy.dialects.postgresql import insert
+from app.models import db, Devices, DeviceStatus, DeviceBattery, DeviceMemory, \
+    DeviceNetworks, DeviceDrives, DeviceUsers, DevicePartitions, DeviceCpu, \
+    DeviceGpu, DeviceBios, DeviceCollector, DevicePrinters, DeviceDrivers
+from app.utilities.app_logging_helper import log_with_route
+from app.utilities.ui_widgets_get_coordinates_from_ip import lookup_ip_location
+
+# PostgreSQL caps bind parameters per statement at 65535
+MAX_BIND_PARAMS = 65000
+
+# Write order and conflict keys for every table fed by an audit
+INGEST_TABLES = (
+    (DeviceStatus, ('deviceuuid',)),
+    (DeviceBattery, ('deviceuuid',)),
+    (DeviceMemory, ('deviceuuid',)),
+    (DeviceNetworks, ('deviceuuid', 'network_name')),
+    (DeviceUsers, ('deviceuuid', 'users_name')),
+    (DevicePartitions, ('deviceuuid', 'partition_name')),
+    (DeviceDrives, ('deviceuuid', 'drive_name')),
+    (DeviceCpu, ('deviceuuid',)),
+    (DeviceGpu, ('deviceuuid',)),
+    (DeviceBios, ('deviceuuid',)),
+    (DeviceCollector, ('deviceuuid',)),
+    (DevicePrinters, ('deviceuuid', 'printer_name')),
+    (DeviceDrivers, ('deviceuuid', 'driver_name')),
+)
+
+
+def _safe_int(value, default=None):
+    """Convert value to int, return default for placeholders such as 'No data found'"""
+    if value in (None, 'No data found', 'N/A', 'n/a', ''):
+        return default
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def _not_present(value):
+    return value if value else 'Not Present'
+
+
+def build_status_rows(deviceUuid, data, base):
+    system = data['system']
+    location = lookup_ip_location(system['publicIp']) or {}
+    return [dict(
+        base,
+        agent_platform=system['devicePlatform'],
+        system_name=system['systemName'],
+        logged_on_user=system['currentUser'],
+        cpu_usage=system['cpuUsage'],
+        cpu_count=system['cpuCount'],
+        boot_time=system['bootTime'],
+        publicIp=system['publicIp'],
+        country=location.get('country'),
+        latitude=location.get('latitude'),
+        longitude=location.get('longitude'),
+        system_model=system.get('systemmodel', 'n/a'),
+        system_locale=system.get('systemlocale', 'n/a'),
+        system_manufacturer=system.get('systemmanufacturer', 'n/a'),
+    )]
+
+
+def build_battery_rows(deviceUuid, data, base):
+    battery = data['battery']
+    return [dict(
+        base,
+        battery_installed=battery['installed'],
+        percent_charged=battery['pcCharged'],
+        secs_remaining=_safe_int(battery.get('secsLeft'), -1),
+        on_mains_power=battery['powerPlug'],
+    )]
+
+
+def build_memory_rows(deviceUuid, data, base):
+    memory = data['memory']
+    total, used, free = memory['total'], memory['used'], memory['free']
+    mem_used_percent = (used / total) * 100
+    return [dict(
+        base,
+        total_memory=total,
+        available_memory=memory['available'],
+        used_memory=used,
+        free_memory=free,
+        mem_used_percent=mem_used_percent,
+        mem_free_percent=100 - mem_used_percent,
+        cache_memory=total - free - used,
+        memory_metrics_json=memory.get('memory_metrics'),
+    )]
+
+
+def build_network_rows(deviceUuid, data, base):
+    rows = []
+    for network in data['networkList']:
+        for name, value in network.items():
+            rows.append(dict(
+                base,
+                network_name=name,
+                if_is_up=value['ifIsUp'],
+                if_speed=value['ifSpeed'],
+                if_mtu=value['ifMtu'],
+                bytes_sent=value['bytesSent'],
+                bytes_rec=value['bytesRecv'],
+                err_in=value['errIn'],
+                err_out=value['errOut'],
+                address_4=_not_present(value.get('address4')),
+                netmask_4=_not_present(value.get('netmask4')),
+                broadcast_4=_not_present(value.get('broadcast4')),
+                address_6=_not_present(value.get('address6')),
+                netmask_6=_not_present(value.get('netmask6')),
+                broadcast_6=_not_present(value.get('broadcast6')),
+            ))
+    return rows
+
+
+def build_user_rows(deviceUuid, data, base):
+    rows = []
+    for user in data['Users']:
+        for value in user.values():
+            rows.append(dict(
+                base,
+                users_name=value['username'],
+                terminal=value['terminal'],
+                host=value['host'],
+                loggedin=value['loggedIn'],
+                pid=value['pid'],
+            ))
+    return rows
+
+
+def build_partition_rows(deviceUuid, data, base):
+    rows = []
+    for partition in data.get('partitions', []):
+        for name, value in partition.items():
+            rows.append(dict(
+                base,
+                partition_name=name,
+                partition_device=value['device'],
+                partition_fs_type=value['fstype'],
+            ))
+    return rows
+
+
+def build_drive_rows(deviceUuid, data, base):
+    rows = []
+    required_fields = ('name', 'total', 'used', 'free', 'usedPer', 'freePer')
+    for drive in data.get('drives', []):
+        if not all(field in drive for field in required_fields):
+            log_with_route(logging.ERROR, f'Missing required fields in drive data for {deviceUuid}: {drive}')
+            continue
+        rows.append(dict(
+            base,
+            drive_name=drive['name'],
+            drive_total=drive['total'],
+            drive_used=drive['used'],
+            drive_free=drive['free'],
+            drive_used_percentage=drive['usedPer'],
+            drive_free_percentage=drive['freePer'],
+        ))
+    return rows
+
+
+def build_cpu_rows(deviceUuid, data, base):
+    cpu = data.get('cpu', {'cpuname': 'n/a'})
+    return [dict(
+        base,
+        cpu_name=cpu['cpuname'],
+        cpu_metrics_json=cpu.get('cpu_metrics'),
+    )]
+
+
+def build_gpu_rows(deviceUuid, data, base):
+    gpu = data.get('gpuinfo', {'gpuvendor': 'n/a', 'gpuproduct': 'n/a'})
+    gpu_colour = _safe_int(gpu.get('gpucolour'))
+    # Clamp colour depth to signed 32-bit integer range to avoid overflow
+    if gpu_colour is not None and gpu_colour > 2147483647:
+        gpu_colour = 2147483647
+    return [dict(
+        base,
+        gpu_vendor=gpu['gpuvendor'],
+        gpu_product=gpu['gpuproduct'],
+        gpu_colour=gpu_colour,
+        gpu_hres=_safe_int(gpu.get('gpuhres')),
+        gpu_vres=_safe_int(gpu.get('gpuvres')),
+    )]
+
+
+def build_bios_rows(deviceUuid, data, base):
+    bios = data.get('bios', {'biosvendor': 'n/a', 'serialnumber': 'n/a', 'biosversion': 'n/a'})
+    return [dict(
+        base,
+        bios_vendor=bios['biosvendor'],
+        bios_name='n/a',
+        bios_serial=bios['serialnumber'],
+        bios_version=bios['biosversion'],
+    )]
+
+
+def build_collector_rows(deviceUuid, data, base):
+    collector = data.get('collector', {})
+    return [dict(
+        base,
+        coll_version=collector.get('collversion', 0),
+        coll_install_dir=collector.get('collinstalldir', 'collector needs upgrade'),
+    )]
+
+
+def build_printer_rows(deviceUuid, data, base):
+    printers_raw = data.get('printers')
+    # Accept both dict and list formats from collectors
+    if isinstance(printers_raw, list):
+        printers_dict = {name.strip(): {} for name in printers_raw if isinstance(name, str) and name.strip()}
+    else:
+        printers_dict = printers_raw if isinstance(printers_raw, dict) else {}
+
+    rows = []
+    for printerName, printerData in printers_dict.items():
+        rows.append(dict(
+            base,
+            printer_name=printerName,
+            printer_driver=printerData.get('drivername', 'unknown'),
+            printer_port=printerData.get('portname', printerData.get('port', 'unknown')),
+            printer_location=printerData.get('location', 'unknown'),
+            printer_status=printerData.get('printerstatus', 'unknown'),
+            printer_default=printerData.get('default', False),
+        ))
+    return rows
+
+
+def build_driver_rows(deviceUuid, data, base):
+    # Driver inventory is only meaningful for Windows devices
+    if not str(data['system'].get('devicePlatform', '')).startswith('Windows'):
+        return []
+
+    drivers_raw = data.get('drivers')
+    # Accept both dict and list formats from collectors
+    if isinstance(drivers_raw, list):
+        drivers_dict = {}
+        for entry in drivers_raw:
+            # Format seen: "Name<spaces>Status"; take first token as name
+            if isinstance(entry, str) and entry.strip():
+                drivers_dict[entry.strip().split()[0]] = {}
+    else:
+        drivers_dict = drivers_raw if isinstance(drivers_raw, dict) else {}
+
+    rows = []
+    for driverName, driverData in drivers_dict.items():
+        rows.append(dict(
+            base,
+            driver_name=driverName,
+            driver_description=driverData.get('description', 'unknown'),
+            driver_path=driverData.get('driverpath', 'unknown'),
+            driver_type=driverData.get('drivertype', 'unknown'),
+            driver_version=driverData.get('version', 'unknown'),
+            driver_date=driverData.get('driverdate', 0),
+        ))
+    return rows
+
+
+ROW_BUILDERS = {
+    DeviceStatus: build_status_rows,
+    DeviceBattery: build_battery_rows,
+    DeviceMemory: build_memory_rows,
+    DeviceNetworks: build_network_rows,
+    DeviceUsers: build_user_rows,
+    DevicePartitions: build_partition_rows,
+    DeviceDrives: build_drive_rows,
+    DeviceCpu: build_cpu_rows,
+    DeviceGpu: build_gpu_rows,
+    DeviceBios: build_bios_rows,
+    DeviceCollector: build_collector_rows,
+    DevicePrinters: build_printer_rows,
+    DeviceDrivers: build_driver_rows,
+}
+
+
+def build_audit_rows(deviceUuid, auditDict, now=None):
+    """
+    Build the rows every audit table needs for one payload.
+
+    Raises whatever the payload's shape triggers (KeyError, TypeError, ...)
+    so that the caller can reject the payload as a whole.
+
+    Returns:
+        dict: model -> list of row dicts
+    """
+    data = auditDict['data']
+    base = {
+        'deviceuuid': str(deviceUuid),
+        'last_update': int(now or time.time()),
+        'last_json': data['device']['systemtime'],
+    }
+    return {model: ROW_BUILDERS[model](deviceUuid, data, base) for model, _ in INGEST_TABLES}
+
+
+def get_existing_device_uuids(deviceUuids):
+    """Return the subset of deviceUuids that exist in the devices table, in one query."""
+    if not deviceUuids:
+        return set()
+    rows = db.session.query(Devices.deviceuuid).filter(Devices.deviceuuid.in_(list(deviceUuids))).all()
+    return {str(row.deviceuuid) for row in rows}
+
+
+class AuditIngestBatch:
+    """
+    Collects the rows of several audit payloads and writes them per table.
+
+    Payloads are keyed by the caller (usually the queue file path). Rows that
+    share a conflict key keep the last payload added, so callers should add
+    payloads of the same device in chronological order.
+    """
+
+    def __init__(self):
+        self.payloads = {}
+        self.rejected = {}
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def add(self, key, deviceUuid, auditDict):
+        """Stage one payload. Returns False if its rows could not be built."""
+        try:
+            self.payloads[key] = build_audit_rows(deviceUuid, auditDict)
+            return True
+        except Exception as e:
+            log_with_route(logging.ERROR, f'Rejecting audit {key} for {deviceUuid}: {type(e).__name__}: {e}')
+            self.rejected[key] = str(e)
+            return False
+
+    def flush(self):
+        """
+        Write every staged payload.
+
+        Returns:
+            tuple: (list of committed keys, dict of failed key -> reason)
+        """
+        keys = list(self.payloads)
+        if not keys:
+            return [], {}
+
+        try:
+            self._write(keys)
+            db.session.commit()
+            log_with_route(logging.INFO, f'Ingested {len(keys)} audit payload(s) in one transaction')
+            self.payloads.clear()
+            return keys, {}
+        except Exception as e:
+            db.session.rollback()
+            log_with_route(logging.WARNING, f'Batched audit ingest failed ({e}); retrying {len(keys)} payload(s) individually')
+
+        committed, failed = [], {}
+        for key in keys:
+            try:
+                self._write([key])
+                db.session.commit()
+                committed.append(key)
+            except Exception as e:
+                db.session.rollback()
+                log_with_route(logging.ERROR, f'Error ingesting audit {key}: {e}')
+                failed[key] = str(e)
+        self.payloads.clear()
+        return committed, failed
+
+    def _write(self, keys):
+        for model, index_elements in INGEST_TABLES:
+            # Last payload wins for duplicate conflict keys; one statement may not
+            # touch the same row twice
+            rows = {}
+            for key in keys:
+                for row in self.payloads[key][model]:
+                    rows[tuple(row[col] for col in index_elements)] = row
+            if not rows:
+                continue
+            # Sorted keys give concurrent writers a consistent lock order
+            ordered = [rows[k] for k in sorted(rows)]
+            upsert_rows(model, index_elements, ordered)
+
+
+def upsert_rows(model, index_elements, rows):
+    """Multi-row INSERT ... ON CONFLICT DO UPDATE, chunked below the bind parameter limit."""
+    columns = list(rows[0].keys())
+    chunk_size = max(1, MAX_BIND_PARAMS // len(columns))
+    for start in range(0, len(rows), chunk_size):
+        stmt = insert(model).values(rows[start:start + chunk_size])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(index_elements),
+            set_={col: stmt.excluded[col] for col in columns if col not in index_elements}
+        )
+        db.session.execute(stmt)
@@ -0,0 +1,128 @@
+# Filepath: app/utilities/payload_push.py
+"""
+Push-based audit ingest
+
+When PAYLOAD_PUSH_INGEST is enabled, /payload/sendaudit hands the already
+validated audit dict to an in-process bounded queue instead of leaving it for
+the periodic queue sweep. A background thread drains the queue in batches
+through the same ingest path as the queue workers, so payloads are written
+within about a second of receipt and are never listed or decoded again.
+
+Each payload is still written to disk first, into this process's own claim
+directory under payloads/inflight/. That file is the durable spill: if the
+in-process queue is full the file is moved to payloads/queue straight away,
+if an ingest fails it is moved back to the queue, and if the process dies the
+queue workers' stale-claim recovery returns it to the queue.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+from app.utilities.app_logging_helper import log_with_route
+from app.utilities.payload_queue import new_worker_id, release_claims
+
+_push_queue = None
+_push_queue_lock = threading.Lock()
+
+
+class AuditPushQueue:
+    """Bounded in-process audit queue drained by one background ingest thread"""
+
+    def __init__(self, app, maxsize=1000, batch_size=50, flush_interval=1.0):
+        from app.routes.payload import getPayloadDirs
+
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.worker_id = new_worker_id('push')
+        self.pid = os.getpid()
+        with app.app_context():
+            self.payloadDirs = getPayloadDirs()
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='audit-push-ingest', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    @property
+    def spill_dir(self):
+        """This process's claim directory; recreated in case stale-claim recovery removed it"""
+        path = os.path.join(self.payloadDirs['inflight'], self.worker_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def submit(self, full_path, auditDict):
+        """
+        Queue a spilled audit for ingest.
+
+        Returns:
+            bool: False if the queue was full and the file was handed to the queue sweep instead
+        """
+        try:
+            self._queue.put_nowait((full_path, auditDict))
+            return True
+        except queue.Full:
+            log_with_route(logging.WARNING, f'Audit push queue full ({self._queue.maxsize}), deferring {os.path.basename(full_path)} to queue workers')
+            self._requeue([full_path])
+            return False
+
+    def stop(self, timeout=5):
+        """Stop the ingest thread and return anything not yet ingested to the queue"""
+        if os.getpid() != self.pid:
+            # Inherited across a fork; the claim directory belongs to the parent
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        release_claims(self.payloadDirs['inflight'], self.worker_id, self.payloadDirs['queue'])
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._ingest(batch)
+
+    def _ingest(self, batch):
+        from app.routes.payload import ingestAuditFiles
+
+        paths = [full_path for full_path, _ in batch]
+        try:
+            with self.app.app_context():
+                ingestAuditFiles(paths, self.payloadDirs, auditDicts=dict(batch))
+        except Exception as e:
+            log_with_route(logging.ERROR, f'Push ingest of {len(paths)} audit(s) failed: {e}', exc_info=True)
+        # Anything ingestAuditFiles did not move out of the spill directory is retried by the queue workers
+        self._requeue([full_path for full_path in paths if os.path.exists(full_path)])
+
+    def _requeue(self, paths):
+        for full_path in paths:
+            try:
+                os.rename(full_path, os.path.join(self.payloadDirs['queue'], os.path.basename(full_path)))
+            except OSError as e:
+                log_with_route(logging.ERROR, f'Failed to return {full_path} to queue: {e}')
+
+
+def get_audit_push_queue(app):
+    """Per-process push queue, started lazily so it is created after gunicorn forks"""
+    global _push_queue
+    if _push_queue is not None and _push_queue._thread.is_alive():
+        return _push_queue
+    with _push_queue_lock:
+        if _push_queue is None or not _push_queue._thread.is_alive():
+            _push_queue = AuditPushQueue(
+                app,
+                maxsize=app.config.get('PAYLOAD_PUSH_QUEUE_SIZE', 1000),
+                batch_size=app.config.get('PAYLOAD_INGEST_BATCH_SIZE', 50),
+            )
+    return _push_queue
@@ -0,0 +1,183 @@
+# Filepath: app/utilities/payload_queue.py
+"""
+Claim-based payload queue
+
+Queue workers claim payload files by renaming them from payloads/queue into
+their own payloads/inflight/<worker_id>/ directory. rename() is atomic on one
+filesystem, so exactly one worker wins each file and no two workers ever
+process the same payload. Whatever a worker leaves behind is returned to the
+queue when it releases its claim, or by recover_stale_claims() if the worker
+died before it could.
+
+Every return counts as a failed attempt for the file, kept as a small counter
+file under the attempts directory. A file that fails max_attempts times is
+moved to the dead letter directory instead of going back to the queue, so one
+payload the database rejects cannot keep the workers busy forever.
+"""
+
+import logging
+import os
+import socket
+import time
+import uuid
+from app.utilities.app_logging_helper import log_with_route
+
+
+def new_worker_id(prefix='worker'):
+    """Unique claim owner name, e.g. celery-web01-4242-1a2b3c4d"""
+    return f'{prefix}-{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+
+def list_queue(queue_dir):
+    """Sorted file names in the queue; <deviceUuid>.<epoch>... names keep each device in order"""
+    try:
+        return sorted(entry.name for entry in os.scandir(queue_dir) if entry.is_file())
+    except FileNotFoundError:
+        return []
+
+
+def get_backlog_depth(queue_dir):
+    """Number of payload files waiting to be claimed"""
+    return len(list_queue(queue_dir))
+
+
+def get_inflight_depth(inflight_root):
+    """Number of payload files currently claimed, per worker"""
+    depth = {}
+    try:
+        for worker_dir in os.scandir(inflight_root):
+            if worker_dir.is_dir():
+                depth[worker_dir.name] = sum(1 for entry in os.scandir(worker_dir.path) if entry.is_file())
+    except FileNotFoundError:
+        pass
+    return depth
+
+
+def claim_payloads(queue_dir, inflight_root, worker_id, limit=None, skip=None):
+    """
+    Atomically move up to `limit` queued files into this worker's in-flight directory.
+    File names in `skip` are left in the queue.
+
+    Returns:
+        list: full paths of the claimed files, in queue order
+    """
+    worker_dir = os.path.join(inflight_root, worker_id)
+    os.makedirs(worker_dir, exist_ok=True)
+
+    claimed = []
+    for filename in list_queue(queue_dir):
+        if limit is not None and len(claimed) >= limit:
+            break
+        if skip and filename in skip:
+            continue
+        target = os.path.join(worker_dir, filename)
+        try:
+            os.rename(os.path.join(queue_dir, filename), target)
+        except FileNotFoundError:
+            # Another worker claimed it first
+            continue
+        except OSError as e:
+            log_with_route(logging.ERROR, f'Failed to claim payload {filename}: {e}')
+            continue
+        # Stamp the claim time so stale claims can be recognised later
+        os.utime(target)
+        claimed.append(target)
+
+    if claimed:
+        log_with_route(logging.INFO, f'{worker_id} claimed {len(claimed)} payload(s)')
+    return claimed
+
+
+def count_attempt(attempts_dir, filename):
+    """Record one more failed attempt at a payload and return how many there have been"""
+    path = os.path.join(attempts_dir, filename)
+    try:
+        with open(path) as counter:
+            attempts = int(counter.read() or 0) + 1
+    except (FileNotFoundError, ValueError):
+        attempts = 1
+    os.makedirs(attempts_dir, exist_ok=True)
+    with open(path, 'w') as counter:
+        counter.write(str(attempts))
+    return attempts
+
+
+def clear_attempts(attempts_dir, filenames):
+    """Forget the failed attempts of payloads that have been handled"""
+    try:
+        counted = set(os.listdir(attempts_dir))
+    except FileNotFoundError:
+        return
+    for filename in counted.intersection(filenames):
+        try:
+            os.remove(os.path.join(attempts_dir, filename))
+        except FileNotFoundError:
+            pass
+
+
+def release_claims(inflight_root, worker_id, queue_dir, attempts_dir=None, dead_letter_dir=None, max_attempts=0):
+    """
+    Return any files still in the worker's in-flight directory to the queue and remove it.
+    With attempts_dir set each returned file counts as a failed attempt; files reaching
+    max_attempts go to dead_letter_dir instead.
+
+    Returns:
+        list: names of the files returned to the queue
+    """
+    worker_dir = os.path.join(inflight_root, worker_id)
+    returned = []
+    try:
+        entries = list(os.scandir(worker_dir))
+    except FileNotFoundError:
+        return returned
+
+    for entry in entries:
+        if not entry.is_file():
+            continue
+        try:
+            if attempts_dir and count_attempt(attempts_dir, entry.name) >= max_attempts > 0:
+                os.makedirs(dead_letter_dir, exist_ok=True)
+                os.rename(entry.path, os.path.join(dead_letter_dir, entry.name))
+                clear_attempts(attempts_dir, [entry.name])
+                log_with_route(logging.ERROR, f'Payload {entry.name} failed {max_attempts} times, moved to {dead_letter_dir}')
+                continue
+            os.rename(entry.path, os.path.join(queue_dir, entry.name))
+            returned.append(entry.name)
+        except OSError as e:
+            log_with_route(logging.ERROR, f'Failed to return payload {entry.name} to queue: {e}')
+
+    try:
+        os.rmdir(worker_dir)
+    except OSError:
+        pass
+
+    if returned:
+        log_with_route(logging.WARNING, f'{worker_id} returned {len(returned)} unprocessed payload(s) to the queue')
+    return returned
+
+
+def recover_stale_claims(inflight_root, queue_dir, max_age=600, attempts_dir=None, dead_letter_dir=None,
+                         max_attempts=0):
+    """Release claims whose newest file was claimed more than max_age seconds ago, counting an attempt for each."""
+    now = time.time()
+    recovered = 0
+    try:
+        worker_dirs = [entry for entry in os.scandir(inflight_root) if entry.is_dir()]
+    except FileNotFoundError:
+        return 0
+
+    for worker_dir in worker_dirs:
+        try:
+            # An empty directory may belong to a worker that is about to claim
+            mtimes = [entry.stat().st_mtime for entry in os.scandir(worker_dir.path) if entry.is_file()]
+            mtimes.append(worker_dir.stat().st_mtime)
+        except FileNotFoundError:
+            continue
+        if now - max(mtimes) < max_age:
+            continue
+        recovered += len(release_claims(inflight_root, worker_dir.name, queue_dir,
+                                        attempts_dir, dead_letter_dir, max_attempts))
+
+    if recovered:
+        log_with_route(logging.WARNING, f'Recovered {recovered} payload(s) from stale claims')
+    return recovered
@@ -0,0 +1,115 @@
+# Filepath: app/utilities/schema_registry.py
+"""
+Compiled JSON Schema registry for payload endpoints
+
+Each schema file is loaded, checked and compiled once per process and reused
+until the file's mtime or size changes. When fastjsonschema is installed the
+schema is compiled to generated Python code; otherwise a prebuilt jsonschema
+validator is cached, which still avoids re-reading the file and rebuilding
+the validator on every request.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import jsonschema
+from app.utilities.app_logging_helper import log_with_route
+
+try:
+    import fastjsonschema
+    FASTJSONSCHEMA_AVAILABLE = True
+except ImportError:
+    fastjsonschema = None
+    FASTJSONSCHEMA_AVAILABLE = False
+
+
+class CompiledSchema:
+    """A loaded schema plus its compiled validate function"""
+
+    def __init__(self, path, schema, signature, use_fast=FASTJSONSCHEMA_AVAILABLE):
+        self.path = path
+        self.schema = schema
+        self.signature = signature
+        self.engine = 'fastjsonschema' if use_fast else 'jsonschema'
+        if use_fast:
+            # Formats are not asserted, matching jsonschema.validate() without a FormatChecker
+            self._fast_validate = fastjsonschema.compile(schema, use_formats=False)
+        else:
+            validator_cls = jsonschema.validators.validator_for(schema)
+            validator_cls.check_schema(schema)
+            self._validator = validator_cls(schema)
+
+    def validate(self, data):
+        """
+        Returns:
+            tuple: (is_valid: bool, error message or None)
+        """
+        if self.engine == 'fastjsonschema':
+            try:
+                self._fast_validate(data)
+                return True, None
+            except fastjsonschema.JsonSchemaException as e:
+                return False, e.message
+        error = jsonschema.exceptions.best_match(self._validator.iter_errors(data))
+        if error is None:
+            return True, None
+        return False, error.message
+
+
+class SchemaRegistry:
+    """Process-wide cache of compiled schemas keyed by file path"""
+
+    def __init__(self, check_interval=1.0):
+        # Seconds between stat() calls on a cached schema file
+        self.check_interval = check_interval
+        self._schemas = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return the compiled schema for path, reloading if the file changed; None if unusable."""
+        now = time.monotonic()
+        compiled = self._schemas.get(path)
+        if compiled is not None and now - self._checked_at.get(path, 0) < self.check_interval:
+            return compiled
+
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            log_with_route(logging.ERROR, f'Schema file unavailable: {path}. Reason: {e}')
+            return compiled
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            self._checked_at[path] = now
+            compiled = self._schemas.get(path)
+            if compiled is not None and compiled.signature == signature:
+                return compiled
+            try:
+                with open(path, 'r') as f:
+                    schema = json.load(f)
+                if not isinstance(schema, dict):
+                    raise ValueError(f'expected object/dict, got {type(schema).__name__}')
+                self._schemas[path] = CompiledSchema(path, schema, signature)
+                log_with_route(logging.INFO, f'Compiled schema {path} with {self._schemas[path].engine}')
+            except Exception as e:
+                # Keep serving the last good version if the file was replaced with a broken one
+                log_with_route(logging.ERROR, f'Failed to compile schema {path}. Reason: {e}')
+            return self._schemas.get(path)
+
+    def validate(self, path, data):
+        """
+        Validate data against the schema at path.
+
+        Returns:
+            tuple: (is_valid: bool, error message or None)
+        """
+        compiled = self.get(path)
+        if compiled is None:
+            return False, f'schema not available: {path}'
+        return compiled.validate(data)
+
+
+schema_registry = SchemaRegistry()
@@ -1,13 +1,19 @@
 # Filepath: app/utilities/sys_function_generate_healthscores.py
 from flask import current_app
 import logging
-from sqlalchemy import text
+import calendar
+from sqlalchemy import text, bindparam
 from app.utilities.app_logging_helper import log_with_route
 from app import db
 from app.extensions import celery
 from datetime import datetime
 from app.models import HealthScoreHistory
 
+# Descriptions written to health_score_update_log by the scheduled task. The newest
+# of these rows is the watermark the incremental run picks up dirty devices from.
+FULL_RUN_DESCRIPTION = 'Health scores recomputed (full)'
+INCREMENTAL_RUN_DESCRIPTION = 'Health scores recomputed (incremental)'
+
 def update_cascading_health_scores():
     """Direct function for route usage"""
     with current_app.app_context():
@@ -87,66 +93,237 @@ tenant_sql = text("""
     WHERE t.tenantuuid = s.tenantuuid
 """)
 
+create_log_table_sql = text("""
+    CREATE TABLE IF NOT EXISTS health_score_update_log (
+        id SERIAL PRIMARY KEY,
+        update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        description TEXT
+    )
+""")
+
+watermark_sql = text("""
+    SELECT MAX(update_time)
+    FROM health_score_update_log
+    WHERE description IN :descriptions
+""").bindparams(bindparam('descriptions', expanding=True))
+
+record_run_sql = text("""
+    INSERT INTO health_score_update_log (update_time, description)
+    VALUES (:update_time, :description)
+""")
+
+# Incremental statements: only devices with metadata analysed since the watermark,
+# then only the parents of rows whose score actually changed. Each returns the
+# rows it changed so the next level and the history writer know what moved.
+dirty_device_sql = text("""
+    WITH dirty AS (
+        SELECT DISTINCT deviceuuid
+        FROM devicemetadata
+        WHERE processing_status = 'processed'
+        AND score IS NOT NULL
+        AND analyzed_at > :since
+    ),
+    device_scores AS (
+        SELECT dm.deviceuuid,
+               ROUND(AVG(dm.score)) as avg_score
+        FROM devicemetadata dm
+        JOIN dirty USING (deviceuuid)
+        WHERE dm.processing_status = 'processed'
+        AND dm.score IS NOT NULL
+        GROUP BY dm.deviceuuid
+    )
+    UPDATE devices d
+    SET health_score = ds.avg_score
+    FROM device_scores ds
+    WHERE d.deviceuuid = ds.deviceuuid
+    AND d.health_score IS DISTINCT FROM ds.avg_score
+    RETURNING d.deviceuuid as uuid, d.groupuuid as parent_uuid, d.health_score
+""")
+
+dirty_group_sql = text("""
+    UPDATE groups g
+    SET health_score = t.avg_score
+    FROM (
+        SELECT groupuuid,
+               ROUND(AVG(health_score)) as avg_score
+        FROM devices
+        WHERE health_score IS NOT NULL
+        AND groupuuid IN :uuids
+        GROUP BY groupuuid
+    ) t
+    WHERE g.groupuuid = t.groupuuid
+    AND g.health_score IS DISTINCT FROM t.avg_score
+    RETURNING g.groupuuid as uuid, g.orguuid as parent_uuid, g.health_score
+""").bindparams(bindparam('uuids', expanding=True))
+
+dirty_org_sql = text("""
+    UPDATE organisations o
+    SET health_score = t.avg_score
+    FROM (
+        SELECT orguuid,
+               ROUND(AVG(health_score)) as avg_score
+        FROM groups
+        WHERE health_score IS NOT NULL
+        AND orguuid IN :uuids
+        GROUP BY orguuid
+    ) t
+    WHERE o.orguuid = t.orguuid
+    AND o.health_score IS DISTINCT FROM t.avg_score
+    RETURNING o.orguuid as uuid, o.tenantuuid as parent_uuid, o.health_score
+""").bindparams(bindparam('uuids', expanding=True))
+
+dirty_tenant_sql = text("""
+    UPDATE tenants t
+    SET health_score = s.avg_score
+    FROM (
+        SELECT tenantuuid,
+               ROUND(AVG(health_score)) as avg_score
+        FROM organisations
+        WHERE health_score IS NOT NULL
+        AND tenantuuid IN :uuids
+        GROUP BY tenantuuid
+    ) s
+    WHERE t.tenantuuid = s.tenantuuid
+    AND t.health_score IS DISTINCT FROM s.avg_score
+    RETURNING t.tenantuuid as uuid, NULL as parent_uuid, t.health_score
+""").bindparams(bindparam('uuids', expanding=True))
+
+
+def get_last_run_time():
+    """UTC start time of the last recorded scheduled run, or None if there has not been one"""
+    return db.session.execute(
+        watermark_sql, {'descriptions': [FULL_RUN_DESCRIPTION, INCREMENTAL_RUN_DESCRIPTION]}
+    ).scalar()
+
+
+def update_health_scores_incremental(since_epoch, current_time):
+    """
+    Recompute scores for devices analysed after since_epoch and cascade up only
+    through parents whose children changed. Does not commit.
+
+    Returns:
+        list: HealthScoreHistory entries for every score that moved
+    """
+    history_entries = []
+    changed = db.session.execute(dirty_device_sql, {'since': since_epoch}).fetchall()
+
+    for entity_type, sql in [('device', None), ('group', dirty_group_sql),
+                             ('organisation', dirty_org_sql), ('tenant', dirty_tenant_sql)]:
+        if sql is not None:
+            parent_uuids = sorted({str(row.parent_uuid) for row in changed if row.parent_uuid})
+            if not parent_uuids:
+                break
+            changed = db.session.execute(sql, {'uuids': parent_uuids}).fetchall()
+
+        for row in changed:
+            if row.health_score is not None:
+                history_entries.append(
+                    HealthScoreHistory(
+                        entity_type=entity_type,
+                        entity_uuid=row.uuid,
+                        health_score=row.health_score,
+                        timestamp=current_time
+                    )
+                )
+
+    return history_entries
+
+
+def update_health_scores_full(current_time):
+    """Recompute every score from the full metadata table and snapshot all of them. Does not commit."""
+    for sql in [device_sql, group_sql, org_sql, tenant_sql]:
+        db.session.execute(sql)
+
+    history_entries = []
+    queries = {
+        'device': "SELECT deviceuuid as uuid, health_score FROM devices WHERE health_score IS NOT NULL",
+        'group': "SELECT groupuuid as uuid, health_score FROM groups WHERE health_score IS NOT NULL",
+        'organisation': "SELECT orguuid as uuid, health_score FROM organisations WHERE health_score IS NOT NULL",
+        'tenant': "SELECT tenantuuid as uuid, health_score FROM tenants WHERE health_score IS NOT NULL"
+    }
+
+    for entity_type, query in queries.items():
+        rows = db.session.execute(text(query))
+        for row in rows:
+            history_entries.append(
+                HealthScoreHistory(
+                    entity_type=entity_type,
+                    entity_uuid=row.uuid,
+                    health_score=row.health_score,
+                    timestamp=current_time
+                )
+            )
+
+    return history_entries
+
+
 @celery.task(name="app.utilities.update_cascading_health_scores")
-def update_cascading_health_scores_task():
-    """Celery task for scheduled updates"""
+def update_cascading_health_scores_task(full=False):
+    """
+    Celery task for scheduled updates.
+
+    Runs incrementally from the last recorded run unless full=True, incremental
+    mode is disabled, or no previous run is recorded.
+    """
     with current_app.app_context():
         try:
             # Create update log table if it doesn't exist
-            create_log_table_sql = """
-            CREATE TABLE IF NOT EXISTS health_score_update_log (
-                id SERIAL PRIMARY KEY,
-                update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                description TEXT
-            );
-            """
-            db.session.execute(text(create_log_table_sql))
+            db.session.execute(create_log_table_sql)
             db.session.commit()
 
-            # Execute score updates using module-level SQL constants
-            for sql in [device_sql, group_sql, org_sql, tenant_sql]:
-                db.session.execute(sql)
-                db.session.commit()
-
-            # Record history entries
+            # Taken before any reads so metadata analysed during this run is picked up next time
             current_time = datetime.utcnow()
-            history_entries = []
-
-            # Get updated scores and create history entries
-            queries = {
-                'device': "SELECT deviceuuid as uuid, health_score FROM devices WHERE health_score IS NOT NULL",
-                'group': "SELECT groupuuid as uuid, health_score FROM groups WHERE health_score IS NOT NULL",
-                'organisation': "SELECT orguuid as uuid, health_score FROM organisations WHERE health_score IS NOT NULL",
-                'tenant': "SELECT tenantuuid as uuid, health_score FROM tenants WHERE health_score IS NOT NULL"
-            }
-
-            for entity_type, query in queries.items():
-                rows = db.session.execute(text(query))
-                for row in rows:
-                    history_entries.append(
-                        HealthScoreHistory(
-                            entity_type=entity_type,
-                            entity_uuid=row.uuid,
-                            health_score=row.health_score,
-                            timestamp=current_time
-                        )
-                    )
+            last_run = None
+            if not full and current_app.config.get('HEALTH_SCORE_INCREMENTAL', True):
+                last_run = get_last_run_time()
+
+            if last_run is not None:
+                # Overlap absorbs workers that stamped analyzed_at before committing their score
+                overlap = current_app.config.get('HEALTH_SCORE_DIRTY_OVERLAP', 900)
+                since_epoch = calendar.timegm(last_run.utctimetuple()) - overlap
+                history_entries = update_health_scores_incremental(since_epoch, current_time)
+                description = INCREMENTAL_RUN_DESCRIPTION
+            else:
+                history_entries = update_health_scores_full(current_time)
+                description = FULL_RUN_DESCRIPTION
 
             if history_entries:
                 db.session.bulk_save_objects(history_entries)
-                
-            # Log the update with explicit timestamp
-            log_sql = text("""
-                INSERT INTO health_score_update_log (update_time, description) 
-                VALUES (CURRENT_TIMESTAMP, 'Cascading health scores updated successfully')
-            """)
-            db.session.execute(log_sql)
+
+            # Log the update with explicit timestamp; this is the next run's watermark
+            db.session.execute(record_run_sql, {'update_time': current_time, 'description': description})
             db.session.commit()
 
-            log_with_route(logging.INFO, f"Successfully updated all health scores and recorded {len(history_entries)} history entries")
+            mode = 'incremental' if last_run is not None else 'full'
+            log_with_route(logging.INFO, f"Successfully updated health scores ({mode}) and recorded {len(history_entries)} history entries")
             return True
 
         except Exception as e:
             log_with_route(logging.ERROR, f"Error updating health scores: {str(e)}")
             db.session.rollback()
-            return False
\ No newline at end of file
+            return False
+
+
+@celery.task(name="app.utilities.maintain_health_score_history")
+def maintain_health_score_history_task():
+    """Celery task: roll raw health score history up into hourly/daily buckets and apply retention"""
+    from app.utilities.health_score_timeseries import rollup_health_history, apply_health_history_retention
+
+    with current_app.app_context():
+        try:
+            rolled_up_to = rollup_health_history()
+            deleted = apply_health_history_retention(
+                raw_days=current_app.config.get('HEALTH_HISTORY_RAW_DAYS', 7),
+                hourly_days=current_app.config.get('HEALTH_HISTORY_HOURLY_DAYS', 90),
+                daily_days=current_app.config.get('HEALTH_HISTORY_DAILY_DAYS', 0),
+                rolled_up_to=rolled_up_to,
+            )
+            db.session.commit()
+
+            log_with_route(logging.INFO, f"Rolled up health score history from {rolled_up_to}; deleted {deleted}")
+            return True
+
+        except Exception as e:
+            log_with_route(logging.ERROR, f"Error maintaining health score history: {str(e)}")
+            db.session.rollback()
+            return False
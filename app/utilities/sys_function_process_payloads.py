@@ -1,37 +1,132 @@
 # Filepath: app/utilities/sys_function_process_payloads.py
+import math
 import os
-import requests
+import time
 import logging
 from flask import current_app
+from sqlalchemy import text
 from dotenv import load_dotenv
 from app.utilities.app_logging_helper import log_with_route
+from app.utilities.payload_queue import claim_payloads, release_claims, recover_stale_claims, clear_attempts, \
+    get_backlog_depth, get_inflight_depth, new_worker_id
+from app.models import db
 from ..extensions import celery
 
 # Load environment variables
 load_dotenv()
 
-def call_processpayloads_url():
-    url = 'https://app.wegweiser.tech/payload/processpayloads'
 
+def database_available():
+    """Whether the database answers; payloads that fail while it does not are not held against them"""
     try:
-        # Add timeout to prevent hanging indefinitely
-        response = requests.get(url, timeout=30)
-        if response.status_code == 200:
-            log_with_route(logging.INFO, f'Successfully called {url}: {response.json()}', source_type="Celery Task")
-        else:
-            log_with_route(logging.ERROR, f'Failed to call {url}: {response.status_code} - {response.text}', source_type="Celery Task")
-    except requests.exceptions.Timeout:
-        log_with_route(logging.ERROR, f'Timeout occurred while calling {url} (30 seconds)', source_type="Celery Task")
-    except Exception as e:
-        log_with_route(logging.ERROR, f'Exception occurred while calling {url}: {e}', exc_info=True, source_type="Celery Task")
+        db.session.execute(text('SELECT 1'))
+        return True
+    except Exception:
+        db.session.rollback()
+        return False
+
+
+def release_payload_claims(payloadDirs, worker_id):
+    """Return a worker's unprocessed files to the queue, counting the attempt while the database is up"""
+    if not database_available():
+        return release_claims(payloadDirs['inflight'], worker_id, payloadDirs['queue'])
+    return release_claims(payloadDirs['inflight'], worker_id, payloadDirs['queue'], payloadDirs['attempts'],
+                          payloadDirs['invalid'], current_app.config.get('PAYLOAD_QUEUE_MAX_ATTEMPTS', 5))
+
+
+def process_payload_queue(max_seconds=None, claim_size=None):
+    """
+    Consume the payload queue until it is empty or max_seconds have passed.
+
+    Files are claimed claim_size at a time into this worker's in-flight directory,
+    so any number of these consumers can run side by side. A file that fails is
+    not claimed again in the same run, and after PAYLOAD_QUEUE_MAX_ATTEMPTS
+    failures it is moved to the invalid directory.
+
+    Returns:
+        dict: processed count, elapsed seconds, throughput and remaining backlog
+    """
+    from app.routes.payload import getPayloadDirs, processPayloadFiles
+
+    max_seconds = max_seconds or current_app.config.get('PAYLOAD_QUEUE_MAX_SECONDS', 50)
+    claim_size = claim_size or current_app.config.get('PAYLOAD_QUEUE_CLAIM_SIZE', 200)
+
+    payloadDirs = getPayloadDirs()
+    worker_id = new_worker_id('celery')
+    start = time.time()
+    processed = 0
+    failed = set()
+
+    while time.time() - start < max_seconds:
+        claimed = claim_payloads(payloadDirs['queue'], payloadDirs['inflight'], worker_id, limit=claim_size,
+                                 skip=failed)
+        if not claimed:
+            break
+        try:
+            processed += processPayloadFiles(claimed, payloadDirs)
+        finally:
+            failed.update(release_payload_claims(payloadDirs, worker_id))
+        clear_attempts(payloadDirs['attempts'], {os.path.basename(path) for path in claimed} - failed)
+
+    elapsed = time.time() - start
+    stats = {
+        'worker': worker_id,
+        'processed': processed,
+        'elapsed': round(elapsed, 3),
+        'per_second': round(processed / elapsed, 2) if elapsed > 0 else 0,
+        'backlog': get_backlog_depth(payloadDirs['queue']),
+    }
+    log_with_route(
+        logging.INFO,
+        f"{worker_id} processed {processed} payload(s) in {stats['elapsed']}s "
+        f"({stats['per_second']}/s), backlog {stats['backlog']}",
+        source_type="Celery Task"
+    )
+    return stats
+
+
+@celery.task
+def process_payload_queue_task(max_seconds=None, claim_size=None):
+    with current_app.app_context():
+        try:
+            return process_payload_queue(max_seconds, claim_size)
+        except Exception as e:
+            log_with_route(logging.ERROR, f'Error occurred in payload queue worker: {e}', exc_info=True, source_type="Celery Task")
+            return None
 
 
 @celery.task
 def call_processpayloads_task():
+    """Periodic dispatcher: recover stale claims and start enough queue workers for the backlog"""
     with current_app.app_context():
         log_with_route(logging.INFO, 'Starting the process payloads task', source_type="Celery Task")
         try:
-            call_processpayloads_url()
-            log_with_route(logging.INFO, 'Successfully completed the process payloads task', source_type="Celery Task")
+            from app.routes.payload import getPayloadDirs
+
+            payloadDirs = getPayloadDirs()
+            recover_stale_claims(
+                payloadDirs['inflight'],
+                payloadDirs['queue'],
+                max_age=current_app.config.get('PAYLOAD_QUEUE_CLAIM_TIMEOUT', 600),
+                attempts_dir=payloadDirs['attempts'],
+                dead_letter_dir=payloadDirs['invalid'],
+                max_attempts=current_app.config.get('PAYLOAD_QUEUE_MAX_ATTEMPTS', 5)
+            )
+
+            backlog = get_backlog_depth(payloadDirs['queue'])
+            inflight = sum(get_inflight_depth(payloadDirs['inflight']).values())
+            max_workers = current_app.config.get('PAYLOAD_QUEUE_WORKERS', 4)
+            claim_size = current_app.config.get('PAYLOAD_QUEUE_CLAIM_SIZE', 200)
+            workers = min(max_workers, math.ceil(backlog / claim_size)) if backlog else 0
+
+            for _ in range(workers):
+                process_payload_queue_task.delay()
+
+            log_with_route(
+                logging.INFO,
+                f'Payload backlog {backlog}, in flight {inflight}, dispatched {workers} queue worker(s)',
+                source_type="Celery Task"
+            )
+            return {'backlog': backlog, 'inflight': inflight, 'workers': workers}
         except Exception as e:
             log_with_route(logging.ERROR, f'Error occurred in process payloads task: {e}', exc_info=True, source_type="Celery Task")
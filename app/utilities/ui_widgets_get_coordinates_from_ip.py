@@ -1,16 +1,143 @@
 # Filepath: app/utilities/ui_widgets_get_coordinates_from_ip.py
+"""
+IP geolocation for the device map
+
+One memory-mapped GeoLite2 City reader (GEOIP_DATABASE_PATH) is opened per
+process on first use and shared by all threads; it is reopened when the
+database file is replaced. Results, misses included, are kept in a
+process-wide LRU of up to GEOIP_CACHE_MAX_ENTRIES addresses.
+
+Audit ingest stores each device's country and coordinates on DeviceStatus
+via lookup_ip_location(), so the map reads them from the database.
+"""
+
+import ipaddress
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
 import geoip2.database
-from flask import current_app
+import geoip2.errors
+from maxminddb import MODE_MMAP
+from flask import current_app, has_app_context
 from app.utilities.app_logging_helper import log_with_route
-import logging
 
-def get_coordinates_from_ip(ip):
+DEFAULT_DATABASE_PATH = '/opt/wegweiser/GeoLite2-City.mmdb'
+# Seconds between checks of the database file for a newer copy
+RELOAD_CHECK_INTERVAL = 60
+
+_reader = None
+_reader_path = None
+_reader_mtime = None
+_reader_checked_at = 0.0
+_reader_lock = threading.Lock()
+
+# Process-wide cache: ip -> location dict, or None for addresses with no location
+_location_cache = OrderedDict()
+_location_cache_lock = threading.Lock()
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def clear_location_cache() -> None:
+    with _location_cache_lock:
+        _location_cache.clear()
+
+
+def get_geoip_reader():
+    """The shared reader, opened (or reopened after the file changed) as needed; None if unavailable"""
+    global _reader, _reader_path, _reader_mtime, _reader_checked_at
+
+    path = _config('GEOIP_DATABASE_PATH', DEFAULT_DATABASE_PATH)
+    now = time.monotonic()
+    if _reader is not None and path == _reader_path and now - _reader_checked_at < RELOAD_CHECK_INTERVAL:
+        return _reader
+
+    with _reader_lock:
+        if _reader is not None and path == _reader_path and now - _reader_checked_at < RELOAD_CHECK_INTERVAL:
+            return _reader
+        _reader_checked_at = now
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as e:
+            if _reader_path != path or _reader is None:
+                log_with_route(logging.ERROR, f"GeoIP database {path} is not available: {e}")
+            return _reader if path == _reader_path else None
+        if _reader is not None and path == _reader_path and mtime == _reader_mtime:
+            return _reader
+
+        try:
+            reader = geoip2.database.Reader(path, mode=MODE_MMAP)
+        except Exception as e:
+            log_with_route(logging.ERROR, f"Error opening GeoIP database {path}: {e}")
+            return _reader if path == _reader_path else None
+
+        # The previous reader is left to the garbage collector; other threads may still be using it
+        _reader, _reader_path, _reader_mtime = reader, path, mtime
+        clear_location_cache()
+        log_with_route(logging.INFO, f"Opened GeoIP database {path}")
+        return _reader
+
+
+def _lookup(ip: str) -> Optional[Dict[str, Any]]:
+    try:
+        if not ipaddress.ip_address(ip).is_global:
+            return None
+    except ValueError:
+        return None
+
+    reader = get_geoip_reader()
+    if reader is None:
+        return None
+    try:
+        response = reader.city(ip)
+    except geoip2.errors.AddressNotFoundError:
+        return None
+    latitude, longitude = response.location.latitude, response.location.longitude
+    if latitude is None or longitude is None:
+        return None
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'country': response.country.name or response.country.iso_code,
+    }
+
+
+def lookup_ip_location(ip) -> Optional[Dict[str, Any]]:
+    """
+    {'latitude', 'longitude', 'country'} for a public IP address, or None if it
+    is private, unknown to the database or the database is unavailable.
+    """
+    if not ip:
+        return None
+    ip = str(ip).strip()
+
+    with _location_cache_lock:
+        if ip in _location_cache:
+            _location_cache.move_to_end(ip)
+            return _location_cache[ip]
+
     try:
-        with geoip2.database.Reader('/opt/wegweiser/GeoLite2-City.mmdb') as reader:
-            response = reader.city(ip)
-            latitude, longitude = response.location.latitude, response.location.longitude
-            log_with_route(logging.INFO, f"Successfully retrieved coordinates for IP {ip}: (Latitude: {latitude}, Longitude: {longitude})")
-            return latitude, longitude
+        location = _lookup(ip)
     except Exception as e:
-        log_with_route(logging.ERROR, f"Error getting coordinates for IP {ip}: {e}")
+        log_with_route(logging.ERROR, f"Error getting location for IP {ip}: {e}")
+        return None
+
+    max_entries = _config('GEOIP_CACHE_MAX_ENTRIES', 50000)
+    with _location_cache_lock:
+        _location_cache[ip] = location
+        while len(_location_cache) > max_entries:
+            _location_cache.popitem(last=False)
+    return location
+
+
+def get_coordinates_from_ip(ip):
+    location = lookup_ip_location(ip)
+    if location is None:
         return None, None
+    return location['latitude'], location['longitude']
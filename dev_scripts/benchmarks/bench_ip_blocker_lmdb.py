@@ -0,0 +1,142 @@
+"""
+Benchmark the IP blocker's LMDB set layout.
+
+Fills a blacklist with N IPs (default 100k) and compares the old layout (the
+whole set JSON-encoded under one key, opened with sync/metasync) against
+LMDBStorage's one-entry-per-member layout for membership checks, adds,
+removes and a full listing. Everything runs in temporary directories.
+
+Usage:
+    python dev_scripts/benchmarks/bench_ip_blocker_lmdb.py [--ips 100000] [--checks 10000] [--writes 500]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import lmdb
+from app.utilities.ip_blocker import LMDBStorage
+
+BLACKLIST = 'wegweiser:ip_blocker:blacklist'
+MAP_SIZE = 1 << 30
+
+
+class LegacyJSONSets:
+    """The previous LMDBStorage set operations: one JSON list per set"""
+
+    def __init__(self, path):
+        self.env = lmdb.open(path, map_size=MAP_SIZE, metasync=True, sync=True, writemap=True, max_dbs=20)
+        with self.env.begin(write=True) as txn:
+            self.db = self.env.open_db(b'sets', txn=txn)
+
+    def load(self, key, values):
+        with self.env.begin(write=True) as txn:
+            txn.put(key.encode('utf-8'), json.dumps(list(values)).encode('utf-8'), db=self.db)
+
+    def sadd(self, key, *values):
+        with self.env.begin(write=True) as txn:
+            current = json.loads((txn.get(key.encode('utf-8'), db=self.db) or b'[]').decode('utf-8'))
+            added = 0
+            for value in values:
+                if value not in current:
+                    current.append(value)
+                    added += 1
+            if added:
+                txn.put(key.encode('utf-8'), json.dumps(current).encode('utf-8'), db=self.db)
+            return added
+
+    def sismember(self, key, value):
+        with self.env.begin() as txn:
+            current = txn.get(key.encode('utf-8'), db=self.db)
+            return current is not None and value in json.loads(current.decode('utf-8'))
+
+    def srem(self, key, *values):
+        with self.env.begin(write=True) as txn:
+            current = json.loads((txn.get(key.encode('utf-8'), db=self.db) or b'[]').decode('utf-8'))
+            removed = 0
+            for value in values:
+                if value in current:
+                    current.remove(value)
+                    removed += 1
+            txn.put(key.encode('utf-8'), json.dumps(current).encode('utf-8'), db=self.db)
+            return removed
+
+    def smembers(self, key):
+        with self.env.begin() as txn:
+            return set(json.loads((txn.get(key.encode('utf-8'), db=self.db) or b'[]').decode('utf-8')))
+
+
+def random_ips(count, seed):
+    rng = random.Random(seed)
+    ips = set()
+    while len(ips) < count:
+        ips.add(f'{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}')
+    return list(ips)
+
+
+def bench(name, func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    elapsed = time.perf_counter() - start
+    print(f'  {name:<28} {elapsed * 1e6 / len(items):>12.1f} us/op')
+    return elapsed
+
+
+def run(label, storage, ips, checks, new_ips):
+    print(f'\n{label}')
+    hits = random.sample(ips, checks // 2)
+    misses = random_ips(checks // 2, seed=2)
+    bench('sismember (hit/miss)', lambda ip: storage.sismember(BLACKLIST, ip), hits + misses)
+    bench('sadd (one new IP)', lambda ip: storage.sadd(BLACKLIST, ip), new_ips)
+    bench('srem (one IP)', lambda ip: storage.srem(BLACKLIST, ip), new_ips)
+    bench('smembers (whole set)', lambda _: storage.smembers(BLACKLIST), range(3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ips', type=int, default=100000)
+    parser.add_argument('--checks', type=int, default=10000)
+    parser.add_argument('--writes', type=int, default=500)
+    args = parser.parse_args()
+
+    ips = random_ips(args.ips, seed=1)
+    new_ips = [ip for ip in random_ips(args.writes * 2, seed=3) if ip not in set(ips)][:args.writes]
+    workdir = tempfile.mkdtemp(prefix='bench_ip_blocker_')
+    try:
+        print(f'{len(ips):,} blocked IPs, {args.checks:,} membership checks, {len(new_ips)} adds/removes')
+
+        legacy = LegacyJSONSets(os.path.join(workdir, 'legacy'))
+        legacy.load(BLACKLIST, ips)
+        run('old layout (JSON list, sync on every commit)', legacy, ips, args.checks, new_ips)
+        legacy.env.close()
+
+        for sync in (True, False):
+            storage = LMDBStorage(os.path.join(workdir, f'members_sync_{sync}'), MAP_SIZE, sync)
+            start = time.perf_counter()
+            storage.sadd(BLACKLIST, *ips)
+            print(f'\nloaded {storage.scard(BLACKLIST):,} members in {time.perf_counter() - start:.2f}s')
+            run(f'per-member layout (sync={sync})', storage, ips, args.checks, new_ips)
+            storage.env.close()
+
+        # Migration of the old layout
+        legacy_path = os.path.join(workdir, 'migrate')
+        legacy = LegacyJSONSets(legacy_path)
+        legacy.load(BLACKLIST, ips)
+        legacy.env.close()
+        start = time.perf_counter()
+        storage = LMDBStorage(legacy_path, MAP_SIZE, False)
+        print(f'\nmigrated {storage.scard(BLACKLIST):,} members in {time.perf_counter() - start:.2f}s')
+        storage.env.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
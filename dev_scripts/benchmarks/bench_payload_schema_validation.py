@@ -0,0 +1,90 @@
+"""
+Benchmark audit payload schema validation.
+
+Compares the per-audit cost of the old /payload/sendaudit path (read the schema
+file and call jsonschema.validate on every request) against the compiled
+schema registry, with both the cached jsonschema validator and, if installed,
+fastjsonschema.
+
+Usage:
+    python dev_scripts/benchmarks/bench_payload_schema_validation.py [--audits 2000] [--interfaces 40] [--drives 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import jsonschema
+from app.utilities.schema_registry import CompiledSchema, FASTJSONSCHEMA_AVAILABLE
+
+SCHEMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'includes', 'payloadAuditSchema.json'))
+
+
+def make_audit(interfaces, drives):
+    """A large but schema-valid audit, shaped like a busy server's payload"""
+    return {'data': {
+        'device': {'deviceUuid': str(uuid.uuid4()), 'groupUuid': str(uuid.uuid4()), 'systemtime': time.time()},
+        'system': {'devicePlatform': 'Windows-10-10.0.19045-SP0', 'systemName': 'bench-host', 'currentUser': 'bench',
+                   'cpuUsage': 12.5, 'cpuCount': 16, 'bootTime': time.time() - 86400, 'publicIp': '203.0.113.10'},
+        'drives': [{'name': f'D{i}:', 'total': 10 ** 12, 'used': 4 * 10 ** 11, 'free': 6 * 10 ** 11,
+                    'usedPer': 40.0, 'freePer': 60.0} for i in range(drives)],
+        'networkList': [{f'eth{i}': {'ifIsUp': True, 'ifSpeed': 1000, 'ifMtu': 1500, 'bytesSent': 123456789,
+                                     'bytesRecv': 987654321, 'errIn': 0, 'errOut': 0, 'address4': '10.0.0.1',
+                                     'netmask4': '255.255.255.0', 'broadcast4': '10.0.0.255', 'address6': 'fe80::1',
+                                     'netmask6': 'ffff:ffff:ffff:ffff::', 'broadcast6': None}
+                         for i in range(interfaces)}],
+        'Users': [{'0': {'username': 'bench', 'terminal': 'console', 'host': 'localhost', 'loggedIn': time.time(), 'pid': 1}}],
+        'battery': {'installed': False, 'pcCharged': 0, 'secsLeft': -1, 'powerPlug': True},
+        'partitions': [{f'/mnt/p{i}': {'device': f'/dev/sd{i}', 'fstype': 'ext4'} for i in range(drives)}],
+        'memory': {'total': 64 * 2 ** 30, 'available': 32 * 2 ** 30, 'used': 30 * 2 ** 30, 'free': 34 * 2 ** 30},
+    }}
+
+
+def bench(name, func, audits):
+    start = time.perf_counter()
+    for audit in audits:
+        func(audit)
+    elapsed = time.perf_counter() - start
+    print(f'{name:<34} {elapsed * 1e6 / len(audits):>10.1f} us/audit  ({len(audits) / elapsed:>9.0f} audits/s)')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--audits', type=int, default=2000)
+    parser.add_argument('--interfaces', type=int, default=40)
+    parser.add_argument('--drives', type=int, default=20)
+    args = parser.parse_args()
+
+    audits = [make_audit(args.interfaces, args.drives) for _ in range(args.audits)]
+    print(f'{args.audits} audits, ~{len(json.dumps(audits[0])) // 1024} KiB each\n')
+
+    def legacy(audit):
+        with open(SCHEMA_PATH, 'r') as f:
+            schema = json.load(f)
+        jsonschema.validate(instance=audit, schema=schema)
+
+    with open(SCHEMA_PATH, 'r') as f:
+        schema = json.load(f)
+    signature = (0, 0)
+
+    baseline = bench('read + jsonschema.validate', legacy, audits)
+
+    cached = CompiledSchema(SCHEMA_PATH, schema, signature, use_fast=False)
+    elapsed = bench('registry (cached jsonschema)', lambda a: cached.validate(a)[0] or sys.exit('invalid audit'), audits)
+    print(f'{"":<34} {baseline / elapsed:>10.1f}x faster\n')
+
+    if FASTJSONSCHEMA_AVAILABLE:
+        fast = CompiledSchema(SCHEMA_PATH, schema, signature, use_fast=True)
+        elapsed = bench('registry (fastjsonschema)', lambda a: fast.validate(a)[0] or sys.exit('invalid audit'), audits)
+        print(f'{"":<34} {baseline / elapsed:>10.1f}x faster')
+    else:
+        print('fastjsonschema not installed; pip install fastjsonschema to benchmark the compiled validator')
+
+
+if __name__ == '__main__':
+    main()
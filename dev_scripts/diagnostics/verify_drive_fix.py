@@ -14,16 +14,16 @@ def verify_fix_in_code():
     print("=== Verifying Drive Fix in Code ===")
     
     try:
-        with open('app/routes/payload.py', 'r') as f:
+        with open('app/utilities/payload_ingest.py', 'r') as f:
             content = f.read()
         
         # Check if the old buggy pattern exists
         if 'for key, value in drive.items():' in content:
-            print("❌ ERROR: Old buggy pattern still exists in upsertDeviceDrives")
+            print("❌ ERROR: Old buggy pattern still exists in build_drive_rows")
             return False
         
         # Check if the function has been properly fixed
-        if 'for drive in auditDict[\'data\'][\'drives\']:' in content:
+        if 'for drive in data.get(\'drives\', []):' in content:
             print("✅ SUCCESS: Drive iteration pattern looks correct")
         else:
             print("❌ ERROR: Expected drive iteration pattern not found")
@@ -39,14 +39,26 @@ def create_test_audit_data():
     }
 
 def test_upsert_function():
-    """Test the upsertDeviceDrives function directly"""
+    """Test the drive rows of the audit ingest directly"""
     try:
         from app import create_app
         from app.models import db, DeviceDrives
-        from app.routes.payload import upsertDeviceDrives
+        from app.utilities.payload_ingest import INGEST_TABLES, build_drive_rows, upsert_rows
         import uuid
         
         app = create_app()
+
+        def upsertDeviceDrives(deviceUuid, auditDict):
+            data = auditDict['data']
+            base = {
+                'deviceuuid': deviceUuid,
+                'last_update': int(time.time()),
+                'last_json': data['device']['systemtime'],
+            }
+            rows = build_drive_rows(deviceUuid, data, base)
+            if rows:
+                upsert_rows(DeviceDrives, dict(INGEST_TABLES)[DeviceDrives], rows)
+            db.session.commit()
         
         with app.app_context():
             # Create a test device UUID
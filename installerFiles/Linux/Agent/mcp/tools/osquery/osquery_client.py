@@ -1,17 +1,217 @@
 """
 osquery client wrapper
+
+Queries run in long-lived `osqueryi --json` shells driven over asyncio pipes, so
+a query costs a round trip instead of an osquery startup, and the MCP server's
+event loop (heartbeats included) keeps running while it waits. Every query is
+followed by a marker SELECT; the marker's row in the output ends the query's
+result. A shell that times out or dies is killed and respawned on next use.
 """
 
+import asyncio
 import subprocess
 import json
 import logging
 import platform
 import sys
+import time
+import uuid
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# osqueryi shells kept per executable
+POOL_SIZE = 2
+# Seconds the table list and table columns are cached
+SCHEMA_CACHE_TTL = 3600
+# Seconds to wait for an error message on stderr when a query printed nothing
+STDERR_SETTLE = 0.05
+# Largest output line of an osqueryi shell
+STREAM_LIMIT = 16 * 1024 * 1024
+MARKER_COLUMN = "__wegweiser_marker"
+
+_executables: Dict[str, Optional[str]] = {}
+_pools: Dict[str, "OsquerySessionPool"] = {}
+
+
+class OsqueryError(Exception):
+    """osqueryi rejected a query"""
+
+
+def strip_line_comments(query: str) -> str:
+    """query without `-- ...` comments, which would swallow the rest of it once joined into one line"""
+    lines = []
+    for line in query.splitlines():
+        quote = None
+        for position, char in enumerate(line):
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in "'\"":
+                quote = char
+            elif line.startswith("--", position):
+                line = line[:position]
+                break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class OsquerySession:
+    """One osqueryi shell; runs one query at a time"""
+
+    def __init__(self, osquery_path: str):
+        self.osquery_path = osquery_path
+        self.process = None
+        self._stderr: List[str] = []
+        self._stderr_event = asyncio.Event()
+        self._stderr_task = None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            self.osquery_path,
+            "--json",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT,
+        )
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+        logger.debug(f"Started osqueryi shell (pid {self.process.pid})")
+
+    async def _drain_stderr(self):
+        while True:
+            line = await self.process.stderr.readline()
+            if not line:
+                return
+            self._stderr.append(line.decode(errors="replace"))
+            self._stderr_event.set()
+
+    async def query(self, query: str, timeout: float) -> List[Dict[str, Any]]:
+        """Rows of one query; raises OsqueryError, asyncio.TimeoutError or ConnectionError"""
+        self._stderr.clear()
+        self._stderr_event.clear()
+
+        token = uuid.uuid4().hex
+        statement = " ".join(strip_line_comments(query).strip().rstrip(";").splitlines())
+        self.process.stdin.write(
+            f"{statement};\nSELECT '{token}' AS {MARKER_COLUMN};\n".encode()
+        )
+        await self.process.stdin.drain()
+
+        try:
+            output = await asyncio.wait_for(self._read_until_marker(token), timeout)
+        except ConnectionError:
+            # Report why the shell gave up rather than that it did
+            await asyncio.wait_for(self.process.wait(), timeout=5)
+            if self._stderr_task is not None:
+                await asyncio.wait_for(self._stderr_task, timeout=1)
+            errors = "".join(self._stderr).strip()
+            if errors:
+                raise OsqueryError(errors)
+            raise
+
+        if not output.strip() and not self._stderr:
+            # Errors go to stderr, which is read separately from stdout
+            try:
+                await asyncio.wait_for(self._stderr_event.wait(), STDERR_SETTLE)
+            except asyncio.TimeoutError:
+                pass
+        errors = "".join(self._stderr).strip()
+        if errors and not output.strip():
+            raise OsqueryError(errors)
+
+        output = output.strip()
+        if not output:
+            return []
+        data = json.loads(output)
+        return data if isinstance(data, list) else [data]
+
+    async def _read_until_marker(self, token: str) -> str:
+        """stdout up to the marker query's result, which is consumed"""
+        buffer = ""
+        while True:
+            chunk = await self.process.stdout.read(65536)
+            if not chunk:
+                raise ConnectionError("osqueryi exited")
+            buffer += chunk.decode(errors="replace")
+            position = buffer.find(token)
+            if position == -1:
+                continue
+            end = buffer.find("]", position)
+            while end == -1:
+                chunk = await self.process.stdout.read(65536)
+                if not chunk:
+                    raise ConnectionError("osqueryi exited")
+                buffer += chunk.decode(errors="replace")
+                end = buffer.find("]", position)
+            return buffer[: buffer.rfind("[", 0, position)]
+
+    async def close(self):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+            await self.process.wait()
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+        self.process = None
+
+
+class OsquerySessionPool:
+    """A few osqueryi shells for one executable, started on demand and respawned when they fail"""
+
+    def __init__(self, osquery_path: str, size: int = POOL_SIZE):
+        self.osquery_path = osquery_path
+        self.size = size
+        self.loop = asyncio.get_running_loop()
+        # Last in, first out: the warmest shell answers, others start only under concurrent load
+        self._idle: asyncio.LifoQueue = asyncio.LifoQueue()
+        for _ in range(size):
+            self._idle.put_nowait(None)  # a slot without a shell yet
+        self.schema_cache: Dict[str, Any] = {}
+
+    async def query(self, query: str, timeout: float) -> List[Dict[str, Any]]:
+        session = await self._idle.get()
+        try:
+            if session is None or not session.is_alive():
+                session = OsquerySession(self.osquery_path)
+                await session.start()
+            try:
+                return await session.query(query, timeout)
+            except (asyncio.TimeoutError, ConnectionError, asyncio.CancelledError):
+                # The shell is mid-query or gone; a new one is started next time
+                await session.close()
+                session = None
+                raise
+        finally:
+            if session is not None and not session.is_alive():
+                await session.close()
+                session = None
+            self._idle.put_nowait(session)
+
+    async def close(self):
+        while not self._idle.empty():
+            session = self._idle.get_nowait()
+            if session is not None:
+                await session.close()
+        for _ in range(self.size):
+            self._idle.put_nowait(None)
+
+
+def get_session_pool(osquery_path: str) -> OsquerySessionPool:
+    """The shared pool for an executable, on the running event loop"""
+    pool = _pools.get(osquery_path)
+    if pool is None or pool.loop is not asyncio.get_running_loop():
+        pool = _pools[osquery_path] = OsquerySessionPool(osquery_path)
+    return pool
+
 
 class OSQueryClient:
     """Wrapper for osquery command-line interface"""
@@ -23,6 +223,9 @@ class OSQueryClient:
 
     def _find_osquery_executable(self) -> Optional[str]:
         """Find osquery executable on the system"""
+        if "path" in _executables:
+            return _executables["path"]
+
         possible_paths = [
             "osqueryi",  # In PATH
             "/usr/bin/osqueryi",  # Linux
@@ -42,11 +245,13 @@ class OSQueryClient:
                 )
                 if result.returncode == 0:
                     logger.info(f"Found osquery at: {path}")
+                    _executables["path"] = path
                     return path
             except (subprocess.TimeoutExpired, FileNotFoundError, OSError):
                 continue
 
         logger.warning("osquery executable not found")
+        _executables["path"] = None
         return None
 
     def is_available(self) -> bool:
@@ -76,48 +281,34 @@ class OSQueryClient:
             return {"success": False, "error": "Empty query"}
 
         try:
-            # Build command
-            cmd = [self.osquery_path, "--json", query]
-
             logger.debug(f"Executing osquery: {query}")
 
-            # Execute command
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-            )
+            data = await get_session_pool(self.osquery_path).query(query, timeout)
+            row_count = len(data)
 
-            if result.returncode != 0:
-                error_msg = result.stderr or f"osquery failed with code {result.returncode}"
-                logger.error(f"osquery error: {error_msg}")
-                return {"success": False, "error": error_msg, "query": query}
+            logger.debug(f"osquery returned {row_count} rows")
 
-            # Parse JSON output
-            try:
-                data = json.loads(result.stdout)
-                row_count = len(data) if isinstance(data, list) else 1
-
-                logger.debug(f"osquery returned {row_count} rows")
+            return {
+                "success": True,
+                "query": query,
+                "data": data,
+                "row_count": row_count,
+            }
 
-                return {
-                    "success": True,
-                    "query": query,
-                    "data": data,
-                    "row_count": row_count,
-                }
+        except OsqueryError as e:
+            logger.error(f"osquery error: {e}")
+            return {"success": False, "error": str(e), "query": query}
 
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse osquery output: {e}")
-                return {
-                    "success": False,
-                    "error": f"Failed to parse osquery output: {str(e)}",
-                    "query": query,
-                    "raw_output": result.stdout[:500],  # First 500 chars
-                }
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse osquery output: {e}")
+            return {
+                "success": False,
+                "error": f"Failed to parse osquery output: {str(e)}",
+                "query": query,
+                "raw_output": e.doc[:500],  # First 500 chars
+            }
 
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             logger.error(f"osquery query timed out after {timeout}s")
             return {
                 "success": False,
@@ -129,6 +320,18 @@ class OSQueryClient:
             logger.error(f"Error executing osquery: {e}", exc_info=True)
             return {"success": False, "error": str(e), "query": query}
 
+    async def _cached_query(self, key: str, query: str) -> Dict[str, Any]:
+        """execute_query for schema lookups, cached for SCHEMA_CACHE_TTL seconds"""
+        cache = get_session_pool(self.osquery_path).schema_cache if self.osquery_path else {}
+        cached = cache.get(key)
+        if cached and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL:
+            return cached[1]
+
+        result = await self.execute_query(query, timeout=10)
+        if result.get("success"):
+            cache[key] = (time.monotonic(), result)
+        return result
+
     async def get_schema(
         self, table_name: Optional[str] = None
     ) -> Dict[str, Any]:
@@ -151,7 +354,7 @@ class OSQueryClient:
 
             logger.debug(f"Getting schema: {query}")
 
-            result = await self.execute_query(query, timeout=10)
+            result = await self._cached_query(table_name or "", query)
 
             if not result.get("success"):
                 return result
@@ -222,3 +425,9 @@ class OSQueryClient:
         except Exception as e:
             logger.error(f"Error validating query: {e}")
             return {"success": False, "error": str(e), "query": query}
+
+    async def close(self):
+        """Stop this executable's osqueryi shells"""
+        pool = _pools.pop(self.osquery_path, None) if self.osquery_path else None
+        if pool is not None:
+            await pool.close()
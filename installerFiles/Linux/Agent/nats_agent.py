@@ -72,7 +72,9 @@ async def handle_osquery(parameters: dict) -> dict:
 
         # Execute query
         cmd = [osqueryi_path]
-        if query.lower().strip().startswith('select '):
+        # SELECTs and CTEs come back as JSON rows; meta commands like .tables stay text
+        returns_rows = query.lower().strip().startswith(('select', 'with'))
+        if returns_rows:
             cmd.append('--json')
         cmd.append(query)
 
@@ -81,9 +83,9 @@ async def handle_osquery(parameters: dict) -> dict:
         if result.returncode == 0:
             logger.info(f"osquery executed successfully")
 
-            # Try to parse JSON for SELECT queries
+            # Try to parse JSON for SELECT queries and CTEs
             json_data = None
-            if query.lower().strip().startswith('select ') and result.stdout.strip():
+            if returns_rows and result.stdout.strip():
                 try:
                     json_data = json.loads(result.stdout)
                 except:
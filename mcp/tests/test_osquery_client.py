@@ -0,0 +1,168 @@
+"""
+Tests for the osqueryi session pool, run against a fake osqueryi shell
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add osquery tool directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools" / "osquery"))
+
+import osquery_client
+from osquery_client import OSQueryClient
+
+
+FAKE_OSQUERYI = r'''#!{python}
+"""Reads statements from stdin and answers like `osqueryi --json`"""
+import json
+import os
+import re
+import sys
+import time
+
+for line in sys.stdin:
+    for statement in filter(None, (s.strip() for s in line.split(";"))):
+        marker = re.match(r"SELECT '(\w+)' AS (\w+)", statement)
+        if marker:
+            rows = [{{marker.group(2): marker.group(1)}}]
+        elif statement == "SELECT pid FROM self":
+            rows = [{{"pid": str(os.getpid())}}]
+        elif statement.startswith("SELECT name FROM sqlite_master"):
+            with open(os.environ["FAKE_OSQUERYI_LOG"], "a") as log:
+                log.write("schema\n")
+            rows = [{{"name": "processes"}}, {{"name": "users"}}]
+        elif statement == "SELECT sleep":
+            time.sleep(60)
+            rows = []
+        elif "--" in statement:
+            # A comment would run to the end of the line, swallowing the rest of the query
+            sys.stderr.write("Error: incomplete input\n")
+            sys.stderr.flush()
+            continue
+        elif statement == "SELECT nothing":
+            rows = []
+        elif statement.startswith("SELECT"):
+            rows = [{{"value": "1"}}, {{"value": "2"}}]
+        else:
+            sys.stderr.write("Error: near \"%s\": syntax error\n" % statement.split()[0])
+            sys.stderr.flush()
+            continue
+        if rows:
+            print(json.dumps(rows, indent=2))
+        sys.stdout.flush()
+'''
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A client whose osqueryi is the fake shell"""
+    executable = tmp_path / "osqueryi"
+    executable.write_text(FAKE_OSQUERYI.format(python=sys.executable))
+    executable.chmod(0o755)
+    monkeypatch.setenv("FAKE_OSQUERYI_LOG", str(tmp_path / "calls.log"))
+    monkeypatch.setattr(osquery_client, "_executables", {"path": str(executable)})
+    monkeypatch.setattr(osquery_client, "_pools", {})
+    return OSQueryClient()
+
+
+def run(client, coroutine):
+    async def run_and_close():
+        try:
+            return await coroutine
+        finally:
+            await client.close()
+
+    return asyncio.run(run_and_close())
+
+
+def test_queries_reuse_shell(client):
+    """Back-to-back queries are answered by the same osqueryi process"""
+
+    async def queries():
+        first = await client.execute_query("SELECT pid FROM self")
+        second = await client.execute_query("SELECT pid FROM self;")
+        rows = await client.execute_query("SELECT value FROM t")
+        return first, second, rows
+
+    first, second, rows = run(client, queries())
+
+    assert first["success"] and second["success"]
+    assert first["data"] == second["data"]
+    assert rows["data"] == [{"value": "1"}, {"value": "2"}]
+    assert rows["row_count"] == 2
+
+
+def test_empty_result_and_error(client):
+    """Empty results are empty lists; errors come from the shell's stderr"""
+
+    async def queries():
+        empty = await client.execute_query("SELECT nothing")
+        error = await client.execute_query("DROP TABLE users")
+        after = await client.execute_query("SELECT value FROM t")
+        return empty, error, after
+
+    empty, error, after = run(client, queries())
+
+    assert empty["success"] and empty["data"] == [] and empty["row_count"] == 0
+    assert not error["success"] and "syntax error" in error["error"]
+    assert after["success"] and after["row_count"] == 2
+
+
+def test_multiline_query_with_comments(client):
+    """Line comments are dropped before a multi-line query is sent as one line"""
+    query = """
+        -- every value
+        SELECT value  -- the column
+        FROM t;  -- done
+    """
+
+    result = run(client, client.execute_query(query))
+
+    assert result["success"] and result["row_count"] == 2
+    assert osquery_client.strip_line_comments("SELECT '--' AS a, \"x--y\" -- note") == "SELECT '--' AS a, \"x--y\" "
+
+
+def test_timeout_respawns_shell(client):
+    """A query that times out kills its shell without blocking the event loop"""
+
+    async def queries():
+        before = await client.execute_query("SELECT pid FROM self")
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        started = time.monotonic()
+        timed_out = await client.execute_query("SELECT sleep", timeout=0.5)
+        elapsed = time.monotonic() - started
+        ticker_task.cancel()
+
+        after = await client.execute_query("SELECT pid FROM self")
+        return before, timed_out, elapsed, ticks, after
+
+    before, timed_out, elapsed, ticks, after = run(client, queries())
+
+    assert not timed_out["success"] and "timed out" in timed_out["error"]
+    assert elapsed < 5
+    assert ticks > 10
+    assert after["success"] and after["data"] != before["data"]
+
+
+def test_schema_is_cached(client, tmp_path):
+    """The table list is read from osquery once"""
+
+    async def schemas():
+        return [await client.get_schema() for _ in range(3)]
+
+    results = run(client, schemas())
+
+    assert all(result["tables"] == ["processes", "users"] for result in results)
+    assert (tmp_path / "calls.log").read_text().count("schema") == 1
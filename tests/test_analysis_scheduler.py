@@ -0,0 +1,32 @@
+import pytest
+
+from app.tasks.base import scheduler
+
+
+class FakeSession:
+    def __init__(self):
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_failed_batch_releases_its_claims(monkeypatch):
+    claimed = [{'metadatauuid': 'a', 'deviceuuid': 'd', 'metalogos': {}},
+               {'metadatauuid': 'b', 'deviceuuid': 'd', 'metalogos': {}}]
+    released = []
+
+    def fail(*args):
+        raise RuntimeError('model client unavailable')
+
+    monkeypatch.setattr(scheduler, 'claim_pending_analyses', lambda session, analysis_type, limit: claimed)
+    monkeypatch.setattr(scheduler, '_process_claimed', fail)
+    monkeypatch.setattr(scheduler, 'release_analyses',
+                        lambda session, ids, status='pending': released.append((list(ids), status)) or len(ids))
+    session = FakeSession()
+
+    with pytest.raises(RuntimeError):
+        scheduler.run_analysis_batch(session, object, 'journalFiltered', 2, 4, 2)
+
+    assert session.rollbacks == 1
+    assert released == [(['a', 'b'], 'pending')]
@@ -0,0 +1,40 @@
+from app.models import db
+from app.utilities.device_backup import BACKUP_TABLES, DEVICE_DELETION_ORDER
+
+DEVICE_COLUMNS = ('deviceuuid', 'entity_uuid', 'entityuuid')
+# Tables with a device column whose rows outlive the device
+NOT_DELETED = {
+    'ai_memories': 'memories are tenant knowledge and stay in the memory index',
+    'fleet_query_results': 'results carry the device name and expire with their job',
+}
+# Deleted tables that are not part of a device backup; the device row is the
+# backup's header and restore starts a new conversation
+NOT_BACKED_UP = {
+    'devices', 'conversations', 'agent_update_history', 'device_osquery', 'device_audit_json_test',
+    'snippetsschedule', 'snippetshistory', 'ai_memory_jobs',
+}
+
+
+def _device_tables():
+    return {name for name, table in db.metadata.tables.items()
+            if any(column in table.c for column in DEVICE_COLUMNS)}
+
+
+def test_deletion_covers_every_device_table():
+    deleted = {table for table, _, _ in DEVICE_DELETION_ORDER}
+
+    assert _device_tables() - set(NOT_DELETED) - deleted == set()
+    assert deleted <= _device_tables()
+
+
+def test_entity_tables_are_deleted_by_entity_type():
+    for table, column, entity_type_column in DEVICE_DELETION_ORDER:
+        if column in ('entity_uuid', 'entityuuid'):
+            assert entity_type_column == 'entity_type', table
+
+
+def test_backup_covers_every_deleted_table():
+    backed_up = {model.__table__.name for _, model in BACKUP_TABLES}
+    deleted = {table for table, _, _ in DEVICE_DELETION_ORDER}
+
+    assert deleted - set(NOT_BACKED_UP) - backed_up == set()
@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+from app.utilities import device_commands
+
+
+def test_task_runs_command_and_saves_history(monkeypatch):
+    saved = []
+    monkeypatch.setattr(device_commands, 'run_device_command',
+                        lambda tenantuuid, device_uuid, action, args: {'rows': [action, args]})
+    monkeypatch.setattr(device_commands, 'save_terminal_history',
+                        lambda *args: saved.append(args))
+
+    payload = device_commands.run_device_command_task.run(
+        't', 'd', 'osquery', {'query': 'select 1'}, {'useruuid': 'u', 'query': 'select 1'})
+
+    assert payload == {'tenantuuid': 't', 'device_uuid': 'd', 'action': 'osquery',
+                       'result': {'rows': ['osquery', {'query': 'select 1'}]}}
+    assert saved == [('t', 'd', 'u', 'select 1', {'rows': ['osquery', {'query': 'select 1'}]})]
+
+
+def test_queued_command_is_none_until_ready(monkeypatch):
+    results = {
+        'running': SimpleNamespace(ready=lambda: False),
+        'done': SimpleNamespace(ready=lambda: True, failed=lambda: False, result={'tenantuuid': 't', 'result': 1}),
+        'broken': SimpleNamespace(ready=lambda: True, failed=lambda: True, result=RuntimeError('boom')),
+    }
+    monkeypatch.setattr(device_commands.celery, 'AsyncResult', results.get)
+
+    assert device_commands.get_queued_command('running') is None
+    assert device_commands.get_queued_command('done') == {'tenantuuid': 't', 'result': 1}
+    assert device_commands.get_queued_command('broken')['result'] == {'error': 'Command failed: boom'}
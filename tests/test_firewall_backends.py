@@ -0,0 +1,93 @@
+from app.utilities import firewall_backends
+from app.utilities.firewall_backends import DryRunBackend, IpsetBackend
+
+
+class FakeRunner:
+    """Records firewall commands; `outputs` maps a command prefix to its stdout"""
+
+    def __init__(self, outputs=None):
+        self.calls = []
+        self.outputs = outputs or {}
+
+    def __call__(self, cmd, input_text=None, quiet=False):
+        self.calls.append((cmd, input_text))
+        for prefix, output in self.outputs.items():
+            if tuple(cmd[:len(prefix)]) == prefix:
+                return output
+        return None if '-C' in cmd else ''
+
+    def restore_scripts(self):
+        return [input_text for cmd, input_text in self.calls if 'restore' in cmd]
+
+
+def _backend(runner):
+    return IpsetBackend(set_name='blk', net_set_name='blk_net', batch_delay=0, sudo_path='sudo',
+                        ipset_path='ipset', iptables_path='iptables', ip6tables_path='ip6tables', runner=runner)
+
+
+def test_ipset_creates_ipv4_and_ipv6_sets_and_rules():
+    runner = FakeRunner()
+    assert _backend(runner).ensure()
+
+    assert runner.restore_scripts()[0].splitlines() == [
+        'create blk hash:ip family inet timeout 0 maxelem 1048576',
+        'create blk_net hash:net family inet timeout 0 maxelem 65536',
+        'create blk6 hash:ip family inet6 timeout 0 maxelem 1048576',
+        'create blk_net6 hash:net family inet6 timeout 0 maxelem 65536',
+    ]
+    inserted = [(cmd[1], cmd[cmd.index('--match-set') + 1]) for cmd, _ in runner.calls if '-I' in cmd]
+    assert inserted == [('iptables', 'blk'), ('iptables', 'blk_net'), ('ip6tables', 'blk6'), ('ip6tables', 'blk_net6')]
+
+
+def test_ipset_routes_entries_by_family():
+    runner = FakeRunner()
+    backend = _backend(runner)
+
+    assert backend.block(['192.0.2.1', '198.51.100.0/24', '2001:db8::1', '2001:db8::/32'], timeout=60)
+    assert runner.restore_scripts()[-1].splitlines() == [
+        'add blk 192.0.2.1 timeout 60',
+        'add blk_net 198.51.100.0/24 timeout 60',
+        'add blk6 2001:db8::1 timeout 60',
+        'add blk_net6 2001:db8::/32 timeout 60',
+    ]
+
+    assert backend.unblock(['2001:db8::1', '192.0.2.1'])
+    assert runner.restore_scripts()[-1].splitlines() == ['del blk6 2001:db8::1', 'del blk 192.0.2.1']
+
+
+def test_ipset_reconcile():
+    runner = FakeRunner({
+        ('sudo', 'ipset', 'save', 'blk'): 'create blk hash:ip\nadd blk 192.0.2.1\nadd blk 192.0.2.9 timeout 30\n',
+        ('sudo', 'ipset', 'save', 'blk6'): 'add blk6 2001:db8::1\n',
+        ('sudo', 'iptables', '-S', 'INPUT'): '-P INPUT ACCEPT\n-A INPUT -s 192.0.2.1/32 -j DROP\n',
+    })
+    backend = _backend(runner)
+
+    stats = backend.reconcile({'192.0.2.1': None, '2001:db8::1': None, '2001:db8::2': 120, '198.51.100.0/24': None})
+
+    assert stats == {'added': 2, 'removed': 1, 'legacy_rules_removed': 1}
+    assert runner.restore_scripts()[-1].splitlines() == [
+        'add blk6 2001:db8::2 timeout 120',
+        'add blk_net 198.51.100.0/24',
+        'del blk 192.0.2.9',
+    ]
+    assert (['sudo', 'iptables', '-D', 'INPUT', '-s', '192.0.2.1', '-j', 'DROP'], None) in runner.calls
+
+
+def test_dry_run_backend(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(firewall_backends.time, 'monotonic', lambda: now[0])
+    backend = DryRunBackend()
+
+    backend.block(['192.0.2.1'])
+    backend.block(['2001:db8::1'], timeout=10)
+    assert backend.is_blocked('192.0.2.1') and backend.is_blocked('2001:db8::1')
+
+    now[0] += 11
+    assert not backend.is_blocked('2001:db8::1')
+
+    stats = backend.reconcile({'198.51.100.7': None})
+    assert stats == {'added': 1, 'removed': 1}
+    assert backend.is_blocked('198.51.100.7') and not backend.is_blocked('192.0.2.1')
+    assert backend.commands == ['block 192.0.2.1', 'block 2001:db8::1 timeout 10',
+                                'unblock 192.0.2.1', 'block 198.51.100.7']
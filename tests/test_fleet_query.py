@@ -0,0 +1,54 @@
+import json
+from types import SimpleNamespace
+
+from app.utilities.fleet_query import parse_osquery_rows, _device_result
+from app.utilities.nats_command_bridge import COMMAND_TIMEOUT_ERROR
+
+TABLE = """
++-----+-----------+
+| pid | name      |
++-----+-----------+
+| 1   | init      |
+| 42  | a | b     |
+| 7   | sshd      |
++-----+-----------+
+"""
+
+JOB = SimpleNamespace(jobuuid='j')
+DEVICE = ('d', 'device-1')
+
+
+def test_parse_table_counts_unsplittable_rows():
+    rows, skipped = parse_osquery_rows({'output': TABLE})
+
+    assert rows == [{'pid': '1', 'name': 'init'}, {'pid': '7', 'name': 'sshd'}]
+    assert skipped == 1
+
+
+def test_parse_json_and_row_lists():
+    data = [{'pid': '1', 'name': 'a | b'}]
+
+    assert parse_osquery_rows({'output': json.dumps(data)}) == (data, 0)
+    assert parse_osquery_rows({'data': data}) == (data, 0)
+    assert parse_osquery_rows({'output': ''}) == ([], 0)
+    assert parse_osquery_rows({'output': 'Error: no such table'}) == (None, 0)
+
+
+def test_device_result_errors():
+    timeout = _device_result(JOB, DEVICE, {'error': COMMAND_TIMEOUT_ERROR}, 30000, 100)
+    failed = _device_result(JOB, DEVICE, {'status': 'success', 'result': {'error': 'no such table'}}, 5, 100)
+
+    assert timeout.status == 'timeout' and timeout.row_count == 0
+    assert failed.status == 'error' and failed.error == 'no such table'
+
+
+def test_device_result_flags_cut_and_unparsed_rows():
+    capped = _device_result(JOB, DEVICE, {'status': 'success', 'result': {'data': [{'n': n} for n in range(5)]}}, 5, 3)
+    partial = _device_result(JOB, DEVICE, {'status': 'success', 'result': {'output': TABLE}}, 5, 1)
+    unparsed = _device_result(JOB, DEVICE, {'status': 'success', 'result': {'output': 'tables: processes'}}, 5, 100)
+
+    assert capped.row_count == 3 and capped.error == 'Result cut to the first 3 of 5 rows'
+    assert partial.row_count == 1 and partial.output == TABLE
+    assert partial.error.startswith('1 table row(s) could not be parsed') and 'first 1 of 2 rows' in partial.error
+    assert unparsed.status == 'success' and unparsed.rows == [] and unparsed.output == 'tables: processes'
+    assert unparsed.error is None
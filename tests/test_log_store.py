@@ -0,0 +1,52 @@
+from app.utilities.log_store import INDEX_REGISTRY_KEY, RedisLogStore
+
+
+class FakeRedis:
+    """Just enough of redis-py for index trimming; every index key is empty"""
+
+    def __init__(self, keys):
+        self.sets = {INDEX_REGISTRY_KEY: sorted(keys)}
+        self.touched = []
+
+    def xrange(self, key, count=None):
+        return [(b'1000-0', {})]
+
+    def sscan(self, key, cursor, count):
+        members = self.sets[key]
+        end = cursor + count
+        return (end if end < len(members) else 0), members[cursor:end]
+
+    def srem(self, key, *members):
+        self.sets[key] = [member for member in self.sets[key] if member not in members]
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    def zremrangebyscore(self, key, low, high):
+        self.client.touched.append(key)
+        self.results.append(0)
+
+    def zcard(self, key):
+        self.results.append(0)
+
+    def execute(self):
+        return self.results
+
+
+def test_trim_walks_the_index_registry_a_slice_at_a_time():
+    keys = [f'wegweiser_logs:idx:client_ip:10.0.0.{n}' for n in range(250)]
+    client = FakeRedis(keys)
+    store = RedisLogStore()
+
+    removed = store.trim_indexes(client, count=100)
+
+    assert removed == 100 and len(client.touched) == 100
+    while client.sets[INDEX_REGISTRY_KEY]:
+        store.trim_indexes(client, count=100)
+    assert sorted(client.touched) == sorted(keys)
@@ -0,0 +1,56 @@
+import json
+import re
+import uuid
+from types import SimpleNamespace
+
+from app.utilities.chat import memory_pipeline
+
+
+class FakeLLM:
+    """Answers batched prompts with each conversation's user message, and records the prompts"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        messages = re.findall(r"^\s*User: (.*)$", prompt, re.MULTILINE)
+        content = json.dumps(messages) if "JSON array" in prompt else messages[0]
+        return SimpleNamespace(content=content)
+
+
+def _job(job_id, tenant, entity, message):
+    return SimpleNamespace(id=job_id, tenantuuid=tenant, entity_uuid=entity, entity_type='device',
+                           attempts=1, payload={'user_message': message, 'ai_message': 'ok', 'topics': []})
+
+
+def test_condense_batches_never_mix_tenants(monkeypatch):
+    tenant_a, tenant_b = uuid.uuid4(), uuid.uuid4()
+    device_a, device_b = uuid.uuid4(), uuid.uuid4()
+    jobs = [
+        _job(1, tenant_a, device_a, 'tenant-a turn 1'),
+        _job(2, tenant_b, device_b, 'tenant-b turn 1'),
+        _job(3, tenant_a, device_a, 'tenant-a turn 2'),
+        _job(4, tenant_b, device_b, 'tenant-b turn 2'),
+    ]
+    claims = [jobs, []]
+    saved = []
+
+    monkeypatch.setattr(memory_pipeline, '_claim_jobs', lambda *args: claims.pop(0))
+    monkeypatch.setattr(memory_pipeline, 'calculate_importance', lambda content: 1.0)
+    monkeypatch.setattr(memory_pipeline, '_save_memory',
+                        lambda tenant, entity, entity_type, content, *args: saved.append((tenant, content)) or content)
+    monkeypatch.setattr(memory_pipeline, '_trickle_up_job', lambda memory, content: None)
+    monkeypatch.setattr(memory_pipeline, 'index_memory', lambda memory, content: None)
+    monkeypatch.setattr(memory_pipeline, 'db', SimpleNamespace(session=SimpleNamespace(
+        execute=lambda *args: None, commit=lambda: None, rollback=lambda: None, add=lambda obj: None)))
+
+    llm = FakeLLM()
+    stats = memory_pipeline.process_condense_jobs(llm, batch_size=10, max_jobs=10, claim_timeout=600, max_attempts=3)
+
+    assert stats['turns'] == 4 and stats['memories'] == 4
+    assert len(llm.prompts) == 2
+    for prompt in llm.prompts:
+        assert ('tenant-a' in prompt) != ('tenant-b' in prompt)
+    for tenant, content in saved:
+        assert content.startswith('tenant-a' if tenant == tenant_a else 'tenant-b')
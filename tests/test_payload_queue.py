@@ -0,0 +1,43 @@
+import os
+
+from app.utilities.payload_queue import claim_payloads, clear_attempts, release_claims
+
+
+def _dirs(tmp_path):
+    dirs = {name: str(tmp_path / name) for name in ('queue', 'inflight', 'attempts', 'invalid')}
+    os.makedirs(dirs['queue'])
+    return dirs
+
+
+def test_failing_payload_is_dead_lettered(tmp_path):
+    dirs = _dirs(tmp_path)
+    (tmp_path / 'queue' / 'device.1.audit.json').write_text('{}')
+
+    for attempt in range(1, 4):
+        claimed = claim_payloads(dirs['queue'], dirs['inflight'], 'worker')
+        assert [os.path.basename(path) for path in claimed] == ['device.1.audit.json']
+        returned = release_claims(dirs['inflight'], 'worker', dirs['queue'], dirs['attempts'], dirs['invalid'], 3)
+        assert returned == ([] if attempt == 3 else ['device.1.audit.json'])
+
+    assert os.listdir(dirs['queue']) == []
+    assert os.listdir(dirs['invalid']) == ['device.1.audit.json']
+    assert os.listdir(dirs['attempts']) == []
+
+
+def test_failed_payloads_are_skipped_and_handled_ones_forgotten(tmp_path):
+    dirs = _dirs(tmp_path)
+    for name in ('a.1.audit.json', 'b.1.audit.json'):
+        (tmp_path / 'queue' / name).write_text('{}')
+
+    claim_payloads(dirs['queue'], dirs['inflight'], 'worker')
+    os.remove(os.path.join(dirs['inflight'], 'worker', 'b.1.audit.json'))
+    failed = set(release_claims(dirs['inflight'], 'worker', dirs['queue'], dirs['attempts'], dirs['invalid'], 5))
+
+    assert failed == {'a.1.audit.json'}
+    assert claim_payloads(dirs['queue'], dirs['inflight'], 'worker', skip=failed) == []
+
+    claimed = claim_payloads(dirs['queue'], dirs['inflight'], 'worker')
+    os.remove(claimed[0])
+    assert release_claims(dirs['inflight'], 'worker', dirs['queue'], dirs['attempts'], dirs['invalid'], 5) == []
+    clear_attempts(dirs['attempts'], {'a.1.audit.json'})
+    assert os.listdir(dirs['attempts']) == []
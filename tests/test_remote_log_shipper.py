@@ -0,0 +1,29 @@
+from app.utilities.app_logging_helper import RemoteLogShipper
+
+
+class FlakyIndexStore:
+    """Appends always succeed; the first index write fails"""
+
+    def __init__(self):
+        self.appended = []
+        self.index_calls = 0
+
+    def append(self, client, entries):
+        self.appended.extend(entries)
+        return [f'{len(self.appended) - len(entries) + n}-0' for n in range(len(entries))]
+
+    def index(self, client, stream_ids, entries):
+        self.index_calls += 1
+        if self.index_calls == 1:
+            raise ConnectionError('index pipeline failed')
+
+
+def test_index_retry_does_not_append_twice():
+    store = FlakyIndexStore()
+    shipper = RemoteLogShipper(client=None, store=store, retry_count=1)
+    batch = [{'level': 'INFO', 'message': 'one'}, {'level': 'ERROR', 'message': 'two'}]
+
+    assert shipper._ship(batch)
+    assert store.appended == batch
+    assert store.index_calls == 2
+    assert shipper.stats['shipped'] == 2 and shipper.stats['ship_errors'] == 1